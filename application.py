@@ -2,12 +2,30 @@
 Module for the application.
 """
 
+from logging import getLogger
 from random import randrange
-from socket import AF_INET, SOCK_STREAM, socket
-from threading import Thread, Lock
-from time import sleep
+from os.path import join
+from socket import socket
+from threading import Condition, Event, Lock, Thread
+from time import perf_counter, sleep
+from typing import Callable
+from lib.data_plane import DataPlaneOptions, DataPlaneServer, DataProducer
+from lib.datagram import DatagramOptions
 from lib.election import ElectionProtocolManager
+from lib.election_state import ElectionStateStore
+from lib.failure_detector import FailureDetector
+from lib.ingest import IngestServer, StreamCollector
+from lib.log import NodeLogger
+from lib.message import DATA_CHANNEL, Message, MessageType, encode_message
+from lib.metrics import MetricsServer
 from lib.network import Network
+from lib.placement import PlacementPolicy
+from lib.socket_manager import connect_with_backoff
+from lib.topology_index import TopologyIndex, load_network
+from lib.trace import Tracer
+from lib.transport import node_transports
+
+logger = getLogger(__name__)
 
 
 class Application():
@@ -17,30 +35,123 @@ class Application():
     """
 
     _node_id: int
+    _log: NodeLogger
     _election_startup_time: float
     _leader_id: int
-    _network: Network
+    _network: Network | TopologyIndex
     _election_protocol_manager: ElectionProtocolManager
-    _server_socket: socket | None
     _client_socket: socket | None
-    _server_thread: Thread | None
+    _client_socket_lock: Lock
+    _client_connected: Event
     _random_number_message: str
-    _lock: Lock
+    _verbose: bool
+    _convergecast: bool
+    _reuse_connections: bool
+    _collector: StreamCollector
+    _children_condition: Condition
+    _finished_children: int
+    _follow_leader: bool
+    _leader_elected: Event
+    _data_plane: DataPlaneOptions | None
+    _metrics_server: MetricsServer | None
+
+    def __init__(self,
+                 node_id: int,
+                 network_file_path: str,
+                 election_startup_time: float = 0.0,
+                 event_loop: bool = False,
+                 placement_policy: PlacementPolicy | None = None,
+                 verbose: bool = False,
+                 convergecast: bool = False,
+                 reuse_connections: bool = False,
+                 heartbeat_interval: float | None = None,
+                 failure_detector: FailureDetector | None = None,
+                 state_dir: str | None = None,
+                 metrics_port: int | None = None,
+                 trace_dir: str | None = None,
+                 data_plane: DataPlaneOptions | None = None,
+                 datagram: DatagramOptions | None = None) -> None:
+        """
+        Args:
+            network_file_path (str): the network.json, or a topology index compiled from it, from which the node
+                reads only its own records.
+            convergecast (bool): if True, each node sends its data to its parent in the election tree, which
+                relays it upwards, instead of every node connecting to the leader.
+            reuse_connections (bool): if True, the convergecast data is sent on a channel of the election
+                connections, which stay open, instead of new connections to the application ports.
+            heartbeat_interval (float): if set, the node keeps running after the data is collected, monitoring
+                its tree links with heartbeats, and prints the new leader whenever a failure cuts it from the
+                current one.
+            failure_detector (FailureDetector): when a tree link is considered failed.
+            state_dir (str): if set, the node persists the election in this directory and, when restarted with
+                the same network file, confirms it instead of electing the leader again.
+            metrics_port (int): if set, the metrics of the election are served as Prometheus text on
+                http://127.0.0.1:<metrics_port>/metrics.
+            trace_dir (str): if set, the election is traced to trace_dir/node-<id>.trace.jsonl, to be merged
+                with python -m lib.trace.
+            data_plane (DataPlaneOptions): if set, each node streams batches of records to the leader with
+                credit based flow control, and the leader prints the records per second and the latency of the
+                records, instead of the random number. Only without convergecast.
+            datagram (DatagramOptions): if set, the election messages are sent in UDP datagrams with
+                retransmissions instead of TCP connections. Not with reuse_connections.
+        """
+
+        if data_plane is not None and (convergecast or reuse_connections):
+            raise ValueError("The data plane sends the records directly to the leader, without convergecast")
 
-    def __init__(self, node_id: int, network_file_path: str, election_startup_time: float) -> None:
         self._node_id = node_id
+        self._log = NodeLogger(logger, node_id)
         self._leader_id = -1
-        self._server_socket = None
-        self._network = Network(network_file_path)
-        self._server_thread = None
+        self._network = load_network(network_file_path)
         self._client_socket = None
+        self._client_socket_lock = Lock()
+        self._client_connected = Event()
         self._random_number_message = ""
-        self._lock = Lock()
+        self._verbose = verbose
+        self._convergecast = convergecast or reuse_connections
+        self._reuse_connections = reuse_connections
+        self._collector = StreamCollector(verbose)
+        self._children_condition = Condition()
+        self._finished_children = 0
+        self._follow_leader = heartbeat_interval is not None
+        self._leader_elected = Event()
+        self._data_plane = data_plane
         node_address = self._network.get_node_election_address(node_id)
         neighbors = self._network.get_election_neighbors(node_id)
 
         self._election_startup_time = election_startup_time
-        self._election_protocol_manager = ElectionProtocolManager(node_id, node_address[0], node_address[1], neighbors)
+        channel_handlers = {DATA_CHANNEL: self.handle_data} if reuse_connections else None
+        tracer = None
+        if trace_dir is not None:
+            tracer = Tracer(node_id, join(trace_dir, f"node-{node_id}.trace.jsonl"))
+        state_store = None
+        if state_dir is not None:
+            state_store = ElectionStateStore(join(state_dir, f"node-{node_id}.json"),
+                                             self._network.get_topology_hash())
+        # The transports of the network are those of the election connections, which datagrams replace.
+        transport, neighbor_transports = (None, None) if datagram is not None else node_transports(self._network,
+                                                                                                   node_id)
+        self._election_protocol_manager = ElectionProtocolManager(node_id,
+                                                                node_address[0],
+                                                                node_address[1],
+                                                                neighbors,
+                                                                event_loop,
+                                                                capacity=self._network.get_node_capacity(node_id),
+                                                                placement_policy=placement_policy,
+                                                                channel_handlers=channel_handlers,
+                                                                heartbeat_interval=heartbeat_interval,
+                                                                failure_detector=failure_detector,
+                                                                state_store=state_store,
+                                                                tracer=tracer,
+                                                                datagram=datagram,
+                                                                transport=transport,
+                                                                neighbor_transports=neighbor_transports)
+
+        self._metrics_server = None
+        if metrics_port is not None:
+            self._metrics_server = MetricsServer(("127.0.0.1", metrics_port),
+                                                 lambda: {node_id: self._election_protocol_manager.get_stats()})
+            self._metrics_server.start()
 
     def start(self) -> None:
         """
@@ -49,69 +160,225 @@ class Application():
 
         self.elect_leader()
 
+    def wait_for_leader(self, timeout: float | None = None) -> int:
+        """
+        Blocks until the node knows the first leader and returns it, while start runs in another thread.
+
+        Raises TimeoutError if the leader is not known in timeout seconds.
+        """
+
+        if not self._leader_elected.wait(timeout):
+            raise TimeoutError(f"Node {self._node_id} does not know the leader")
+
+        return self._leader_id
+
+    def wait_for_network_ready(self, timeout: float | None = None) -> None:
+        """
+        Blocks until the subtree of the node acknowledged the first leader; on the leader, until every node
+        knows it.
+
+        Raises TimeoutError if the subtree is not ready in timeout seconds.
+        """
+
+        start = perf_counter()
+        self.wait_for_leader(timeout)
+        remaining = None if timeout is None else max(0.0, timeout - (perf_counter() - start))
+        self._election_protocol_manager.wait_for_network_ready(remaining)
+
+    def get_stats(self) -> dict[str, int | float | None]:
+        """
+        Returns the counters of the election of the node.
+        """
+
+        return self._election_protocol_manager.get_stats()
+
     def connect_to_leader(self) -> None:
         """
         Connects to the neighbors.
         """
 
-        print(f"Conectando ao líder: {self._network.get_node_application_address(self._leader_id)}")
+        self._log.info("Connecting to the leader: %s", self._network.get_node_application_address(self._leader_id))
 
-        self._client_socket = socket(AF_INET, SOCK_STREAM)
-        self._client_socket.connect(self._network.get_node_application_address(self._leader_id))
+        # The leader may still be opening its application server.
+        self._client_socket = connect_with_backoff(self._network.get_node_application_address(self._leader_id), 30.0)
+
+        if self._data_plane is not None:
+            producer = DataProducer(self._node_id, self._data_plane)
+            producer.run(self._client_socket)
+            self._client_socket.close()
+            self._log.info("Data plane: %s", producer.get_stats())
+            return
+
+        self.send_random_numbers(self.send_to_client_socket)
+
+        self._client_socket.sendall(encode_message(MessageType.END_OF_STREAM, self._node_id))
+        self._client_socket.close()
+
+    def connect_to_parent(self) -> None:
+        """
+        Sends the node data to its parent in the election tree, relaying the data of its children.
+
+        The parent receives a single stream, which ends after the node and every child finished.
+        """
+
+        parent_id = self._election_protocol_manager.get_parent_id()
+        children_ids = self._election_protocol_manager.get_children_ids()
+        relay_thread = None
+
+        if children_ids:
+            server = IngestServer(self._network.get_node_application_address(self._node_id),
+                                  len(children_ids),
+                                  self._verbose,
+                                  relay=self.relay_to_parent)
+            relay_thread = Thread(target=server.serve)
+            relay_thread.start()
+
+        self._log.info("Connecting to the parent: %s", self._network.get_node_application_address(parent_id))
+
+        # The parent may still be opening its application server.
+        self._client_socket = connect_with_backoff(self._network.get_node_application_address(parent_id), 30.0)
+        self._client_connected.set()
+
+        self.send_random_numbers(self.send_to_client_socket)
+
+        if relay_thread is not None:
+            relay_thread.join()
+
+        self._client_socket.sendall(encode_message(MessageType.END_OF_STREAM, self._node_id))
+        self._client_socket.close()
+
+    def send_through_election_connections(self) -> None:
+        """
+        Sends the node data to its parent on the data channel of the election connections, relaying the data
+        of its children, or collects it on the leader. The connections are closed once every child finished.
+        """
+
+        parent_id = self._election_protocol_manager.get_parent_id()
+        children_count = len(self._election_protocol_manager.get_children_ids())
+
+        if parent_id is not None:
+            self.send_random_numbers(
+                lambda payload: self._election_protocol_manager.send_on_channel(
+                    parent_id, DATA_CHANNEL, MessageType.DATA, payload
+                )
+            )
+
+        with self._children_condition:
+            self._children_condition.wait_for(lambda: self._finished_children >= children_count)
+
+        if parent_id is not None:
+            self._election_protocol_manager.send_on_channel(parent_id, DATA_CHANNEL, MessageType.END_OF_STREAM)
+        else:
+            self._random_number_message = self._collector.join().decode("utf-8")
+
+        # The heartbeats keep using the election connections.
+        if not self._follow_leader:
+            self._election_protocol_manager.close()
+
+        if parent_id is None:
+            print(f"\nO número aleatório capturado é {self._random_number_message}")
+
+    def handle_data(self, node_id: int, message: Message) -> None:
+        """
+        Handles a message of the data channel sent by a child, relaying its data to the parent.
+        """
+
+        with self._children_condition:
+            data, ended = self._collector.collect(node_id, [message])
+
+            parent_id = self._election_protocol_manager.get_parent_id()
+            if parent_id is not None:
+                for data_message in data:
+                    self._election_protocol_manager.send_on_channel(
+                        parent_id, DATA_CHANNEL, MessageType.DATA, data_message.payload, data_message.sender_id
+                    )
+
+            if ended:
+                self._finished_children += 1
+                self._children_condition.notify_all()
+
+    def send_random_numbers(self, send: Callable[[bytes], None]) -> None:
+        """
+        Sends the node contribution to the random number, one digit at a time.
+        """
 
         for _ in range(100):
             message = str(self._node_id)
-            self._client_socket.sendall(message.encode("utf-8"))
+            send(message.encode("utf-8"))
             sleep(randrange(1, 10) / 20)
 
-        self._client_socket.sendall("X".encode("utf-8"))
-        self._client_socket.close()
+    def send_to_client_socket(self, payload: bytes) -> None:
+        """
+        Sends a DATA frame on the connection to the leader or to the parent.
+        """
 
-    def start_server(self) -> None:
+        frame = encode_message(MessageType.DATA, self._node_id, payload)
+
+        with self._client_socket_lock:
+            self._client_socket.sendall(frame)
+
+    def relay_to_parent(self, messages: list[Message]) -> None:
         """
-        Starts the server.
+        Forwards the data received from the children to the parent, merged in a single write.
         """
 
-        self._server_socket = socket(AF_INET, SOCK_STREAM)
-        self._server_socket.bind(self._network.get_node_application_address(self._node_id))
-        self._server_socket.listen(10)
+        frames = b"".join(encode_message(MessageType.DATA, message.sender_id, message.payload) for message in messages)
 
-        remaining_neighbors = self._network.get_node_count() - 1
+        # The children may connect before this node is connected to its parent.
+        self._client_connected.wait()
 
-        threads = []
+        with self._client_socket_lock:
+            self._client_socket.sendall(frames)
 
-        while remaining_neighbors > 0:
-            client_socket, client_address = self._server_socket.accept()
+    def start_server(self) -> None:
+        """
+        Starts the server, collecting the streams of every other node in a single thread.
+
+        The server listens as soon as the node knows it is the leader, and collects once every node acknowledged
+        the leader. In convergecast mode only the children of the leader connect to it.
+        """
+
+        if self._convergecast:
+            expected_clients = len(self._election_protocol_manager.get_children_ids())
+        else:
+            expected_clients = self._network.get_node_count() - 1
 
-            print(f"Aceitou conexão de {client_address}")
-            remaining_neighbors -= 1
+        if self._data_plane is not None:
+            self.serve_data_plane(expected_clients)
+            return
 
-            threads.append(Thread(target=self.handle_client, args=(client_socket,)))
-            threads[-1].start()
+        server = IngestServer(self._network.get_node_application_address(self._node_id),
+                              expected_clients,
+                              self._verbose)
+        server.listen()
 
-        for thread in threads:
-            thread.join()
+        self._election_protocol_manager.wait_for_network_ready()
+        self._log.info("Every node knows the leader, collecting from %d clients", expected_clients)
 
-        self._server_socket.close()
+        self._random_number_message = server.serve().decode("utf-8")
 
         print(f"\nO número aleatório capturado é {self._random_number_message}")
 
-    def handle_client(self, client_socket: socket) -> None:
+    def serve_data_plane(self, expected_clients: int) -> None:
         """
-        Handles a client.
+        Consumes the records of every other node with flow control and prints the throughput and the latency.
         """
 
-        while True:
-            message = client_socket.recv(1024).decode("utf-8")
-
-            if message == "X":
-                break
+        server = DataPlaneServer(self._network.get_node_application_address(self._node_id),
+                                 expected_clients,
+                                 self._data_plane.window)
+        server.listen()
 
-            with self._lock:
-                self._random_number_message += message
-                print(f"{message} ", end="", flush=True)
+        self._election_protocol_manager.wait_for_network_ready()
+        server.serve()
 
-        client_socket.close()
+        stats = server.get_stats()
+        print(f"\n{stats['records_received']} registros de {stats['producers']} nós em {stats['elapsed']:.3f} s: "
+              f"{stats['records_per_second']:,.0f} registros/s")
+        if stats["latency_p50"] is not None:
+            print(f"Latência (ms): p50 {stats['latency_p50'] * 1000:.3f}, p90 {stats['latency_p90'] * 1000:.3f}, "
+                  f"p99 {stats['latency_p99'] * 1000:.3f}, p99.9 {stats['latency_p999'] * 1000:.3f}, "
+                  f"máx. {stats['latency_max'] * 1000:.3f}")
 
     def elect_leader(self) -> None:
         """
@@ -120,12 +387,33 @@ class Application():
 
         self._election_protocol_manager.start_server(self._election_startup_time)
 
+        # The future resolves as soon as the node knows the leader, while its subtree is still acknowledging it.
         if self._node_id == self._network.get_election_starter_id():
-            self._leader_id = self._election_protocol_manager.start_election()
+            election = self._election_protocol_manager.start_election(block_until_result=False)
         else:
-            self._leader_id = self._election_protocol_manager.wait_for_election()
+            election = self._election_protocol_manager.get_election_future()
+        self._leader_id = election.result()
+
+        self._leader_elected.set()
 
-        if self._leader_id == self._node_id:
+        if self._reuse_connections:
+            self.send_through_election_connections()
+        elif self._leader_id == self._node_id:
             self.start_server()
+        elif self._convergecast:
+            self.connect_to_parent()
         else:
             self.connect_to_leader()
+
+        if self._follow_leader:
+            self.follow_leader()
+
+    def follow_leader(self) -> None:
+        """
+        Prints the leader elected after each failure that cuts the node from the current one, until the process
+        is stopped.
+        """
+
+        while True:
+            self._leader_id = self._election_protocol_manager.wait_for_leader_change(self._leader_id)
+            print(f"Novo líder: {self._leader_id}")
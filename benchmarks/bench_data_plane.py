@@ -0,0 +1,155 @@
+"""
+Throughput and latency benchmark of the data plane.
+
+Compares the per record sends of the example application (one DATA frame and one sendall per record, collected
+by the IngestServer) with the flow controlled data plane at several batch sizes and windows. Each producer runs
+in its own process and streams the same number of records; the leader reports the records consumed per second
+and the percentiles of the time from the production of a record to its consumption.
+
+With --rate every producer sends at a fixed rate, and with --consume-delay the leader sleeps after each batch, a
+consumer slower than the producers, where the window bounds the latency instead of letting the queues grow.
+
+Run with: python -m benchmarks.bench_data_plane
+"""
+
+import argparse
+from multiprocessing import Process
+from time import sleep, time
+
+from lib.data_plane import DataPlaneOptions, DataPlaneServer, DataProducer
+from lib.ingest import IngestServer
+from lib.message import RECORD, MessageType, encode_message
+from lib.socket_manager import connect_with_backoff
+
+
+def run_producer(address: tuple[str, int], producer_id: int, options: DataPlaneOptions, legacy: bool) -> None:
+    """
+    Streams the records of a producer, one frame per record without flow control if legacy.
+    """
+
+    connection = connect_with_backoff(address, 30.0)
+
+    if not legacy:
+        DataProducer(producer_id, options).run(connection)
+        connection.close()
+        return
+
+    record = b"x" * options.record_size
+    start_time = time()
+
+    for index in range(options.records):
+        produced_at = time()
+        if options.rate is not None:
+            produced_at = start_time + index / options.rate
+            sleep(max(0.0, produced_at - time()))
+
+        connection.sendall(encode_message(MessageType.DATA, producer_id, RECORD.pack(produced_at, 0) + record))
+
+    connection.sendall(encode_message(MessageType.END_OF_STREAM, producer_id))
+    connection.close()
+
+
+class LegacyCollector():
+
+    """
+    Measures the latency of the per record DATA frames relayed by the IngestServer.
+    """
+
+    latencies: list[float]
+
+    def __init__(self) -> None:
+        self.latencies = []
+
+    def relay(self, messages) -> None:
+        """
+        Records the latency of each DATA frame.
+        """
+
+        consumed_at = time()
+        self.latencies.extend(consumed_at - RECORD.unpack_from(message.payload)[0] for message in messages)
+
+
+def run(address: tuple[str, int],
+        producers: int,
+        options: DataPlaneOptions,
+        legacy: bool,
+        consume_delay: float) -> dict:
+    """
+    Runs one configuration and returns the stats of the leader.
+    """
+
+    def consume(sender_id: int, records: list) -> None:
+        sleep(consume_delay)
+
+    if legacy:
+        collector = LegacyCollector()
+        server = IngestServer(address, producers, backlog=producers, relay=collector.relay)
+    else:
+        server = DataPlaneServer(address, producers, options.window, backlog=producers,
+                                 consume=consume if consume_delay > 0 else None)
+    server.listen()
+
+    processes = [Process(target=run_producer, args=(address, producer_id, options, legacy))
+                 for producer_id in range(producers)]
+    for process in processes:
+        process.start()
+
+    server.serve(timeout=600.0)
+
+    for process in processes:
+        process.join()
+
+    stats = server.get_stats()
+    if not legacy:
+        return stats
+
+    # The legacy server has no latency, it is measured from the relayed frames like the data plane does.
+    latencies = sorted(collector.latencies)
+    records = len(latencies)
+
+    return {
+        "records_received": records,
+        "records_per_second": records / stats["elapsed"],
+        "latency_p50": latencies[records // 2],
+        "latency_p99": latencies[min(records - 1, records * 99 // 100)],
+        "latency_p999": latencies[min(records - 1, records * 999 // 1000)],
+        "latency_max": latencies[-1],
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the flow controlled data plane")
+    parser.add_argument("--producers", type=int, default=4, help="Producer processes")
+    parser.add_argument("--records", type=int, default=50000, help="Records sent by each producer")
+    parser.add_argument("--record-size", type=int, default=64, help="Bytes per record")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 256], help="Records per batch")
+    parser.add_argument("--windows", type=int, nargs="+", default=[256, 4096], help="Records in flight per producer")
+    parser.add_argument("--rate", type=float, help="Records per second of each producer, unthrottled if not set")
+    parser.add_argument("--consume-delay", type=float, default=0.0, help="Seconds the leader sleeps after each batch")
+    parser.add_argument("--no-legacy", action="store_true", help="Skip the per record sends")
+    parser.add_argument("--port", type=int, default=39500, help="Port of the leader")
+    args = parser.parse_args()
+
+    configurations = [] if args.no_legacy else [("legacy", 1, 0)]
+    configurations += [("data plane", batch_size, window) for window in args.windows for batch_size in args.batch_sizes]
+
+    print(f"{'mode':<12}{'batch':>7}{'window':>8}{'records':>10}{'records/s':>13}{'p50 (ms)':>10}{'p99':>10}"
+          f"{'p99.9':>10}{'max':>10}")
+
+    for mode, batch_size, window in configurations:
+        options = DataPlaneOptions(args.records, args.record_size, batch_size, args.rate, window)
+        stats = run(("localhost", args.port), args.producers, options, mode == "legacy", args.consume_delay)
+        window_column = "-" if mode == "legacy" else window
+
+        print(f"{mode:<12}{batch_size:>7}{window_column:>8}{stats['records_received']:>10}"
+              f"{stats['records_per_second']:>13,.0f}{stats['latency_p50'] * 1000:>10.3f}"
+              f"{stats['latency_p99'] * 1000:>10.3f}{stats['latency_p999'] * 1000:>10.3f}"
+              f"{stats['latency_max'] * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
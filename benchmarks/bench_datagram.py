@@ -0,0 +1,89 @@
+"""
+Election latency over TCP against the datagram transport.
+
+On a line every node waits for the connection to the next one before the start of the election goes on, so the
+wake up wave pays a TCP handshake per hop, where the datagram transport sends the start right away. For each
+length of the line the benchmark runs the election over both transports and reports the median time until the
+start reached the last node and until every node knew the leader. With --loss the datagram transport drops that
+fraction of its datagrams, to see what the retransmissions cost.
+
+Run with: python -m benchmarks.bench_datagram
+"""
+
+import argparse
+from os.path import join
+from statistics import median
+from tempfile import TemporaryDirectory
+
+from benchmarks.local_cluster import run_election
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.datagram import DatagramOptions
+from lib.network import Network
+
+TRANSPORTS = ("tcp", "udp")
+
+
+def run(network: Network, transport: str, loss: float) -> dict:
+    """
+    Runs an election and returns the time until the start reached every node and until every node knew the
+    leader.
+    """
+
+    datagram = DatagramOptions(loss=loss) if transport == "udp" else None
+    result = run_election(network, "threaded", datagram=datagram)
+
+    if len(set(result["leaders"].values())) != 1:
+        raise RuntimeError(f"The nodes disagree on the leader: {result['leaders']}")
+
+    stats = result["stats"].values()
+
+    return {
+        "wake_up": max(node_stats["election_started_at"] for node_stats in stats) - result["start"],
+        "election": max(node_stats["leader_known_at"] for node_stats in stats) - result["start"],
+        "messages": sum(node_stats["messages_sent"] for node_stats in stats),
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Compare the election over TCP and over datagrams")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="line")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200], help="Nodes of each network")
+    parser.add_argument("--repetitions", type=int, default=5, help="Elections per size and transport")
+    parser.add_argument("--loss", type=float, default=0.0, help="Fraction of the datagrams dropped")
+    parser.add_argument("--base-port", type=int, default=12000, help="First election port used by the nodes")
+    parser.add_argument("--last-port", type=int, default=20000, help="Last election port used by the nodes")
+    args = parser.parse_args()
+
+    port = args.base_port
+
+    print(f"{'nodes':>7}{'transport':>11}{'wake up (ms)':>14}{'election (ms)':>15}{'messages':>10}")
+
+    with TemporaryDirectory() as directory:
+        path = join(directory, "network.json")
+
+        for nodes in args.sizes:
+            for transport in TRANSPORTS:
+                results = []
+
+                for _ in range(args.repetitions):
+                    # Listening ports may linger for a moment after an election, so each one gets fresh ports.
+                    if port + nodes > args.last_port:
+                        port = args.base_port
+
+                    write_network(generate_topology(args.topology, nodes), path, election_port=port)
+                    port += nodes
+
+                    results.append(run(Network(path), transport, args.loss))
+
+                print(f"{nodes:>7}{transport:>11}"
+                      f"{median(result['wake_up'] for result in results) * 1000:>14.3f}"
+                      f"{median(result['election'] for result in results) * 1000:>15.3f}"
+                      f"{results[0]['messages']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Election latency benchmark suite.
+
+Generates a network.json for each topology and size, runs the election with every node in this process and
+reports, per run: time to the first leader, time until every node knows the leader, messages, bytes, root
+contention rounds and the mean and largest distance to the leader. The results are written as JSON and CSV.
+
+Run with: python -m benchmarks.bench_election
+"""
+
+import argparse
+import csv
+import json
+import subprocess
+from datetime import datetime, timezone
+from os import makedirs
+from os.path import join
+
+from benchmarks.local_cluster import MODES, raise_file_limit, required_file_descriptors, run_election
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.contention import CONTENTION_POLICIES
+from lib.network import Network
+from lib.placement import PLACEMENT_POLICIES
+
+FIELDS = (
+    "version",
+    "timestamp",
+    "topology",
+    "nodes",
+    "mode",
+    "contention_policy",
+    "placement_policy",
+    "run",
+    "leader",
+    "time_to_first_leader",
+    "time_to_all_know_leader",
+    "messages",
+    "bytes",
+    "contention_rounds",
+    "contention_backoff_time",
+    "mean_leader_distance",
+    "max_leader_distance",
+)
+
+
+def repository_version() -> str:
+    """
+    Returns the current commit of the repository, or "unknown".
+    """
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True,
+                              check=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(result: dict) -> dict:
+    """
+    Reduces the per node stats of an election to the benchmark metrics.
+    """
+
+    stats = result["stats"].values()
+    known_at = [node_stats["leader_known_at"] for node_stats in stats]
+    distances = [node_stats["leader_distance"] for node_stats in stats]
+    leaders = set(result["leaders"].values())
+
+    if len(leaders) != 1:
+        raise RuntimeError(f"Nodes disagree on the leader: {leaders}")
+
+    return {
+        "leader": leaders.pop(),
+        "time_to_first_leader": min(known_at) - result["start"],
+        "time_to_all_know_leader": max(known_at) - result["start"],
+        "messages": sum(node_stats["messages_sent"] for node_stats in stats),
+        "bytes": sum(node_stats["bytes_sent"] for node_stats in stats),
+        # Both nodes of a root contention count the round, so the election took the largest count.
+        "contention_rounds": max(node_stats["contention_rounds"] for node_stats in stats),
+        "contention_backoff_time": max(node_stats["contention_backoff_time"] for node_stats in stats),
+        "mean_leader_distance": sum(distances) / len(distances),
+        "max_leader_distance": max(distances),
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark suite.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the election latency on generated topologies")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Numbers of nodes")
+    parser.add_argument("--mode", choices=MODES, default="async", help="How the nodes are run")
+    parser.add_argument("--contention",
+                        choices=CONTENTION_POLICIES,
+                        default="exponential",
+                        help="The root contention resolution policy")
+    parser.add_argument("--placement",
+                        choices=PLACEMENT_POLICIES,
+                        default="root",
+                        help="Which node of the spanning tree becomes the leader")
+    parser.add_argument("--runs", type=int, default=3, help="Elections per topology and size")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout of each election in seconds")
+    parser.add_argument("--base-port", type=int, default=20000, help="First election port used by the nodes")
+    parser.add_argument("--last-port", type=int, default=32000, help="Last election port used by the nodes")
+    parser.add_argument("--output-dir", default=join("benchmarks", "results"), help="Where the files are written")
+    args = parser.parse_args()
+
+    file_limit = raise_file_limit()
+    makedirs(args.output_dir, exist_ok=True)
+
+    version = repository_version()
+    timestamp = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    rows = []
+    port = args.base_port
+
+    print(f"{'topology':<12}{'nodes':>7}{'run':>5}{'first (s)':>11}{'all (s)':>10}"
+          f"{'messages':>10}{'bytes':>10}{'contention':>12}{'distance':>10}")
+
+    for topology in args.topologies:
+        for size in args.sizes:
+            if file_limit is not None and required_file_descriptors(size) > file_limit:
+                print(f"Skipping {topology} with {size} nodes: about {required_file_descriptors(size)} open files "
+                      f"are needed and the limit is {file_limit}")
+                continue
+
+            connections = generate_topology(topology, size)
+            path = join(args.output_dir, f"{topology}-{size}.json")
+
+            for run in range(args.runs):
+                # Listening ports may linger for a moment after an election, so each run gets a fresh range.
+                if port + size > args.last_port:
+                    port = args.base_port
+
+                write_network(connections, path, election_port=port)
+                network = Network(path)
+                port += size
+
+                row = {
+                    "version": version,
+                    "timestamp": timestamp,
+                    "topology": topology,
+                    "nodes": size,
+                    "mode": args.mode,
+                    "contention_policy": args.contention,
+                    "placement_policy": args.placement,
+                    "run": run,
+                    **summarize(run_election(network,
+                                             args.mode,
+                                             args.timeout,
+                                             contention_policy=CONTENTION_POLICIES[args.contention](),
+                                             placement_policy=PLACEMENT_POLICIES[args.placement]())),
+                }
+                rows.append(row)
+
+                print(f"{topology:<12}{size:>7}{run:>5}{row['time_to_first_leader']:>11.3f}"
+                      f"{row['time_to_all_know_leader']:>10.3f}{row['messages']:>10}{row['bytes']:>10}"
+                      f"{row['contention_rounds']:>12}{row['mean_leader_distance']:>10.2f}")
+
+    with open(join(args.output_dir, "results.json"), "w", encoding="utf-8") as results_file:
+        json.dump(rows, results_file, indent=2)
+
+    with open(join(args.output_dir, "results.csv"), "w", encoding="utf-8", newline="") as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark of the threaded and event loop connection modes on star topologies.
+
+Run with: python -m benchmarks.bench_event_loop
+"""
+
+import argparse
+from os.path import join
+from statistics import median
+from tempfile import TemporaryDirectory
+from threading import active_count
+
+from benchmarks.local_cluster import run_election
+from benchmarks.topology import star_topology, write_network
+from lib.network import Network
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark threaded and event loop modes on stars")
+    parser.add_argument("--leaves", type=int, nargs="+", default=[10, 50, 100, 250, 500], help="Star sizes")
+    parser.add_argument("--runs", type=int, default=3, help="Elections per configuration")
+    parser.add_argument("--base-port", type=int, default=20000, help="First port used by the nodes")
+    args = parser.parse_args()
+
+    port = args.base_port
+
+    print(f"{'leaves':>8}{'mode':>12}{'median (s)':>14}{'max (s)':>10}")
+    with TemporaryDirectory() as directory:
+        for leaves in args.leaves:
+            connections = star_topology(leaves)
+
+            for mode in ("threaded", "event-loop"):
+                times = []
+                for run in range(args.runs):
+                    path = join(directory, f"star-{leaves}-{mode}-{run}.json")
+                    write_network(connections, path, election_port=port)
+                    port += len(connections)
+
+                    result = run_election(Network(path), mode)
+
+                    leaders = set(result["leaders"].values())
+                    if len(leaders) != 1:
+                        raise RuntimeError(f"Nodes disagree on the leader: {leaders}")
+
+                    times.append(result["elapsed"])
+
+                print(f"{leaves:>8}{mode:>12}{median(times):>14.3f}{max(times):>10.3f}")
+
+    print(f"Threads still alive: {active_count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Election groups benchmark.
+
+Runs many independent elections at once over the same tree, one per group, each one started by a different
+node. With shared connections every node runs all its groups with one ElectionGroupManager, over one listening
+port and one connection per neighbor. The baseline runs a separate ElectionProtocolManager per node and group,
+each with its own port, listener and connections, as before the groups.
+
+Reports the time until every node of every group knew its leader, the listening ports, the peak of threads and
+the connections opened.
+
+Run with: python -m benchmarks.bench_groups
+"""
+
+import argparse
+from os.path import join
+from statistics import median
+from tempfile import TemporaryDirectory
+from threading import Event, Thread, active_count
+from time import perf_counter
+
+from benchmarks.local_cluster import raise_file_limit
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.election import ElectionGroupManager, ElectionProtocolManager
+from lib.network import Network
+
+LAYOUTS = ("shared", "per-group")
+
+
+class ThreadSampler():
+
+    """
+    Samples the number of threads of the process until stopped, keeping the peak.
+    """
+
+    peak: int
+    _stopped: Event
+    _thread: Thread
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.peak = active_count()
+        self._stopped = Event()
+        self._thread = Thread(target=self._sample, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def _sample(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self.peak = max(self.peak, active_count())
+
+    def stop(self) -> int:
+        """
+        Stops sampling and returns the peak.
+        """
+
+        self._stopped.set()
+        self._thread.join()
+
+        return self.peak
+
+
+def connections_opened(stats: list[dict]) -> int:
+    """
+    Returns the connections the nodes opened, one per connect latency observation.
+    """
+
+    return sum(histogram["count"] for node_stats in stats for histogram in node_stats["connect_latency"].values())
+
+
+def run_shared(network: Network, groups: int, event_loop: bool) -> dict:
+    """
+    Runs the elections of the groups with one ElectionGroupManager per node.
+    """
+
+    node_ids = network.get_node_ids()
+    sampler = ThreadSampler()
+    managers = {}
+
+    for node_id in node_ids:
+        host, port = network.get_node_election_address(node_id)
+        managers[node_id] = ElectionGroupManager(node_id, host, port, network.get_election_neighbors(node_id),
+                                                 event_loop)
+        for group in range(groups):
+            managers[node_id].add_group(group)
+
+    try:
+        for manager in managers.values():
+            manager.start_server()
+
+        start = perf_counter()
+        for group in range(groups):
+            managers[node_ids[group % len(node_ids)]].start_election(group, block_until_result=False)
+
+        leaders = {group: {managers[node_id].wait_for_election(group) for node_id in node_ids}
+                   for group in range(groups)}
+        stats = [manager.get_stats(group) for manager in managers.values() for group in range(groups)]
+    finally:
+        for manager in managers.values():
+            manager.close()
+
+    return summarize(start, leaders, stats, len(node_ids), sampler.stop())
+
+
+def run_per_group(network: Network, groups: int, event_loop: bool) -> dict:
+    """
+    Runs the elections of the groups with one ElectionProtocolManager per node and group, each on its own port.
+    """
+
+    node_ids = network.get_node_ids()
+    port_offset = len(node_ids)
+    sampler = ThreadSampler()
+    managers = {}
+
+    for group in range(groups):
+        def address(node_id: int) -> tuple[str, int]:
+            host, port = network.get_node_election_address(node_id)
+            return host, port + group * port_offset
+
+        for node_id in node_ids:
+            neighbors = {neighbor_id: address(neighbor_id) for neighbor_id in network.get_election_neighbors(node_id)}
+            managers[group, node_id] = ElectionProtocolManager(node_id, *address(node_id), neighbors, event_loop)
+
+    for manager in managers.values():
+        manager.start_server()
+
+    start = perf_counter()
+    for group in range(groups):
+        managers[group, node_ids[group % len(node_ids)]].start_election(block_until_result=False)
+
+    leaders = {group: {managers[group, node_id].wait_for_election() for node_id in node_ids}
+               for group in range(groups)}
+    stats = [manager.get_stats() for manager in managers.values()]
+
+    return summarize(start, leaders, stats, len(managers), sampler.stop())
+
+
+def summarize(start: float, leaders: dict[int, set[int]], stats: list[dict], listeners: int, threads: int) -> dict:
+    """
+    Checks that the nodes of each group agree on its leader and returns the result of a run.
+    """
+
+    for group, group_leaders in leaders.items():
+        if len(group_leaders) != 1:
+            raise RuntimeError(f"The nodes of group {group} disagree on the leader: {group_leaders}")
+
+    return {
+        "elapsed": max(node_stats["leader_known_at"] for node_stats in stats) - start,
+        "messages": sum(node_stats["messages_sent"] for node_stats in stats),
+        "connections": connections_opened(stats),
+        "listeners": listeners,
+        "threads": threads,
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark concurrent election groups over shared connections")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="random")
+    parser.add_argument("--nodes", type=int, default=10, help="Nodes of the tree every group elects over")
+    parser.add_argument("--groups", type=int, nargs="+", default=[10, 100, 300], help="Numbers of groups")
+    parser.add_argument("--modes", nargs="+", choices=("threaded", "event-loop"), default=["threaded", "event-loop"])
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument("--per-group-max", type=int, default=100,
+                        help="Largest number of groups run with a port per group, which needs a port, a listener "
+                             "and connections per node and group")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per configuration, the median time is reported")
+    parser.add_argument("--base-port", type=int, default=20000, help="First port used by the nodes")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    port = args.base_port
+    connections = generate_topology(args.topology, args.nodes)
+
+    print(f"{'groups':>7}{'mode':>12}{'layout':>11}{'median (s)':>12}{'listeners':>11}{'threads':>9}"
+          f"{'connections':>13}{'messages':>10}")
+
+    with TemporaryDirectory() as directory:
+        for groups in args.groups:
+            for mode in args.modes:
+                for layout in args.layouts:
+                    if layout == "per-group" and groups > args.per_group_max:
+                        continue
+
+                    results = []
+                    for run in range(args.runs):
+                        path = join(directory, f"{groups}-{mode}-{layout}-{run}.json")
+                        write_network(connections, path, election_port=port)
+                        port += len(connections) * (groups if layout == "per-group" else 1)
+
+                        run_layout = run_shared if layout == "shared" else run_per_group
+                        results.append(run_layout(Network(path), groups, mode == "event-loop"))
+
+                    result = results[-1]
+                    print(f"{groups:>7}{mode:>12}{layout:>11}{median(r['elapsed'] for r in results):>12.3f}"
+                          f"{result['listeners']:>11}{result['threads']:>9}{result['connections']:>13}"
+                          f"{result['messages']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Throughput benchmark of the leader ingest server.
+
+Compares the legacy application server (one thread per client, recv(1024) decoded and appended to a shared
+str under a lock, printing every chunk, "X" as the end of stream) with the selector based IngestServer. The
+simulated clients run in another process and send their chunks round robin over all their connections.
+
+Run with: python -m benchmarks.bench_ingest
+"""
+
+import argparse
+from contextlib import redirect_stdout
+from multiprocessing import Process
+from os import devnull
+from socket import AF_INET, SO_REUSEADDR, SOCK_STREAM, SOL_SOCKET, socket
+from threading import Lock, Thread
+from time import perf_counter
+
+from lib.ingest import IngestServer
+from lib.message import MessageType, encode_message
+from lib.socket_manager import connect_with_backoff
+
+
+def run_clients(address: tuple[str, int], clients: int, chunks: int, chunk_size: int, legacy: bool) -> None:
+    """
+    Connects the clients to the server and streams chunks round robin over the connections.
+    """
+
+    connections = [connect_with_backoff(address, 30.0) for _ in range(clients)]
+    payloads = [str(client_id % 10).encode("utf-8") * chunk_size for client_id in range(clients)]
+
+    if legacy:
+        frames = payloads
+        ends = [b"X"] * clients
+    else:
+        frames = [encode_message(MessageType.DATA, client_id, payload) for client_id, payload in enumerate(payloads)]
+        ends = [encode_message(MessageType.END_OF_STREAM, client_id) for client_id in range(clients)]
+
+    for _ in range(chunks):
+        for connection, frame in zip(connections, frames):
+            connection.sendall(frame)
+
+    for connection, end in zip(connections, ends):
+        connection.sendall(end)
+        connection.close()
+
+
+def legacy_server(address: tuple[str, int], clients: int) -> tuple[int, int]:
+    """
+    Runs the legacy application server until every client leaves.
+
+    Returns the number of bytes collected and how many end of stream markers were missed because reads
+    coalesced, in which case the client is only noticed leaving when its connection closes.
+    """
+
+    server_socket = socket(AF_INET, SOCK_STREAM)
+    server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    server_socket.bind(address)
+    server_socket.listen(128)
+
+    lock = Lock()
+    result = ""
+    missed = 0
+
+    def handle_client(client_socket: socket) -> None:
+        nonlocal result, missed
+
+        while True:
+            message = client_socket.recv(1024).decode("utf-8")
+
+            if message == "X":
+                break
+
+            if not message:
+                # The original server spins forever here.
+                with lock:
+                    missed += 1
+                break
+
+            with lock:
+                result += message
+                print(f"{message} ", end="", flush=True)
+
+        client_socket.close()
+
+    threads = []
+    with open(devnull, "w", encoding="utf-8") as output, redirect_stdout(output):
+        for _ in range(clients):
+            client_socket, _ = server_socket.accept()
+            threads.append(Thread(target=handle_client, args=(client_socket,)))
+            threads[-1].start()
+
+        for thread in threads:
+            thread.join()
+
+    server_socket.close()
+
+    return len(result.replace("X", "")), missed
+
+
+def run(address: tuple[str, int], clients: int, chunks: int, chunk_size: int, legacy: bool) -> tuple[float, int, int]:
+    """
+    Runs one configuration, returning the elapsed time, the bytes collected and the missed end of streams.
+    """
+
+    process = Process(target=run_clients, args=(address, clients, chunks, chunk_size, legacy))
+    start = perf_counter()
+    process.start()
+
+    if legacy:
+        received, missed = legacy_server(address, clients)
+    else:
+        server = IngestServer(address, clients, backlog=clients)
+        received = len(server.serve(timeout=300.0))
+        missed = server.get_stats()["dropped_clients"]
+
+    elapsed = perf_counter() - start
+    process.join()
+
+    return elapsed, received, missed
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the leader ingest server")
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 250, 500], help="Simulated clients")
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks sent by each client")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Bytes per chunk")
+    parser.add_argument("--port", type=int, default=39000, help="Port of the server")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8}{'server':>10}{'time (s)':>10}{'MB/s':>10}{'chunks/s':>12}{'bytes ok':>10}{'missed end':>12}")
+
+    for clients in args.clients:
+        expected = clients * args.chunks * args.chunk_size
+
+        for legacy in (True, False):
+            elapsed, received, missed = run(("localhost", args.port), clients, args.chunks, args.chunk_size, legacy)
+            rate = received / elapsed / 1e6
+            chunks = clients * args.chunks / elapsed
+            name = "legacy" if legacy else "selector"
+
+            print(f"{clients:>8}{name:>10}{elapsed:>10.3f}{rate:>10.2f}{chunks:>12,.0f}"
+                  f"{str(received == expected):>10}{missed:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Logging overhead benchmark.
+
+Measures the election latency with the log off, at INFO and at DEBUG, the level that writes a record per
+message, through the queue of configure_logging, and at DEBUG with a handler that writes from the threads of
+the election, as the prints did. The log is written to devnull.
+
+Run with: python -m benchmarks.bench_logging
+"""
+
+import argparse
+import logging
+from os import devnull
+from os.path import join
+from statistics import median
+from tempfile import TemporaryDirectory
+
+from benchmarks.local_cluster import run_election
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.log import StructuredFormatter, configure_logging, stop_logging
+from lib.network import Network
+
+LEVELS = ("off", "info", "debug", "debug-sync")
+
+
+def set_logging(level: str, stream) -> None:
+    """
+    Configures the log of a run.
+    """
+
+    if level == "off":
+        configure_logging(logging.CRITICAL, stream=stream)
+    elif level == "debug-sync":
+        stop_logging()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(StructuredFormatter())
+        logging.getLogger().addHandler(handler)
+        logging.getLogger().setLevel(logging.DEBUG)
+    else:
+        configure_logging(level.upper(), stream=stream)
+
+
+def reset_logging() -> None:
+    """
+    Removes the handlers of the previous run.
+    """
+
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.flush()
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the election latency at each log level")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=["random", "star"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100], help="Numbers of nodes")
+    parser.add_argument("--modes", nargs="+", choices=("threaded", "event-loop"), default=["threaded", "event-loop"])
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--runs", type=int, default=5, help="Elections per configuration, the median is reported")
+    parser.add_argument("--base-port", type=int, default=20000, help="First port used by the nodes")
+    args = parser.parse_args()
+
+    port = args.base_port
+
+    print(f"{'topology':<12}{'nodes':>7}{'mode':>12}{'log':>12}{'median (s)':>12}{'vs off':>8}")
+
+    with TemporaryDirectory() as directory, open(devnull, "w", encoding="utf-8") as stream:
+        for topology in args.topologies:
+            for size in args.sizes:
+                connections = generate_topology(topology, size)
+
+                for mode in args.modes:
+                    baseline = None
+
+                    for level in args.levels:
+                        times = []
+                        for run in range(args.runs):
+                            path = join(directory, f"{topology}-{size}-{mode}-{level}-{run}.json")
+                            write_network(connections, path, election_port=port)
+                            port += len(connections)
+
+                            set_logging(level, stream)
+                            try:
+                                result = run_election(Network(path), mode)
+                            finally:
+                                reset_logging()
+
+                            leaders = set(result["leaders"].values())
+                            if len(leaders) != 1:
+                                raise RuntimeError(f"Nodes disagree on the leader: {leaders}")
+
+                            times.append(result["elapsed"])
+
+                        latency = median(times)
+                        baseline = baseline or latency
+                        print(f"{topology:<12}{size:>7}{mode:>12}{level:>12}{latency:>12.4f}"
+                              f"{latency / baseline:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
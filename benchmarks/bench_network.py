@@ -0,0 +1,141 @@
+"""
+Network loader benchmark.
+
+Generates network files of up to hundreds of thousands of nodes and compares the validated, array-backed
+Network with the dict-based loader it replaced: load time, memory kept after loading and the time to look up
+the neighbors of every node.
+
+Run with: python -m benchmarks.bench_network
+"""
+
+import argparse
+import gc
+from json import dump, load
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from benchmarks.topology import TOPOLOGIES, generate_topology
+from lib.network import Network
+
+# Nodes sharing a host, so that every port of a large network is valid.
+NODES_PER_HOST = 1000
+
+
+class LegacyNetwork():
+
+    """
+    The loader before the validation: every node in dicts of tuples and the neighbors built on each call.
+    """
+
+    _nodes: dict[int, tuple[str, int, int]]
+    _connections: dict[int, list[int]]
+    _capacities: dict[int, float]
+
+    def __init__(self, network_file_path: str) -> None:
+        with open(network_file_path, "r", encoding="utf-8") as network_file:
+            network = load(network_file)
+
+        self._nodes = {}
+        self._capacities = {}
+        for node_id, data in network["nodes"].items():
+            self._nodes[int(node_id)] = (data["host"], data["election_port"], data["application_port"])
+            self._capacities[int(node_id)] = float(data.get("capacity", 1.0))
+
+        self._connections = {int(node_id): neighbors for node_id, neighbors in network["connections"].items()}
+
+    def get_node_ids(self) -> list[int]:
+        """
+        Returns the ids of the nodes.
+        """
+
+        return list(self._nodes.keys())
+
+    def get_election_neighbors(self, node_id: int) -> dict[int, tuple[str, int]]:
+        """
+        Returns the neighbors of a node.
+        """
+
+        return {neighbor_id: self._nodes[neighbor_id][:2] for neighbor_id in self._connections[node_id]}
+
+
+LOADERS = {
+    "legacy": LegacyNetwork,
+    "network": Network,
+}
+
+
+def write_large_network(connections: dict[int, list[int]], path: str) -> None:
+    """
+    Writes a network file, spreading the nodes over hosts of NODES_PER_HOST nodes each.
+    """
+
+    nodes = {}
+    for index, node_id in enumerate(sorted(connections)):
+        nodes[str(node_id)] = {
+            "host": f"10.0.{index // NODES_PER_HOST // 256}.{index // NODES_PER_HOST % 256}",
+            "election_port": 20000 + index % NODES_PER_HOST,
+            "application_port": 40000 + index % NODES_PER_HOST,
+        }
+
+    with open(path, "w", encoding="utf-8") as network_file:
+        dump({"nodes": nodes,
+              "connections": {str(node_id): neighbors for node_id, neighbors in connections.items()}},
+             network_file)
+
+
+def measure(loader, path: str, runs: int) -> dict:
+    """
+    Returns the best load time, the memory kept by the loaded network and the time of a neighbors sweep.
+    """
+
+    load_time = float("inf")
+    for _ in range(runs):
+        gc.collect()
+        started = perf_counter()
+        loader(path)
+        load_time = min(load_time, perf_counter() - started)
+
+    gc.collect()
+    start()
+    network = loader(path)
+    gc.collect()
+    kept_memory, _ = get_traced_memory()
+    stop()
+
+    started = perf_counter()
+    for node_id in network.get_node_ids():
+        network.get_election_neighbors(node_id)
+    sweep_time = perf_counter() - started
+
+    return {"load_time": load_time, "memory": kept_memory, "sweep_time": sweep_time}
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the network loaders")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=["random", "star"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Numbers of nodes")
+    parser.add_argument("--runs", type=int, default=3, help="Loads per file, the best one is reported")
+    args = parser.parse_args()
+
+    print(f"{'topology':<12}{'nodes':>8}{'loader':>9}{'load (s)':>10}{'memory (MB)':>13}{'neighbors (s)':>15}")
+
+    with TemporaryDirectory() as directory:
+        for topology in args.topologies:
+            for size in args.sizes:
+                path = join(directory, f"{topology}-{size}.json")
+                write_large_network(generate_topology(topology, size), path)
+
+                for name, loader in LOADERS.items():
+                    row = measure(loader, path, args.runs)
+                    print(f"{topology:<12}{size:>8}{name:>9}{row['load_time']:>10.3f}"
+                          f"{row['memory'] / 2 ** 20:>13.2f}{row['sweep_time']:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Micro-benchmark of the election wire protocol.
+
+Compares the legacy text messages ("be_my_parent 3", read with recv(1024) and split) with the framed
+binary protocol of lib.message, both as a pure codec and streamed through a socket pair.
+
+Run with: python -m benchmarks.bench_protocol
+"""
+
+import argparse
+from socket import socketpair
+from threading import Thread
+from time import perf_counter
+
+from lib.message import MessageReader, MessageType, encode_message
+
+LEGACY_MESSAGE = "be_my_parent"
+
+
+def legacy_codec(count: int) -> float:
+    """
+    Encodes and decodes count legacy messages, returning messages per second.
+    """
+
+    start = perf_counter()
+    for index in range(count):
+        data = f"{LEGACY_MESSAGE} {index}".encode("utf-8")
+        message, node_id = data.decode("utf-8").split()
+        int(node_id)
+
+    return count / (perf_counter() - start)
+
+
+def framed_codec(count: int, batch: int) -> float:
+    """
+    Encodes and decodes count framed messages, decoding batch frames per read, returning messages per second.
+    """
+
+    reader = MessageReader()
+    start = perf_counter()
+    decoded = 0
+    for _ in range(count // batch):
+        data = b"".join(encode_message(MessageType.CHILD_PARENTING_REQUEST, index, b"") for index in range(batch))
+        decoded += len(reader.feed(data))
+
+    assert decoded == count // batch * batch
+    return decoded / (perf_counter() - start)
+
+
+def legacy_stream(count: int) -> tuple[float, int]:
+    """
+    Streams count legacy messages through a socket pair.
+
+    Returns the messages per second and how many messages were lost because reads coalesced.
+    """
+
+    sender, receiver = socketpair()
+
+    def send() -> None:
+        for index in range(count):
+            sender.sendall(f"{LEGACY_MESSAGE} {index}".encode("utf-8"))
+        sender.close()
+
+    thread = Thread(target=send)
+    start = perf_counter()
+    thread.start()
+
+    received = 0
+    while True:
+        data = receiver.recv(1024)
+        if not data:
+            break
+        try:
+            _, node_id = data.decode("utf-8").split()
+            int(node_id)
+            received += 1
+        except ValueError:
+            # The original ConnectionManager drops the connection here.
+            pass
+
+    elapsed = perf_counter() - start
+    thread.join()
+    receiver.close()
+
+    return received / elapsed, count - received
+
+
+def framed_stream(count: int) -> tuple[float, int]:
+    """
+    Streams count framed messages through a socket pair.
+
+    Returns the messages per second and how many messages were lost.
+    """
+
+    sender, receiver = socketpair()
+
+    def send() -> None:
+        for index in range(count):
+            sender.sendall(encode_message(MessageType.CHILD_PARENTING_REQUEST, index))
+        sender.close()
+
+    thread = Thread(target=send)
+    reader = MessageReader()
+    start = perf_counter()
+    thread.start()
+
+    received = 0
+    while True:
+        messages = reader.receive(receiver)
+        if messages is None:
+            break
+        received += len(messages)
+
+    elapsed = perf_counter() - start
+    thread.join()
+    receiver.close()
+
+    return received / elapsed, count - received
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the election wire protocol")
+    parser.add_argument("--count", type=int, default=200_000, help="Messages per run")
+    parser.add_argument("--batch", type=int, default=16, help="Frames decoded per read in the codec benchmark")
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<24}{'messages/s':>14}{'lost':>10}")
+    print(f"{'legacy codec':<24}{legacy_codec(args.count):>14,.0f}{'-':>10}")
+    print(f"{'framed codec':<24}{framed_codec(args.count, args.batch):>14,.0f}{'-':>10}")
+
+    rate, lost = legacy_stream(args.count)
+    print(f"{'legacy stream':<24}{rate:>14,.0f}{lost:>10}")
+
+    rate, lost = framed_stream(args.count)
+    print(f"{'framed stream':<24}{rate:>14,.0f}{lost:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Failure recovery benchmark.
+
+Runs the election with heartbeats on each generated topology, crashes a node and measures how long the
+subtrees cut from the leader take to detect the failure and to agree on new leaders, and how many election
+messages (heartbeats not included) the recovery needed, compared with the first election.
+
+Run with: python -m benchmarks.bench_recovery
+"""
+
+import argparse
+from contextlib import redirect_stdout
+from os import devnull
+from os.path import join
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+
+from benchmarks.local_cluster import MODES, start_cluster
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.failure_detector import FAILURE_DETECTORS, FailureDetector, failure_detector_for
+from lib.network import Network
+
+VICTIMS = ("leader", "inner", "leaf")
+
+
+def choose_victim(kind: str, connections: dict[int, list[int]], leader_id: int, seed: int) -> int:
+    """
+    Returns the node to crash: the leader, a random node with two or more neighbors other than the leader, or a
+    random leaf. Falls back to the leader when there is no such node.
+    """
+
+    if kind == "inner":
+        candidates = [node_id for node_id, neighbors in connections.items()
+                      if len(neighbors) > 1 and node_id != leader_id]
+    elif kind == "leaf":
+        candidates = [node_id for node_id, neighbors in connections.items()
+                      if len(neighbors) == 1 and node_id != leader_id]
+    else:
+        candidates = []
+
+    return Random(seed).choice(sorted(candidates)) if candidates else leader_id
+
+
+def components_without(connections: dict[int, list[int]], victim_id: int) -> list[set[int]]:
+    """
+    Returns the connected components of the tree once victim_id is removed.
+    """
+
+    components = []
+    seen = {victim_id}
+
+    for neighbor_id in connections[victim_id]:
+        component = {neighbor_id}
+        stack = [neighbor_id]
+        while stack:
+            for next_id in connections[stack.pop()]:
+                if next_id not in seen and next_id not in component:
+                    component.add(next_id)
+                    stack.append(next_id)
+
+        seen |= component
+        components.append(component)
+
+    return components
+
+
+def election_messages(stats: dict) -> int:
+    """
+    Returns the messages a node sent, heartbeats not included.
+    """
+
+    return stats["messages_sent"] - stats["heartbeats_sent"]
+
+
+def run(connections: dict[int, list[int]],
+        network: Network,
+        victim: str,
+        event_loop: bool,
+        heartbeat_interval: float,
+        make_detector: Callable[[], FailureDetector],
+        seed: int) -> dict:
+    """
+    Elects a leader, crashes the victim and waits for the re-elections.
+    """
+
+    start, leaders, managers = start_cluster(network,
+                                             event_loop,
+                                             {"heartbeat_interval": heartbeat_interval},
+                                             lambda node_id: {"failure_detector": make_detector()})
+
+    try:
+        elected_at = max(manager.get_stats()["leader_known_at"] for manager in managers.values())
+        leader_id = leaders[network.get_election_starter_id()]
+        victim_id = choose_victim(victim, connections, leader_id, seed)
+
+        # The subtrees that do not contain the leader lose it; if the leader crashes, all of them do.
+        affected = [component for component in components_without(connections, victim_id)
+                    if leader_id not in component]
+
+        messages_before = {node_id: election_messages(manager.get_stats()) for node_id, manager in managers.items()}
+
+        crashed_at = perf_counter()
+        managers[victim_id].close()
+
+        new_leaders = []
+        for component in affected:
+            component_leaders = {managers[node_id].wait_for_leader_change(leader_id, 60.0) for node_id in component}
+
+            if len(component_leaders) != 1 or not component_leaders <= component:
+                raise RuntimeError(f"The component {sorted(component)} elected {component_leaders}")
+
+            new_leaders.append(component_leaders.pop())
+
+        survivors = {node_id: manager for node_id, manager in managers.items() if node_id != victim_id}
+        stats = [survivors[node_id].get_stats() for component in affected for node_id in component]
+
+        return {
+            "victim": victim_id,
+            "election_time": elected_at - start,
+            "election_messages": sum(messages_before.values()),
+            "affected_nodes": sum(len(component) for component in affected),
+            "new_leaders": len(new_leaders),
+            "detection_time": min((node_stats["recovery_started_at"] for node_stats in stats), default=crashed_at)
+                              - crashed_at,
+            "recovery_time": max((node_stats["leader_known_at"] for node_stats in stats), default=crashed_at)
+                             - crashed_at,
+            "recovery_messages": sum(election_messages(manager.get_stats()) - messages_before[node_id]
+                                     for node_id, manager in survivors.items()),
+            "untouched_recoveries": sum(manager.get_stats()["recoveries"] for node_id, manager in survivors.items()
+                                        if not any(node_id in component for component in affected)),
+        }
+    finally:
+        for manager in managers.values():
+            manager.close()
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the recovery from a node failure")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50], help="Numbers of nodes")
+    parser.add_argument("--mode", choices=MODES[:2], default="threaded",
+                        help="How the nodes are run, the asyncio nodes have no heartbeats")
+    parser.add_argument("--victim", choices=VICTIMS, default="leader", help="Which node crashes")
+    parser.add_argument("--detector", choices=FAILURE_DETECTORS, default="timeout", help="The failure detector")
+    parser.add_argument("--heartbeat", type=float, default=0.05, help="Seconds between heartbeats")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per topology and size")
+    parser.add_argument("--base-port", type=int, default=12000, help="First election port used by the nodes")
+    parser.add_argument("--last-port", type=int, default=20000, help="Last election port used by the nodes")
+    args = parser.parse_args()
+
+    def make_detector() -> FailureDetector:
+        return failure_detector_for(args.detector, args.heartbeat)
+
+    port = args.base_port
+
+    print(f"{'topology':<12}{'nodes':>7}{'run':>5}{'victim':>8}{'election (s)':>14}{'messages':>10}"
+          f"{'affected':>10}{'leaders':>9}{'detect (s)':>12}{'recover (s)':>13}{'messages':>10}{'untouched':>11}")
+
+    with TemporaryDirectory() as directory:
+        for topology in args.topologies:
+            for size in args.sizes:
+                connections = generate_topology(topology, size)
+                path = join(directory, f"{topology}-{size}.json")
+
+                for run_index in range(args.runs):
+                    # Listening ports may linger for a moment after a run, so each run gets a fresh range.
+                    if port + len(connections) > args.last_port:
+                        port = args.base_port
+
+                    write_network(connections, path, election_port=port)
+                    network = Network(path)
+                    port += len(connections)
+
+                    with open(devnull, "w", encoding="utf-8") as output, redirect_stdout(output):
+                        row = run(connections, network, args.victim, args.mode == "event-loop", args.heartbeat,
+                                  make_detector, run_index)
+
+                    print(f"{topology:<12}{len(connections):>7}{run_index:>5}{row['victim']:>8}"
+                          f"{row['election_time']:>14.3f}{row['election_messages']:>10}{row['affected_nodes']:>10}"
+                          f"{row['new_leaders']:>9}{row['detection_time']:>12.3f}{row['recovery_time']:>13.3f}"
+                          f"{row['recovery_messages']:>10}{row['untouched_recoveries']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Restart benchmark.
+
+Runs the election on each generated topology with the election state persisted, then restarts the whole
+network and measures how long the nodes take to confirm the persisted election and how many messages it
+needs, compared with the first election. A last restart removes the state of one node, so the confirmation
+fails and the nodes fall back to a new election, after the confirmation timeout when the node is a leaf.
+
+Run with: python -m benchmarks.bench_restart
+"""
+
+import argparse
+from contextlib import redirect_stdout
+from os import devnull, remove
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from benchmarks.local_cluster import MODES, start_cluster
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.election_state import ElectionStateStore
+from lib.network import Network
+
+RESTARTS = ("cold", "confirmed", "fallback")
+
+
+def run(network: Network, event_loop: bool, state_dir: str, confirmation_timeout: float) -> dict:
+    """
+    Runs the election, or its confirmation, with every node persisting its state in state_dir.
+    """
+
+    def node_options(node_id: int) -> dict:
+        return {"state_store": ElectionStateStore(join(state_dir, f"node-{node_id}.json"),
+                                                  network.get_topology_hash())}
+
+    start, leaders, managers = start_cluster(network,
+                                             event_loop,
+                                             {"confirmation_timeout": confirmation_timeout},
+                                             node_options)
+    stats = [manager.get_stats() for manager in managers.values()]
+
+    if len(set(leaders.values())) != 1:
+        raise RuntimeError(f"The nodes disagree on the leader: {leaders}")
+
+    return {
+        "leader": leaders[network.get_election_starter_id()],
+        "elapsed": max(node_stats["leader_known_at"] for node_stats in stats) - start,
+        "messages": sum(node_stats["messages_sent"] for node_stats in stats),
+        "epoch": max(node_stats["epoch"] for node_stats in stats),
+        "confirmed": sum(node_stats["confirmed"] for node_stats in stats),
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the restart from a persisted election")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50], help="Numbers of nodes")
+    parser.add_argument("--mode", choices=MODES[:2], default="threaded",
+                        help="How the nodes are run, the asyncio nodes do not persist their state")
+    parser.add_argument("--confirmation-timeout", type=float, default=1.0,
+                        help="Seconds before a failed confirmation falls back to the election")
+    parser.add_argument("--base-port", type=int, default=12000, help="First election port used by the nodes")
+    parser.add_argument("--last-port", type=int, default=20000, help="Last election port used by the nodes")
+    args = parser.parse_args()
+
+    port = args.base_port
+
+    print(f"{'topology':<12}{'nodes':>7}{'restart':>11}{'leader':>8}{'epoch':>7}{'confirmed':>11}"
+          f"{'time (s)':>10}{'messages':>10}")
+
+    with TemporaryDirectory() as directory:
+        for topology in args.topologies:
+            for size in args.sizes:
+                connections = generate_topology(topology, size)
+                path = join(directory, f"{topology}-{size}.json")
+                state_dir = join(directory, f"{topology}-{size}-state")
+
+                for restart in RESTARTS:
+                    if restart != "cold":
+                        # The threaded accept loops poll their listening socket every second and hold it until
+                        # they wake up, so the restarted nodes wait for the ports to be released.
+                        sleep(1.5)
+
+                    if restart == "fallback":
+                        remove(join(state_dir, f"node-{max(connections)}.json"))
+
+                    # The persisted state is tied to the topology, ports included, so only the first run of
+                    # each network gets a fresh range and the restarts reuse it.
+                    if restart == "cold":
+                        if port + len(connections) > args.last_port:
+                            port = args.base_port
+                        write_network(connections, path, election_port=port)
+                        port += len(connections)
+
+                    with open(devnull, "w", encoding="utf-8") as output, redirect_stdout(output):
+                        row = run(Network(path), args.mode == "event-loop", state_dir, args.confirmation_timeout)
+
+                    print(f"{topology:<12}{len(connections):>7}{restart:>11}{row['leader']:>8}{row['epoch']:>7}"
+                          f"{row['confirmed']:>11}{row['elapsed']:>10.3f}{row['messages']:>10}")
+
+
+if __name__ == "__main__":
+    main()
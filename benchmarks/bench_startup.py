@@ -0,0 +1,99 @@
+"""
+Node startup benchmark.
+
+Measures what a node pays at startup to learn its address, neighbors, capacity and the starter id, reading the
+whole network.json with the previous loader or with Network, or reading only its records from a topology index.
+
+Run with: python -m benchmarks.bench_startup
+"""
+
+import argparse
+import gc
+from os.path import getsize, join
+from random import Random
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from benchmarks.bench_network import LegacyNetwork, write_large_network
+from benchmarks.topology import TOPOLOGIES, generate_topology
+from lib.network import Network
+from lib.topology_index import TopologyIndex, write_topology_index
+
+
+def start_node(loader, path: str, node_id: int) -> None:
+    """
+    Reads what a node needs to start.
+    """
+
+    network = loader(path)
+
+    if isinstance(network, LegacyNetwork):
+        network.get_election_neighbors(node_id)
+        min(network.get_node_ids())
+        return
+
+    network.get_node_election_address(node_id)
+    network.get_election_neighbors(node_id)
+    network.get_node_capacity(node_id)
+    network.get_election_starter_id()
+
+    if isinstance(network, TopologyIndex):
+        network.close()
+
+
+def measure(loader, path: str, node_ids: list[int]) -> dict:
+    """
+    Returns the median startup time and the peak memory of a startup.
+    """
+
+    times = []
+    for node_id in node_ids:
+        gc.collect()
+        started = perf_counter()
+        start_node(loader, path, node_id)
+        times.append(perf_counter() - started)
+
+    gc.collect()
+    start()
+    start_node(loader, path, node_ids[0])
+    _, peak_memory = get_traced_memory()
+    stop()
+
+    return {"time": median(times), "memory": peak_memory}
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the startup of a node in large networks")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=["random"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 100000],
+                        help="Numbers of nodes")
+    parser.add_argument("--nodes", type=int, default=5, help="Nodes started per network, the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'topology':<12}{'nodes':>8}{'format':>9}{'file (MB)':>11}{'startup (ms)':>14}{'peak memory (MB)':>18}")
+
+    with TemporaryDirectory() as directory:
+        for topology in args.topologies:
+            for size in args.sizes:
+                json_path = join(directory, f"{topology}-{size}.json")
+                index_path = join(directory, f"{topology}-{size}.idx")
+                write_large_network(generate_topology(topology, size), json_path)
+                write_topology_index(Network(json_path), index_path)
+                node_ids = Random(size).sample(range(size), min(args.nodes, size))
+
+                for name, loader, path in (("legacy", LegacyNetwork, json_path),
+                                           ("network", Network, json_path),
+                                           ("index", TopologyIndex, index_path)):
+                    row = measure(loader, path, node_ids)
+                    print(f"{topology:<12}{size:>8}{name:>9}{getsize(path) / 2 ** 20:>11.2f}"
+                          f"{row['time'] * 1000:>14.3f}{row['memory'] / 2 ** 20:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
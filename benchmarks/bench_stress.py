@@ -0,0 +1,123 @@
+"""
+Election stress benchmark.
+
+Runs thousands of small elections in a loop, each one over a freshly generated tree, and reports the tail of
+the time until every node knew the leader. An election whose nodes do not all know the leader before the
+timeout counts as a hang, and the states of its nodes are printed, so a node stuck waiting for a message
+that already arrived shows up instead of hiding in the mean.
+
+Run with: python -m benchmarks.bench_stress
+"""
+
+import argparse
+from os.path import join
+from statistics import mean, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.contention import CONTENTION_POLICIES
+from lib.election import ElectionProtocolManager
+from lib.network import Network
+
+
+def run(network: Network, event_loop: bool, contention: str, timeout: float) -> dict:
+    """
+    Runs an election and returns its latency, or the states of the nodes if it did not end in timeout seconds.
+    """
+
+    managers = {}
+    for node_id in network.get_node_ids():
+        host, port = network.get_node_election_address(node_id)
+        managers[node_id] = ElectionProtocolManager(node_id, host, port, network.get_election_neighbors(node_id),
+                                                    event_loop,
+                                                    contention_policy=CONTENTION_POLICIES[contention]())
+
+    for manager in managers.values():
+        manager.start_server()
+
+    start = perf_counter()
+    managers[network.get_election_starter_id()].start_election(block_until_result=False)
+
+    try:
+        leaders = {manager.wait_for_election(max(0.0, start + timeout - perf_counter()))
+                   for manager in managers.values()}
+    except TimeoutError:
+        states = {node_id: manager.get_state().value for node_id, manager in managers.items()}
+        for manager in managers.values():
+            manager.close()
+        return {"hung": True, "states": states}
+
+    if len(leaders) != 1:
+        raise RuntimeError(f"The nodes disagree on the leader: {leaders}")
+
+    stats = [manager.get_stats() for manager in managers.values()]
+
+    return {
+        "hung": False,
+        "elapsed": max(node_stats["leader_known_at"] for node_stats in stats) - start,
+        "contention_rounds": max(node_stats["contention_rounds"] for node_stats in stats),
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Run many elections in a loop and report the tail latency")
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=["random", "star", "line"])
+    parser.add_argument("--nodes", type=int, default=8, help="Nodes of each election")
+    parser.add_argument("--elections", type=int, default=2000, help="Elections per topology and mode")
+    parser.add_argument("--modes", nargs="+", choices=("threaded", "event-loop"), default=["threaded", "event-loop"])
+    parser.add_argument("--contention", choices=CONTENTION_POLICIES, default="exponential",
+                        help="The root contention resolution policy")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds after which an election hung")
+    parser.add_argument("--base-port", type=int, default=12000, help="First election port used by the nodes")
+    parser.add_argument("--last-port", type=int, default=20000, help="Last election port used by the nodes")
+    args = parser.parse_args()
+
+    port = args.base_port
+
+    print(f"{'topology':<12}{'mode':>12}{'elections':>11}{'hung':>6}{'mean (ms)':>11}{'p50':>9}{'p90':>9}"
+          f"{'p99':>9}{'p99.9':>9}{'max':>9}{'contention':>12}")
+
+    with TemporaryDirectory() as directory:
+        path = join(directory, "network.json")
+
+        for topology in args.topologies:
+            for mode in args.modes:
+                elapsed = []
+                contention_rounds = 0
+                hangs = 0
+
+                for _ in range(args.elections):
+                    # Listening ports may linger for a moment after an election, so each one gets fresh ports.
+                    if port + args.nodes > args.last_port:
+                        port = args.base_port
+
+                    write_network(generate_topology(topology, args.nodes), path, election_port=port)
+                    port += args.nodes
+
+                    result = run(Network(path), mode == "event-loop", args.contention, args.timeout)
+                    if result["hung"]:
+                        hangs += 1
+                        print(f"Hung election, node states: {result['states']}")
+                        continue
+
+                    elapsed.append(result["elapsed"] * 1000)
+                    contention_rounds = max(contention_rounds, result["contention_rounds"])
+
+                if len(elapsed) < 2:
+                    print(f"{topology:<12}{mode:>12}{args.elections:>11}{hangs:>6}")
+                    continue
+
+                percentiles = quantiles(elapsed, n=1000, method="inclusive")
+                print(f"{topology:<12}{mode:>12}{args.elections:>11}{hangs:>6}"
+                      f"{mean(elapsed):>11.3f}{percentiles[499]:>9.3f}{percentiles[899]:>9.3f}"
+                      f"{percentiles[989]:>9.3f}{percentiles[998]:>9.3f}{max(elapsed):>9.3f}"
+                      f"{contention_rounds:>12}")
+
+
+if __name__ == "__main__":
+    main()
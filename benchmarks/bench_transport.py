@@ -0,0 +1,146 @@
+"""
+Round trip, throughput and election latency of the election transports.
+
+An echo server in another process answers each heartbeat with a ready message, which gives the round trip of a
+small frame, and then drains a stream of data frames, which gives the throughput. Both are measured over a
+fresh connection per transport. The election part writes the same topology with every node on one transport
+and reports the median time until every node knew the leader.
+
+Run with: python -m benchmarks.bench_transport
+"""
+
+import argparse
+from multiprocessing import Process
+from os.path import join
+from socket import timeout
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks.local_cluster import run_election
+from benchmarks.topology import TOPOLOGIES, generate_topology, write_network
+from lib.message import MessageReader, MessageType, encode_message
+from lib.network import Network
+from lib.socket_manager import connect_with_backoff
+from lib.transport import TRANSPORTS
+
+
+def echo_server(transport: str, address: tuple[str, int]) -> None:
+    """
+    Accepts a single connection, answers every heartbeat and reads until the connection is closed.
+    """
+
+    listener = TRANSPORTS[transport]().bind(address)
+    listener.listen(1)
+    connection, _ = listener.accept()
+    reader = MessageReader()
+    ready = encode_message(MessageType.READY, 0)
+
+    try:
+        while True:
+            try:
+                messages = reader.receive(connection)
+            except timeout:
+                # An accepted shared memory connection reads the handshake of the client first.
+                continue
+
+            if messages is None:
+                break
+
+            for message in messages:
+                if message.message_type == MessageType.HEARTBEAT:
+                    connection.sendall(ready)
+    finally:
+        connection.close()
+        listener.close()
+
+
+def measure_link(transport: str, address: tuple[str, int], round_trips: int, frames: int, frame_size: int) -> dict:
+    """
+    Returns the median round trip of a heartbeat and the throughput of a stream of data frames.
+    """
+
+    server = Process(target=echo_server, args=(transport, address))
+    server.start()
+
+    connection = connect_with_backoff(address, 30.0, transport=TRANSPORTS[transport]())
+    reader = MessageReader()
+    heartbeat = encode_message(MessageType.HEARTBEAT, 1)
+    frame = encode_message(MessageType.DATA, 1, b"x" * frame_size)
+
+    try:
+        samples = []
+        for _ in range(round_trips):
+            start = perf_counter()
+            connection.sendall(heartbeat)
+            while not reader.receive(connection):
+                pass
+            samples.append(perf_counter() - start)
+
+        start = perf_counter()
+        for _ in range(frames):
+            connection.sendall(frame)
+    finally:
+        connection.close()
+
+    # The stream only counts as delivered once the server read it all and left.
+    server.join()
+    elapsed = perf_counter() - start
+
+    return {"round_trip": median(samples), "throughput": frames * len(frame) / elapsed}
+
+
+def measure_election(transport: str, topology: str, nodes: int, repetitions: int, port: int) -> float:
+    """
+    Returns the median time until every node knew the leader with every node on the transport.
+    """
+
+    elapsed = []
+
+    with TemporaryDirectory() as directory:
+        path = join(directory, "network.json")
+
+        for repetition in range(repetitions):
+            # Listening ports may linger for a moment after an election, so each one gets fresh ports.
+            write_network(generate_topology(topology, nodes), path, election_port=port + repetition * nodes,
+                          transport=transport)
+            result = run_election(Network(path), "threaded")
+
+            if len(set(result["leaders"].values())) != 1:
+                raise RuntimeError(f"The nodes disagree on the leader: {result['leaders']}")
+
+            elapsed.append(result["elapsed"])
+
+    return median(elapsed)
+
+
+def main() -> None:
+    """
+    Runs the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description="Compare the election transports")
+    parser.add_argument("--transports", choices=TRANSPORTS, nargs="+", default=list(TRANSPORTS))
+    parser.add_argument("--round-trips", type=int, default=5000, help="Heartbeats timed per transport")
+    parser.add_argument("--frames", type=int, default=5000, help="Data frames streamed per transport")
+    parser.add_argument("--frame-size", type=int, default=60000, help="Payload bytes of each data frame")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="random")
+    parser.add_argument("--nodes", type=int, default=100, help="Nodes of the election network")
+    parser.add_argument("--repetitions", type=int, default=5, help="Elections per transport")
+    parser.add_argument("--base-port", type=int, default=24000, help="First port used by the benchmark")
+    args = parser.parse_args()
+
+    print(f"{'transport':>10}{'round trip (us)':>17}{'throughput (MB/s)':>19}{'election (ms)':>15}")
+
+    port = args.base_port
+    for transport in args.transports:
+        link = measure_link(transport, ("localhost", port), args.round_trips, args.frames, args.frame_size)
+        election = measure_election(transport, args.topology, args.nodes, args.repetitions, port + 1)
+        port += 1 + args.nodes * args.repetitions
+
+        print(f"{transport:>10}{link['round_trip'] * 1e6:>17.1f}{link['throughput'] / 1e6:>19.0f}"
+              f"{election * 1000:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Helpers to run a whole election network inside a single process.
+"""
+
+import asyncio
+import sys
+from contextlib import redirect_stdout
+from os import devnull
+from time import perf_counter
+from typing import Callable
+
+from lib.election import AsyncElectionProtocolManager, ElectionProtocolManager
+from lib.network import Network
+from lib.transport import node_transports
+
+MODES = ("threaded", "event-loop", "async")
+
+
+def _result(start: float, leaders: dict[int, int], managers: dict) -> dict:
+    """
+    Builds the result of an election from the managers stats.
+    """
+
+    elapsed = perf_counter() - start
+    stats = {node_id: manager.get_stats() for node_id, manager in managers.items()}
+
+    return {
+        "start": start,
+        "elapsed": elapsed,
+        "leaders": leaders,
+        "stats": stats,
+    }
+
+
+def start_cluster(network: Network,
+                  event_loop: bool,
+                  options: dict,
+                  node_options: Callable[[int], dict] | None = None) -> tuple[float, dict[int, int], dict]:
+    """
+    Runs the election with one ElectionProtocolManager per node and returns when it started, the leader seen
+    by each node and the managers, which the caller closes if they keep their connections.
+
+    node_options returns the options of a single node, for the ones that cannot be shared, like the failure
+    detectors.
+    """
+
+    managers = {}
+    for node_id in network.get_node_ids():
+        host, port = network.get_node_election_address(node_id)
+        neighbors = network.get_election_neighbors(node_id)
+        capacity = network.get_node_capacity(node_id)
+        extra_options = node_options(node_id) if node_options is not None else {}
+        if options.get("datagram") is None:
+            transport, neighbor_transports = node_transports(network, node_id)
+            extra_options = {"transport": transport, "neighbor_transports": neighbor_transports, **extra_options}
+        managers[node_id] = ElectionProtocolManager(node_id, host, port, neighbors, event_loop,
+                                                    capacity=capacity, **options, **extra_options)
+
+    for manager in managers.values():
+        manager.start_server(0)
+
+    starter_id = network.get_election_starter_id()
+    start = perf_counter()
+    leaders = {starter_id: managers[starter_id].start_election()}
+
+    for node_id, manager in managers.items():
+        if node_id != starter_id:
+            leaders[node_id] = manager.wait_for_election()
+
+    return start, leaders, managers
+
+
+def _run_threaded(network: Network, event_loop: bool, options: dict) -> dict:
+    """
+    Runs the election with one ElectionProtocolManager per node.
+    """
+
+    return _result(*start_cluster(network, event_loop, options))
+
+
+async def _run_async(network: Network, timeout: float, options: dict) -> dict:
+    """
+    Runs the election with one AsyncElectionProtocolManager per node, all in the running event loop.
+    """
+
+    managers = {}
+    for node_id in network.get_node_ids():
+        host, port = network.get_node_election_address(node_id)
+        neighbors = network.get_election_neighbors(node_id)
+        capacity = network.get_node_capacity(node_id)
+        managers[node_id] = AsyncElectionProtocolManager(node_id, host, port, neighbors, capacity=capacity, **options)
+
+    for manager in managers.values():
+        await manager.start_server()
+
+    starter_id = network.get_election_starter_id()
+    start = perf_counter()
+
+    try:
+        results = await asyncio.gather(*(
+            manager.start_election(timeout) if node_id == starter_id else manager.wait_for_election(timeout)
+            for node_id, manager in managers.items()
+        ))
+        # Like the threaded nodes, the nodes only close their connections once their subtree acknowledged.
+        await asyncio.gather(*(manager.wait_for_network_ready(timeout) for manager in managers.values()))
+        return _result(start, dict(zip(managers, results)), managers)
+    finally:
+        for manager in managers.values():
+            await manager.close()
+
+
+def run_election(network: Network,
+                 mode: str = "threaded",
+                 timeout: float = 120.0,
+                 quiet: bool = True,
+                 **options) -> dict:
+    """
+    Runs an election with every node of the network in this process.
+
+    The options are passed to every election protocol manager, the capacities are read from the network.
+
+    The node returned by get_election_starter_id starts the election. Returns a dict with the perf_counter
+    value when the election started, the time until every node knew the leader, the leader seen by each node
+    and the stats of each node.
+    """
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}, expected one of {', '.join(MODES)}")
+
+    output = open(devnull, "w", encoding="utf-8") if quiet else sys.stdout
+
+    try:
+        with redirect_stdout(output):
+            if mode == "async":
+                return asyncio.run(_run_async(network, timeout, options))
+
+            return _run_threaded(network, mode == "event-loop", options)
+    finally:
+        if quiet:
+            output.close()
+
+
+def raise_file_limit() -> int | None:
+    """
+    Raises the soft limit of open files to the hard limit and returns it, or None if it is unknown.
+    """
+
+    try:
+        from resource import RLIM_INFINITY, RLIMIT_NOFILE, getrlimit, setrlimit
+    except ImportError:
+        return None
+
+    _, hard = getrlimit(RLIMIT_NOFILE)
+    setrlimit(RLIMIT_NOFILE, (hard, hard))
+
+    return None if hard == RLIM_INFINITY else hard
+
+
+def required_file_descriptors(nodes: int) -> int:
+    """
+    Returns an estimate of the descriptors used by a network running in one process.
+
+    Every node listens on a socket and every tree edge is connected by two sockets.
+    """
+
+    return nodes + 2 * (nodes - 1) + 64
@@ -0,0 +1,155 @@
+"""
+Generator of tree topologies in the network.json format.
+
+Run with: python -m benchmarks.topology <kind> <nodes> -o <network.json>
+"""
+
+import argparse
+from json import dump
+from random import Random
+
+from lib.transport import TRANSPORTS
+
+TOPOLOGIES = ("line", "star", "kary", "caterpillar", "random")
+
+
+def _connect(edges: list[tuple[int, int]], nodes: int) -> dict[int, list[int]]:
+    """
+    Returns the adjacency lists of an undirected edge list.
+    """
+
+    connections = {node_id: [] for node_id in range(nodes)}
+    for first, second in edges:
+        connections[first].append(second)
+        connections[second].append(first)
+
+    return connections
+
+
+def line_topology(nodes: int) -> dict[int, list[int]]:
+    """
+    Returns a path 0 - 1 - ... - nodes-1.
+    """
+
+    return _connect([(node_id - 1, node_id) for node_id in range(1, nodes)], nodes)
+
+
+def star_topology(leaves: int) -> dict[int, list[int]]:
+    """
+    Returns a star with the node 0 at the center.
+    """
+
+    return _connect([(0, leaf_id) for leaf_id in range(1, leaves + 1)], leaves + 1)
+
+
+def kary_topology(nodes: int, arity: int = 2) -> dict[int, list[int]]:
+    """
+    Returns a balanced k-ary tree rooted at the node 0.
+    """
+
+    return _connect([((node_id - 1) // arity, node_id) for node_id in range(1, nodes)], nodes)
+
+
+def caterpillar_topology(nodes: int, legs: int = 2) -> dict[int, list[int]]:
+    """
+    Returns a caterpillar: a line (the spine) where every spine node has legs leaves attached.
+    """
+
+    spine = max(1, nodes // (legs + 1))
+    edges = [(node_id - 1, node_id) for node_id in range(1, spine)]
+    edges += [(min(index // legs, spine - 1), spine + index) for index in range(nodes - spine)]
+
+    return _connect(edges, nodes)
+
+
+def random_topology(nodes: int, seed: int = 0) -> dict[int, list[int]]:
+    """
+    Returns a random recursive tree: every node is attached to a uniformly chosen earlier node.
+    """
+
+    random = Random(seed)
+
+    return _connect([(random.randrange(node_id), node_id) for node_id in range(1, nodes)], nodes)
+
+
+def generate_topology(kind: str, nodes: int, seed: int = 0) -> dict[int, list[int]]:
+    """
+    Returns the connections of a topology with the given number of nodes.
+    """
+
+    match kind:
+        case "line":
+            return line_topology(nodes)
+        case "star":
+            return star_topology(nodes - 1)
+        case "kary":
+            return kary_topology(nodes)
+        case "caterpillar":
+            return caterpillar_topology(nodes)
+        case "random":
+            return random_topology(nodes, seed)
+
+    raise ValueError(f"Unknown topology {kind}, expected one of {', '.join(TOPOLOGIES)}")
+
+
+def network_description(connections: dict[int, list[int]],
+                        host: str = "localhost",
+                        election_port: int = 20000,
+                        application_port: int = 40000,
+                        transport: str = "tcp") -> dict:
+    """
+    Returns the network.json description of a topology, the ports are assigned sequentially and every node
+    listens on the transport.
+    """
+
+    nodes = {}
+    for index, node_id in enumerate(sorted(connections)):
+        nodes[str(node_id)] = {
+            "host": host,
+            "election_port": election_port + index,
+            "application_port": application_port + index,
+        }
+        if transport != "tcp":
+            nodes[str(node_id)]["transport"] = transport
+
+    return {
+        "nodes": nodes,
+        "connections": {str(node_id): neighbors for node_id, neighbors in connections.items()},
+    }
+
+
+def write_network(connections: dict[int, list[int]], path: str, **ports) -> None:
+    """
+    Writes the network.json of a topology.
+    """
+
+    with open(path, "w", encoding="utf-8") as network_file:
+        dump(network_description(connections, **ports), network_file)
+
+
+def main() -> None:
+    """
+    Generates a network file.
+    """
+
+    parser = argparse.ArgumentParser(description="Generate a tree topology in the network.json format")
+    parser.add_argument("kind", choices=TOPOLOGIES, help="The shape of the tree")
+    parser.add_argument("nodes", type=int, help="The number of nodes")
+    parser.add_argument("-o", "--output", default="network.json", help="The output file")
+    parser.add_argument("--host", default="localhost", help="The host of every node")
+    parser.add_argument("--election-port", type=int, default=20000, help="The election port of the first node")
+    parser.add_argument("--application-port", type=int, default=40000, help="The application port of the first node")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of random trees")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="tcp", help="The transport of every node")
+    args = parser.parse_args()
+
+    write_network(generate_topology(args.kind, args.nodes, args.seed),
+                  args.output,
+                  host=args.host,
+                  election_port=args.election_port,
+                  application_port=args.application_port,
+                  transport=args.transport)
+
+
+if __name__ == "__main__":
+    main()
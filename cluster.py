@@ -0,0 +1,372 @@
+"""
+Launches every node of a network on this machine.
+
+The nodes are spread over worker processes, each running its nodes in threads. The launcher waits until every
+node that waits for the election answers a readiness probe, triggers the election on the starter and collects
+the leader and the counters of every node, stopping the cluster as soon as two nodes disagree on the leader.
+
+By default the nodes only run the election library; with --application each node runs the Application, data
+phase included.
+
+Run with: python cluster.py --network config/network.json --processes 4
+"""
+
+import argparse
+import multiprocessing
+from json import dump
+from os import cpu_count
+from os.path import join
+from queue import Empty
+from threading import Thread
+from time import monotonic, perf_counter, time
+
+from application import Application
+from lib.data_plane import DataPlaneOptions
+from lib.election import ElectionProtocolManager
+from lib.log import configure_logging
+from lib.network import Network
+from lib.placement import PLACEMENT_POLICIES
+from lib.socket_manager import probe_server
+from lib.topology_index import TopologyIndex, load_network
+from lib.transport import TRANSPORTS, node_transports
+
+
+class ClusterError(RuntimeError):
+
+    """
+    Raised when a node fails or the nodes disagree on the leader.
+    """
+
+
+def node_report(node_id: int, leader_id: int, stats: dict) -> tuple:
+    """
+    Returns the report of a node that knows the leader, with the times it learned it and its subtree
+    acknowledged it as wall clock times, which the launcher can compare across processes.
+    """
+
+    known_at = time() - (perf_counter() - stats["leader_known_at"])
+    ready_at = None
+    if stats["network_ready_at"] is not None:
+        ready_at = time() - (perf_counter() - stats["network_ready_at"])
+
+    return ("leader", node_id, leader_id, {
+        "known_at": known_at,
+        "ready_at": ready_at,
+        "leader_distance": stats["leader_distance"],
+        "messages_sent": stats["messages_sent"],
+        "bytes_sent": stats["bytes_sent"],
+        "contention_rounds": stats["contention_rounds"],
+    })
+
+
+def run_election_node(node_id: int, manager: ElectionProtocolManager, starter: bool, trigger, results) -> None:
+    """
+    Runs the election of a node, the starter once the launcher triggers it, and reports its leader.
+    """
+
+    try:
+        if starter:
+            trigger.wait()
+            leader_id = manager.start_election()
+        else:
+            leader_id = manager.wait_for_election()
+        manager.wait_for_network_ready()
+
+        results.put(node_report(node_id, leader_id, manager.get_stats()))
+        results.put(("finished", node_id))
+    except Exception as exception:
+        results.put(("error", node_id, repr(exception)))
+
+
+def run_application_node(node_id: int, application: Application, starter: bool, trigger, results) -> None:
+    """
+    Runs the Application of a node, the starter once the launcher triggers it, reporting its leader as soon as
+    it is known and again when the application finishes.
+    """
+
+    def report_leader() -> None:
+        leader_id = application.wait_for_leader()
+        application.wait_for_network_ready()
+        results.put(node_report(node_id, leader_id, application.get_stats()))
+
+    try:
+        if starter:
+            trigger.wait()
+
+        reporter = Thread(target=report_leader, daemon=True)
+        reporter.start()
+        application.start()
+        reporter.join()
+        results.put(("finished", node_id))
+    except Exception as exception:
+        results.put(("error", node_id, repr(exception)))
+
+
+def run_worker(node_ids: list[int], network_file_path: str, options: dict, trigger, results) -> None:
+    """
+    Runs the nodes of a worker process, one thread per node.
+    """
+
+    configure_logging(options["log_level"])
+    network = load_network(network_file_path)
+    starter_id = network.get_election_starter_id()
+    threads = []
+
+    for node_id in node_ids:
+        try:
+            node, target = start_node(node_id, network, network_file_path, options)
+        except Exception as exception:
+            # The nodes already started keep the process alive until the launcher stops it.
+            results.put(("error", node_id, repr(exception)))
+            return
+
+        threads.append(Thread(target=target, args=(node_id, node, node_id == starter_id, trigger, results)))
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
+def start_node(node_id: int, network: Network | TopologyIndex, network_file_path: str, options: dict) -> tuple:
+    """
+    Creates a node and the function that runs it; the election nodes start listening right away.
+    """
+
+    placement_policy = PLACEMENT_POLICIES[options["placement"]]
+
+    if options["application"]:
+        application = Application(node_id,
+                                  network_file_path,
+                                  event_loop=options["event_loop"],
+                                  placement_policy=placement_policy(),
+                                  convergecast=options["convergecast"],
+                                  reuse_connections=options["reuse_connections"],
+                                  data_plane=DataPlaneOptions() if options["data_plane"] else None)
+        return application, run_application_node
+
+    host, port = network.get_node_election_address(node_id)
+    transport, neighbor_transports = node_transports(network, node_id)
+    manager = ElectionProtocolManager(node_id,
+                                      host,
+                                      port,
+                                      network.get_election_neighbors(node_id),
+                                      options["event_loop"],
+                                      capacity=network.get_node_capacity(node_id),
+                                      placement_policy=placement_policy(),
+                                      transport=transport,
+                                      neighbor_transports=neighbor_transports)
+    manager.start_server()
+
+    return manager, run_election_node
+
+
+def check_workers(workers: list, results=None) -> None:
+    """
+    Raises ClusterError if a worker process failed or, before the election is triggered, when results has the
+    report of a node that could not start, the only report sent so early.
+    """
+
+    if results is not None:
+        try:
+            _, node_id, error = results.get_nowait()
+            raise ClusterError(f"Node {node_id} could not start: {error}")
+        except Empty:
+            pass
+
+    for worker in workers:
+        if worker.exitcode not in (None, 0):
+            raise ClusterError(f"A worker process exited with code {worker.exitcode}")
+
+
+def wait_until_ready(network: Network | TopologyIndex,
+                     node_ids: list[int],
+                     workers: list,
+                     results,
+                     timeout: float) -> None:
+    """
+    Blocks until every node answers a readiness probe, raising TimeoutError otherwise, or ClusterError as soon as
+    a worker fails.
+    """
+
+    deadline = monotonic() + timeout
+
+    for node_id in node_ids:
+        while True:
+            check_workers(workers, results)
+
+            try:
+                probe_server(network.get_node_election_address(node_id), -1,
+                             min(1.0, max(0.0, deadline - monotonic())),
+                             TRANSPORTS[network.get_node_transport(node_id)]())
+                break
+            except TimeoutError:
+                if monotonic() >= deadline:
+                    raise
+
+
+def launch_cluster(network_file_path: str,
+                   processes: int | None = None,
+                   application: bool = False,
+                   event_loop: bool = False,
+                   placement: str = "root",
+                   convergecast: bool = False,
+                   reuse_connections: bool = False,
+                   timeout: float = 120.0,
+                   log_level: str = "WARNING",
+                   data_plane: bool = False) -> dict:
+    """
+    Runs every node of a network in worker processes and returns the leader, the time from the trigger until
+    the first and the last node knew it and until the leader knew that every node knew it, and the report of
+    each node.
+
+    Raises ClusterError if a node fails or reports another leader, and TimeoutError if the nodes are not ready
+    or do not finish in timeout seconds; the workers are stopped in both cases.
+    """
+
+    network = load_network(network_file_path)
+    node_ids = network.get_node_ids()
+    starter_id = network.get_election_starter_id()
+    processes = max(1, min(processes or cpu_count() or 1, len(node_ids)))
+
+    context = multiprocessing.get_context("spawn")
+    trigger = context.Event()
+    results = context.Queue()
+    options = {
+        "application": application,
+        "event_loop": event_loop,
+        "placement": placement,
+        "convergecast": convergecast,
+        "reuse_connections": reuse_connections,
+        "log_level": log_level,
+        "data_plane": data_plane,
+    }
+    workers = [context.Process(target=run_worker,
+                               args=(node_ids[index::processes], network_file_path, options, trigger, results),
+                               daemon=True)
+               for index in range(processes)]
+
+    for worker in workers:
+        worker.start()
+
+    try:
+        # In application mode the starter only opens its server when the election starts.
+        waiting_ids = [node_id for node_id in node_ids if not (application and node_id == starter_id)]
+        wait_until_ready(network, waiting_ids, workers, results, timeout)
+
+        triggered_at = time()
+        trigger.set()
+
+        reports = collect_reports(results, workers, len(node_ids), monotonic() + timeout)
+    except BaseException:
+        for worker in workers:
+            worker.terminate()
+        raise
+    finally:
+        for worker in workers:
+            worker.join()
+
+    known_at = [report["known_at"] for report in reports.values()]
+    leader_id = next(iter(reports.values()))["leader"]
+
+    return {
+        "leader": leader_id,
+        "processes": processes,
+        "time_to_first_leader": min(known_at) - triggered_at,
+        "time_to_all_know_leader": max(known_at) - triggered_at,
+        "time_to_network_ready": reports[leader_id]["ready_at"] - triggered_at,
+        "nodes": {node_id: {**report, "known_after": report["known_at"] - triggered_at}
+                  for node_id, report in sorted(reports.items())},
+    }
+
+
+def collect_reports(results, workers: list, node_count: int, deadline: float) -> dict[int, dict]:
+    """
+    Collects the reports of the nodes until every node finished, failing as soon as the leaders disagree.
+    """
+
+    reports = {}
+    finished = 0
+    leader_id = None
+
+    while finished < node_count:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Only {finished} of {node_count} nodes finished")
+
+        try:
+            report = results.get(timeout=min(remaining, 1.0))
+        except Empty:
+            check_workers(workers)
+            continue
+
+        match report:
+            case ("leader", node_id, reported_leader_id, counters):
+                if leader_id is None:
+                    leader_id = reported_leader_id
+                elif reported_leader_id != leader_id:
+                    raise ClusterError(f"Node {node_id} elected {reported_leader_id}, another node elected "
+                                       f"{leader_id}")
+                reports[node_id] = {"leader": reported_leader_id, **counters}
+            case ("finished", _):
+                finished += 1
+            case ("error", node_id, error):
+                raise ClusterError(f"Node {node_id} failed: {error}")
+
+    return reports
+
+
+def main() -> None:
+    """
+    Launches the network and prints the result of the election.
+    """
+
+    parser = argparse.ArgumentParser(description="Launch every node of a network on this machine")
+    parser.add_argument("--network", default=join("config", "network.json"),
+                        help="The network.json or a topology index compiled from it")
+    parser.add_argument("--processes", type=int, help="Worker processes, by default one per CPU")
+    parser.add_argument("--application", action="store_true", help="Run the Application instead of the election")
+    parser.add_argument("--event-loop", action="store_true", help="Multiplex the connections of each node")
+    parser.add_argument("--placement", choices=PLACEMENT_POLICIES, default="root")
+    parser.add_argument("--convergecast", action="store_true", help="With --application, see main.py")
+    parser.add_argument("--reuse-connections", action="store_true", help="With --application, see main.py")
+    parser.add_argument("--data-plane", action="store_true", help="With --application, see main.py")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to get ready and to finish")
+    parser.add_argument("--log-level", default="WARNING", type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    parser.add_argument("--output", help="Write the report of every node to this JSON file")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+
+    try:
+        result = launch_cluster(args.network,
+                                args.processes,
+                                args.application,
+                                args.event_loop,
+                                args.placement,
+                                args.convergecast,
+                                args.reuse_connections,
+                                args.timeout,
+                                args.log_level,
+                                args.data_plane)
+    except (ClusterError, TimeoutError) as exception:
+        raise SystemExit(f"Cluster failed: {exception}") from exception
+
+    nodes = result["nodes"].values()
+    print(f"Leader: {result['leader']}, {len(nodes)} nodes in {result['processes']} processes")
+    print(f"Time to the first leader: {result['time_to_first_leader'] * 1000:.3f} ms, "
+          f"until every node knew it: {result['time_to_all_know_leader'] * 1000:.3f} ms, "
+          f"until the leader knew that: {result['time_to_network_ready'] * 1000:.3f} ms")
+    print(f"Messages: {sum(node['messages_sent'] for node in nodes)}, "
+          f"bytes: {sum(node['bytes_sent'] for node in nodes)}, "
+          f"root contention rounds: {max(node['contention_rounds'] for node in nodes)}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            dump(result, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,654 @@
+"""
+Election algorithm definition on asyncio streams.
+
+The node runs the state machine of ElectionNode, but its events are consumed by a task of the running event loop
+instead of the election thread, and every connection is served by a task instead of a thread.
+"""
+
+import asyncio
+from logging import getLogger
+from queue import Empty
+from time import monotonic, perf_counter
+from typing import Callable
+
+from lib.backoff import ExponentialBackoff
+from lib.contention import ContentionPolicy
+from lib.election_node import ElectionNode, EventType, NodeAddress, NodeEvent, NodeState
+from lib.election_state import ElectionStateStore
+from lib.failure_detector import FailureDetector
+from lib.log import NodeLogger
+from lib.message import ELECTION_CHANNEL, Message, MessageReader, MessageType, ProtocolError, encode_message
+from lib.metrics import WAKE_UP, NodeMetrics
+from lib.placement import PlacementPolicy
+from lib.trace import Tracer
+from lib.transport import Transport
+
+logger = getLogger(__name__)
+
+
+async def open_connection_with_backoff(address: tuple[str, int],
+                                       connect_timeout: float,
+                                       backoff: ExponentialBackoff | None = None
+                                       ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    Opens a stream connection, retrying with a capped exponential backoff while the server is not listening.
+
+    Raises TimeoutError if the connection could not be made in connect_timeout seconds.
+    """
+
+    backoff = backoff or ExponentialBackoff()
+    deadline = monotonic() + connect_timeout
+
+    for delay in backoff.delays():
+        try:
+            return await asyncio.open_connection(*address)
+        except OSError as exception:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Could not connect to {address[0]}:{address[1]}: {exception}") from exception
+
+            await asyncio.sleep(min(delay, remaining))
+
+
+async def probe_server(address: tuple[str, int], sender_id: int, probe_timeout: float) -> None:
+    """
+    Checks that a node is accepting election connections, raising TimeoutError if it is not ready in time.
+    """
+
+    async def probe() -> None:
+        reader, writer = await open_connection_with_backoff(address, probe_timeout)
+        message_reader = MessageReader(256)
+
+        try:
+            writer.write(encode_message(MessageType.READINESS_PROBE, sender_id))
+
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    raise TimeoutError(f"Node at {address[0]}:{address[1]} closed the readiness probe")
+
+                if any(message.message_type == MessageType.READY for message in message_reader.feed(data)):
+                    return
+        finally:
+            writer.close()
+
+    await asyncio.wait_for(probe(), probe_timeout)
+
+
+class AsyncConnectionManager():
+
+    """
+    Defines the connection manager of an election over asyncio streams.
+
+    It has the methods of ConnectionManager an ElectionNode uses, for a single election without application
+    channels. Every connection is read by a task of the running event loop, and the connections are opened by
+    tasks too, so no method blocks the loop.
+    """
+
+    _node_id: int
+    _server_address: NodeAddress
+    _neighbors_addresses: dict[int, NodeAddress]
+    _connect_timeout: float
+    _election_start_handler: Callable[[], None] | None
+    _handle_message: Callable[[int, Message], None] | None
+    _metrics: NodeMetrics
+    _tracer: Tracer | None
+    _server: asyncio.AbstractServer | None
+    _writers: dict[int, asyncio.StreamWriter]
+    _connect_locks: dict[int, asyncio.Lock]
+    _tasks: set[asyncio.Task]
+    _waiting_for_election: bool
+    _election_started: asyncio.Event
+    _server_finished: bool
+    _log: NodeLogger
+
+    def __init__(self,
+                 node_id: int,
+                 server_address: NodeAddress,
+                 neighbors_addresses: dict[int, NodeAddress],
+                 connect_timeout: float = 30.0,
+                 election_start_handler: Callable[[], None] | None = None,
+                 metrics: NodeMetrics | None = None,
+                 tracer: Tracer | None = None) -> None:
+        """
+        Args:
+            connect_timeout (float): how long the connections to the neighbors are retried while they are not
+                listening yet, and how long wait_for_neighbors probes them by default.
+            election_start_handler (Callable): called when the election reaches this node, before the start
+                message is forwarded to the neighbors.
+            metrics (NodeMetrics): where the messages, the connections and the wake up phase are counted.
+            tracer (Tracer): if set, the frames carry the Lamport clock of the node and the sends and receives
+                are traced.
+        """
+
+        self._node_id = node_id
+        self._server_address = server_address
+        self._neighbors_addresses = neighbors_addresses
+        self._connect_timeout = connect_timeout
+        self._election_start_handler = election_start_handler
+        self._handle_message = None
+        self._metrics = metrics or NodeMetrics()
+        self._tracer = tracer
+        self._server = None
+        self._writers = {}
+        self._connect_locks = {}
+        self._tasks = set()
+        self._waiting_for_election = True
+        self._election_started = asyncio.Event()
+        self._server_finished = False
+        self._log = NodeLogger(logger, node_id)
+
+    @property
+    def metrics(self) -> NodeMetrics:
+        """
+        Returns the metrics of the connections.
+        """
+
+        return self._metrics
+
+    @property
+    def messages_sent(self) -> int:
+        """
+        Returns the number of messages sent to the neighbors.
+        """
+
+        return self._metrics.messages_sent
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Returns the number of bytes sent to the neighbors, including the frame headers.
+        """
+
+        return self._metrics.bytes_sent
+
+    async def start_server(self, handle_message: Callable[[int, Message], None]) -> None:
+        """
+        Starts listening for the election connections, whose messages are passed to handle_message.
+        """
+
+        self._handle_message = handle_message
+
+        host, port = self._server_address.get_address()
+        self._server = await asyncio.start_server(self.accept_connection, host, port)
+
+        self._log.info("Listening on %s", self._server_address)
+
+    async def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        """
+        Waits until every neighbor answers a readiness probe, raising TimeoutError otherwise.
+        """
+
+        timeout = self._connect_timeout if timeout is None else timeout
+
+        await asyncio.gather(*(probe_server(neighbor.get_address(), self._node_id, timeout)
+                               for neighbor in self._neighbors_addresses.values()))
+
+    def start_leader_election(self) -> None:
+        """
+        Starts the leader election.
+        """
+
+        self.join_election(None)
+
+    async def wait_for_election_start(self) -> None:
+        """
+        Waits until the election reached this node and the start message was broadcast to the neighbors.
+        """
+
+        await self._election_started.wait()
+
+    def stop_waiting_for_election(self) -> None:
+        """
+        Stops waiting for the start of the election, once a persisted election was confirmed without it or the
+        node is closed, waking up wait_for_election_start.
+        """
+
+        self._waiting_for_election = False
+        self._election_started.set()
+
+    def get_connected_ids(self) -> list[int]:
+        """
+        Returns the neighbors this node has a connection with.
+        """
+
+        return list(self._writers)
+
+    def connect_to_neighbor(self,
+                            node_id: int,
+                            message_type: MessageType,
+                            payload: bytes,
+                            timeout: float | None = None) -> bool:
+        """
+        Opens a connection to a neighbor before the election starts and sends its first message, to confirm a
+        persisted election.
+
+        Returns False if the election already started or the neighbor is already connected. The connection is
+        opened by a task, so a neighbor that is not listening in timeout seconds is only logged and the
+        confirmation times out.
+        """
+
+        if not self._waiting_for_election or node_id in self._writers:
+            return False
+
+        self.spawn(self.send_first_message(node_id, message_type, payload, timeout))
+
+        return True
+
+    def send_message(self,
+                     node_id: int,
+                     message_type: MessageType,
+                     payload: bytes = b"",
+                     channel: int = ELECTION_CHANNEL,
+                     sender_id: int | None = None) -> None:
+        """
+        Queues a message to a neighbor, the stream writer flushes it without blocking the loop.
+        """
+
+        writer = self._writers.get(node_id)
+        if writer is None or writer.is_closing():
+            self._log.warning("Could not send %s to %d, it is not connected", message_type.name, node_id)
+            return
+
+        clock = None if self._tracer is None else self._tracer.send(node_id, message_type, channel)
+        frame = encode_message(message_type, self._node_id if sender_id is None else sender_id, payload, channel,
+                               clock)
+        writer.write(frame)
+        self._metrics.count_sent(message_type, len(frame))
+
+        self._log.debug("Sent message %s to %d", message_type.name, node_id)
+
+    def finish_server(self) -> None:
+        """
+        Stops accepting connections, the messages received from now on are dropped.
+        """
+
+        self._server_finished = True
+
+        if self._server is not None:
+            self._server.close()
+
+    def close_all_sockets(self) -> None:
+        """
+        Closes the server and the connections, once the queued messages are flushed, and cancels the tasks of
+        the connections.
+        """
+
+        self.finish_server()
+
+        for task in list(self._tasks):
+            if task is not asyncio.current_task():
+                task.cancel()
+
+        for writer in self._writers.values():
+            writer.close()
+
+    # non public lib methods
+
+    def spawn(self, coroutine) -> asyncio.Task:
+        """
+        Runs a coroutine in a task owned by the connection manager.
+        """
+
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return task
+
+    def accept_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves a connection accepted by the server in a task of the connection manager, cancelled on close.
+        """
+
+        self.spawn(self.handle_connection(reader, writer))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Handles a connection accepted by the server, which is identified by its first message: a readiness probe
+        is answered, the start of the election or the confirmation of a persisted one comes from a neighbor.
+        """
+
+        message_reader = MessageReader()
+        messages = []
+
+        try:
+            while not messages:
+                data = await reader.read(65536)
+                if not data:
+                    writer.close()
+                    return
+
+                messages = message_reader.feed(data)
+        except (OSError, ProtocolError) as exception:
+            self._log.warning("Error reading the first message of a connection: %s", exception)
+            writer.close()
+            return
+
+        message = messages[0]
+        node_id = message.sender_id
+
+        if message.message_type == MessageType.READINESS_PROBE:
+            writer.write(encode_message(MessageType.READY, self._node_id))
+            writer.close()
+            return
+
+        if (message.message_type not in (MessageType.START_ELECTION, MessageType.STATE_CONFIRMATION)
+                or node_id not in self._neighbors_addresses):
+            self._log.warning("Refused a connection starting with %s from %d", message.message_type.name, node_id)
+            writer.close()
+            return
+
+        # Like the threaded server, the messages go on the first connection with the neighbor and both are read.
+        async with self._connect_locks.setdefault(node_id, asyncio.Lock()):
+            self._writers.setdefault(node_id, writer)
+
+        self.receive(node_id, messages)
+        await self.receive_messages(node_id, reader, writer, message_reader)
+
+    def join_election(self, sender_id: int | None) -> None:
+        """
+        Forwards the start of the election to every neighbor but the sender, the first time it reaches the node.
+        """
+
+        if not self._waiting_for_election:
+            return
+
+        self._waiting_for_election = False
+        started = perf_counter()
+
+        if self._tracer is not None:
+            self._tracer.start_election(sender_id)
+
+        if self._election_start_handler is not None:
+            self._election_start_handler()
+
+        neighbor_ids = [neighbor_id for neighbor_id in self._neighbors_addresses if neighbor_id != sender_id]
+        self.spawn(self.broadcast_start_election(neighbor_ids, started))
+
+    async def broadcast_start_election(self, neighbor_ids: list[int], started: float) -> None:
+        """
+        Broadcasts the start of the election to the neighbors at once and lets the election run.
+        """
+
+        await asyncio.gather(*(self.send_first_message(neighbor_id, MessageType.START_ELECTION)
+                               for neighbor_id in neighbor_ids))
+
+        self._metrics.observe_phase(WAKE_UP, perf_counter() - started)
+        self._election_started.set()
+
+    async def send_first_message(self,
+                                 node_id: int,
+                                 message_type: MessageType,
+                                 payload: bytes = b"",
+                                 timeout: float | None = None) -> None:
+        """
+        Sends the first message of the election to a neighbor, on the connection the neighbor or the
+        confirmation of a persisted election already opened, or on a new connection.
+
+        A neighbor that is not listening in timeout seconds, by default the connect timeout, is logged.
+        """
+
+        # The start of the election and a confirmation must not open two connections to the same neighbor.
+        async with self._connect_locks.setdefault(node_id, asyncio.Lock()):
+            if node_id not in self._writers:
+                started = perf_counter()
+                try:
+                    reader, writer = await open_connection_with_backoff(
+                        self._neighbors_addresses[node_id].get_address(),
+                        self._connect_timeout if timeout is None else timeout,
+                    )
+                except OSError as exception:
+                    # TimeoutError included: an unreachable neighbor does not keep the others from the election.
+                    self._log.warning("Could not send %s to %d: %s", message_type.name, node_id, exception)
+                    return
+
+                self._metrics.observe_connect(node_id, perf_counter() - started)
+                self._writers[node_id] = writer
+                self.spawn(self.receive_messages(node_id, reader, writer, MessageReader()))
+
+            self.send_message(node_id, message_type, payload)
+
+    async def receive_messages(self,
+                               node_id: int,
+                               reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter,
+                               message_reader: MessageReader) -> None:
+        """
+        Reads the frames of a neighbor connection until it is closed or the server finishes.
+        """
+
+        try:
+            while not self._server_finished:
+                data = await reader.read(65536)
+                if not data:
+                    self._log.debug("The connection to %d was closed", node_id)
+                    break
+
+                self.receive(node_id, message_reader.feed(data))
+        except (OSError, ProtocolError) as exception:
+            self._log.warning("Error on the connection to %d: %s", node_id, exception)
+        finally:
+            writer.close()
+
+    def receive(self, node_id: int, messages: list[Message]) -> None:
+        """
+        Counts the messages read from a neighbor and passes them to the election.
+        """
+
+        self._metrics.count_received(messages)
+
+        for message in messages:
+            if self._tracer is not None:
+                self._tracer.receive(node_id, message)
+
+            if self._server_finished:
+                self._log.debug("Dropped %s, the election finished", message.message_type.name)
+            elif message.channel != ELECTION_CHANNEL:
+                self._log.warning("Received a message on the unknown channel %d", message.channel)
+            elif message.message_type == MessageType.START_ELECTION:
+                self.join_election(node_id)
+            else:
+                self._handle_message(node_id, message)
+
+
+class AsyncElectionNode(ElectionNode):
+
+    """
+    Defines a node that participates in the election algorithm inside an asyncio event loop.
+
+    The node runs the state machine of ElectionNode in a task of the loop instead of the election thread, over
+    an AsyncConnectionManager, so many nodes can share a single loop. The blocking methods of ElectionNode are
+    coroutines here.
+    """
+
+    _connection_manager: AsyncConnectionManager
+    _election_task: asyncio.Task | None
+    _wakeup: asyncio.Event  # set when an event is posted
+    _changed: asyncio.Event  # set, and replaced, after the node handled an event or a timer
+
+    def __init__(self,
+                 id: int,
+                 server_address: NodeAddress,
+                 neighbors: dict[int, NodeAddress],
+                 connect_timeout: float = 30.0,
+                 contention_policy: ContentionPolicy | None = None,
+                 capacity: float = 1.0,
+                 placement_policy: PlacementPolicy | None = None,
+                 heartbeat_interval: float | None = None,
+                 failure_detector: FailureDetector | None = None,
+                 state_store: ElectionStateStore | None = None,
+                 confirmation_timeout: float | None = None,
+                 tracer: Tracer | None = None,
+                 ack_timeout: float | None = None) -> None:
+        super().__init__(id,
+                         server_address,
+                         neighbors,
+                         connect_timeout=connect_timeout,
+                         contention_policy=contention_policy,
+                         capacity=capacity,
+                         placement_policy=placement_policy,
+                         heartbeat_interval=heartbeat_interval,
+                         failure_detector=failure_detector,
+                         state_store=state_store,
+                         confirmation_timeout=confirmation_timeout,
+                         tracer=tracer,
+                         ack_timeout=ack_timeout)
+        self._election_task = None
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Event()
+
+    # public lib methods
+
+    async def start_server(self) -> None:
+        await self._connection_manager.start_server(self.handle_message)
+        self._election_task = asyncio.create_task(self.run_election())
+
+    async def wait_for_election(self, timeout: float | None = None) -> int:
+        # The wait is shielded: timing it out or cancelling it does not cancel the election.
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._election_result)), timeout)
+
+    async def wait_for_network_ready(self, timeout: float | None = None) -> None:
+        if not await self.wait_until(self._network_ready.is_set, timeout) or self._ack_timed_out:
+            raise TimeoutError(f"The subtree of node {self._id} did not acknowledge the leader in time")
+
+    async def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        await self._connection_manager.wait_for_neighbors(timeout)
+
+    async def start_the_election(self) -> None:
+        if self._persisted_state is not None:
+            await self.wait_until(self._confirmation_finished.is_set)
+
+        if not self._confirmed and not self._election_result.done():
+            await self._connection_manager.wait_for_neighbors()
+            self._connection_manager.start_leader_election()
+
+    async def wait_for_leader_change(self, leader_id: int, timeout: float | None = None) -> int:
+        if not await self.wait_until(lambda: self._leader_id not in (-1, leader_id), timeout):
+            raise TimeoutError(f"Node {self._id} still follows the leader {leader_id}")
+
+        return self._leader_id
+
+    async def close(self) -> None:
+        self._closing.set()
+        self.post(NodeEvent(EventType.STOP))
+        # The task may still wait for a start that will never reach the node.
+        self._connection_manager.stop_waiting_for_election()
+
+        if self._election_task is not None and self._election_task is not asyncio.current_task():
+            await self._election_task
+
+        self._connection_manager.close_all_sockets()
+
+    # non public lib methods
+
+    def open_connections(self,
+                         server_node_address: NodeAddress,
+                         neighbors: dict[int, NodeAddress],
+                         timeout: float,
+                         event_loop: bool,
+                         connect_timeout: float,
+                         channel_handlers: dict[int, Callable[[int, Message], None]] | None,
+                         transport: Transport | None,
+                         neighbor_transports: dict[int, Transport] | None) -> AsyncConnectionManager:
+        return AsyncConnectionManager(self._id, server_node_address, neighbors, connect_timeout,
+                                      self.handle_election_start, self._metrics, self._tracer)
+
+    def post(self, event: NodeEvent) -> None:
+        super().post(event)
+        self._wakeup.set()
+
+    async def run_election(self) -> None:
+        """
+        Runs the election like process_leader_election does in the election thread, consuming the events of the
+        node in the running loop.
+        """
+
+        try:
+            if self._state is NodeState.CONFIRMING:
+                try:
+                    self.begin_confirmation()
+                    await self.consume_events_in_loop(lambda: self._state is not NodeState.CONFIRMING)
+                finally:
+                    # The start of the election waits for the confirmation, even one that failed with an error.
+                    self._confirmation_finished.set()
+                    self.notify_change()
+
+            if not self._confirmed and not self._stopped:
+                await self._connection_manager.wait_for_election_start()
+                # Closing the node wakes the wait up, before the start reached the node.
+                if not self._closing.is_set():
+                    self.begin_election()
+                    await self.consume_events_in_loop(lambda: self._state is NodeState.DONE)
+
+                    if self._state is NodeState.DONE:
+                        self.end_election()
+        except Exception as exception:
+            # Nothing awaits the task but close, the future of the election carries the exception.
+            self._log.exception("The election failed: %s", exception)
+            self.resolve_election(exception=exception)
+            return
+
+        if self._state is not NodeState.DONE:
+            self.resolve_election(exception=RuntimeError(f"Node {self._id} was closed before the election ended"))
+            return
+
+        self.resolve_election()
+
+        if self._keep_connections:
+            await self.consume_events_in_loop(lambda: False)
+        else:
+            # The connections stay open until the subtree acknowledged the leader.
+            await self.consume_events_in_loop(self._network_ready.is_set)
+            self._connection_manager.close_all_sockets()
+
+    async def consume_events_in_loop(self, finished: Callable[[], bool]) -> None:
+        """
+        Handles the events of the node and its expired timers like consume_events, waiting for them without
+        blocking the loop.
+        """
+
+        while not self._stopped and not finished():
+            stopped = self.handle_expired_timers(finished)
+            self.notify_change()
+            if stopped:
+                return
+
+            try:
+                event = self._events.get_nowait()
+            except Empty:
+                # Only the tasks of this loop post events, so none can be posted between the check and the wait.
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.time_to_next_timer())
+                except TimeoutError:
+                    pass
+                continue
+
+            self.handle_event(event)
+            self.notify_change()
+
+    def notify_change(self) -> None:
+        """
+        Wakes up the coroutines waiting for a change of the node, like the leader condition of the threads.
+        """
+
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_until(self, predicate: Callable[[], bool], timeout: float | None = None) -> bool:
+        """
+        Waits until predicate returns True, checking it after each change of the node. Returns False if it did
+        not after timeout seconds.
+        """
+
+        async def wait() -> None:
+            while not predicate():
+                await self._changed.wait()
+
+        try:
+            await asyncio.wait_for(wait(), timeout)
+        except TimeoutError:
+            return False
+
+        return True
@@ -0,0 +1,53 @@
+"""
+Module for retry delays.
+"""
+
+from random import uniform
+from typing import Iterator
+
+
+class ExponentialBackoff():
+
+    """
+    Defines a capped exponential backoff with jitter.
+
+    The delay of the attempt n is min(maximum, initial * multiplier ** n), scaled by a random factor in
+    [1 - jitter, 1] so that nodes retrying at the same time spread out.
+    """
+
+    _initial: float
+    _maximum: float
+    _multiplier: float
+    _jitter: float
+
+    def __init__(self, initial: float = 0.01, maximum: float = 1.0, multiplier: float = 2.0, jitter: float = 0.5):
+        if initial <= 0 or maximum < initial:
+            raise ValueError("The backoff needs 0 < initial <= maximum")
+
+        if not 0 <= jitter <= 1:
+            raise ValueError("The jitter must be between 0 and 1")
+
+        self._initial = initial
+        self._maximum = maximum
+        self._multiplier = multiplier
+        self._jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the delay before the given attempt, starting at 0.
+        """
+
+        # The exponent is capped to avoid overflows after many attempts.
+        delay = min(self._maximum, self._initial * self._multiplier ** min(attempt, 64))
+
+        return delay * uniform(1 - self._jitter, 1)
+
+    def delays(self) -> Iterator[float]:
+        """
+        Returns the infinite sequence of delays.
+        """
+
+        attempt = 0
+        while True:
+            yield self.delay(attempt)
+            attempt += 1
@@ -1,18 +1,67 @@
 """
 Module for the connection manager.
+
+A connection manager listens for the election connections of a node and opens the connections to its neighbors.
+By default the connections carry the election of the node. A manager created for election groups carries instead
+the elections of every group opened with open_group, each one with its own ElectionNode, over the same listener
+and the same connection to each neighbor: the frames of a group carry its id.
 """
 
 
 from __future__ import annotations
 
-from threading import Thread
-from typing import TYPE_CHECKING
-
-from lib.socket_manager import SocketManager
+from collections import deque
+from logging import getLogger
+from selectors import EVENT_READ, DefaultSelector, SelectorKey
+from socket import socket, socketpair
+from threading import Event, Lock, Thread, current_thread
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Callable
+
+from lib.log import NodeLogger
+from lib.message import DEFAULT_GROUP, ELECTION_CHANNEL, Message, MessageType, ProtocolError, encode_message
+from lib.metrics import WAKE_UP, NodeMetrics
+from lib.socket_manager import SocketManager, probe_server
+from lib.trace import Tracer
+from lib.transport import TcpTransport, Transport
 
 if TYPE_CHECKING:
     from lib.election_node import NodeAddress
 
+logger = getLogger(__name__)
+
+
+class ElectionSession():
+
+    """
+    Defines the state of one election over the connections of a connection manager.
+    """
+
+    group: int
+    neighbors: dict[int, NodeAddress]
+    handle_message: Callable[[int, Message], None] | None
+    election_start_handler: Callable[[], None] | None
+    metrics: NodeMetrics
+    waiting_for_election: bool
+    election_started: Event
+    finished: bool
+    lock: Lock
+
+    def __init__(self,
+                 group: int,
+                 neighbors: dict[int, NodeAddress],
+                 election_start_handler: Callable[[], None] | None,
+                 metrics: NodeMetrics) -> None:
+        self.group = group
+        self.neighbors = neighbors
+        self.handle_message = None
+        self.election_start_handler = election_start_handler
+        self.metrics = metrics
+        self.waiting_for_election = True
+        self.election_started = Event()
+        self.finished = False
+        self.lock = Lock()
+
 
 class ConnectionManager():
 
@@ -24,26 +73,88 @@ class ConnectionManager():
     _socket_manager: SocketManager
     _server_address: NodeAddress
     _neighbors_addresses: dict[int, NodeAddress]
+    _neighbor_transports: dict[int, Transport]  # by neighbor, of the connection this node opens to it
     _server_finished: bool
     _server_thread: Thread | None
-    _waiting_for_election: bool
-    _connection_types: dict[int, str]  # str: client | server
-    _start_election_message: str
+    _connection_threads: list[Thread]
+    _connection_types: dict[int, str]  # str: client | server, of the connection the messages are sent on
+    _connect_locks: dict[int, Lock]  # by neighbor
+    _groups: bool
+    _sessions: dict[int, ElectionSession]  # by group
+    _event_loop: bool
+    _selector: DefaultSelector | None
+    _wakeup_sockets: tuple[socket, socket] | None
+    _loop_calls: deque
+    _connect_timeout: float
+    _metrics: NodeMetrics
+    _tracer: Tracer | None
+    _send_locks: dict[int, Lock]  # by neighbor
+    _channel_handlers: dict[int, Callable[[int, Message], None]]
+    _log: NodeLogger
 
     def __init__(self,
                  node_id: int,
                  server_address: NodeAddress,
                  neighbors_addresses: dict[int, NodeAddress],
-                 timeout: float) -> None:
+                 timeout: float,
+                 event_loop: bool = False,
+                 connect_timeout: float = 30.0,
+                 channel_handlers: dict[int, Callable[[int, Message], None]] | None = None,
+                 election_start_handler: Callable[[], None] | None = None,
+                 metrics: NodeMetrics | None = None,
+                 tracer: Tracer | None = None,
+                 groups: bool = False,
+                 transport: Transport | None = None,
+                 neighbor_transports: dict[int, Transport] | None = None) -> None:
+        """
+        Args:
+            channel_handlers (dict): the handler of the messages of each channel other than the election one.
+                They are called from the threads that read the connections.
+            election_start_handler (Callable): called when the election reaches this node, before the start
+                message is forwarded to the neighbors.
+            metrics (NodeMetrics): where the messages, the connections and the wake up phase are counted, by
+                default metrics of its own.
+            tracer (Tracer): if set, the frames carry the Lamport clock of the node and the sends and receives
+                are traced.
+            groups (bool): if True, the manager carries the elections of the groups opened with open_group
+                instead of a single election, and serves until close_all_sockets is called.
+            transport (Transport): the transport of the listener of the node, TCP by default.
+            neighbor_transports (dict): the transport of the connection to each neighbor, by default the one of
+                the listener. The node also listens on each of them, since the transport set for a link is used
+                in both directions.
+        """
+
         self._node_id = node_id
         self._server_address = server_address
-        self._socket_manager = SocketManager(timeout)
+        transport = transport or TcpTransport()
+        self._neighbor_transports = {node_id: (neighbor_transports or {}).get(node_id, transport)
+                                     for node_id in neighbors_addresses}
+        listener_transports = {transport.name: transport}
+        for neighbor_transport in self._neighbor_transports.values():
+            listener_transports.setdefault(neighbor_transport.name, neighbor_transport)
+        self._socket_manager = SocketManager(timeout, connect_timeout, list(listener_transports.values()))
+        self._connect_timeout = connect_timeout
         self._neighbors_addresses = neighbors_addresses
         self._server_finished = False
         self._server_thread = None
-        self._waiting_for_election = True
+        self._connection_threads = []
         self._connection_types = {}
-        self._start_election_message = "start_election"
+        self._connect_locks = {}
+        self._event_loop = event_loop
+        self._selector = None
+        self._wakeup_sockets = None
+        self._loop_calls = deque()
+        self._metrics = metrics or NodeMetrics()
+        self._tracer = tracer
+        self._send_locks = {}
+        self._channel_handlers = dict(channel_handlers or {})
+        self._log = NodeLogger(logger, node_id)
+        self._groups = groups
+        self._sessions = {}
+
+        if not groups:
+            self._sessions[DEFAULT_GROUP] = ElectionSession(DEFAULT_GROUP, neighbors_addresses, election_start_handler,
+                                                            self._metrics)
 
     @property
     def server_finished(self) -> bool:
@@ -61,6 +172,58 @@ class ConnectionManager():
 
         return self._server_thread
 
+    @property
+    def metrics(self) -> NodeMetrics:
+        """
+        Returns the metrics of the connections.
+        """
+
+        return self._metrics
+
+    @property
+    def messages_sent(self) -> int:
+        """
+        Returns the number of messages sent to the neighbors.
+        """
+
+        return self._metrics.messages_sent
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Returns the number of bytes sent to the neighbors, including the frame headers.
+        """
+
+        return self._metrics.bytes_sent
+
+    def open_group(self,
+                   group: int,
+                   neighbors_addresses: dict[int, NodeAddress],
+                   election_start_handler: Callable[[], None] | None = None,
+                   metrics: NodeMetrics | None = None) -> GroupConnection:
+        """
+        Adds the election of a group among the neighbors given, which must be neighbors of the node, and returns
+        the connection manager of its ElectionNode.
+
+        The groups are opened before the server starts: the messages of a group the node does not know are
+        dropped.
+        """
+
+        if not self._groups:
+            raise ValueError("The connection manager carries a single election")
+
+        if group in self._sessions:
+            raise ValueError(f"The group {group} is already open")
+
+        unknown_ids = neighbors_addresses.keys() - self._neighbors_addresses.keys()
+        if unknown_ids:
+            raise ValueError(f"The nodes {sorted(unknown_ids)} are not neighbors of node {self._node_id}")
+
+        session = ElectionSession(group, neighbors_addresses, election_start_handler, metrics or NodeMetrics())
+        self._sessions[group] = session
+
+        return GroupConnection(self, session)
+
     def finish_server(self) -> None:
         """
         Finishes the server.
@@ -68,118 +231,664 @@ class ConnectionManager():
 
         self._server_finished = True
 
-    def start_server(self, handle_message):
+        if self._event_loop:
+            self.wake_up_event_loop()
+
+    def wait_for_election_start(self) -> None:
+        """
+        Blocks until the election reached this node and the start message was broadcast to the neighbors.
+        """
+
+        self._sessions[DEFAULT_GROUP].election_started.wait()
+
+    def start_server(self, handle_message: Callable[[int, Message], None] | None = None) -> None:
         """
         Starts the server and listens for incoming connections.
 
+        In event loop mode a single thread multiplexes the server socket and every neighbor connection,
+        otherwise a thread is started for each connection.
+
         Args:
-            handle_message (function): The function to handle the received message.
+            handle_message (function): The function to handle the received message, of the election of the node.
+                The groups get theirs from their ElectionNode.
         """
 
+        if handle_message is not None:
+            self._sessions[DEFAULT_GROUP].handle_message = handle_message
+
         self._socket_manager.bind_server(self._server_address.get_address())
         self._socket_manager.listen(10)
 
-        print(f"Node {self._node_id} listening on {self._server_address}")
-        self._server_thread = Thread(target=self.wait_for_election, args=(handle_message,))
+        self._log.info("Listening on %s", self._server_address)
+
+        if self._event_loop:
+            self._selector = DefaultSelector()
+            self._wakeup_sockets = socketpair()
+            self._wakeup_sockets[1].setblocking(False)
+            self._server_thread = Thread(target=self.run_event_loop)
+        else:
+            self._server_thread = Thread(target=self.wait_for_election)
+
         self._server_thread.start()
 
-    def start_leader_election(self, handle_message):
+    def start_leader_election(self, group: int = DEFAULT_GROUP) -> None:
         """
         Starts the leader election.
         """
 
-        self._waiting_for_election = False
-        self.broadcast_start_election(list(self._neighbors_addresses.keys()), handle_message)
+        session = self._sessions[group]
+
+        if self._event_loop:
+            self.call_in_event_loop(self.join_election, session, None)
+            return
 
-    def wait_for_election(self, handle_message):
+        self.join_election(session, None)
+
+    def join_election(self, session: ElectionSession, sender_id: int | None) -> None:
+        """
+        Forwards the start of the election to every neighbor but the sender, the first time it reaches the node.
+        """
+
+        with session.lock:
+            if not session.waiting_for_election:
+                return
+
+            session.waiting_for_election = False
+
+        started = perf_counter()
+
+        if self._tracer is not None:
+            self._tracer.start_election(sender_id)
+
+        if session.election_start_handler is not None:
+            session.election_start_handler()
+
+        neighbor_ids = [neighbor_id for neighbor_id in session.neighbors if neighbor_id != sender_id]
+
+        if self._event_loop:
+            # Connecting to a neighbor that is not listening blocks up to the connect timeout, so the event loop
+            # goes on serving the other connections while another thread connects.
+            broadcast_thread = Thread(target=self.finish_joining, args=(session, neighbor_ids, started))
+            broadcast_thread.start()
+            self._connection_threads.append(broadcast_thread)
+            return
+
+        self.finish_joining(session, neighbor_ids, started)
+
+    def finish_joining(self, session: ElectionSession, neighbor_ids: list[int], started: float) -> None:
+        """
+        Broadcasts the start of the election to neighbor_ids and lets the election run.
+        """
+
+        self.broadcast_start_election(session, neighbor_ids)
+        session.metrics.observe_phase(WAKE_UP, perf_counter() - started)
+        session.election_started.set()
+
+    def stop_waiting_for_election(self, group: int = DEFAULT_GROUP) -> None:
+        """
+        Stops waiting for the start of the election, once a persisted election was confirmed without it or the
+        node is closed, waking up wait_for_election_start.
+        """
+
+        session = self._sessions[group]
+
+        with session.lock:
+            session.waiting_for_election = False
+
+        session.election_started.set()
+
+    def get_connected_ids(self, group: int = DEFAULT_GROUP) -> list[int]:
+        """
+        Returns the neighbors of the election this node has a connection with.
+        """
+
+        neighbors = self._sessions[group].neighbors
+
+        return [node_id for node_id in self._connection_types if node_id in neighbors]
+
+    def connect_to_neighbor(self,
+                            node_id: int,
+                            message_type: MessageType,
+                            payload: bytes,
+                            timeout: float | None = None,
+                            group: int = DEFAULT_GROUP) -> bool:
+        """
+        Opens a connection to a neighbor before the election starts and sends its first message, to confirm a
+        persisted election.
+
+        Returns False if the election already started or the neighbor is already connected. Raises
+        TimeoutError if the neighbor is not listening in timeout seconds, by default the connect timeout.
+        """
+
+        session = self._sessions[group]
+
+        # Holding the lock keeps the start of the election from sending on the connection before its first
+        # message, which identifies it to the neighbor.
+        with session.lock:
+            if not session.waiting_for_election or node_id in self._connection_types:
+                return False
+
+            self.send_first_message(session, node_id, message_type, payload, timeout)
+
+        return True
+
+    def accepting_connections(self) -> bool:
+        """
+        Returns whether the threaded server still accepts connections: until the manager is closed, like the
+        event loop.
+
+        A neighbor confirming a persisted election may connect just before the election starts here; its
+        connection must still be accepted and read, since the neighbor sends all its messages on it.
+        """
+
+        return not self._server_finished
+
+    def wait_for_election(self) -> None:
         """
         Waits for an election.
         """
 
-        print("Vai entrar no while do accept não bloqueante em wait_for_election.")
-        while self._waiting_for_election:
-            not_connected_neighbors = list(self._neighbors_addresses.keys())
+        while self.accepting_connections():
             client_address = self._socket_manager.accept()
 
             if client_address:
-                print(f"Node {self._node_id} accepted connection from {client_address[0]}:{client_address[1]}")
+                self._log.debug("Accepted connection from %s:%d", *client_address)
+
+                messages = self.receive_first_messages(client_address)
+                if not messages:
+                    continue
 
-                message, client_node_id = self._socket_manager.receive_from_client_by_address(client_address).split()
-                client_node_id = int(client_node_id)
+                message = messages[0]
+                client_node_id = message.sender_id
 
-                print(f"Node {self._node_id} received message \"{message}\" from node {client_node_id}")
+                if message.message_type == MessageType.READINESS_PROBE:
+                    self.answer_readiness_probe(client_address)
+                    continue
 
-                if self._start_election_message == message:
-                    self._waiting_for_election = False
+                self.count_received(messages)
 
-                    not_connected_neighbors.remove(client_node_id)
-                    self._socket_manager.bind_client_id_to_address(client_node_id, client_address)
+                self._log.debug("Received message %s from node %d", message.message_type.name, client_node_id)
 
-                    self.broadcast_start_election(not_connected_neighbors, handle_message)
+                if message.message_type in (MessageType.START_ELECTION, MessageType.STATE_CONFIRMATION):
+                    self.register_client(client_node_id, client_address)
 
-                    print(f"Inicializando thread do cliente {client_node_id}")
-                    self._connection_types[client_node_id] = "client"
-                    client_thread = Thread(target=self.handle_connection_thread, args=(client_node_id, handle_message))
+                    # The start of the election is handled by the thread of the connection too, so a node that
+                    # carries election groups goes on accepting while it connects to its neighbors.
+                    self._log.debug("Starting the thread of client %d", client_node_id)
+                    client_thread = Thread(target=self.handle_connection_thread,
+                                           args=(client_node_id, client_address, messages))
                     client_thread.start()
+                    self._connection_threads.append(client_thread)
 
-    def broadcast_start_election(self, not_connected_neighbors: list[int], handle_message):
+    def register_client(self, node_id: int, client_address: tuple[str, int]) -> None:
         """
-        Broadcasts a start election message to all not connected neighbors.
+        Sends the messages to a neighbor on the connection it opened, unless there already is a connection with it.
+
+        Two nodes that start elections of different groups at once may connect to each other at the same time.
+        Each one keeps sending on the first connection it had, so the messages it sends are received in order,
+        and reads both.
         """
 
-        for neighbour_id in not_connected_neighbors:
-            address = self._neighbors_addresses[neighbour_id].get_address()
-            self._socket_manager.connect_to_server(neighbour_id, address)
-            self._connection_types[neighbour_id] = "server"
-            self.send_message(neighbour_id, f"{self._start_election_message} {self._node_id}")
-            connection_thread = Thread(target=self.handle_connection_thread, args=(neighbour_id, handle_message))
-            connection_thread.start()
+        with self._connect_locks.setdefault(node_id, Lock()):
+            if node_id not in self._connection_types:
+                self._socket_manager.bind_client_id_to_address(node_id, client_address)
+                self._connection_types[node_id] = "client"
 
-    def handle_connection_thread(self, connection_id: int, handle_message) -> None:
+    def answer_readiness_probe(self, client_address: tuple[str, int]) -> None:
         """
-        Handles a connection thread.
+        Tells a probing neighbor that this node accepts election connections and closes the probe connection.
         """
 
-        print(f"Node {self._node_id} handling connection thread {connection_id}, server {self._server_finished}")
-        while not self._server_finished:
+        self._socket_manager.send_to_address(client_address, encode_message(MessageType.READY, self._node_id))
+        self._socket_manager.close_connection_with_address(client_address)
+
+    def wait_for_neighbors(self, timeout: float | None = None, group: int = DEFAULT_GROUP) -> None:
+        """
+        Blocks until every neighbor of the election answers a readiness probe.
+
+        Raises TimeoutError if a neighbor is not ready in timeout seconds, by default the connect timeout.
+        """
+
+        deadline = monotonic() + (self._connect_timeout if timeout is None else timeout)
+
+        for neighbor_id, address in self._sessions[group].neighbors.items():
+            probe_server(address.get_address(), self._node_id, max(0.0, deadline - monotonic()),
+                         self._neighbor_transports[neighbor_id])
+            self._log.debug("Neighbor %d is ready", neighbor_id)
+
+    def receive_first_messages(self, client_address: tuple[str, int]) -> list[Message] | None:
+        """
+        Receives from a new connection until at least one complete message arrives.
+        """
+
+        try:
+            messages = []
+            while messages == []:
+                messages = self._socket_manager.receive_from_client_by_address(client_address)
+
+            return messages
+        except ProtocolError as exception:
+            self._log.warning("Protocol error: %s", exception)
+            return None
+
+    def broadcast_start_election(self, session: ElectionSession, neighbor_ids: list[int]) -> None:
+        """
+        Broadcasts a start election message to the neighbors, connecting to the ones not connected yet and
+        logging the ones that cannot be reached.
+        """
+
+        for neighbour_id in neighbor_ids:
             try:
-                print(f"Node {self._node_id} waiting for message from {connection_id}")
-                connection_type = self._connection_types[connection_id]
-                if connection_type == "client":
-                    message, node_message = self._socket_manager.receive_from_client_by_id(connection_id).split()
-                elif connection_type == "server":
-                    message, node_message = self._socket_manager.receive_from_server(connection_id).split()
+                self.send_first_message(session, neighbour_id, MessageType.START_ELECTION)
+            except OSError as exception:
+                # TimeoutError included: an unreachable neighbor does not keep the others from the election.
+                self._log.warning("Could not send the start of the election to %d: %s", neighbour_id, exception)
+
+    def send_first_message(self,
+                           session: ElectionSession,
+                           node_id: int,
+                           message_type: MessageType,
+                           payload: bytes = b"",
+                           timeout: float | None = None) -> None:
+        """
+        Sends the first message of an election to a neighbor, on the connection other elections or the
+        confirmation of a persisted one already opened, or on a new connection.
+        """
+
+        # Two elections reaching the node at once must not open two connections to the same neighbor.
+        with self._connect_locks.setdefault(node_id, Lock()):
+            if node_id in self._connection_types:
+                self.send_message(node_id, message_type, payload, group=session.group)
+                return
+
+            started = perf_counter()
+            self._socket_manager.connect_to_server(node_id, self._neighbors_addresses[node_id].get_address(), timeout,
+                                                   self._neighbor_transports[node_id])
+            session.metrics.observe_connect(node_id, perf_counter() - started)
+            self._connection_types[node_id] = "server"
+            self.send_message(node_id, message_type, payload, group=session.group)
+
+        if not self._event_loop:
+            connection_thread = Thread(target=self.handle_connection_thread, args=(node_id,))
+            connection_thread.start()
+            self._connection_threads.append(connection_thread)
+        elif current_thread() is self._server_thread:
+            self._selector.register(self._socket_manager.get_server_socket(node_id),
+                                    EVENT_READ,
+                                    ("server", node_id, None))
+        else:
+            self.call_in_event_loop(self._selector.register,
+                                    self._socket_manager.get_server_socket(node_id),
+                                    EVENT_READ,
+                                    ("server", node_id, None))
+
+    def handle_connection_thread(self,
+                                 connection_id: int,
+                                 client_address: tuple[str, int] | None = None,
+                                 pending_messages: list[Message] | None = None) -> None:
+        """
+        Handles a connection thread, of a connection the neighbor opened if client_address is given.
+        """
 
-                handle_message(connection_id, message, int(node_message))
+        self._log.debug("Handling connection thread %d, server finished %s", connection_id, self._server_finished)
+
+        for message in pending_messages or []:
+            self.dispatch(connection_id, message)
+
+        while not self._server_finished:
+            try:
+                if client_address is not None:
+                    messages = self._socket_manager.receive_from_client_by_address(client_address)
+                else:
+                    messages = self._socket_manager.receive_from_server(connection_id)
+
+                if messages is None:
+                    self._log.debug("Socket %d was closed", connection_id)
+                    break
+
+                self.count_received(messages)
+                for message in messages:
+                    self.dispatch(connection_id, message)
             except OSError:
-                print(f"Socket {connection_id} pode ter finalizado")
+                self._log.debug("Socket %d may have finished", connection_id)
                 break
-            except ValueError:   
-                print(f"Socket {connection_id} pode ter finalizado")
+            except ProtocolError as exception:
+                self._log.warning("Protocol error on socket %d: %s", connection_id, exception)
                 break
 
-    def send_message(self, node_id: int, message: str):
+    # event loop mode
+
+    def run_event_loop(self) -> None:
+        """
+        Multiplexes the server socket and all neighbor connections in a single thread until the server finishes.
+        """
+
+        for server_socket in self._socket_manager.server_sockets:
+            self._selector.register(server_socket, EVENT_READ, ("listener", None, None))
+        self._selector.register(self._wakeup_sockets[0], EVENT_READ, ("wakeup", None, None))
+
+        while not self._server_finished:
+            for key, _ in self._selector.select():
+                kind, _, _ = key.data
+
+                if kind == "listener":
+                    self.accept_in_loop()
+                elif kind == "wakeup":
+                    self.run_loop_calls()
+                else:
+                    self.read_in_loop(key)
+
+                if self._server_finished:
+                    break
+
+        self._selector.close()
+        for wakeup_socket in self._wakeup_sockets:
+            wakeup_socket.close()
+
+    def call_in_event_loop(self, function, *args) -> None:
+        """
+        Schedules a function to be called from the event loop thread.
+        """
+
+        self._loop_calls.append((function, args))
+        self.wake_up_event_loop()
+
+    def wake_up_event_loop(self) -> None:
+        """
+        Interrupts the select call of the event loop.
+        """
+
+        try:
+            self._wakeup_sockets[1].send(b"\0")
+        except (BlockingIOError, OSError, TypeError):
+            # Either a wake up is already pending or the loop was never started.
+            pass
+
+    def run_loop_calls(self) -> None:
+        """
+        Runs the functions scheduled with call_in_event_loop.
+        """
+
+        self._wakeup_sockets[0].recv(1024)
+
+        while self._loop_calls:
+            function, args = self._loop_calls.popleft()
+            function(*args)
+
+    def accept_in_loop(self) -> None:
+        """
+        Accepts a connection, which stays pending until its first message identifies the neighbor.
+        """
+
+        client_address = self._socket_manager.accept()
+
+        if client_address:
+            self._selector.register(self._socket_manager.get_client_socket(client_address),
+                                    EVENT_READ,
+                                    ("pending", None, client_address))
+
+    def read_in_loop(self, key: SelectorKey) -> None:
+        """
+        Reads the messages of a readable connection and dispatches them.
+        """
+
+        kind, connection_id, client_address = key.data
+
+        try:
+            if kind == "server":
+                messages = self._socket_manager.receive_from_server(connection_id)
+            else:
+                messages = self._socket_manager.receive_from_client_by_address(client_address)
+        except (OSError, ProtocolError) as exception:
+            self._log.debug("Error on socket %s: %s", connection_id or client_address, exception)
+            messages = None
+
+        if messages is None:
+            self._selector.unregister(key.fileobj)
+            return
+
+        if kind == "pending":
+            if not messages:
+                return
+
+            message = messages[0]
+            if message.message_type == MessageType.READINESS_PROBE:
+                self._selector.unregister(key.fileobj)
+                self.answer_readiness_probe(client_address)
+                return
+
+            if message.message_type not in (MessageType.START_ELECTION, MessageType.STATE_CONFIRMATION):
+                self._log.warning("Received %s before %s", message.message_type.name, MessageType.START_ELECTION.name)
+                self._selector.unregister(key.fileobj)
+                return
+
+            connection_id = message.sender_id
+            self.register_client(connection_id, client_address)
+            self._selector.modify(key.fileobj, EVENT_READ, ("client", connection_id, client_address))
+
+        self.count_received(messages)
+
+        for message in messages:
+            self.dispatch(connection_id, message)
+
+    def count_received(self, messages: list[Message]) -> None:
+        """
+        Counts the messages read from a connection in the metrics of their elections.
+        """
+
+        if not self._groups:
+            self._metrics.count_received(messages)
+            return
+
+        for message in messages:
+            session = self._sessions.get(message.group)
+            if session is not None:
+                session.metrics.count_received([message])
+
+    def dispatch(self, connection_id: int, message: Message) -> None:
+        """
+        Passes a message to the election of its group or to the handler of its channel.
+        """
+
+        if self._tracer is not None:
+            self._tracer.receive(connection_id, message)
+
+        if message.channel == ELECTION_CHANNEL:
+            session = self._sessions.get(message.group)
+
+            if session is None:
+                self._log.warning("Received %s of the unknown group %d", message.message_type.name, message.group)
+            elif session.finished:
+                self._log.debug("Dropped %s of the finished group %d", message.message_type.name, message.group)
+            elif message.message_type == MessageType.START_ELECTION:
+                self.join_election(session, connection_id)
+            else:
+                session.handle_message(connection_id, message)
+            return
+
+        channel_handler = self._channel_handlers.get(message.channel)
+        if channel_handler is None:
+            self._log.warning("Received a message on the unknown channel %d", message.channel)
+            return
+
+        channel_handler(connection_id, message)
+
+    def send_message(self,
+                     node_id: int,
+                     message_type: MessageType,
+                     payload: bytes = b"",
+                     channel: int = ELECTION_CHANNEL,
+                     sender_id: int | None = None,
+                     group: int = DEFAULT_GROUP):
         """Sends a message, identifying if it's for a client socket or a server socket.
 
         Args:
             node_id (int): The ID of the neighbor node to send.
-            message (str): The message.
+            message_type (MessageType): The type of the message.
+            payload (bytes): The message payload.
+            channel (int): The channel of the message.
+            sender_id (int | None): The sender written in the frame, this node by default. Relays keep the
+                original sender.
+            group (int): The election group of the message.
         """
 
         try:
             connection_type = self._connection_types[node_id]
-            if connection_type == "client":
-                self._socket_manager.send_to_client(node_id, message)
-            elif connection_type == "server":
-                self._socket_manager.send_to_server(node_id, message)
+            clock = None if self._tracer is None else self._tracer.send(node_id, message_type, channel)
+            frame = encode_message(message_type, self._node_id if sender_id is None else sender_id, payload, channel,
+                                   clock, group)
+
+            # Frames written by different threads to the same socket must not interleave, a slow neighbor does
+            # not hold back the others.
+            with self._send_locks.setdefault(node_id, Lock()):
+                if connection_type == "client":
+                    self._socket_manager.send_to_client(node_id, frame)
+                elif connection_type == "server":
+                    self._socket_manager.send_to_server(node_id, frame)
 
-            print(f"Node {self._node_id} sent message: {message} to {node_id} via ", connection_type)
+            self._sessions[group].metrics.count_sent(message_type, len(frame))
+
+            self._log.debug("Sent message %s to %d via %s", message_type.name, node_id, connection_type)
         except Exception as exception:
-            print(f"Node {self._node_id} error: {exception}")
+            self._log.warning("Error sending %s to %d: %s", message_type.name, node_id, exception)
 
     def close_all_sockets(self) -> None:
         """
         Closes all sockets.
         """
 
+        if self._event_loop and self._server_thread is not None and self._server_thread is not current_thread():
+            self.finish_server()
+            self._server_thread.join()
+        elif not self._event_loop:
+            # The connection threads are woken up and joined before the descriptors are released, otherwise a
+            # thread about to read could wait on a descriptor number reused by a new socket.
+            self.finish_server()
+            self._socket_manager.shutdown_sockets()
+
+            for connection_thread in self._connection_threads:
+                if connection_thread is not current_thread():
+                    connection_thread.join()
+
         self._socket_manager.close_sockets()
+
+
+class GroupConnection():
+
+    """
+    Defines the connection manager of the election of a group, over the connections of a manager shared by the
+    election groups of the node.
+
+    It has the methods of ConnectionManager an ElectionNode uses. Finishing or closing it only ends the
+    election of the group, the connections stay open until the shared manager is closed.
+    """
+
+    _manager: ConnectionManager
+    _session: ElectionSession
+
+    def __init__(self, manager: ConnectionManager, session: ElectionSession) -> None:
+        self._manager = manager
+        self._session = session
+
+    @property
+    def metrics(self) -> NodeMetrics:
+        """
+        Returns the metrics of the election of the group.
+        """
+
+        return self._session.metrics
+
+    @property
+    def messages_sent(self) -> int:
+        """
+        Returns the number of messages of the group sent to the neighbors.
+        """
+
+        return self._session.metrics.messages_sent
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Returns the number of bytes of the group sent to the neighbors, including the frame headers.
+        """
+
+        return self._session.metrics.bytes_sent
+
+    def start_server(self, handle_message: Callable[[int, Message], None]) -> None:
+        """
+        Starts handling the messages of the group, the shared manager listens for their connections.
+        """
+
+        self._session.handle_message = handle_message
+
+    def start_leader_election(self) -> None:
+        """
+        Starts the leader election of the group.
+        """
+
+        self._manager.start_leader_election(self._session.group)
+
+    def wait_for_election_start(self) -> None:
+        """
+        Blocks until the election of the group reached this node and the start message was broadcast.
+        """
+
+        self._session.election_started.wait()
+
+    def stop_waiting_for_election(self) -> None:
+        """
+        Stops waiting for the start of the election of the group, waking up wait_for_election_start.
+        """
+
+        self._manager.stop_waiting_for_election(self._session.group)
+
+    def get_connected_ids(self) -> list[int]:
+        """
+        Returns the neighbors of the group this node has a connection with.
+        """
+
+        return self._manager.get_connected_ids(self._session.group)
+
+    def connect_to_neighbor(self,
+                            node_id: int,
+                            message_type: MessageType,
+                            payload: bytes,
+                            timeout: float | None = None) -> bool:
+        """
+        Opens a connection to a neighbor before the election of the group starts and sends its first message.
+        """
+
+        return self._manager.connect_to_neighbor(node_id, message_type, payload, timeout, self._session.group)
+
+    def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        """
+        Blocks until every neighbor of the group answers a readiness probe.
+        """
+
+        self._manager.wait_for_neighbors(timeout, self._session.group)
+
+    def send_message(self,
+                     node_id: int,
+                     message_type: MessageType,
+                     payload: bytes = b"",
+                     channel: int = ELECTION_CHANNEL,
+                     sender_id: int | None = None) -> None:
+        """
+        Sends a message of the group.
+        """
+
+        self._manager.send_message(node_id, message_type, payload, channel, sender_id, self._session.group)
+
+    def finish_server(self) -> None:
+        """
+        Stops handling the messages of the group.
+        """
+
+        self._session.finished = True
+
+    def close_all_sockets(self) -> None:
+        """
+        Ends the election of the group, without closing the shared connections.
+        """
+
+        self._session.finished = True
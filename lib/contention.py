@@ -0,0 +1,97 @@
+"""
+Module for the root contention resolution policies.
+
+A root contention happens when the last two candidates send a parenting request to each other. By default
+both reject the other request and retry after the delay given by the policy.
+"""
+
+from abc import ABC, abstractmethod
+from random import getrandbits, uniform
+
+
+class ContentionPolicy(ABC):
+
+    """
+    Defines how a node resolves a root contention.
+    """
+
+    @abstractmethod
+    def backoff(self, contention_round: int) -> float:
+        """
+        Returns how long the node waits before retrying after its contention_round-th contention, starting at 0.
+        """
+
+    def tiebreak(self, node_id: int, other_id: int) -> bool | None:
+        """
+        Returns whether the node wins a contention against other_id without retrying.
+
+        None means there is no tiebreak: both requests are rejected and both nodes back off.
+        """
+
+        return None
+
+
+class BoundedExponentialBackoff(ContentionPolicy):
+
+    """
+    Waits a random time in [minimum, minimum * 2 ** (round + 1)], never more than maximum.
+    """
+
+    _minimum: float
+    _maximum: float
+
+    def __init__(self, minimum: float = 0.002, maximum: float = 0.25) -> None:
+        if minimum <= 0 or maximum < minimum:
+            raise ValueError("The backoff needs 0 < minimum <= maximum")
+
+        self._minimum = minimum
+        self._maximum = maximum
+
+    def backoff(self, contention_round: int) -> float:
+        upper = min(self._maximum, self._minimum * 2 ** min(contention_round + 1, 64))
+
+        return uniform(self._minimum, upper)
+
+
+class RandomBitBackoff(ContentionPolicy):
+
+    """
+    The IEEE 1394 scheme: each node flips a random bit and waits a short or a long time.
+
+    The node that waits less retries first and the other one accepts its request, so long - short must be
+    larger than a round trip between the nodes.
+    """
+
+    _short: float
+    _long: float
+
+    def __init__(self, short: float = 0.002, long: float = 0.02) -> None:
+        if short < 0 or long <= short:
+            raise ValueError("The random bit backoff needs 0 <= short < long")
+
+        self._short = short
+        self._long = long
+
+    def backoff(self, contention_round: int) -> float:
+        return self._long if getrandbits(1) else self._short
+
+
+class DeterministicTiebreak(ContentionPolicy):
+
+    """
+    The node with the largest id accepts the other request and becomes the root, the other keeps waiting for
+    its answer. No node sleeps.
+    """
+
+    def backoff(self, contention_round: int) -> float:
+        return 0.0
+
+    def tiebreak(self, node_id: int, other_id: int) -> bool | None:
+        return node_id > other_id
+
+
+CONTENTION_POLICIES = {
+    "exponential": BoundedExponentialBackoff,
+    "random-bit": RandomBitBackoff,
+    "tiebreak": DeterministicTiebreak,
+}
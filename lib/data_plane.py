@@ -0,0 +1,475 @@
+"""
+Module for the flow controlled data plane between the nodes and the leader.
+
+Each node produces fixed size records and sends them to the leader in RECORD_BATCH frames, many records per
+frame. The leader grants every producer a window of records with a CREDIT frame when it connects and returns
+the credit of each batch once its records are consumed, so a producer never has more than a window of records
+in flight, however fast it is or however slow the leader consumes.
+
+Every record carries the wall clock time it was produced, which the leader subtracts from the time it consumed
+it. Across machines the latency includes the difference between their clocks.
+"""
+
+from array import array
+from logging import getLogger
+from select import select
+from selectors import EVENT_READ, EVENT_WRITE, DefaultSelector, SelectorKey
+from socket import AF_INET, SHUT_WR, SO_REUSEADDR, SOCK_STREAM, SOL_SOCKET, socket
+from statistics import quantiles
+from time import monotonic, perf_counter, sleep, time
+from typing import Callable, NamedTuple
+
+from lib.message import (CREDIT_PAYLOAD, DATA_CHANNEL, RECORD, Message, MessageReader, MessageType, ProtocolError,
+                         encode_message)
+
+logger = getLogger(__name__)
+
+
+class DataPlaneOptions(NamedTuple):
+
+    """
+    Defines how the nodes produce their records.
+
+    rate is in records per second for each producer, None sends as fast as the credit allows. window is the
+    number of records the leader lets each producer have in flight.
+    """
+
+    records: int = 10000
+    record_size: int = 64
+    batch_size: int = 256
+    rate: float | None = None
+    window: int = 4096
+
+
+def encode_records(records: list[tuple[float, bytes]]) -> bytes:
+    """
+    Encodes the (produced at, bytes) records of a batch into a RECORD_BATCH payload.
+    """
+
+    pack = RECORD.pack
+
+    return b"".join(pack(produced_at, len(record)) + record for produced_at, record in records)
+
+
+def decode_records(payload: bytes) -> list[tuple[float, bytes]]:
+    """
+    Decodes the records of a RECORD_BATCH payload.
+
+    Raises ProtocolError if a record is truncated.
+    """
+
+    records = []
+    unpack_from = RECORD.unpack_from
+    header_size = RECORD.size
+    start = 0
+
+    while start < len(payload):
+        if len(payload) - start < header_size:
+            raise ProtocolError(f"Record header truncated at byte {start} of {len(payload)}")
+
+        produced_at, length = unpack_from(payload, start)
+        start += header_size
+
+        if len(payload) - start < length:
+            raise ProtocolError(f"Record of {length} bytes truncated at byte {start} of {len(payload)}")
+
+        records.append((produced_at, payload[start:start + length]))
+        start += length
+
+    return records
+
+
+class DataProducer():
+
+    """
+    Defines the sending side of the data plane, which streams the records of a node on a connection to the
+    leader and ends it with END_OF_STREAM.
+
+    With a rate, the records are due at fixed times from the start and each one is stamped with its due time,
+    so the latency includes the time a record waited for credit or for the previous send. Whatever is due and
+    allowed by the credit is sent in a single batch, up to batch_size records.
+    """
+
+    _node_id: int
+    _options: DataPlaneOptions
+    _credit: int
+    _reader: MessageReader
+    _records_sent: int
+    _batches_sent: int
+    _credit_waits: int
+    _elapsed: float
+
+    def __init__(self, node_id: int, options: DataPlaneOptions) -> None:
+        self._node_id = node_id
+        self._options = options
+        self._credit = 0
+        self._reader = MessageReader(4096)
+        self._records_sent = 0
+        self._batches_sent = 0
+        self._credit_waits = 0
+        self._elapsed = 0.0
+
+    def run(self, connection: socket, make_record: Callable[[int], bytes] | None = None) -> None:
+        """
+        Sends every record on a connected blocking socket and the end of the stream, returning once the leader
+        closed the connection.
+
+        Args:
+            make_record (Callable): returns the bytes of the record with the given index, by default the node
+                id repeated up to record_size bytes.
+        """
+
+        options = self._options
+        record = (str(self._node_id).encode("utf-8") * options.record_size)[:options.record_size]
+        make_record = make_record or (lambda index: record)
+        start_time = time()
+        start = perf_counter()
+
+        while self._records_sent < options.records:
+            remaining = options.records - self._records_sent
+            due = remaining
+
+            if options.rate is not None:
+                due = min(remaining, int((time() - start_time) * options.rate) + 1 - self._records_sent)
+                if due <= 0:
+                    sleep(max(0.0, self._records_sent / options.rate - (time() - start_time)))
+                    continue
+
+            self.receive_credit(connection, block=self._credit == 0)
+
+            count = min(due, options.batch_size, self._credit)
+            now = time()
+            records = []
+            for index in range(self._records_sent, self._records_sent + count):
+                produced_at = now if options.rate is None else start_time + index / options.rate
+                records.append((produced_at, make_record(index)))
+
+            connection.sendall(encode_message(MessageType.RECORD_BATCH, self._node_id, encode_records(records),
+                                              DATA_CHANNEL))
+            self._credit -= count
+            self._records_sent += count
+            self._batches_sent += 1
+
+        connection.sendall(encode_message(MessageType.END_OF_STREAM, self._node_id, channel=DATA_CHANNEL))
+        self._elapsed = perf_counter() - start
+
+        # Closing with unread credit would reset the connection and lose the records the leader did not read yet,
+        # so the producer reads until the leader closes it.
+        connection.shutdown(SHUT_WR)
+        while self._reader.receive(connection) is not None:
+            pass
+
+    def receive_credit(self, connection: socket, block: bool) -> None:
+        """
+        Reads the credit the leader returned, waiting for some if block is True.
+
+        Raises ConnectionError if the leader closed the connection.
+        """
+
+        if block:
+            self._credit_waits += 1
+
+        while True:
+            readable, _, _ = select([connection], [], [], None if block else 0)
+            if not readable:
+                return
+
+            messages = self._reader.receive(connection)
+            if messages is None:
+                raise ConnectionError("The leader closed the data connection")
+
+            for message in messages:
+                if message.message_type == MessageType.CREDIT:
+                    self._credit += CREDIT_PAYLOAD.unpack(message.payload)[0]
+
+            if self._credit > 0:
+                block = False
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        Returns the counters of the last run: records and batches sent, how many times the producer stopped to
+        wait for credit and how long it took.
+        """
+
+        return {
+            "records_sent": self._records_sent,
+            "batches_sent": self._batches_sent,
+            "credit_waits": self._credit_waits,
+            "elapsed": self._elapsed,
+        }
+
+
+class ProducerConnection():
+
+    """
+    Defines the state the leader keeps for the connection of a producer: its frame reader, the credit frames
+    not yet written to it and how many more records it may send.
+    """
+
+    __slots__ = ("reader", "outgoing", "credit")
+
+    reader: MessageReader
+    outgoing: bytearray
+    credit: int
+
+    def __init__(self, credit: int) -> None:
+        self.reader = MessageReader()
+        self.outgoing = bytearray()
+        self.credit = credit
+
+
+class DataPlaneServer():
+
+    """
+    Defines the receiving side of the data plane, which consumes the records of the producers in a single
+    selector loop.
+
+    A producer gets a window of credit when it connects and the credit of every batch back once its records are
+    consumed, in one CREDIT frame per read. The credit frames are written without blocking the loop; the ones a
+    producer does not read right away wait in its outgoing buffer. They carry the sender id -1, the server does
+    not need to know the id of the leader. The server counts the credit of each producer itself, and a producer
+    that sends more records than it was granted, or a malformed batch, is dropped.
+    """
+
+    _address: tuple[str, int]
+    _expected_clients: int
+    _window: int
+    _backlog: int
+    _consume: Callable[[int, list[tuple[float, bytes]]], None] | None
+    _server_socket: socket | None
+    _finished_clients: int
+    _dropped_clients: int
+    _records_received: int
+    _bytes_received: int
+    _batches_received: int
+    _latencies: array  # seconds from the production to the consumption of each record
+    _elapsed: float
+
+    def __init__(self,
+                 address: tuple[str, int],
+                 expected_clients: int,
+                 window: int = DataPlaneOptions().window,
+                 backlog: int = 128,
+                 consume: Callable[[int, list[tuple[float, bytes]]], None] | None = None) -> None:
+        """
+        Args:
+            address (tuple[str, int]): where the server listens.
+            expected_clients (int): how many producers are served before serve returns.
+            window (int): how many records each producer may have in flight.
+            backlog (int): the listen backlog, large enough for every producer to connect at once.
+            consume (Callable): called from the loop with the sender id and the (produced at, bytes) records of
+                each batch; the credit of the batch is only returned after it returns.
+        """
+
+        self._address = address
+        self._expected_clients = expected_clients
+        self._window = window
+        self._backlog = backlog
+        self._consume = consume
+        self._server_socket = None
+        self._finished_clients = 0
+        self._dropped_clients = 0
+        self._records_received = 0
+        self._bytes_received = 0
+        self._batches_received = 0
+        self._latencies = array("d")
+        self._elapsed = 0.0
+
+    def listen(self) -> None:
+        """
+        Binds the server, so the producers can connect before serve is called.
+        """
+
+        if self._server_socket is not None:
+            return
+
+        self._server_socket = socket(AF_INET, SOCK_STREAM)
+        self._server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self._server_socket.bind(self._address)
+        self._server_socket.listen(self._backlog)
+        self._server_socket.setblocking(False)
+
+    def serve(self, timeout: float | None = None) -> None:
+        """
+        Consumes the records of the expected producers until each one ends its stream or closes its connection,
+        binding the server first unless listen was called.
+
+        Raises TimeoutError if they did not finish in timeout seconds.
+        """
+
+        self.listen()
+        server_socket = self._server_socket
+        self._server_socket = None
+
+        selector = DefaultSelector()
+        selector.register(server_socket, EVENT_READ, None)
+        deadline = None if timeout is None else monotonic() + timeout
+        start = perf_counter()
+
+        try:
+            while self._finished_clients + self._dropped_clients < self._expected_clients:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Only {self._finished_clients} of {self._expected_clients} producers "
+                                       f"finished")
+
+                for key, events in selector.select(remaining):
+                    if key.data is None:
+                        self.accept(server_socket, selector)
+                        continue
+
+                    if events & EVENT_WRITE:
+                        self.flush(key, selector)
+                    if events & EVENT_READ and key.fileobj in selector.get_map():
+                        self.read(key, selector)
+        finally:
+            self._elapsed = perf_counter() - start
+
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+    def get_stats(self) -> dict[str, int | float | None]:
+        """
+        Returns the counters of the last serve call, the records consumed per second and the percentiles of the
+        latency of the records, in seconds, None without records.
+        """
+
+        stats = {
+            "producers": self._finished_clients,
+            "dropped_producers": self._dropped_clients,
+            "records_received": self._records_received,
+            "bytes_received": self._bytes_received,
+            "batches_received": self._batches_received,
+            "elapsed": self._elapsed,
+            "records_per_second": self._records_received / self._elapsed if self._elapsed > 0 else 0.0,
+            "latency_p50": None,
+            "latency_p90": None,
+            "latency_p99": None,
+            "latency_p999": None,
+            "latency_max": None,
+        }
+
+        if len(self._latencies) >= 2:
+            percentiles = quantiles(self._latencies, n=1000, method="inclusive")
+            stats.update(latency_p50=percentiles[499], latency_p90=percentiles[899], latency_p99=percentiles[989],
+                         latency_p999=percentiles[998], latency_max=max(self._latencies))
+
+        return stats
+
+    # non public lib methods
+
+    def accept(self, server_socket: socket, selector: DefaultSelector) -> None:
+        """
+        Accepts every pending connection and grants it a window of credit.
+        """
+
+        while True:
+            try:
+                client_socket, _ = server_socket.accept()
+            except BlockingIOError:
+                return
+
+            client_socket.setblocking(False)
+            producer = ProducerConnection(self._window)
+            producer.outgoing += encode_message(MessageType.CREDIT, -1, CREDIT_PAYLOAD.pack(self._window),
+                                                DATA_CHANNEL)
+            selector.register(client_socket, EVENT_READ, producer)
+            self.flush(selector.get_key(client_socket), selector)
+
+    def read(self, key: SelectorKey, selector: DefaultSelector) -> None:
+        """
+        Reads the frames of a readable producer, consumes its records and returns their credit.
+        """
+
+        client_socket = key.fileobj
+        producer = key.data
+
+        try:
+            messages = producer.reader.receive(client_socket)
+        except BlockingIOError:
+            return
+        except (OSError, ProtocolError) as exception:
+            logger.warning("Data plane error: %s", exception)
+            messages = None
+
+        if messages is None:
+            logger.warning("Producer closed the connection without an end of stream")
+            self._dropped_clients += 1
+            self.close(client_socket, selector)
+            return
+
+        credit = 0
+        try:
+            for message in messages:
+                if message.message_type == MessageType.RECORD_BATCH:
+                    credit += self.consume(producer, message)
+                elif message.message_type == MessageType.END_OF_STREAM:
+                    self._finished_clients += 1
+                    self.close(client_socket, selector)
+                    return
+        except ProtocolError as exception:
+            logger.warning("Data plane error, dropping the producer: %s", exception)
+            self._dropped_clients += 1
+            self.close(client_socket, selector)
+            return
+
+        if credit > 0:
+            producer.credit += credit
+            producer.outgoing += encode_message(MessageType.CREDIT, -1, CREDIT_PAYLOAD.pack(credit), DATA_CHANNEL)
+            self.flush(key, selector)
+
+    def consume(self, producer: ProducerConnection, message: Message) -> int:
+        """
+        Consumes the records of a batch and returns how many there were.
+
+        Raises ProtocolError if the batch is malformed or has more records than the credit of the producer.
+        """
+
+        records = decode_records(message.payload)
+
+        if len(records) > producer.credit:
+            raise ProtocolError(f"Batch of {len(records)} records from {message.sender_id} is over its credit of "
+                                f"{producer.credit}")
+        producer.credit -= len(records)
+
+        if self._consume is not None:
+            self._consume(message.sender_id, records)
+
+        consumed_at = time()
+        self._latencies.extend(consumed_at - produced_at for produced_at, _ in records)
+        self._records_received += len(records)
+        self._bytes_received += sum(len(record) for _, record in records)
+        self._batches_received += 1
+
+        return len(records)
+
+    def flush(self, key: SelectorKey, selector: DefaultSelector) -> None:
+        """
+        Writes the pending credit frames of a producer, waiting to write the rest while its socket is full.
+        """
+
+        client_socket = key.fileobj
+        producer = key.data
+
+        try:
+            sent = client_socket.send(producer.outgoing)
+            del producer.outgoing[:sent]
+        except BlockingIOError:
+            pass
+        except OSError as exception:
+            # The reads notice the closed connection.
+            logger.warning("Data plane error returning credit: %s", exception)
+            producer.outgoing.clear()
+
+        events = EVENT_READ | EVENT_WRITE if producer.outgoing else EVENT_READ
+        if events != selector.get_key(client_socket).events:
+            selector.modify(client_socket, events, producer)
+
+    def close(self, client_socket: socket, selector: DefaultSelector) -> None:
+        """
+        Stops serving a producer.
+        """
+
+        selector.unregister(client_socket)
+        client_socket.close()
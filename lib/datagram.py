@@ -0,0 +1,603 @@
+"""
+Module for the datagram transport of the election.
+
+The election messages are a few bytes each, but over TCP the start of the election waits for a connection to
+every neighbor before it goes on. With the datagram transport a node sends its frames in UDP datagrams from the
+socket bound to its election address, so the start of the election reaches a neighbor in a single datagram.
+
+The datagrams of each link are numbered and acknowledged cumulatively, every datagram carrying the number of
+frames the sender delivered from the receiver, so a lost acknowledgement is covered by any later one. A datagram
+not acknowledged in time is sent again with an exponential backoff, and the receiver acknowledges the copies but
+delivers each frame once and in order, as a TCP connection would. The receiver keeps at most a window of frames
+received ahead of a missing one and drops the ones beyond it, which their sender sends again. A node closing its
+socket tells its neighbors, which stop sending it again the datagrams it did not acknowledge. After
+max_retransmissions the sender gives up on a datagram and the frames after it on the link are never delivered,
+like a broken connection.
+"""
+
+from __future__ import annotations
+
+from enum import IntEnum
+from logging import getLogger
+from random import random
+from select import select
+from socket import AF_INET, SOCK_DGRAM, socket
+from struct import Struct
+from threading import Event, Lock, Thread, current_thread
+from time import monotonic, perf_counter, sleep
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+from lib.connection_manager import ElectionSession
+from lib.log import NodeLogger
+from lib.message import (DEFAULT_GROUP, ELECTION_CHANNEL, Message, MessageReader, MessageType, ProtocolError,
+                         encode_message)
+from lib.metrics import WAKE_UP, NodeMetrics
+from lib.trace import Tracer
+
+if TYPE_CHECKING:
+    from lib.election_node import NodeAddress
+
+logger = getLogger(__name__)
+
+# Header of every datagram: its kind, its sequence number on the link (0 if it is not numbered), the number of
+# frames delivered in order from the receiver and the sender id. A FRAME datagram carries a frame of the
+# election after the header.
+DATAGRAM = Struct("!BIIi")
+
+# Copies of the CLOSE datagram sent to each neighbor when the manager is closed.
+CLOSE_COPIES = 3
+
+
+class DatagramKind(IntEnum):
+    """
+    Defines the kinds of datagrams.
+    """
+
+    FRAME = 1
+    ACK = 2
+    PROBE = 3
+    READY = 4
+    CLOSE = 5
+
+
+class DatagramOptions(NamedTuple):
+
+    """
+    Defines the retransmissions of the datagram transport.
+
+    retransmit_timeout is the time a datagram waits for its acknowledgement before it is sent again, doubled at
+    each retransmission up to max_retransmit_timeout. window is how many frames of a link past the next one to
+    deliver the receiver keeps while that one is missing; the frames beyond it are dropped without an
+    acknowledgement and wait for their retransmission. loss drops that fraction of the outgoing datagrams, to
+    exercise the retransmissions.
+    """
+
+    retransmit_timeout: float = 0.02
+    max_retransmit_timeout: float = 1.0
+    max_retransmissions: int = 10
+    window: int = 64
+    loss: float = 0.0
+
+
+class PendingDatagram():
+
+    """
+    Defines a numbered datagram waiting for its acknowledgement.
+    """
+
+    __slots__ = ("datagram", "address", "deadline", "timeout", "retransmissions")
+
+    datagram: bytes
+    address: tuple[str, int]
+    deadline: float
+    timeout: float
+    retransmissions: int
+
+    def __init__(self, datagram: bytes, address: tuple[str, int], timeout: float) -> None:
+        self.datagram = datagram
+        self.address = address
+        self.deadline = monotonic() + timeout
+        self.timeout = timeout
+        self.retransmissions = 0
+
+
+class DatagramConnectionManager():
+
+    """
+    Defines the connection manager of an election over datagrams.
+
+    It has the methods of ConnectionManager an ElectionNode uses, for a single election without application
+    channels. A thread reads the socket, acknowledges and delivers the frames and sends the retransmissions.
+    """
+
+    _node_id: int
+    _server_address: NodeAddress
+    _neighbors_addresses: dict[int, NodeAddress]
+    _options: DatagramOptions
+    _connect_timeout: float
+    _socket: socket
+    _session: ElectionSession
+    _metrics: NodeMetrics
+    _tracer: Tracer | None
+    _lock: Lock
+    _next_sequence: dict[int, int]  # by neighbor, of the next datagram sent
+    _pending: dict[int, dict[int, PendingDatagram]]  # by neighbor and sequence number
+    _next_delivery: dict[int, int]  # by neighbor, of the next frame delivered
+    _out_of_order: dict[int, dict[int, bytes]]  # by neighbor, the frames received ahead of the next delivery
+    _readers: dict[int, MessageReader]
+    _linked_ids: set[int]  # the neighbors this node sent a frame to or received one from
+    _ready: dict[int, Event]  # by neighbor, set when it answers a readiness probe
+    _last_frame_at: float
+    _server_finished: bool
+    _closed: bool
+    _server_thread: Thread | None
+    _retransmissions: int
+    _duplicates: int
+    _beyond_window: int
+    _given_up: int
+    _log: NodeLogger
+
+    def __init__(self,
+                 node_id: int,
+                 server_address: NodeAddress,
+                 neighbors_addresses: dict[int, NodeAddress],
+                 options: DatagramOptions | None = None,
+                 connect_timeout: float = 30.0,
+                 election_start_handler: Callable[[], None] | None = None,
+                 metrics: NodeMetrics | None = None,
+                 tracer: Tracer | None = None) -> None:
+        """
+        Args:
+            connect_timeout (float): how long wait_for_neighbors probes the neighbors by default.
+            election_start_handler (Callable): called when the election reaches this node, before the start
+                message is forwarded to the neighbors.
+            metrics (NodeMetrics): where the messages and the wake up phase are counted.
+            tracer (Tracer): if set, the frames carry the Lamport clock of the node and the sends and receives
+                are traced.
+        """
+
+        self._node_id = node_id
+        self._server_address = server_address
+        self._neighbors_addresses = neighbors_addresses
+        self._options = options or DatagramOptions()
+        self._connect_timeout = connect_timeout
+        self._socket = socket(AF_INET, SOCK_DGRAM)
+        self._metrics = metrics or NodeMetrics()
+        self._session = ElectionSession(DEFAULT_GROUP, neighbors_addresses, election_start_handler, self._metrics)
+        self._tracer = tracer
+        self._lock = Lock()
+        self._next_sequence = {}
+        self._pending = {}
+        self._next_delivery = {}
+        self._out_of_order = {}
+        self._readers = {}
+        self._linked_ids = set()
+        self._ready = {node_id: Event() for node_id in neighbors_addresses}
+        self._last_frame_at = 0.0
+        self._server_finished = False
+        self._closed = False
+        self._server_thread = None
+        self._retransmissions = 0
+        self._duplicates = 0
+        self._beyond_window = 0
+        self._given_up = 0
+        self._log = NodeLogger(logger, node_id)
+
+    @property
+    def metrics(self) -> NodeMetrics:
+        """
+        Returns the metrics of the election.
+        """
+
+        return self._metrics
+
+    @property
+    def messages_sent(self) -> int:
+        """
+        Returns the number of messages sent to the neighbors, without the retransmissions.
+        """
+
+        return self._metrics.messages_sent
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Returns the number of bytes sent to the neighbors, including the datagram and frame headers.
+        """
+
+        return self._metrics.bytes_sent
+
+    @property
+    def retransmissions(self) -> int:
+        """
+        Returns the number of datagrams sent again.
+        """
+
+        return self._retransmissions
+
+    @property
+    def duplicates(self) -> int:
+        """
+        Returns the number of copies of already received frames that were dropped.
+        """
+
+        return self._duplicates
+
+    @property
+    def beyond_window(self) -> int:
+        """
+        Returns the number of frames dropped because they arrived too far ahead of the next delivery.
+        """
+
+        return self._beyond_window
+
+    def start_server(self, handle_message: Callable[[int, Message], None]) -> None:
+        """
+        Binds the socket to the election address and starts the thread that reads it.
+        """
+
+        self._session.handle_message = handle_message
+        self._socket.bind(self._server_address.get_address())
+
+        self._log.info("Listening for datagrams on %s", self._server_address)
+
+        self._server_thread = Thread(target=self.run)
+        self._server_thread.start()
+
+    def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        """
+        Blocks until every neighbor answers a readiness probe, sent again with the retransmission backoff.
+
+        Raises TimeoutError if a neighbor is not ready in timeout seconds, by default the connect timeout.
+        """
+
+        deadline = monotonic() + (self._connect_timeout if timeout is None else timeout)
+        probe = DATAGRAM.pack(DatagramKind.PROBE, 0, 0, self._node_id)
+
+        for neighbor_id, address in self._neighbors_addresses.items():
+            interval = self._options.retransmit_timeout
+
+            while not self._ready[neighbor_id].is_set():
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Node {neighbor_id} at {address} did not answer the readiness probe")
+
+                self.transmit(probe, address.get_address())
+                self._ready[neighbor_id].wait(min(interval, remaining))
+                interval = min(2 * interval, self._options.max_retransmit_timeout)
+
+            self._log.debug("Neighbor %d is ready", neighbor_id)
+
+    def start_leader_election(self) -> None:
+        """
+        Starts the leader election.
+        """
+
+        self.join_election(None)
+
+    def wait_for_election_start(self) -> None:
+        """
+        Blocks until the election reached this node and the start message was sent to the neighbors.
+        """
+
+        self._session.election_started.wait()
+
+    def stop_waiting_for_election(self) -> None:
+        """
+        Stops waiting for the start of the election, once a persisted election was confirmed without it or the
+        node is closed, waking up wait_for_election_start.
+        """
+
+        with self._session.lock:
+            self._session.waiting_for_election = False
+
+        self._session.election_started.set()
+
+    def get_connected_ids(self) -> list[int]:
+        """
+        Returns the neighbors this node exchanged frames with.
+        """
+
+        with self._lock:
+            return [node_id for node_id in self._linked_ids if node_id in self._neighbors_addresses]
+
+    def connect_to_neighbor(self,
+                            node_id: int,
+                            message_type: MessageType,
+                            payload: bytes,
+                            timeout: float | None = None) -> bool:
+        """
+        Sends the first message to a neighbor before the election starts, to confirm a persisted election.
+
+        Returns False if the election already started or the node already exchanged frames with the neighbor.
+        There is no connection to wait for, so the timeout is not used.
+        """
+
+        with self._session.lock:
+            if not self._session.waiting_for_election or node_id in self._linked_ids:
+                return False
+
+            self.send_message(node_id, message_type, payload)
+
+        return True
+
+    def send_message(self,
+                     node_id: int,
+                     message_type: MessageType,
+                     payload: bytes = b"",
+                     channel: int = ELECTION_CHANNEL,
+                     sender_id: int | None = None) -> None:
+        """
+        Sends a message to a neighbor in a numbered datagram, which is sent again until it is acknowledged.
+        """
+
+        try:
+            clock = None if self._tracer is None else self._tracer.send(node_id, message_type, channel)
+            frame = encode_message(message_type, self._node_id if sender_id is None else sender_id, payload, channel,
+                                   clock)
+            address = self._neighbors_addresses[node_id].get_address()
+
+            with self._lock:
+                sequence = self._next_sequence.get(node_id, 1)
+                self._next_sequence[node_id] = sequence + 1
+                datagram = DATAGRAM.pack(DatagramKind.FRAME, sequence, self.get_delivered(node_id),
+                                         self._node_id) + frame
+                self._pending.setdefault(node_id, {})[sequence] = PendingDatagram(datagram, address,
+                                                                                   self._options.retransmit_timeout)
+                self._linked_ids.add(node_id)
+
+            self.transmit(datagram, address)
+            self._metrics.count_sent(message_type, len(datagram))
+
+            self._log.debug("Sent message %s to %d in datagram %d", message_type.name, node_id, sequence)
+        except Exception as exception:
+            self._log.warning("Error sending %s to %d: %s", message_type.name, node_id, exception)
+
+    def finish_server(self) -> None:
+        """
+        Stops delivering the messages received. The datagrams are still acknowledged until the manager is
+        closed.
+        """
+
+        self._server_finished = True
+
+    def close_all_sockets(self) -> None:
+        """
+        Waits for the acknowledgement of the datagrams sent, or for the sender to give up on them, and until no
+        frame arrived for a few retransmission timeouts, then stops the thread and closes the socket.
+        """
+
+        self.finish_server()
+
+        # The last frames of the election, like the acknowledgement of the leader announcement, must not be lost
+        # with the socket. The quiet period answers the copies a neighbor sends when an acknowledgement of this
+        # node was lost, which it would otherwise send until it gives up, like the TIME_WAIT of TCP.
+        quiet_period = 4 * self._options.retransmit_timeout
+        lingering = self._server_thread is not None and self._server_thread is not current_thread()
+        while lingering and self._server_thread.is_alive() and (
+                any(self._pending.values()) or monotonic() - self._last_frame_at < quiet_period):
+            sleep(self._options.retransmit_timeout)
+
+        # Like the FIN of TCP, the neighbors stop sending again the datagrams this node will no longer
+        # acknowledge. It is not acknowledged itself, so it is sent a few times.
+        with self._lock:
+            linked_ids = list(self._linked_ids)
+        if self._server_thread is not None:
+            for node_id in linked_ids:
+                close = DATAGRAM.pack(DatagramKind.CLOSE, 0, self.get_delivered(node_id), self._node_id)
+                for _ in range(CLOSE_COPIES):
+                    self.transmit(close, self._neighbors_addresses[node_id].get_address())
+
+        self._closed = True
+        if self._server_thread is not None and self._server_thread is not current_thread():
+            self._server_thread.join()
+
+        self._socket.close()
+
+        self._log.debug("Datagram transport closed: %d retransmissions, %d duplicates, %d beyond the window, "
+                        "%d given up", self._retransmissions, self._duplicates, self._beyond_window, self._given_up)
+
+    # non public lib methods
+
+    def run(self) -> None:
+        """
+        Reads the datagrams and sends the retransmissions until the manager is closed.
+        """
+
+        while not self._closed:
+            timeout = self.retransmit()
+
+            try:
+                readable, _, _ = select([self._socket], [], [], timeout)
+                if not readable:
+                    continue
+
+                datagram, address = self._socket.recvfrom(65536)
+            except ConnectionRefusedError:
+                # The port unreachable answer to a datagram sent before the neighbor was bound.
+                continue
+            except (OSError, ValueError):
+                # The socket was closed.
+                break
+
+            self.handle_datagram(datagram, address)
+
+    def retransmit(self) -> float:
+        """
+        Sends again the datagrams whose acknowledgement is late and returns how long the reader may wait for the
+        next one.
+        """
+
+        now = monotonic()
+        due = []
+        next_deadline = now + self._options.retransmit_timeout
+
+        with self._lock:
+            for node_id, pending_datagrams in self._pending.items():
+                for sequence, pending in list(pending_datagrams.items()):
+                    if pending.deadline > now:
+                        next_deadline = min(next_deadline, pending.deadline)
+                        continue
+
+                    if pending.retransmissions >= self._options.max_retransmissions:
+                        del pending_datagrams[sequence]
+                        self._given_up += 1
+                        self._log.warning("Gave up on datagram %d to %d after %d retransmissions",
+                                          sequence, node_id, pending.retransmissions)
+                        continue
+
+                    pending.retransmissions += 1
+                    pending.timeout = min(2 * pending.timeout, self._options.max_retransmit_timeout)
+                    pending.deadline = now + pending.timeout
+                    next_deadline = min(next_deadline, pending.deadline)
+                    due.append(pending)
+
+        for pending in due:
+            self._retransmissions += 1
+            self.transmit(pending.datagram, pending.address)
+
+        return max(0.0, next_deadline - monotonic())
+
+    def transmit(self, datagram: bytes, address: tuple[str, int]) -> None:
+        """
+        Sends a datagram, or drops it with the probability of the loss option.
+        """
+
+        if self._options.loss > 0 and random() < self._options.loss:
+            return
+
+        try:
+            self._socket.sendto(datagram, address)
+        except OSError as exception:
+            # The retransmissions cover a datagram the kernel did not take.
+            self._log.debug("Error sending a datagram to %s:%d: %s", *address, exception)
+
+    def handle_datagram(self, datagram: bytes, address: tuple[str, int]) -> None:
+        """
+        Handles a datagram received from a neighbor.
+        """
+
+        if len(datagram) < DATAGRAM.size:
+            self._log.warning("Received a datagram of %d bytes from %s:%d", len(datagram), *address)
+            return
+
+        kind, sequence, acknowledged, sender_id = DATAGRAM.unpack_from(datagram)
+
+        match kind:
+            case DatagramKind.FRAME if sender_id in self._neighbors_addresses:
+                self._last_frame_at = monotonic()
+                self.acknowledge(sender_id, acknowledged)
+                self.receive_frame(sender_id, sequence, datagram[DATAGRAM.size:])
+                self.transmit(DATAGRAM.pack(DatagramKind.ACK, 0, self.get_delivered(sender_id), self._node_id),
+                              address)
+            case DatagramKind.ACK:
+                self.acknowledge(sender_id, acknowledged)
+            case DatagramKind.CLOSE:
+                with self._lock:
+                    self._pending.pop(sender_id, None)
+            case DatagramKind.PROBE:
+                self.transmit(DATAGRAM.pack(DatagramKind.READY, 0, 0, self._node_id), address)
+            case DatagramKind.READY if sender_id in self._ready:
+                self._ready[sender_id].set()
+            case _:
+                self._log.warning("Received an unexpected datagram of kind %d from %d", kind, sender_id)
+
+    def get_delivered(self, node_id: int) -> int:
+        """
+        Returns the number of frames of a neighbor delivered in order, the cumulative acknowledgement sent to it.
+        """
+
+        return self._next_delivery.get(node_id, 1) - 1
+
+    def acknowledge(self, node_id: int, acknowledged: int) -> None:
+        """
+        Stops sending again the datagrams to a neighbor up to the sequence number it acknowledged.
+        """
+
+        with self._lock:
+            pending_datagrams = self._pending.get(node_id, {})
+            for sequence in [sequence for sequence in pending_datagrams if sequence <= acknowledged]:
+                del pending_datagrams[sequence]
+
+    def receive_frame(self, sender_id: int, sequence: int, frame: bytes) -> None:
+        """
+        Delivers the frames of a neighbor in order, once each, keeping the ones ahead of the next delivery up to
+        the window.
+        """
+
+        next_delivery = self._next_delivery.get(sender_id, 1)
+        out_of_order = self._out_of_order.setdefault(sender_id, {})
+
+        if sequence < next_delivery or sequence in out_of_order:
+            self._duplicates += 1
+            return
+
+        if sequence > next_delivery + self._options.window:
+            self._beyond_window += 1
+            self._log.debug("Dropped the datagram %d of %d, beyond the window after %d", sequence, sender_id,
+                            next_delivery)
+            return
+
+        out_of_order[sequence] = frame
+
+        with self._lock:
+            self._linked_ids.add(sender_id)
+
+        while next_delivery in out_of_order:
+            frame = out_of_order.pop(next_delivery)
+            next_delivery += 1
+            self._next_delivery[sender_id] = next_delivery
+
+            try:
+                messages = self._readers.setdefault(sender_id, MessageReader(256)).feed(frame)
+            except ProtocolError as exception:
+                self._log.warning("Protocol error in a datagram of %d: %s", sender_id, exception)
+                continue
+
+            self._metrics.count_received(messages)
+            for message in messages:
+                self.dispatch(sender_id, message)
+
+    def dispatch(self, sender_id: int, message: Message) -> None:
+        """
+        Passes a message to the election.
+        """
+
+        if self._tracer is not None:
+            self._tracer.receive(sender_id, message)
+
+        if self._server_finished:
+            self._log.debug("Dropped %s of %d, the election finished", message.message_type.name, sender_id)
+        elif message.channel != ELECTION_CHANNEL:
+            self._log.warning("Received a message on the channel %d, datagrams only carry the election",
+                              message.channel)
+        elif message.message_type == MessageType.START_ELECTION:
+            self.join_election(sender_id)
+        else:
+            self._session.handle_message(sender_id, message)
+
+    def join_election(self, sender_id: int | None) -> None:
+        """
+        Forwards the start of the election to every neighbor but the sender, the first time it reaches the node.
+        """
+
+        with self._session.lock:
+            if not self._session.waiting_for_election:
+                return
+
+            self._session.waiting_for_election = False
+
+        started = perf_counter()
+
+        if self._tracer is not None:
+            self._tracer.start_election(sender_id)
+
+        if self._session.election_start_handler is not None:
+            self._session.election_start_handler()
+
+        for neighbor_id in self._neighbors_addresses:
+            if neighbor_id != sender_id:
+                self.send_message(neighbor_id, MessageType.START_ELECTION)
+
+        self._metrics.observe_phase(WAKE_UP, perf_counter() - started)
+        self._session.election_started.set()
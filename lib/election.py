@@ -2,9 +2,22 @@
 The Leader Election Protocol of IEEE 1394
 """
 
+import asyncio
+from concurrent.futures import Future
 from time import sleep
+from typing import Callable
 
-from lib.election_node import ElectionNode, NodeAddress
+from lib.async_election_node import AsyncElectionNode
+from lib.connection_manager import ConnectionManager
+from lib.contention import ContentionPolicy
+from lib.datagram import DatagramOptions
+from lib.election_state import ElectionStateStore
+from lib.election_node import ElectionNode, NodeAddress, NodeState
+from lib.failure_detector import FailureDetector
+from lib.message import Message, MessageType
+from lib.placement import PlacementPolicy
+from lib.trace import Tracer
+from lib.transport import Transport
 
 
 class ElectionProtocolManager():
@@ -15,32 +28,526 @@ class ElectionProtocolManager():
 
     _election_node: ElectionNode
 
-    def __init__(self, node_id: int, node_host: str, node_port: int, neighbors: dict[int, tuple[str, int]]) -> None:
+    def __init__(self,
+                 node_id: int,
+                 node_host: str,
+                 node_port: int,
+                 neighbors: dict[int, tuple[str, int]],
+                 event_loop: bool = False,
+                 connect_timeout: float = 30.0,
+                 contention_policy: ContentionPolicy | None = None,
+                 capacity: float = 1.0,
+                 placement_policy: PlacementPolicy | None = None,
+                 channel_handlers: dict[int, Callable[[int, Message], None]] | None = None,
+                 heartbeat_interval: float | None = None,
+                 failure_detector: FailureDetector | None = None,
+                 state_store: ElectionStateStore | None = None,
+                 confirmation_timeout: float | None = None,
+                 tracer: Tracer | None = None,
+                 ack_timeout: float | None = None,
+                 datagram: DatagramOptions | None = None,
+                 transport: Transport | None = None,
+                 neighbor_transports: dict[int, Transport] | None = None) -> None:
+        """
+        Args:
+            event_loop (bool): if True, all connections of the node are multiplexed in a single selector thread
+                instead of one thread per connection.
+            connect_timeout (float): how long the connections to the neighbors are retried while they are not
+                listening yet.
+            contention_policy (ContentionPolicy): how root contentions are resolved, by default a bounded
+                exponential backoff.
+            capacity (float): the weight the node advertises to the capacity placement policy, a finite,
+                non-negative number.
+            placement_policy (PlacementPolicy): which node of the spanning tree becomes the leader, by default its
+                root.
+            channel_handlers (dict): the handlers of the application channels multiplexed over the election
+                connections, called with the neighbor id and the message. With channels the connections stay
+                open after the election until close is called.
+            heartbeat_interval (float): if set, the node keeps its tree links open after the election and sends
+                heartbeats over them every heartbeat_interval seconds. When a link fails, the subtree cut from
+                the leader elects a leader of its own and the rest of the tree is not disturbed.
+            failure_detector (FailureDetector): when a link is considered failed, by default after five
+                missed heartbeats.
+            state_store (ElectionStateStore): if set, the node persists each election it takes part in and, on
+                the next start, confirms the persisted one with the other nodes instead of electing a leader
+                again. If the confirmation fails, the leader is elected as usual.
+            confirmation_timeout (float): how long the confirmation of the persisted election may take before
+                it fails, by default the connect timeout.
+            tracer (Tracer): if set, the frames of the node carry its Lamport clock and its sends, receives and
+                message handling are written to the trace file of the tracer, for python -m lib.trace.
+            ack_timeout (float): how long the node waits for its subtree to acknowledge the leader announcement,
+                by default the connect timeout. After it wait_for_network_ready raises TimeoutError and the
+                election connections are closed anyway.
+            datagram (DatagramOptions): if set, the election messages travel in UDP datagrams, numbered,
+                acknowledged and sent again until they are, instead of TCP connections, so the start of the
+                election does not wait for a connection at each hop. Not with channel_handlers.
+            transport (Transport): the transport of the listener of the node, from lib.transport, TCP by
+                default.
+            neighbor_transports (dict): the transport of the connection to each neighbor, by default the one of
+                the listener, like Network.get_neighbor_transports gives. Not with datagram.
+        """
+
         node_address = NodeAddress(node_host, node_port)
         neighbors_addresses = {id: NodeAddress(host, port) for id, (host, port) in neighbors.items()}
-        self._election_node = ElectionNode(node_id, node_address, neighbors_addresses)
+        self._election_node = ElectionNode(node_id,
+                                           node_address,
+                                           neighbors_addresses,
+                                           event_loop=event_loop,
+                                           connect_timeout=connect_timeout,
+                                           contention_policy=contention_policy,
+                                           capacity=capacity,
+                                           placement_policy=placement_policy,
+                                           channel_handlers=channel_handlers,
+                                           heartbeat_interval=heartbeat_interval,
+                                           failure_detector=failure_detector,
+                                           state_store=state_store,
+                                           confirmation_timeout=confirmation_timeout,
+                                           tracer=tracer,
+                                           ack_timeout=ack_timeout,
+                                           datagram=datagram,
+                                           transport=transport,
+                                           neighbor_transports=neighbor_transports)
 
-    def start_server(self, startup_time: float) -> None:
+    def start_server(self, startup_time: float = 0.0) -> None:
         """
         Starts the node server and start the accept of other requests in another thread.
+
+        The connections to the neighbors are retried until they are listening, so no startup time is needed.
         """
 
         self._election_node.start_server()
         sleep(startup_time)
 
-    def wait_for_election(self) -> int:
+    def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        """
+        Blocks until every neighbor accepts election connections, raising TimeoutError otherwise.
+
+        start_election already does this before broadcasting.
+        """
+
+        self._election_node.wait_for_neighbors(timeout)
+
+    def get_parent_id(self) -> int | None:
+        """
+        Returns the parent of the node in the spanning tree rooted at the leader, None on the leader.
+
+        Only valid after the election ends.
+        """
+
+        return self._election_node.get_parent_id()
+
+    def get_children_ids(self) -> list[int]:
+        """
+        Returns the children of the node in the spanning tree rooted at the leader.
+        """
+
+        return self._election_node.get_children_ids()
+
+    def get_state(self) -> NodeState:
+        """
+        Returns the state of the node in the election, like NodeState.CHILD while it waits for the leader
+        announcement or NodeState.DONE once it knows the leader.
+        """
+
+        return self._election_node.get_state()
+
+    def get_stats(self) -> dict[str, int | float | None]:
+        """
+        Returns the counters of the election: messages and bytes sent, root contention rounds, time spent backing
+        off, when the leader was learned and the distance to it, and the metrics of the node: messages and bytes
+        received, the counts by message type and the histograms of the connect latency to each neighbor and of
+        the phases of the election. MetricsServer serves them as Prometheus text.
+        """
+
+        return self._election_node.get_stats()
+
+    def wait_for_election(self, timeout: float | None = None) -> int:
         """
         Block the process until the leader election ends, returning it's result.
+
+        Raises TimeoutError if the leader is not known after timeout seconds, which does not stop the election.
+        """
+
+        return self._election_node.wait_for_election(timeout)
+
+    def wait_for_network_ready(self, timeout: float | None = None) -> None:
+        """
+        Blocks until every node below this one in the tree acknowledged the leader; on the leader, until every
+        node of the network knows it.
+
+        Raises TimeoutError if the acknowledgements did not arrive after timeout seconds.
         """
 
-        return self._election_node.wait_for_election()
+        self._election_node.wait_for_network_ready(timeout)
+
+    def get_election_future(self) -> Future[int]:
+        """
+        Returns a concurrent.futures.Future resolved with the leader as soon as the node knows it, to add
+        callbacks or wait with a timeout without parking a thread on the election.
 
-    def start_election(self, block_until_result=True) -> int:
+        The callbacks run in the election thread of the node and should not block. The future cannot be
+        cancelled, the election goes on until close.
+        """
+
+        return self._election_node.get_election_future()
+
+    def send_on_channel(self,
+                        node_id: int,
+                        channel: int,
+                        message_type: MessageType,
+                        payload: bytes = b"",
+                        sender_id: int | None = None) -> None:
+        """
+        Sends a message to a neighbor on an application channel, over the election connection.
+
+        sender_id is written in the frame instead of this node id, for relays.
+        """
+
+        self._election_node.send_on_channel(node_id, channel, message_type, payload, sender_id)
+
+    def wait_for_leader_change(self, leader_id: int, timeout: float | None = None) -> int:
+        """
+        Blocks until a re-election replaces leader_id and returns the new leader, raising TimeoutError otherwise.
+
+        Only nodes whose subtree was cut from leader_id by a failure get a new leader.
+        """
+
+        return self._election_node.wait_for_leader_change(leader_id, timeout)
+
+    def close(self) -> None:
+        """
+        Stops the heartbeats and closes the election connections kept open for the channels or the heartbeats.
+        """
+
+        self._election_node.close()
+
+    def start_election(self, block_until_result=True) -> int | Future[int]:
         """
         Starts the election process, broadcasting to other nodes.
 
         Args:
-            block_until_result (bool): if True, will wait for the result of the election and return it. If false, returns -1, and the result can be obtained from the ElectionNode class in nondeterministic time.
+            block_until_result (bool): if True, will wait for the result of the election and return it. If false,
+                returns the future of get_election_future right away and the election starts in another thread.
         """
 
         return self._election_node.start_the_election(block_until_result)
+
+
+class ElectionGroupManager():
+
+    """
+    Defines the interface of many independent elections, one per group, run by a node over a single listening
+    port and a single connection to each neighbor.
+
+    Each group elects its own leader with its own ElectionNode, among all the neighbors or a part of them, like
+    the nodes of a shard. The groups are added before the server starts, on every node that takes part in them.
+    """
+
+    _node_id: int
+    _connection_manager: ConnectionManager
+    _neighbors: dict[int, NodeAddress]
+    _election_nodes: dict[int, ElectionNode]  # by group
+    _tracer: Tracer | None
+    _started: bool
+
+    def __init__(self,
+                 node_id: int,
+                 node_host: str,
+                 node_port: int,
+                 neighbors: dict[int, tuple[str, int]],
+                 event_loop: bool = False,
+                 connect_timeout: float = 30.0,
+                 tracer: Tracer | None = None,
+                 transport: Transport | None = None,
+                 neighbor_transports: dict[int, Transport] | None = None) -> None:
+        """
+        Args:
+            event_loop (bool): if True, the connections of every group are multiplexed in a single selector
+                thread instead of one thread per connection.
+            connect_timeout (float): how long the connections to the neighbors are retried while they are not
+                listening yet.
+            tracer (Tracer): if set, the frames of every group carry the Lamport clock of the node.
+            transport (Transport): the transport of the listener of the node, TCP by default.
+            neighbor_transports (dict): the transport of the connection to each neighbor, by default the one of
+                the listener.
+        """
+
+        self._node_id = node_id
+        self._neighbors = {id: NodeAddress(host, port) for id, (host, port) in neighbors.items()}
+        self._connection_manager = ConnectionManager(node_id,
+                                                     NodeAddress(node_host, node_port),
+                                                     self._neighbors,
+                                                     120.0,
+                                                     event_loop,
+                                                     connect_timeout,
+                                                     tracer=tracer,
+                                                     groups=True,
+                                                     transport=transport,
+                                                     neighbor_transports=neighbor_transports)
+        self._election_nodes = {}
+        self._tracer = tracer
+        self._started = False
+
+    def add_group(self,
+                  group: int,
+                  neighbor_ids: list[int] | None = None,
+                  contention_policy: ContentionPolicy | None = None,
+                  capacity: float = 1.0,
+                  placement_policy: PlacementPolicy | None = None) -> None:
+        """
+        Adds the election of a group among neighbor_ids, by default every neighbor. The neighbors of a group
+        must form a tree over the nodes of the group, like the election network.
+
+        Raises ValueError if the server already started, the group was already added or a node is not a neighbor.
+        """
+
+        if self._started:
+            raise ValueError("The groups are added before the server starts")
+
+        neighbor_ids = list(self._neighbors) if neighbor_ids is None else neighbor_ids
+        unknown_ids = set(neighbor_ids) - self._neighbors.keys()
+        if unknown_ids:
+            raise ValueError(f"The nodes {sorted(unknown_ids)} are not neighbors of node {self._node_id}")
+
+        self._election_nodes[group] = ElectionNode(self._node_id,
+                                                   None,
+                                                   {id: self._neighbors[id] for id in neighbor_ids},
+                                                   contention_policy=contention_policy,
+                                                   capacity=capacity,
+                                                   placement_policy=placement_policy,
+                                                   tracer=self._tracer,
+                                                   shared_connections=self._connection_manager,
+                                                   group=group)
+
+    def get_groups(self) -> list[int]:
+        """
+        Returns the groups of the node.
+        """
+
+        return list(self._election_nodes)
+
+    def start_server(self) -> None:
+        """
+        Starts the election of every group and listens for the connections of all of them.
+        """
+
+        for election_node in self._election_nodes.values():
+            election_node.start_server()
+
+        self._connection_manager.start_server()
+        self._started = True
+
+    def wait_for_neighbors(self, group: int, timeout: float | None = None) -> None:
+        """
+        Blocks until every neighbor of a group accepts election connections, raising TimeoutError otherwise.
+
+        start_election already does this before broadcasting.
+        """
+
+        self._election_nodes[group].wait_for_neighbors(timeout)
+
+    def start_election(self, group: int, block_until_result=True) -> int | Future[int]:
+        """
+        Starts the election of a group, broadcasting to the other nodes of the group.
+
+        Args:
+            block_until_result (bool): if True, waits for the leader of the group and returns it, otherwise
+                returns the future of get_election_future right away.
+        """
+
+        return self._election_nodes[group].start_the_election(block_until_result)
+
+    def wait_for_election(self, group: int, timeout: float | None = None) -> int:
+        """
+        Blocks until the election of a group ends, returning its leader, raising TimeoutError after timeout
+        seconds.
+        """
+
+        return self._election_nodes[group].wait_for_election(timeout)
+
+    def wait_for_network_ready(self, group: int, timeout: float | None = None) -> None:
+        """
+        Blocks until the subtree of the node in a group acknowledged its leader, like
+        ElectionProtocolManager.wait_for_network_ready.
+        """
+
+        self._election_nodes[group].wait_for_network_ready(timeout)
+
+    def get_election_future(self, group: int) -> Future[int]:
+        """
+        Returns the future of the election of a group, like ElectionProtocolManager.get_election_future.
+        """
+
+        return self._election_nodes[group].get_election_future()
+
+    def get_parent_id(self, group: int) -> int | None:
+        """
+        Returns the parent of the node in the spanning tree of a group, None on its leader.
+        """
+
+        return self._election_nodes[group].get_parent_id()
+
+    def get_children_ids(self, group: int) -> list[int]:
+        """
+        Returns the children of the node in the spanning tree of a group.
+        """
+
+        return self._election_nodes[group].get_children_ids()
+
+    def get_stats(self, group: int) -> dict[str, int | float | None]:
+        """
+        Returns the counters and the metrics of the election of a group, like ElectionProtocolManager.get_stats,
+        counting only the messages of the group.
+        """
+
+        return self._election_nodes[group].get_stats()
+
+    def close(self) -> None:
+        """
+        Ends the election of every group and closes the listener and the connections.
+        """
+
+        for election_node in self._election_nodes.values():
+            election_node.close()
+
+        self._connection_manager.close_all_sockets()
+
+
+class AsyncElectionProtocolManager():
+
+    """
+    Defines the asyncio interface of the election protocol.
+
+    The node runs the same state machine as ElectionProtocolManager, but its events and every connection are
+    served by tasks of the running event loop, so the calls never block the loop and many elections can run in
+    the same loop.
+    """
+
+    _election_node: AsyncElectionNode
+
+    def __init__(self,
+                 node_id: int,
+                 node_host: str,
+                 node_port: int,
+                 neighbors: dict[int, tuple[str, int]],
+                 connect_timeout: float = 30.0,
+                 contention_policy: ContentionPolicy | None = None,
+                 capacity: float = 1.0,
+                 placement_policy: PlacementPolicy | None = None,
+                 heartbeat_interval: float | None = None,
+                 failure_detector: FailureDetector | None = None,
+                 state_store: ElectionStateStore | None = None,
+                 confirmation_timeout: float | None = None,
+                 tracer: Tracer | None = None,
+                 ack_timeout: float | None = None) -> None:
+        """
+        The arguments are the ones of ElectionProtocolManager, which has the application channels, the
+        datagrams and the other transports this manager does not.
+        """
+
+        node_address = NodeAddress(node_host, node_port)
+        neighbors_addresses = {id: NodeAddress(host, port) for id, (host, port) in neighbors.items()}
+        self._election_node = AsyncElectionNode(node_id,
+                                                node_address,
+                                                neighbors_addresses,
+                                                connect_timeout=connect_timeout,
+                                                contention_policy=contention_policy,
+                                                capacity=capacity,
+                                                placement_policy=placement_policy,
+                                                heartbeat_interval=heartbeat_interval,
+                                                failure_detector=failure_detector,
+                                                state_store=state_store,
+                                                confirmation_timeout=confirmation_timeout,
+                                                tracer=tracer,
+                                                ack_timeout=ack_timeout)
+
+    async def start_server(self) -> None:
+        """
+        Starts listening for the election connections.
+        """
+
+        await self._election_node.start_server()
+
+    async def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        """
+        Waits until every neighbor accepts election connections, raising TimeoutError otherwise.
+
+        start_election already does this before broadcasting.
+        """
+
+        await self._election_node.wait_for_neighbors(timeout)
+
+    async def wait_for_election(self, timeout: float | None = None) -> int:
+        """
+        Waits until the leader election ends, returning it's result.
+
+        Raises TimeoutError if the result is not known after timeout seconds. Cancelling or timing out the wait
+        does not cancel the election, use close for that.
+        """
+
+        return await self._election_node.wait_for_election(timeout)
+
+    async def wait_for_network_ready(self, timeout: float | None = None) -> None:
+        """
+        Waits until every node below this one in the tree acknowledged the leader; on the leader, until every
+        node of the network knows it.
+
+        Raises TimeoutError if the acknowledgements did not arrive after timeout seconds, or if a child did not
+        acknowledge the leader within the ack timeout of the node.
+        """
+
+        await self._election_node.wait_for_network_ready(timeout)
+
+    async def wait_for_leader_change(self, leader_id: int, timeout: float | None = None) -> int:
+        """
+        Waits until a re-election replaces leader_id and returns the new leader, raising TimeoutError otherwise.
+
+        Only nodes whose subtree was cut from leader_id by a failure get a new leader.
+        """
+
+        return await self._election_node.wait_for_leader_change(leader_id, timeout)
+
+    async def start_election(self, timeout: float | None = None) -> int:
+        """
+        Starts the election process as soon as the neighbors are ready, broadcasting to other nodes, and waits for
+        its result.
+
+        Raises TimeoutError if the result is not known after timeout seconds, counting the start.
+        """
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        await asyncio.wait_for(self._election_node.start_the_election(), timeout)
+
+        return await self.wait_for_election(None if deadline is None else max(0.0, deadline - loop.time()))
+
+    def get_parent_id(self) -> int | None:
+        """
+        Returns the parent of the node in the spanning tree rooted at the leader, None on the leader.
+
+        Only valid after the election ends.
+        """
+
+        return self._election_node.get_parent_id()
+
+    def get_children_ids(self) -> list[int]:
+        """
+        Returns the children of the node in the spanning tree rooted at the leader.
+        """
+
+        return self._election_node.get_children_ids()
+
+    def get_stats(self) -> dict[str, int | float | None]:
+        """
+        Returns the counters and the metrics of the election, like ElectionProtocolManager.get_stats.
+        """
+
+        return self._election_node.get_stats()
+
+    async def close(self) -> None:
+        """
+        Stops the election, and with it the heartbeats, and closes the connections of the node.
+        """
+
+        await self._election_node.close()
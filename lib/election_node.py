@@ -1,27 +1,79 @@
 """
 Election algorithm definition
-"""
 
+Each node runs the protocol as a state machine owned by its election thread. The connections only post the
+received messages to the event queue of the node, and the election thread consumes them one at a time, along
+with its timers (the root contention backoff, the deadline of the confirmation and the heartbeats), so the
+state of the node is never shared between threads and each message sees the effects of the previous ones.
+"""
 
+from concurrent.futures import Future, InvalidStateError
 from enum import Enum
-from random import randint
-from threading import Condition, Lock, Semaphore, Thread
-from time import sleep
+from heapq import heappop, heappush
+from itertools import count
+from logging import getLogger
+from queue import Empty, SimpleQueue
+from threading import Condition, Event, Lock, Thread, current_thread
+from time import monotonic, perf_counter
+from typing import Callable, NamedTuple
+
+from lib.connection_manager import ConnectionManager, GroupConnection
+from lib.contention import BoundedExponentialBackoff, ContentionPolicy
+from lib.datagram import DatagramConnectionManager, DatagramOptions
+from lib.election_state import ElectionState, ElectionStateStore
+from lib.failure_detector import FailureDetector, TimeoutDetector
+from lib.log import NodeLogger
+from lib.message import (ANNOUNCEMENT_ACK_PAYLOAD, DEFAULT_GROUP, LEADER_PAYLOAD, PLACEMENT_PAYLOAD, STATE_PAYLOAD,
+                         SUBTREE_PAYLOAD, Message, MessageType)
+from lib.metrics import LEADER_ANNOUNCEMENT, PARENT_REQUESTS, NodeMetrics
+from lib.placement import (ROOT_SEARCH, PlacementPolicy, PlacementSearch, RootPlacement, SubtreeSummary,
+                           check_capacity, summarize_subtree)
+from lib.trace import CONTENTION_BACKOFF, Tracer, now
+from lib.transport import Transport
+
+logger = getLogger(__name__)
+
+
+class NodeState(Enum):
+
+    """
+    The states of a node in the election.
+    """
+
+    WAITING = "waiting"  # for the parenting requests of the children, until one possible parent is left
+    REQUESTING = "requesting"  # the parenting request to the last possible parent is not answered yet
+    CONTENTION = "contention"  # backing off after a root contention, before requesting again
+    CHILD = "child"  # accepted by the parent, waiting for the leader announcement
+    LEADER = "leader"  # the root of the tree, placing the leader, itself with the root placement
+    DONE = "done"  # the leader is known
+    CONFIRMING = "confirming"  # confirming the persisted election
+    RECOVERING = "recovering"  # re-electing the subtree cut from the leader by a failure
 
-from lib.connection_manager import ConnectionManager
 
+class EventType(Enum):
 
-class MessageType(Enum):
     """
-    Defines the message types.
+    The events consumed by the election thread of a node.
     """
 
-    CHILD_PARENTING_REQUEST = "be_my_parent"
-    PARENT_ACK_RESPONSE = "you_are_my_child"
-    PARENT_REJECT_MESSAGE = "you_are_not_my_child"
-    LEADER_ANNOUNCEMENT = "leader_announcement"
-    ERROR = "error"
-    LEADER_ANNOUNCEMENT_ACK = "leader_announcement_ack"
+    MESSAGE = "message"
+    ELECTION_START = "election_start"
+    STOP = "stop"
+    BACKOFF_EXPIRED = "backoff_expired"
+    CONFIRMATION_TIMEOUT = "confirmation_timeout"
+    ACK_TIMEOUT = "ack_timeout"
+    HEARTBEAT_DUE = "heartbeat_due"
+
+
+class NodeEvent(NamedTuple):
+
+    """
+    An event of the event queue of a node, with the sender and the message of the MESSAGE events.
+    """
+
+    event_type: EventType
+    node_id: int | None = None
+    message: Message | None = None
 
 
 class NodeAddress:
@@ -58,50 +110,193 @@ class ElectionNode:
 
     _id: int
     _neighbors: dict[int, NodeAddress]  # id: NeighborNode
+    _state: NodeState
+    _events: SimpleQueue[NodeEvent]
+    _timers: list[tuple[float, int, EventType]]  # heap of (monotonic deadline, timer id, event type)
+    _timer_ids: count
+    _stopped: bool
+    _closing: Event
     _possible_parents_ids: list[int]
+    _requested_parent_id: int | None
     _children_ids: list[int]
-    _done: bool
-    _able_to_request_parent: bool
-    _is_leaf: bool
+    _children_subtrees: dict[int, SubtreeSummary]
+    _parent_id: int | None
     _leader_id: int
-    _is_leaf: bool
-    _connection_manager: ConnectionManager
+    _connection_manager: ConnectionManager | GroupConnection | DatagramConnectionManager
     _election_thread: Thread | None
+    _election_result: Future[int]
+    _contention_policy: ContentionPolicy
+    _contention_rounds: int
+    _contention_backoff_time: float
+    _backoff_timer_id: int | None
+    _backoff_started: int
+    _election_started_at: float | None
+    _parent_found_at: float | None
+    _leader_known_at: float | None
+    _leader_distance: int | None
+    _pending_acks: set[int]
+    _ack_timeout: float
+    _ack_timer_id: int | None
+    _ack_timed_out: bool
+    _network_ready: Event
+    _network_ready_at: float | None
+    _capacity: float
+    _placement_policy: PlacementPolicy
+    _keep_connections: bool
+    _heartbeat_interval: float | None
+    _failure_detector: FailureDetector | None
+    _heartbeat_timer_id: int | None
+    _heartbeats_sent: int
+    _pending_children: set[int]
+    _failed_ids: set[int]
+    _recoveries: int
+    _recovery_started_at: float | None
+    _state_store: ElectionStateStore | None
+    _persisted_state: ElectionState | None
+    _confirmation_timeout: float
+    _confirmation_deadline: float | None
+    _confirmation_sent: bool
+    _confirmed: bool
+    _confirmed_children: set[int]
+    _confirmation_finished: Event
+    _epoch: int
+    _max_epoch: int
+    _metrics: NodeMetrics
+    _tracer: Tracer | None
+    _log: NodeLogger
 
     def __init__(
         self,
         id: int,
-        server_node_address: NodeAddress,
+        server_node_address: NodeAddress | None,
         neighbors: dict[int, NodeAddress],
         timeout: float = 120.0,
+        event_loop: bool = False,
+        connect_timeout: float = 30.0,
+        contention_policy: ContentionPolicy | None = None,
+        capacity: float = 1.0,
+        placement_policy: PlacementPolicy | None = None,
+        channel_handlers: dict[int, Callable[[int, Message], None]] | None = None,
+        heartbeat_interval: float | None = None,
+        failure_detector: FailureDetector | None = None,
+        state_store: ElectionStateStore | None = None,
+        confirmation_timeout: float | None = None,
+        tracer: Tracer | None = None,
+        ack_timeout: float | None = None,
+        shared_connections: ConnectionManager | None = None,
+        group: int = DEFAULT_GROUP,
+        datagram: DatagramOptions | None = None,
+        transport: Transport | None = None,
+        neighbor_transports: dict[int, Transport] | None = None,
     ) -> None:
+        """
+        Args:
+            ack_timeout (float): how long the node waits for its children to acknowledge the leader announcement
+                before it gives up on the readiness of its subtree, by default the connect timeout.
+            shared_connections (ConnectionManager): a connection manager created for election groups. The node
+                runs the election of its group over the listener and the connections of that manager instead of
+                opening its own, so server_node_address, timeout, event_loop, connect_timeout and
+                channel_handlers are not used.
+            group (int): the election group of the node, with shared_connections.
+            datagram (DatagramOptions): if set, the election messages are sent in UDP datagrams with
+                retransmissions instead of TCP connections; event_loop and timeout are not used. The datagrams
+                carry no application channels.
+            transport (Transport): the transport of the listener of the node, TCP by default.
+            neighbor_transports (dict): the transport of the connection to each neighbor, by default the one of
+                the listener. Not used with shared_connections, whose manager has its own.
+        """
+
+        if datagram is not None and (channel_handlers or shared_connections is not None):
+            raise ValueError("The datagram transport carries a single election without application channels")
+        if datagram is not None and (transport is not None or neighbor_transports):
+            raise ValueError("The datagram transport replaces the stream transports")
+        capacity = check_capacity(capacity)
+
         self._id = id
+        self._log = NodeLogger(logger, id)
         self._neighbors = neighbors
+        self._state = NodeState.WAITING
+        self._events = SimpleQueue()
+        self._timers = []
+        self._timer_ids = count()
+        self._stopped = False
+        self._closing = Event()
         self._possible_parents_ids = list(neighbors.keys())
+        self._requested_parent_id = None
         self._children_ids = []
-        self._done = False
-        self._is_leaf = len(self._possible_parents_ids) == 1
+        self._children_subtrees = {}
+        self._parent_id = None
+        self._metrics = NodeMetrics()
+        self._tracer = tracer
 
         # Be careful, the neighbors are passed as a reference.
-        self._connection_manager = ConnectionManager(
-            self._id, server_node_address, neighbors, timeout
-        )
-        self._parent_response = None
-        self._is_waiting_for = (False, None)
+        if datagram is not None:
+            self._connection_manager = DatagramConnectionManager(
+                self._id, server_node_address, neighbors, datagram, connect_timeout, self.handle_election_start,
+                self._metrics, tracer
+            )
+        elif shared_connections is None:
+            self._connection_manager = self.open_connections(server_node_address, neighbors, timeout, event_loop,
+                                                             connect_timeout, channel_handlers, transport,
+                                                             neighbor_transports)
+        else:
+            self._connection_manager = shared_connections.open_group(group, neighbors, self.handle_election_start,
+                                                                     self._metrics)
         self._leader_id = -1
 
+        # Only guards what the other threads read of the leader, the election thread owns the rest.
         self._leader_mutex = Lock()
         self._leader_condition = Condition(self._leader_mutex)
 
-        self._able_to_request_parent_sem = Semaphore(0)
-        self._parent_response_sem = Semaphore(0)
-        self._send_parent_response_sem = Semaphore(0)
-        self._possible_parents_ids_mutex = Lock()
-        self._is_waiting_for_mutex = Lock()
-
         self._election_thread = None
-
-        print(f"Node {self._id} is leaf: {self._is_leaf}")
+        # The election cannot be cancelled once the node exists, so the future is running from the start.
+        self._election_result = Future()
+        self._election_result.set_running_or_notify_cancel()
+        self._contention_policy = contention_policy or BoundedExponentialBackoff()
+        self._contention_rounds = 0
+        self._contention_backoff_time = 0.0
+        self._backoff_timer_id = None
+        self._backoff_started = 0
+        self._election_started_at = None
+        self._parent_found_at = None
+        self._leader_known_at = None
+        self._leader_distance = None
+        self._pending_acks = set()
+        self._ack_timeout = connect_timeout if ack_timeout is None else ack_timeout
+        self._ack_timer_id = None
+        self._ack_timed_out = False
+        self._network_ready = Event()
+        self._network_ready_at = None
+        self._capacity = capacity
+        self._placement_policy = placement_policy or RootPlacement()
+        # With channels or heartbeats the connections stay open after the election until close is called.
+        self._keep_connections = bool(channel_handlers) or heartbeat_interval is not None
+        self._heartbeat_interval = heartbeat_interval
+        self._failure_detector = None
+        if heartbeat_interval is not None:
+            self._failure_detector = failure_detector or TimeoutDetector(5 * heartbeat_interval)
+        self._heartbeat_timer_id = None
+        self._heartbeats_sent = 0
+        self._pending_children = set()
+        self._failed_ids = set()
+        self._recoveries = 0
+        self._recovery_started_at = None
+        self._state_store = state_store
+        self._persisted_state = state_store.load() if state_store is not None else None
+        self._confirmation_timeout = connect_timeout if confirmation_timeout is None else confirmation_timeout
+        self._confirmation_deadline = None
+        self._confirmation_sent = False
+        self._confirmed = False
+        self._confirmed_children = set()
+        self._confirmation_finished = Event()
+        self._epoch = 0
+        self._max_epoch = 0
+        # The persisted tree is set before the server starts, so the confirmations of the children find it.
+        if self._persisted_state is not None:
+            self._state = NodeState.CONFIRMING
+            self._parent_id = self._persisted_state.parent_id
+            self._children_ids = list(self._persisted_state.children_ids)
+            self._max_epoch = self._persisted_state.epoch
 
     # public lib methods
 
@@ -114,223 +309,761 @@ class ElectionNode:
         self._election_thread = Thread(target=self.process_leader_election)
         self._election_thread.start()
 
-    def wait_for_election(self) -> int:
+    def wait_for_election(self, timeout: float | None = None) -> int:
         """
         Block the process until the leader election ends, returning it's result.
+
+        Raises TimeoutError if the leader is not known after timeout seconds, which does not stop the election.
+        Once the leader is known, waits at most what is left of timeout for the connections to close.
+        """
+
+        deadline = None if timeout is None else monotonic() + timeout
+        leader_id = self._election_result.result(timeout)
+        # The election thread closes the connections once the subtree acknowledged the leader or the
+        # acknowledgements timed out, unless it keeps them.
+        if not self._keep_connections and self._election_thread is not current_thread():
+            self._election_thread.join(None if deadline is None else max(0.0, deadline - monotonic()))
+
+        return leader_id
+
+    def wait_for_network_ready(self, timeout: float | None = None) -> None:
+        """
+        Blocks until every node of the subtree of the node acknowledged the leader announcement. On the leader
+        the subtree is the whole network.
+
+        Raises TimeoutError if the subtree is not ready after timeout seconds, or if a child did not acknowledge
+        the leader within the ack timeout of the node.
+        """
+
+        if not self._network_ready.wait(timeout) or self._ack_timed_out:
+            raise TimeoutError(f"The subtree of node {self._id} did not acknowledge the leader in time")
+
+    def get_election_future(self) -> Future[int]:
+        """
+        Returns the future of the election, resolved with the leader by the election thread as soon as the node
+        knows it, or with the exception that ended the thread.
+
+        The callbacks added with add_done_callback run in the election thread, or right away if the leader is
+        already known, so they should not block. The future cannot be cancelled.
+        """
+
+        return self._election_result
+
+    def wait_for_neighbors(self, timeout: float | None = None) -> None:
+        """
+        Blocks until every neighbor answers a readiness probe, raising TimeoutError otherwise.
         """
-        self._election_thread.join()
-        return self._leader_id
 
-    def start_the_election(self, block_until_result=True) -> int:
+        self._connection_manager.wait_for_neighbors(timeout)
+
+    def start_the_election(self, block_until_result=True) -> int | Future[int]:
         """
         Starts the election process, broadcasting to other nodes.
 
+        The broadcast starts as soon as every neighbor answers a readiness probe. If the node persisted the
+        last election, the broadcast only happens when the confirmation of that election fails.
+
         Args:
-            block_until_result (bool): if True, will wait for the result of the election and return it. If false, returns -1, and the result can be obtained from the ElectionNode class in nondeterministic time.
+            block_until_result (bool): if True, will wait for the result of the election and return it. If false,
+                the election is started in another thread and the future of the election is returned right away.
+                If the election cannot be started, the future fails with the exception.
         """
-        self._connection_manager.start_leader_election(self.handle_message)
 
-        if block_until_result:
-            return self.wait_for_election()
-        else:
-            return -1
+        if not block_until_result:
+            Thread(target=self.start_in_background).start()
+            return self._election_result
+
+        self.broadcast_election_start()
+
+        return self.wait_for_election()
+
+    def send_on_channel(self,
+                        node_id: int,
+                        channel: int,
+                        message_type: MessageType,
+                        payload: bytes = b"",
+                        sender_id: int | None = None) -> None:
+        """
+        Sends a message to a neighbor on a channel, over the election connection.
+        """
+
+        self._connection_manager.send_message(node_id, message_type, payload, channel, sender_id)
+
+    def wait_for_leader_change(self, leader_id: int, timeout: float | None = None) -> int:
+        """
+        Blocks until the node knows a leader other than leader_id, after a re-election, and returns it.
+
+        Raises TimeoutError if no other leader is known in timeout seconds.
+        """
+
+        with self._leader_mutex:
+            if not self._leader_condition.wait_for(lambda: self._leader_id not in (-1, leader_id), timeout):
+                raise TimeoutError(f"Node {self._id} still follows the leader {leader_id}")
+
+            return self._leader_id
+
+    def close(self) -> None:
+        """
+        Stops the election thread, and with it the heartbeats, and closes the connections kept open for the
+        channels or the heartbeats.
+        """
+
+        self._closing.set()
+        self.post(NodeEvent(EventType.STOP))
+        # The thread may still wait for a start that will never reach the node.
+        self._connection_manager.stop_waiting_for_election()
+
+        if self._election_thread is not None and self._election_thread is not current_thread():
+            self._election_thread.join()
+
+        self._connection_manager.close_all_sockets()
+
+    def get_state(self) -> NodeState:
+        """
+        Returns the state of the node in the election.
+        """
+
+        return self._state
+
+    def get_parent_id(self) -> int | None:
+        """
+        Returns the parent of the node in the spanning tree rooted at the leader, None on the leader.
+
+        The tree is only final after the node learns the leader.
+        """
+
+        return self._parent_id
+
+    def get_children_ids(self) -> list[int]:
+        """
+        Returns the children of the node in the spanning tree rooted at the leader.
+        """
+
+        return list(self._children_ids)
+
+    def get_stats(self) -> dict[str, int | float | None]:
+        """
+        Returns the counters of the election.
+
+        election_started_at is the time.perf_counter value when the start of the election reached the node and
+        was forwarded to its neighbors, leader_known_at when the node learned the leader, network_ready_at when
+        its whole subtree acknowledged it, and leader_distance is the number of tree hops between the node and
+        the leader. After a failure they refer to the leader of the last re-election, and recovery_started_at is
+        when the node joined it. epoch numbers the election of the leader and confirmed tells whether it was
+        confirmed from the persisted state instead of elected.
+
+        The metrics add the messages and bytes received, the messages and bytes by type, and histograms of the
+        time to connect to each neighbor and of the time spent in each phase of the election.
+        """
+
+        return {
+            "messages_sent": self._connection_manager.messages_sent,
+            "bytes_sent": self._connection_manager.bytes_sent,
+            "contention_rounds": self._contention_rounds,
+            "contention_backoff_time": self._contention_backoff_time,
+            "election_started_at": self._election_started_at,
+            "leader_known_at": self._leader_known_at,
+            "network_ready_at": self._network_ready_at,
+            "leader_distance": self._leader_distance,
+            "heartbeats_sent": self._heartbeats_sent,
+            "recoveries": self._recoveries,
+            "recovery_started_at": self._recovery_started_at,
+            "epoch": self._epoch,
+            "confirmed": self._confirmed,
+            **self._metrics.snapshot(),
+        }
 
     # non public lib methods
 
+    def open_connections(self,
+                         server_node_address: NodeAddress,
+                         neighbors: dict[int, NodeAddress],
+                         timeout: float,
+                         event_loop: bool,
+                         connect_timeout: float,
+                         channel_handlers: dict[int, Callable[[int, Message], None]] | None,
+                         transport: Transport | None,
+                         neighbor_transports: dict[int, Transport] | None) -> ConnectionManager:
+        """
+        Returns the connection manager of a node with a listener of its own.
+        """
+
+        return ConnectionManager(self._id, server_node_address, neighbors, timeout, event_loop, connect_timeout,
+                                 channel_handlers, self.handle_election_start, self._metrics, self._tracer,
+                                 transport=transport, neighbor_transports=neighbor_transports)
+
+    def broadcast_election_start(self) -> None:
+        """
+        Broadcasts the start of the election once every neighbor is ready, unless the persisted election was
+        confirmed or its confirmation failed the election.
+        """
+
+        if self._persisted_state is not None:
+            self._confirmation_finished.wait()
+
+        if not self._confirmed and not self._election_result.done():
+            self._connection_manager.wait_for_neighbors()
+            self._connection_manager.start_leader_election()
+
+    def start_in_background(self) -> None:
+        """
+        Starts the election for start_the_election without blocking, failing the future of the election if it
+        cannot be started.
+        """
+
+        try:
+            self.broadcast_election_start()
+        except Exception as exception:
+            self._log.error("Could not start the election: %s", exception)
+            self.resolve_election(exception=exception)
+
+    def resolve_election(self, exception: Exception | None = None) -> None:
+        """
+        Resolves the future of the election with the leader or with the exception that ended it; only the first
+        outcome counts.
+        """
+
+        try:
+            if exception is None:
+                self._election_result.set_result(self._leader_id)
+            else:
+                self._election_result.set_exception(exception)
+        except InvalidStateError:
+            pass
+
     def process_leader_election(self):
         """
-        Wait for the end of the process of waiting for leader election, and then starts it.
+        Confirms the persisted election or, if there is none or it fails, waits for the start of the leader
+        election and then runs it. With channels or heartbeats the thread then keeps handling the events of
+        the node until close.
         """
 
-        self._connection_manager.server_thread.join()
-        self.leader_election()
-        self._connection_manager.close_all_sockets()
+        try:
+            if self._state is NodeState.CONFIRMING:
+                try:
+                    self.begin_confirmation()
+                    self.consume_events(lambda: self._state is not NodeState.CONFIRMING)
+                finally:
+                    # The start of the election waits for the confirmation, even one that failed with an error.
+                    self._confirmation_finished.set()
+
+            if not self._confirmed and not self._stopped:
+                self._connection_manager.wait_for_election_start()
+                # Closing the node wakes the wait up, before the start reached the node.
+                if not self._closing.is_set():
+                    self.leader_election()
+        except Exception as exception:
+            self.resolve_election(exception=exception)
+            raise
+
+        if self._state is not NodeState.DONE:
+            self.resolve_election(exception=RuntimeError(f"Node {self._id} was closed before the election ended"))
+            return
+
+        self.resolve_election()
+
+        if self._keep_connections:
+            self.consume_events(lambda: False)
+        else:
+            # The connections stay open until the subtree acknowledged the leader.
+            self.consume_events(self._network_ready.is_set)
+            self._connection_manager.close_all_sockets()
 
     def leader_election(self) -> None:
         """
-        Performs the leader election algorithm, setting the leader_id attribute and finish only when election ends.
-        """
-        print("Entrou na eleição")
-
-        if self._is_leaf:
-            self._able_to_request_parent_sem.release()
-
-        while not self._done:
-            self._able_to_request_parent_sem.acquire()
-
-            while True:  # While em caso de root contention
-                self._possible_parents_ids_mutex.acquire()
-                if len(self._possible_parents_ids) == 0:
-                    self._possible_parents_ids_mutex.release()
-                    print(self._id, "is leader")
-                    self._leader_id = self._id
-                    # waiting to send response to children
-                    self._send_parent_response_sem.acquire()
-                    print(self._id, "broadcasting leader announcement")
-                    self.broadcast_leader_announcement(self._id)
-                    self._done = True
-                    self._connection_manager.finish_server()
-                    break
-
-                self._possible_parents_ids_mutex.release()
-
-                self.send_parenting_request(self._possible_parents_ids[0])
-                with self._is_waiting_for_mutex:
-                    self._is_waiting_for = (
-                        True,
-                        self._possible_parents_ids[0],
-                    )
-
-                print("enviou request, vai esperar resposta")
-                self._parent_response_sem.acquire()
-
-                if self._parent_response:
-                    self._done = True
-                    break
-
-                # root contention? -> if the request was not accepted, try again after some time
-                print("try again after some time")
-                sleep_time = randint(1, 3000)
-                sleep(float(30 / sleep_time))
-
-        if self._id != self._leader_id:
-            print(
-                "### Nodo finalizado, entra em estado de espera por anuncio do líder."
-            )
-            with self._leader_mutex:
-                self._leader_condition.wait()
-        else:
-            print("### Nodo finalizado, é o líder!")
+        Performs the leader election algorithm, consuming the events of the node until it knows the leader.
+        """
+
+        self.begin_election()
+        self.consume_events(lambda: self._state is NodeState.DONE)
+
+        if self._state is NodeState.DONE:
+            self.end_election()
+
+    def begin_election(self) -> None:
+        """
+        Enters the election once its start reached the node.
+        """
+
+        self._log.debug("Entered the election")
+        self._election_started_at = perf_counter()
+
+        # A leaf requests its only neighbor right away, the other nodes wait for their children. A node without
+        # neighbors is the root of its tree right away.
+        self.check_possible_parents()
+
+    def end_election(self) -> None:
+        """
+        Records the phases of the election once the node knows the leader.
+        """
+
+        if self._parent_found_at is not None:
+            self._metrics.observe_phase(LEADER_ANNOUNCEMENT,
+                                        max(0.0, self._leader_known_at - self._parent_found_at))
+
+        if self._id == self._leader_id:
+            self._log.info("The node finished, it is the leader")
+
+    def consume_events(self, finished: Callable[[], bool]) -> None:
+        """
+        Handles the events of the node and its expired timers, in order, until finished returns True or close
+        is called.
+        """
+
+        while not self._stopped and not finished():
+            if self.handle_expired_timers(finished):
+                return
+
+            try:
+                event = self._events.get(timeout=self.time_to_next_timer())
+            except Empty:
+                continue
+
+            self.handle_event(event)
+
+    def handle_expired_timers(self, finished: Callable[[], bool]) -> bool:
+        """
+        Handles the expired timers, in order, and returns whether the node stopped or finished meanwhile.
+        """
+
+        while self._timers and self._timers[0][0] <= monotonic():
+            _, timer_id, event_type = heappop(self._timers)
+            self.handle_timer(event_type, timer_id)
+            if self._stopped or finished():
+                return True
+
+        return False
+
+    def time_to_next_timer(self) -> float | None:
+        """
+        Returns the seconds until the next timer expires, None without timers.
+        """
+
+        return max(0.0, self._timers[0][0] - monotonic()) if self._timers else None
+
+    def schedule(self, delay: float, event_type: EventType) -> int:
+        """
+        Schedules a timer event in delay seconds and returns its id.
+        """
+
+        timer_id = next(self._timer_ids)
+        heappush(self._timers, (monotonic() + delay, timer_id, event_type))
+
+        return timer_id
+
+    def handle_message(self, node_id: int, message: Message) -> None:
+        """
+        Posts a message received from a neighbor to the event queue of the node.
+
+        Called by the connections, the message is handled by the election thread.
+        """
+
+        self.post(NodeEvent(EventType.MESSAGE, node_id, message))
+
+    def handle_election_start(self) -> None:
+        """
+        Posts the start of the election, which reached the node before it is broadcast to the neighbors.
+
+        Called by the connections, the election thread gives up the confirmation of the persisted election.
+        """
+
+        self.post(NodeEvent(EventType.ELECTION_START))
+
+    def post(self, event: NodeEvent) -> None:
+        """
+        Adds an event to the queue of the node.
+        """
+
+        self._events.put(event)
+
+    def handle_event(self, event: NodeEvent) -> None:
+        """
+        Handles an event of the queue of the node.
+        """
+
+        match event.event_type:
+            case EventType.MESSAGE:
+                self.handle_election_message(event.node_id, event.message)
+            case EventType.ELECTION_START:
+                self.abort_confirmation()
+            case EventType.STOP:
+                self._stopped = True
+
+    def handle_timer(self, event_type: EventType, timer_id: int) -> None:
+        """
+        Handles an expired timer. The timers that no longer match the state of the node are ignored.
+        """
+
+        try:
+            match event_type:
+                case EventType.BACKOFF_EXPIRED if timer_id == self._backoff_timer_id:
+                    self.end_backoff()
+                    self.request_parent()
+                case EventType.CONFIRMATION_TIMEOUT if self._state is NodeState.CONFIRMING:
+                    self._log.info("The confirmation timed out")
+                    self.abort_confirmation()
+                case EventType.ACK_TIMEOUT if timer_id == self._ack_timer_id and not self._network_ready.is_set():
+                    self.give_up_acknowledgements()
+                case EventType.HEARTBEAT_DUE:
+                    self._heartbeat_timer_id = self.schedule(self._heartbeat_interval, EventType.HEARTBEAT_DUE)
+                    self.send_heartbeats()
+        except Exception as exception:
+            self._log.exception("Error handling the %s timer: %s", event_type.value, exception)
 
-    def handle_message(self, node_id: int, message: str, node_message: int) -> None:
+    def handle_election_message(self, node_id: int, message: Message) -> None:
         """
-        Handles the connection and receives data from a neighbor node.
+        Handles a message received from a neighbor node.
         """
 
-        print(f"Mensagem recebida do nó {node_id}: {message}")
+        self._log.debug("Received message from %d: %s", node_id, message.message_type.name)
+        started = now() if self._tracer is not None else 0
 
         try:
-            match message:
-                case MessageType.CHILD_PARENTING_REQUEST.value:
-                    self.handle_parenting_request(node_id)
-                    print(
-                        "Sent parent ack to ",
-                        node_id,
-                        " possible parents: ",
-                        self._possible_parents_ids,
-                    )
-                    self._possible_parents_ids_mutex.acquire()
-                    if len(self._possible_parents_ids) == 0:
-                        self._possible_parents_ids_mutex.release()
-                        print("releasing leader sem", node_id)
-                        self._send_parent_response_sem.release()
-                    else:
-                        self._possible_parents_ids_mutex.release()
-                case MessageType.LEADER_ANNOUNCEMENT.value:
-                    # TODO: enviar ack?
-                    with self._leader_mutex:
-                        self._leader_id = node_message
-                        self.broadcast_leader_announcement(node_message)
-                        self._leader_condition.notify()
-                        self._connection_manager.finish_server()  # Vai fazer não receber mais mensagens.
-                case MessageType.PARENT_ACK_RESPONSE.value:
-                    self._parent_response = True
-                    self._parent_response_sem.release()
-                    print(
-                        f"Node {self._id} received parent ack response from {node_id}"
-                    )
-                case MessageType.PARENT_REJECT_MESSAGE.value:
-                    self._parent_response = False
-                    self._parent_response_sem.release()
-                case MessageType.ERROR.value:  # TODO: especificar msg de erro pra rejeição?
-                    self._parent_response = False
-                    self._parent_response_sem.release()
+            match message.message_type:
+                case MessageType.HEARTBEAT:
+                    # A neighbor suspected once stays out of the tree, even if its heartbeats come back.
+                    if self._failure_detector is not None and node_id not in self._failed_ids:
+                        self._failure_detector.heartbeat(node_id, perf_counter())
+                case MessageType.CHILD_PARENTING_REQUEST if self._state is NodeState.RECOVERING:
+                    *subtree, epoch = SUBTREE_PAYLOAD.unpack(message.payload)
+                    self.observe_epoch(epoch)
+                    self.handle_recovery_request(node_id, SubtreeSummary(*subtree))
+                case MessageType.REELECTION:
+                    self.handle_reelection(node_id)
+                case MessageType.STATE_CONFIRMATION:
+                    self.handle_state_confirmation(node_id, *STATE_PAYLOAD.unpack(message.payload))
+                case MessageType.CONFIRMATION_ABORT:
+                    self.abort_confirmation(node_id)
+                case MessageType.CHILD_PARENTING_REQUEST:
+                    *subtree, epoch = SUBTREE_PAYLOAD.unpack(message.payload)
+                    self.observe_epoch(epoch)
+                    self.handle_parenting_request(node_id, SubtreeSummary(*subtree))
+                    self._log.debug("Handled the parenting request of %d, possible parents: %s",
+                                    node_id,
+                                    self._possible_parents_ids)
+                case MessageType.LEADER_ANNOUNCEMENT:
+                    leader_id, distance, epoch = LEADER_PAYLOAD.unpack(message.payload)
+                    self.set_leader(leader_id, distance + 1, node_id, epoch)
+                case MessageType.LEADER_ANNOUNCEMENT_ACK:
+                    self.handle_announcement_ack(node_id, *ANNOUNCEMENT_ACK_PAYLOAD.unpack(message.payload))
+                case MessageType.PLACEMENT_SEARCH:
+                    *search, epoch = PLACEMENT_PAYLOAD.unpack(message.payload)
+                    self.observe_epoch(epoch)
+                    self.place_leader(PlacementSearch(*search))
+                case MessageType.PARENT_ACK_RESPONSE:
+                    self._log.debug("Received parent ack response from %d", node_id)
+                    self.handle_parent_response(node_id, True)
+                case MessageType.PARENT_REJECT_MESSAGE | MessageType.ERROR:
+                    self.handle_parent_response(node_id, False)
                 case _:
-                    print(f"Node {self._id} received unknown message from {node_id}")
+                    self._log.warning("Received unknown message from %d", node_id)
 
         except Exception as exception:
-            print(f"Node {self._id} error: {exception}")
+            self._log.exception("Error handling a message from %d: %s", node_id, exception)
+
+        if self._tracer is not None:
+            self._tracer.span(f"handle {message.message_type.name}", started, {"from": node_id})
+
+    def check_possible_parents(self) -> None:
+        """
+        Requests the last possible parent once every other neighbor became a child.
+        """
+
+        if self._state is NodeState.WAITING and len(self._possible_parents_ids) <= 1:
+            self.request_parent()
+
+    def request_parent(self) -> None:
+        """
+        Sends a parenting request to the last possible parent or, if every neighbor became a child, becomes the
+        root of the tree.
+        """
+
+        if not self._possible_parents_ids:
+            self.become_root()
+            return
+
+        self._requested_parent_id = self._possible_parents_ids[0]
+        self._state = NodeState.REQUESTING
+        self.send_parenting_request(self._requested_parent_id)
+        self._log.debug("Sent the parenting request, waiting for the answer")
+
+    def handle_parent_response(self, node_id: int, accepted: bool) -> None:
+        """
+        Becomes a child of the requested parent, or backs off if the request was rejected on a root contention.
+        """
+
+        if self._state is not NodeState.REQUESTING or node_id != self._requested_parent_id:
+            self._log.warning("Ignored a parenting response from %d in state %s", node_id, self._state.value)
+            return
+
+        self._requested_parent_id = None
+
+        if not accepted:
+            self.back_off()
+            return
+
+        self._parent_id = node_id
+        self._state = NodeState.CHILD
+        self.observe_parent_found()
+        self._log.debug("The node finished, waiting for the announcement of the leader")
+
+    def back_off(self) -> None:
+        """
+        Waits the backoff of the contention policy before requesting the parent again.
+        """
+
+        # root contention? -> if the request was not accepted, try again after the policy backoff
+        delay = self._contention_policy.backoff(self._contention_rounds)
+        self._log.info("Root contention, try again after %.3fs", delay)
+        self._contention_rounds += 1
+        self._contention_backoff_time += delay
+
+        if delay <= 0:
+            self.request_parent()
+            return
+
+        self._state = NodeState.CONTENTION
+        self._backoff_started = now()
+        self._backoff_timer_id = self.schedule(delay, EventType.BACKOFF_EXPIRED)
+
+    def end_backoff(self) -> None:
+        """
+        Ends the root contention backoff, when it expires or when the other node became a child meanwhile.
+        """
+
+        self._backoff_timer_id = None
+
+        if self._tracer is not None:
+            self._tracer.span(CONTENTION_BACKOFF, self._backoff_started,
+                              {"round": self._contention_rounds,
+                               "parent": self._possible_parents_ids[0] if self._possible_parents_ids else None})
+
+    def become_root(self) -> None:
+        """
+        Becomes the root of the spanning tree, once every neighbor is a child, and places the leader.
+        """
+
+        self._log.info("The node is the root of the tree")
+        self._state = NodeState.LEADER
+        self.observe_parent_found()
+        self.place_leader(ROOT_SEARCH)
+
+    def observe_parent_found(self) -> None:
+        """
+        Records the end of the parent requests phase.
+        """
+
+        self._parent_found_at = perf_counter()
+        self._metrics.observe_phase(PARENT_REQUESTS, self._parent_found_at - self._election_started_at)
 
-    def handle_parenting_request(self, node_id: int) -> None:
+    def handle_parenting_request(self, node_id: int, subtree: SubtreeSummary) -> None:
         """
         Handles the parenting request received from a node.
 
         Args:
-            client_socket (socket): The socket object representing the client connection.
             node_id (int): The ID of the node.
+            subtree (SubtreeSummary): The summary of the subtree rooted at the node.
         """
 
-        print(f"Parenting request from {node_id}")
+        self._log.debug("Parenting request from %d", node_id)
 
-        with self._is_waiting_for_mutex:
-            # print("entrou no mutex", self._is_waiting_for)
-            concurrency = self._is_waiting_for[0] and node_id == self._is_waiting_for[1]
+        concurrency = self._state is NodeState.REQUESTING and node_id == self._requested_parent_id
+        wins_contention = self._contention_policy.tiebreak(self._id, node_id) if concurrency else None
+        accepted = (not concurrency or wins_contention) and node_id in self._possible_parents_ids
 
-        # print(concurrency)
-        if (
-            not concurrency
-            and node_id in self._possible_parents_ids
-        ):
-            print("Accept parenting request from", node_id)
-
-            self.add_child(node_id)
+        if accepted:
+            self._log.debug("Accept parenting request from %d", node_id)
+            self.add_child(node_id, subtree)
             self.remove_possible_parent(node_id)
+            self._connection_manager.send_message(node_id, MessageType.PARENT_ACK_RESPONSE)
 
-            self._possible_parents_ids_mutex.acquire()
-            if len(self._possible_parents_ids) <= 1:
-                self._possible_parents_ids_mutex.release()
-                self._able_to_request_parent_sem.release()
+            if concurrency:
+                # Won the tiebreak: the other node drops our request, so it is resolved here.
+                self._requested_parent_id = None
+                self.back_off()
+            elif self._state is NodeState.CONTENTION and not self._possible_parents_ids:
+                # The other node retried first: the node is the root, without waiting for its backoff.
+                self.end_backoff()
+                self.become_root()
             else:
-                self._possible_parents_ids_mutex.release()
+                self.check_possible_parents()
 
-            self._connection_manager.send_message(
-                node_id, f"{MessageType.PARENT_ACK_RESPONSE.value} {str(self._id)}"
-            )
+        elif wins_contention is False:
+            # Lost the tiebreak: the other node accepts our request, so this one is not answered.
+            self._log.debug("Lost the root contention against %d", node_id)
 
         else:
-            if concurrency:
-                self._parent_response = False
-                with self._is_waiting_for_mutex:
-                    self._is_waiting_for = (False, None)
+            # On root contention both nodes reject each other, so each one still gets exactly one response.
+            self._log.debug("Reject parent request from %d", node_id)
+
+            self._connection_manager.send_message(node_id, MessageType.ERROR)
 
-                self._parent_response_sem.release()
+    def place_leader(self, search: PlacementSearch) -> None:
+        """
+        Becomes the leader or hands the leadership to the child chosen by the placement policy.
+        """
 
-            print("Reject parent request from", node_id)
+        next_hop = self._placement_policy.next_hop(self._id, self._capacity, self._children_subtrees, search)
 
-            self._connection_manager.send_message(
-                node_id, f"{MessageType.ERROR.value} {str(self._id)}"
-            )
+        if next_hop is None:
+            self._log.info("The node is the leader")
+            self.set_leader(self._id, 0, None, self._max_epoch + 1)
+            return
+
+        child_id, child_search = next_hop
+        self._log.debug("Hands the leadership to %d", child_id)
+        self._connection_manager.send_message(
+            child_id, MessageType.PLACEMENT_SEARCH, PLACEMENT_PAYLOAD.pack(*child_search, self._max_epoch)
+        )
+
+    def set_leader(self, leader_id: int, distance: int, sender_id: int | None, epoch: int) -> None:
+        """
+        Records the leader, re-roots the tree at it, forwards the announcement and persists the election.
+
+        Args:
+            leader_id (int): The id of the winner node.
+            distance (int): The number of tree hops to the leader.
+            sender_id (int | None): The neighbor that sent the announcement, None on the leader.
+            epoch (int): The epoch of the election.
+        """
+
+        # Checked before any change, so an announcement from outside the tree leaves the node as it was.
+        if sender_id is not None and sender_id != self._parent_id and sender_id not in self._children_ids:
+            self._log.warning("Ignored the announcement of the leader %d from %d, which is not in the tree",
+                              leader_id, sender_id)
+            return
+
+        if self._state is NodeState.CONFIRMING:
+            # The announcement of the confirmed leader commits the persisted election.
+            self._confirmed = True
+            self._connection_manager.stop_waiting_for_election()
+
+        with self._leader_mutex:
+            if sender_id != self._parent_id:
+                # The leader is not the root of the tree: the path to it is reversed.
+                if self._parent_id is not None:
+                    self._children_ids.append(self._parent_id)
+                if sender_id is not None:
+                    self._children_ids.remove(sender_id)
+                self._parent_id = sender_id
+
+            self._state = NodeState.DONE
+            self._leader_id = leader_id
+            self._leader_distance = distance
+            self._leader_known_at = perf_counter()
+            self._epoch = epoch
+            self._max_epoch = max(self._max_epoch, epoch)
+            self._leader_condition.notify_all()
+
+        self._pending_acks = set(self._children_ids)
+        self._ack_timed_out = False
+        self._network_ready.clear()
+        self.broadcast_leader_announcement(leader_id, distance, epoch)
+        state = ElectionState(epoch, leader_id, self._parent_id, list(self._children_ids), distance)
+        self.check_acknowledgements()
+
+        if not self._network_ready.is_set():
+            self._ack_timer_id = self.schedule(self._ack_timeout, EventType.ACK_TIMEOUT)
+
+        if self._heartbeat_interval is not None and self._heartbeat_timer_id is None:
+            self._heartbeat_timer_id = self.schedule(self._heartbeat_interval, EventType.HEARTBEAT_DUE)
+
+        if self._state_store is not None:
+            try:
+                self._state_store.save(state)
+            except OSError as exception:
+                self._log.error("Could not persist the election: %s", exception)
+
+    def handle_announcement_ack(self, node_id: int, epoch: int) -> None:
+        """
+        Records that the subtree of a child acknowledged the leader of the epoch.
+        """
 
-    def broadcast_leader_announcement(self, leader_id: int) -> None:
+        if self._state is not NodeState.DONE or epoch != self._epoch or node_id not in self._pending_acks:
+            self._log.debug("Ignored an announcement acknowledgement from %d for epoch %d", node_id, epoch)
+            return
+
+        self._pending_acks.remove(node_id)
+        self.check_acknowledgements()
+
+    def check_acknowledgements(self) -> None:
+        """
+        Once every child acknowledged the leader, acknowledges it to the parent and marks the subtree as ready.
+        On the leader this means every node of the network knows it.
+        """
+
+        if self._state is not NodeState.DONE or self._pending_acks or self._network_ready.is_set():
+            return
+
+        self._network_ready_at = perf_counter()
+        if self._parent_id is not None:
+            self._connection_manager.send_message(self._parent_id, MessageType.LEADER_ANNOUNCEMENT_ACK,
+                                                  ANNOUNCEMENT_ACK_PAYLOAD.pack(self._epoch))
+        else:
+            self._log.info("Every node knows the leader")
+
+        if not self._keep_connections:
+            self._connection_manager.finish_server()  # No more messages are received.
+
+        self._network_ready.set()
+
+    def give_up_acknowledgements(self) -> None:
+        """
+        Stops waiting for the children that did not acknowledge the leader in time. The subtree is not ready, so
+        the node does not acknowledge the leader to its parent either, which gives up in turn.
+        """
+
+        self._log.warning("The children %s did not acknowledge the leader in time", sorted(self._pending_acks))
+        self._ack_timed_out = True
+
+        if not self._keep_connections:
+            self._connection_manager.finish_server()
+
+        # Wakes up wait_for_network_ready, which raises, and the election thread, which closes the connections.
+        self._network_ready.set()
+
+    def broadcast_leader_announcement(self, leader_id: int, distance: int, epoch: int) -> None:
         """Broadcast leader annoucement for the children.
 
         Args:
             leader_id (int): The id of the winner node.
+            distance (int): The number of tree hops between this node and the leader.
+            epoch (int): The epoch of the election.
         """
 
+        payload = LEADER_PAYLOAD.pack(leader_id, distance, epoch)
         for child_id in self._children_ids:
-            self._connection_manager.send_message(
-                child_id, f"{MessageType.LEADER_ANNOUNCEMENT.value} {str(leader_id)}"
-            )
+            self._connection_manager.send_message(child_id, MessageType.LEADER_ANNOUNCEMENT, payload)
 
     def send_parenting_request(self, parent_id: int) -> None:
         """
-        Sends a parenting request.
+        Sends a parenting request with the summary of the node subtree.
         """
 
+        subtree = summarize_subtree(self._id, self._capacity, self._children_subtrees)
+
         self._connection_manager.send_message(
-            parent_id, f"{MessageType.CHILD_PARENTING_REQUEST.value} {str(self._id)}"
+            parent_id, MessageType.CHILD_PARENTING_REQUEST, SUBTREE_PAYLOAD.pack(*subtree, self._max_epoch)
         )
 
-    def add_child(self, child_id: int) -> None:
+    def observe_epoch(self, epoch: int) -> None:
+        """
+        Records an epoch received from a neighbor, so the next leader gets a larger one.
+        """
+
+        self._max_epoch = max(self._max_epoch, epoch)
+
+    def add_child(self, child_id: int, subtree: SubtreeSummary) -> None:
         """
         Adds a child to the node.
 
         Args:
             child_id (int): The ID of the child.
+            subtree (SubtreeSummary): The summary of the subtree rooted at the child.
         """
 
         self._children_ids.append(child_id)
+        self._children_subtrees[child_id] = subtree
 
     def remove_possible_parent(self, parent_id: int) -> None:
         """
@@ -341,3 +1074,219 @@ class ElectionNode:
         """
 
         self._possible_parents_ids.remove(parent_id)
+
+    def send_heartbeats(self) -> None:
+        """
+        Sends heartbeats to the parent and the children and handles the links the failure detector suspects.
+        """
+
+        links = self._children_ids + ([] if self._parent_id is None else [self._parent_id])
+
+        now = perf_counter()
+        for link in links:
+            self._failure_detector.watch(link, now)
+        failed_ids = [link for link in links if self._failure_detector.suspect(link, now)]
+
+        for link in links:
+            if link not in failed_ids:
+                self._connection_manager.send_message(link, MessageType.HEARTBEAT)
+                self._heartbeats_sent += 1
+
+        for failed_id in failed_ids:
+            self.handle_failure(failed_id)
+
+    def handle_failure(self, node_id: int) -> None:
+        """
+        Removes a failed neighbor from the tree.
+
+        A failed child is dropped. A failed parent disconnects the subtree of the node, which re-runs the
+        parent requests phase over its surviving tree, rooted at this node, to elect a leader of its own.
+        """
+
+        self._log.warning("Suspects that %d failed", node_id)
+
+        self._failure_detector.forget(node_id)
+        self._failed_ids.add(node_id)
+
+        ready = False
+        if node_id == self._parent_id:
+            self._parent_id = None
+            ready = self.start_reelection()
+        elif node_id in self._children_ids:
+            self._children_ids.remove(node_id)
+            self._children_subtrees.pop(node_id, None)
+
+            if node_id in self._pending_children:
+                self._pending_children.remove(node_id)
+                ready = not self._pending_children
+
+            # The subtree of a failed child cannot acknowledge the leader anymore.
+            if node_id in self._pending_acks:
+                self._pending_acks.remove(node_id)
+                self.check_acknowledgements()
+
+        if ready:
+            self.report_subtree()
+
+    def handle_reelection(self, node_id: int) -> None:
+        """
+        Joins the re-election started by the parent.
+        """
+
+        if node_id != self._parent_id:
+            self._log.info("Ignored a re-election from %d, which is not its parent", node_id)
+            return
+
+        if self.start_reelection():
+            self.report_subtree()
+
+    def start_reelection(self) -> bool:
+        """
+        Forgets the leader and asks the children for the summaries of their subtrees again.
+
+        Returns whether the node has no child to wait for.
+        """
+
+        self._log.info("Starts a re-election of its subtree")
+
+        with self._leader_mutex:
+            self._state = NodeState.RECOVERING
+            self._leader_id = -1
+
+        self._recoveries += 1
+        self._recovery_started_at = perf_counter()
+        self._children_subtrees = {}
+        self._pending_children = set(self._children_ids)
+
+        for child_id in self._children_ids:
+            self._connection_manager.send_message(child_id, MessageType.REELECTION)
+
+        return not self._pending_children
+
+    def handle_recovery_request(self, node_id: int, subtree: SubtreeSummary) -> None:
+        """
+        Records the subtree summary a child sent during a re-election.
+        """
+
+        if node_id not in self._pending_children:
+            return
+
+        self._pending_children.remove(node_id)
+        self._children_subtrees[node_id] = subtree
+
+        if not self._pending_children:
+            self.report_subtree()
+
+    def report_subtree(self) -> None:
+        """
+        Ends the re-election of the subtree: the node sends its summary to the parent or, if it is the root of
+        the disconnected subtree, places the new leader.
+        """
+
+        if self._parent_id is None:
+            self.place_leader(ROOT_SEARCH)
+        else:
+            self.send_parenting_request(self._parent_id)
+
+    def begin_confirmation(self) -> None:
+        """
+        Starts confirming the persisted election with the other nodes instead of running a new one.
+
+        The confirmation is a convergecast over the persisted tree: once every child confirmed the same
+        topology, epoch and leader, each node connects to its parent and confirms them too. The root then
+        announces the leader again with the persisted epoch, which commits the election on every node. Any
+        mismatch, missing node or timeout aborts the confirmation on every connected node, which then run a
+        normal election.
+        """
+
+        state = self._persisted_state
+        self._log.info("Confirms the election of %d in epoch %d", state.leader_id, state.epoch)
+
+        self._confirmation_deadline = monotonic() + self._confirmation_timeout
+        self.schedule(self._confirmation_timeout, EventType.CONFIRMATION_TIMEOUT)
+
+        self.check_confirmation()
+
+    def check_confirmation(self) -> None:
+        """
+        Confirms the persisted election to the parent, or commits it on the root, once every child confirmed it.
+        """
+
+        state = self._persisted_state
+
+        if (self._state is not NodeState.CONFIRMING or self._confirmation_sent
+                or not self._confirmed_children >= set(state.children_ids)):
+            return
+
+        if state.parent_id is None:
+            if state.leader_id != self._id:
+                self.abort_confirmation()
+            else:
+                self.set_leader(self._id, 0, None, state.epoch)
+            return
+
+        # The connection to the parent is only opened now, with the confirmation as its first message.
+        try:
+            connected = self._connection_manager.connect_to_neighbor(
+                state.parent_id,
+                MessageType.STATE_CONFIRMATION,
+                STATE_PAYLOAD.pack(self._state_store.topology_digest, state.epoch, state.leader_id),
+                max(0.0, self._confirmation_deadline - monotonic()),
+            )
+        except TimeoutError:
+            self._log.warning("Could not reach its persisted parent %d", state.parent_id)
+            connected = False
+
+        if not connected:
+            self.abort_confirmation()
+            return
+
+        # The leader announcement commits the confirmation, the timer aborts it otherwise.
+        self._confirmation_sent = True
+
+    def handle_state_confirmation(self, node_id: int, topology_digest: int, epoch: int, leader_id: int) -> None:
+        """
+        Records the confirmation of a child, aborting the confirmation if it does not match the persisted state.
+        """
+
+        state = self._persisted_state
+        valid = (self._state is NodeState.CONFIRMING
+                 and topology_digest == self._state_store.topology_digest
+                 and epoch == state.epoch
+                 and leader_id == state.leader_id
+                 and node_id in state.children_ids)
+
+        if valid:
+            self._confirmed_children.add(node_id)
+            self.check_confirmation()
+            return
+
+        self._log.warning("Rejected the confirmation of %d", node_id)
+
+        if not self.abort_confirmation():
+            self._connection_manager.send_message(node_id, MessageType.CONFIRMATION_ABORT)
+
+    def abort_confirmation(self, source_id: int | None = None) -> bool:
+        """
+        Gives up the confirmation of the persisted election, forgetting the persisted tree, and tells the
+        connected neighbors but source_id to give it up too.
+
+        Also called when the election reaches the node. Returns whether the node was confirming.
+        """
+
+        if self._state is not NodeState.CONFIRMING:
+            return False
+
+        with self._leader_mutex:
+            self._state = NodeState.WAITING
+            self._parent_id = None
+            self._children_ids = []
+
+        self._confirmed_children = set()
+        self._log.info("Aborted the confirmation, the leader will be elected")
+
+        for neighbor_id in self._connection_manager.get_connected_ids():
+            if neighbor_id != source_id:
+                self._connection_manager.send_message(neighbor_id, MessageType.CONFIRMATION_ABORT)
+
+        return True
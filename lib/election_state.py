@@ -0,0 +1,91 @@
+"""
+Module for the election state persisted between runs.
+
+After each election a node writes the leader, the epoch and its position in the tree rooted at the leader to
+a small JSON file. On restart, if the topology did not change, the nodes confirm that state with each other
+instead of running a new election.
+"""
+
+from hashlib import sha256
+from json import JSONDecodeError, dump, dumps, load
+from os import makedirs, replace
+from os.path import dirname
+from typing import NamedTuple
+
+
+class ElectionState(NamedTuple):
+
+    """
+    Defines what a node remembers of the last election.
+    """
+
+    epoch: int
+    leader_id: int
+    parent_id: int | None
+    children_ids: list[int]
+    leader_distance: int
+
+
+def topology_hash(description: dict) -> str:
+    """
+    Returns the hash of a network description, independent of the order of its keys.
+    """
+
+    return sha256(dumps(description, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ElectionStateStore():
+
+    """
+    Defines the file where a node persists its election state, tied to the hash of the topology it was
+    elected in.
+    """
+
+    _path: str
+    _topology_hash: str
+
+    def __init__(self, path: str, topology_hash: str) -> None:
+        self._path = path
+        self._topology_hash = topology_hash
+
+    @property
+    def topology_digest(self) -> int:
+        """
+        Returns the first 8 bytes of the topology hash, which the nodes compare during the confirmation.
+        """
+
+        return int(self._topology_hash[:16], 16)
+
+    def load(self) -> ElectionState | None:
+        """
+        Returns the persisted state, or None if there is none, it is unreadable or the topology changed.
+        """
+
+        try:
+            with open(self._path, "r", encoding="utf-8") as state_file:
+                data = load(state_file)
+
+            if data.get("topology") != self._topology_hash:
+                return None
+
+            return ElectionState(int(data["epoch"]),
+                                 int(data["leader_id"]),
+                                 None if data["parent_id"] is None else int(data["parent_id"]),
+                                 [int(child_id) for child_id in data["children_ids"]],
+                                 int(data["leader_distance"]))
+        except (OSError, JSONDecodeError, KeyError, TypeError, ValueError):
+            return None
+
+    def save(self, state: ElectionState) -> None:
+        """
+        Persists the state, replacing the file at once so a crash never leaves half of it.
+        """
+
+        if dirname(self._path):
+            makedirs(dirname(self._path), exist_ok=True)
+
+        temporary_path = f"{self._path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as state_file:
+            dump({"topology": self._topology_hash, **state._asdict()}, state_file)
+
+        replace(temporary_path, self._path)
@@ -0,0 +1,167 @@
+"""
+Module for the failure detectors of the election tree links.
+
+After the election each node sends heartbeats to its parent and children. A detector records when the
+heartbeats of each neighbor arrive and tells when a neighbor should be suspected to have failed.
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from math import exp, log, log10, sqrt
+
+
+class FailureDetector(ABC):
+
+    """
+    Defines how a node decides that a neighbor failed from the arrival times of its heartbeats.
+    """
+
+    @abstractmethod
+    def watch(self, node_id: int, now: float) -> None:
+        """
+        Starts monitoring a neighbor, as if a heartbeat arrived now. Does nothing if it is already monitored.
+        """
+
+    @abstractmethod
+    def heartbeat(self, node_id: int, now: float) -> None:
+        """
+        Records a heartbeat of a neighbor.
+        """
+
+    @abstractmethod
+    def suspect(self, node_id: int, now: float) -> bool:
+        """
+        Returns whether a monitored neighbor is suspected to have failed. Neighbors not monitored never are.
+        """
+
+    @abstractmethod
+    def forget(self, node_id: int) -> None:
+        """
+        Stops monitoring a neighbor.
+        """
+
+
+class TimeoutDetector(FailureDetector):
+
+    """
+    Suspects a neighbor when no heartbeat arrived for timeout seconds.
+    """
+
+    _timeout: float
+    _last_heartbeats: dict[int, float]
+
+    def __init__(self, timeout: float = 0.5) -> None:
+        if timeout <= 0:
+            raise ValueError("The timeout must be positive")
+
+        self._timeout = timeout
+        self._last_heartbeats = {}
+
+    def watch(self, node_id: int, now: float) -> None:
+        self._last_heartbeats.setdefault(node_id, now)
+
+    def heartbeat(self, node_id: int, now: float) -> None:
+        self._last_heartbeats[node_id] = now
+
+    def suspect(self, node_id: int, now: float) -> bool:
+        last_heartbeat = self._last_heartbeats.get(node_id)
+
+        return last_heartbeat is not None and now - last_heartbeat > self._timeout
+
+    def forget(self, node_id: int) -> None:
+        self._last_heartbeats.pop(node_id, None)
+
+
+class PhiAccrualDetector(FailureDetector):
+
+    """
+    The phi accrual detector: suspects a neighbor when phi, the -log10 of the probability that a heartbeat
+    arrives later than now, is above threshold.
+
+    The intervals between heartbeats are modeled as a normal distribution estimated over the last window
+    intervals, starting from first_interval. The standard deviation is never below min_std, so a perfectly
+    regular sender does not turn a small delay into a failure.
+    """
+
+    _threshold: float
+    _window: int
+    _first_interval: float
+    _min_std: float
+    _intervals: dict[int, deque[float]]
+    _last_heartbeats: dict[int, float]
+
+    def __init__(self,
+                 threshold: float = 8.0,
+                 window: int = 100,
+                 first_interval: float = 0.1,
+                 min_std: float = 0.05) -> None:
+        if threshold <= 0 or window < 1 or first_interval <= 0 or min_std <= 0:
+            raise ValueError("The phi accrual detector needs positive parameters")
+
+        self._threshold = threshold
+        self._window = window
+        self._first_interval = first_interval
+        self._min_std = min_std
+        self._intervals = {}
+        self._last_heartbeats = {}
+
+    def watch(self, node_id: int, now: float) -> None:
+        if node_id not in self._last_heartbeats:
+            self._last_heartbeats[node_id] = now
+            self._intervals[node_id] = deque([self._first_interval], maxlen=self._window)
+
+    def heartbeat(self, node_id: int, now: float) -> None:
+        if node_id not in self._last_heartbeats:
+            self.watch(node_id, now)
+            return
+
+        self._intervals[node_id].append(now - self._last_heartbeats[node_id])
+        self._last_heartbeats[node_id] = now
+
+    def suspect(self, node_id: int, now: float) -> bool:
+        if node_id not in self._last_heartbeats:
+            return False
+
+        return self.phi(node_id, now) > self._threshold
+
+    def forget(self, node_id: int) -> None:
+        self._last_heartbeats.pop(node_id, None)
+        self._intervals.pop(node_id, None)
+
+    def phi(self, node_id: int, now: float) -> float:
+        """
+        Returns the suspicion level of a monitored neighbor.
+        """
+
+        intervals = self._intervals[node_id]
+        mean = sum(intervals) / len(intervals)
+        variance = sum((interval - mean) ** 2 for interval in intervals) / len(intervals)
+        std = max(sqrt(variance), self._min_std)
+
+        # Logistic approximation of the normal cumulative distribution, as in the Akka detector, written so
+        # that long pauses neither underflow nor overflow.
+        y = (now - self._last_heartbeats[node_id] - mean) / std
+        z = y * (1.5976 + 0.070566 * y * y)
+
+        if z > 0:
+            return z / log(10) + log10(1.0 + exp(-z))
+
+        return -log10(1.0 - 1.0 / (1.0 + exp(min(-z, 700.0))))
+
+
+FAILURE_DETECTORS = {
+    "timeout": TimeoutDetector,
+    "phi": PhiAccrualDetector,
+}
+
+
+def failure_detector_for(kind: str, heartbeat_interval: float) -> FailureDetector:
+    """
+    Returns a detector of the kind, a key of FAILURE_DETECTORS, tuned for heartbeats sent every
+    heartbeat_interval seconds: the timeout detector waits for five of them.
+    """
+
+    if kind == "timeout":
+        return TimeoutDetector(5 * heartbeat_interval)
+
+    return FAILURE_DETECTORS[kind](first_interval=heartbeat_interval)
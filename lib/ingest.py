@@ -0,0 +1,268 @@
+"""
+Module for the leader ingest server.
+"""
+
+from logging import getLogger
+from selectors import EVENT_READ, DefaultSelector, SelectorKey
+from socket import AF_INET, SO_REUSEADDR, SOCK_STREAM, SOL_SOCKET, socket
+from time import monotonic, perf_counter
+from typing import Callable, Hashable
+
+from lib.message import Message, MessageReader, MessageType, ProtocolError
+
+logger = getLogger(__name__)
+
+
+class StreamCollector():
+
+    """
+    Defines the collector of the data streams received from several sources.
+
+    A source is a connection or a neighbor, it sends DATA frames followed by an END_OF_STREAM frame and may
+    carry the streams of several senders when it relays them. The payloads are appended to a buffer per
+    sender id, and the buffers are joined once, in the order the sources ended and, inside a source, in the
+    order the senders first appeared. The streams of a source that never ends are not joined.
+    """
+
+    _verbose: bool
+    _streams: dict[int, bytearray]
+    _source_sender_ids: dict[Hashable, list[int]]
+    _finished_ids: list[int]
+    _frames_received: int
+    _bytes_received: int
+
+    def __init__(self, verbose: bool = False) -> None:
+        """
+        Args:
+            verbose (bool): if True, every chunk is printed as it arrives.
+        """
+
+        self._verbose = verbose
+        self._streams = {}
+        self._source_sender_ids = {}
+        self._finished_ids = []
+        self._frames_received = 0
+        self._bytes_received = 0
+
+    @property
+    def finished_ids(self) -> list[int]:
+        """
+        Returns the senders whose streams ended, in the order they are joined.
+        """
+
+        return self._finished_ids
+
+    @property
+    def frames_received(self) -> int:
+        """
+        Returns the number of frames collected.
+        """
+
+        return self._frames_received
+
+    @property
+    def bytes_received(self) -> int:
+        """
+        Returns the number of payload bytes collected.
+        """
+
+        return self._bytes_received
+
+    def collect(self, source: Hashable, messages: list[Message]) -> tuple[list[Message], bool]:
+        """
+        Collects the frames received from a source.
+
+        Returns its DATA frames, in order, and whether the source ended. The frames after the end are ignored.
+        """
+
+        data = []
+        sender_ids = self._source_sender_ids.setdefault(source, [])
+
+        for message in messages:
+            self._frames_received += 1
+
+            if message.sender_id not in self._streams:
+                self._streams[message.sender_id] = bytearray()
+                sender_ids.append(message.sender_id)
+
+            if message.message_type == MessageType.DATA:
+                self._streams[message.sender_id] += message.payload
+                self._bytes_received += len(message.payload)
+                data.append(message)
+
+                if self._verbose:
+                    print(f"{message.payload.decode('utf-8', 'replace')} ", end="", flush=True)
+
+            elif message.message_type == MessageType.END_OF_STREAM:
+                self._finished_ids.extend(self._source_sender_ids.pop(source))
+                return data, True
+
+        return data, False
+
+    def join(self) -> bytes:
+        """
+        Returns the streams of the sources that ended, joined.
+        """
+
+        return b"".join(self._streams[sender_id] for sender_id in self._finished_ids)
+
+
+class IngestServer():
+
+    """
+    Defines the server that collects the data streams sent to the leader.
+
+    Every client connection is multiplexed in a single selector loop and collected by a StreamCollector, so
+    a connection may relay the streams of several senders. A client that closes its connection without an
+    END_OF_STREAM frame also counts as finished, but its streams are discarded.
+    """
+
+    _address: tuple[str, int]
+    _expected_clients: int
+    _backlog: int
+    _relay: Callable[[list[Message]], None] | None
+    _server_socket: socket | None
+    _collector: StreamCollector
+    _finished_clients: int
+    _dropped_clients: int
+    _elapsed: float
+
+    def __init__(self,
+                 address: tuple[str, int],
+                 expected_clients: int,
+                 verbose: bool = False,
+                 backlog: int = 128,
+                 relay: Callable[[list[Message]], None] | None = None):
+        """
+        Args:
+            address (tuple[str, int]): where the server listens.
+            expected_clients (int): how many client connections are served before serve returns.
+            verbose (bool): if True, every chunk is printed as it arrives.
+            backlog (int): the listen backlog, large enough for every client to connect at once.
+            relay (Callable): called from the loop with the DATA frames of each read, in order, to forward
+                them while they are collected.
+        """
+
+        self._address = address
+        self._expected_clients = expected_clients
+        self._backlog = backlog
+        self._relay = relay
+        self._server_socket = None
+        self._collector = StreamCollector(verbose)
+        self._finished_clients = 0
+        self._dropped_clients = 0
+        self._elapsed = 0.0
+
+    def listen(self) -> None:
+        """
+        Binds the server, so the clients can connect before serve is called. The connections wait in the backlog.
+        """
+
+        if self._server_socket is not None:
+            return
+
+        self._server_socket = socket(AF_INET, SOCK_STREAM)
+        self._server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self._server_socket.bind(self._address)
+        self._server_socket.listen(self._backlog)
+        self._server_socket.setblocking(False)
+
+    def serve(self, timeout: float | None = None) -> bytes:
+        """
+        Collects the streams of the expected clients and returns them joined, binding the server first unless
+        listen was called.
+
+        Raises TimeoutError if they did not finish in timeout seconds.
+        """
+
+        self.listen()
+        server_socket = self._server_socket
+        self._server_socket = None
+
+        selector = DefaultSelector()
+        selector.register(server_socket, EVENT_READ, None)
+        deadline = None if timeout is None else monotonic() + timeout
+        start = perf_counter()
+
+        try:
+            while self._finished_clients + self._dropped_clients < self._expected_clients:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Only {self._finished_clients} of {self._expected_clients} clients finished")
+
+                for key, _ in selector.select(remaining):
+                    if key.data is None:
+                        self.accept(server_socket, selector)
+                    else:
+                        self.read(key, selector)
+        finally:
+            self._elapsed = perf_counter() - start
+
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+        return self._collector.join()
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        Returns the counters of the last serve call.
+        """
+
+        return {
+            "clients": self._finished_clients,
+            "dropped_clients": self._dropped_clients,
+            "streams": len(self._collector.finished_ids),
+            "frames_received": self._collector.frames_received,
+            "bytes_received": self._collector.bytes_received,
+            "elapsed": self._elapsed,
+        }
+
+    # non public lib methods
+
+    def accept(self, server_socket: socket, selector: DefaultSelector) -> None:
+        """
+        Accepts every pending connection.
+        """
+
+        while True:
+            try:
+                client_socket, client_address = server_socket.accept()
+            except BlockingIOError:
+                return
+
+            client_socket.setblocking(False)
+            selector.register(client_socket, EVENT_READ, MessageReader())
+
+    def read(self, key: SelectorKey, selector: DefaultSelector) -> None:
+        """
+        Reads the frames of a readable client and collects them.
+        """
+
+        client_socket = key.fileobj
+        reader = key.data
+
+        try:
+            messages = reader.receive(client_socket)
+        except BlockingIOError:
+            return
+        except (OSError, ProtocolError) as exception:
+            logger.warning("Ingest error: %s", exception)
+            messages = None
+
+        if messages is None:
+            logger.warning("Ingest client closed the connection without an end of stream")
+            self._dropped_clients += 1
+            selector.unregister(client_socket)
+            client_socket.close()
+            return
+
+        data, ended = self._collector.collect(client_socket, messages)
+
+        if data and self._relay is not None:
+            self._relay(data)
+
+        if ended:
+            self._finished_clients += 1
+            selector.unregister(client_socket)
+            client_socket.close()
@@ -0,0 +1,116 @@
+"""
+Module for the logging of the library.
+
+Every module logs to its own logger, named after the module, so the levels can be set per module, and the
+nodes add their id to their records as a field. Records below the level of their logger are dropped before
+their message is formatted. configure_logging sends the records through a queue to a listener thread, so the
+threads of the election never wait for the output stream.
+"""
+
+import logging
+import sys
+from atexit import register
+from json import dumps
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import TextIO
+
+# The attributes of every record, the others come from extra and are the fields of the record.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: QueueListener | None = None
+_queue_handler: QueueHandler | None = None
+
+
+class NodeLogger(logging.LoggerAdapter):
+
+    """
+    Adds the id of a node to the records of a logger.
+    """
+
+    def __init__(self, logger: logging.Logger, node_id: int) -> None:
+        super().__init__(logger, {"node": node_id})
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+class StructuredFormatter(logging.Formatter):
+
+    """
+    Formats a record as a line of text followed by its fields as key=value, or as a JSON object.
+    """
+
+    _json_lines: bool
+
+    def __init__(self, json_lines: bool = False) -> None:
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self._json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+        if not self._json_lines:
+            text = super().format(record)
+            return " ".join([text, *(f"{key}={value}" for key, value in fields.items())])
+
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return dumps(entry, default=str)
+
+
+def configure_logging(level: int | str = logging.WARNING,
+                      module_levels: dict[str, int | str] | None = None,
+                      json_lines: bool = False,
+                      stream: TextIO | None = None) -> None:
+    """
+    Sends the records of level or above, or of the level of their module in module_levels, to the stream,
+    by default stderr, through a queue. Replaces any previous configuration.
+
+    The module names are the names of the loggers, like lib.connection_manager.
+    """
+
+    global _listener, _queue_handler
+
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(json_lines))
+
+    queue = SimpleQueue()
+    _queue_handler = QueueHandler(queue)
+    _listener = QueueListener(queue, handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    for module, module_level in (module_levels or {}).items():
+        logging.getLogger(module).setLevel(module_level)
+
+
+def stop_logging() -> None:
+    """
+    Writes the queued records and removes the handler added by configure_logging, if any.
+    """
+
+    global _listener, _queue_handler
+
+    if _listener is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
+
+
+register(stop_logging)
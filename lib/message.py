@@ -0,0 +1,268 @@
+"""
+Module for the election wire protocol.
+
+Every message is a frame made of a fixed size header followed by an optional payload:
+
+    version (u8) | message type (u8) | channel (u8) | sender id (i32) | payload length (u32) | payload
+
+The channel multiplexes several logical streams over the same connection: the election uses channel 0 and the
+other channels carry application data. Its high bit marks a traced frame, whose payload starts with the Lamport
+clock of the sender, and the next bit a frame of an election group other than 0, whose payload starts with the
+group id, after the clock if there is one. So the channels go up to 63, and one connection carries the elections
+of many groups.
+"""
+
+from enum import IntEnum
+from socket import socket
+from struct import Struct
+from typing import NamedTuple
+
+PROTOCOL_VERSION = 4
+
+HEADER = Struct("!BBBiI")
+
+# Largest payload length accepted by MessageReader: a header announcing more is a protocol error, so a corrupt or
+# hostile peer cannot make the reader buffer without bound.
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+ELECTION_CHANNEL = 0
+DATA_CHANNEL = 1
+
+TRACED_FLAG = 0x80
+CLOCK = Struct("!Q")
+
+DEFAULT_GROUP = 0
+GROUP_FLAG = 0x40
+GROUP = Struct("!I")
+CHANNEL_MASK = 0x3F
+
+# The election messages carry epochs: each election numbers its leader with an epoch larger than every epoch
+# known by the nodes that took part in it.
+# Payload of CHILD_PARENTING_REQUEST: subtree height, subtree size, best capacity and its node id, and the
+# largest epoch known in the subtree.
+SUBTREE_PAYLOAD = Struct("!IIdiI")
+# Payload of LEADER_ANNOUNCEMENT: leader id, the distance in hops from the sender to the leader and the epoch.
+LEADER_PAYLOAD = Struct("!iII")
+# Payload of LEADER_ANNOUNCEMENT_ACK: the epoch of the acknowledged leader.
+ANNOUNCEMENT_ACK_PAYLOAD = Struct("!I")
+# Payload of PLACEMENT_SEARCH: target node id (-1 for none), the height outside the receiver subtree and the
+# largest epoch known by the sender.
+PLACEMENT_PAYLOAD = Struct("!iII")
+# Payload of STATE_CONFIRMATION: digest of the topology, epoch and leader id of the persisted election.
+STATE_PAYLOAD = Struct("!QIi")
+
+# The payload of RECORD_BATCH is a sequence of records, each one this header followed by its bytes: the wall
+# clock time the record was produced and the record length.
+RECORD = Struct("!dI")
+# Payload of CREDIT: how many more records the receiver accepts from the sender.
+CREDIT_PAYLOAD = Struct("!I")
+
+
+class MessageType(IntEnum):
+    """
+    Defines the message types.
+    """
+
+    START_ELECTION = 1
+    CHILD_PARENTING_REQUEST = 2
+    PARENT_ACK_RESPONSE = 3
+    PARENT_REJECT_MESSAGE = 4
+    LEADER_ANNOUNCEMENT = 5
+    ERROR = 6
+    LEADER_ANNOUNCEMENT_ACK = 7
+    READINESS_PROBE = 8
+    READY = 9
+    PLACEMENT_SEARCH = 10
+    DATA = 11
+    END_OF_STREAM = 12
+    HEARTBEAT = 13
+    REELECTION = 14
+    STATE_CONFIRMATION = 15
+    CONFIRMATION_ABORT = 16
+    RECORD_BATCH = 17
+    CREDIT = 18
+
+
+MESSAGE_TYPES = {message_type.value: message_type for message_type in MessageType}
+
+
+class ProtocolError(Exception):
+
+    """
+    Raised when the received bytes are not a valid frame.
+    """
+
+
+class Message(NamedTuple):
+
+    """
+    Defines a decoded message.
+    """
+
+    message_type: MessageType
+    sender_id: int
+    payload: bytes = b""
+    channel: int = ELECTION_CHANNEL
+    clock: int | None = None  # the Lamport clock of the sender of a traced frame
+    group: int = DEFAULT_GROUP
+
+
+def encode_message(message_type: MessageType,
+                   sender_id: int,
+                   payload: bytes = b"",
+                   channel: int = ELECTION_CHANNEL,
+                   clock: int | None = None,
+                   group: int = DEFAULT_GROUP) -> bytes:
+    """
+    Encodes a message into a frame, a traced one if the Lamport clock of the sender is given.
+    """
+
+    if clock is None and group == DEFAULT_GROUP:
+        return HEADER.pack(PROTOCOL_VERSION, message_type, channel, sender_id, len(payload)) + payload
+
+    prefix = b""
+    if clock is not None:
+        channel |= TRACED_FLAG
+        prefix = CLOCK.pack(clock)
+    if group != DEFAULT_GROUP:
+        channel |= GROUP_FLAG
+        prefix += GROUP.pack(group)
+
+    header = HEADER.pack(PROTOCOL_VERSION, message_type, channel, sender_id, len(prefix) + len(payload))
+
+    return header + prefix + payload
+
+
+class MessageReader():
+
+    """
+    Defines a buffered frame reader for a stream socket.
+
+    Each call to receive reads once from the socket and returns every complete frame in the buffer,
+    keeping partial frames until the rest of the bytes arrive. Frames longer than MAX_FRAME_SIZE raise ProtocolError.
+    """
+
+    _buffer: bytearray
+    _start: int
+    _end: int
+
+    def __init__(self, buffer_size: int = 65536) -> None:
+        self._buffer = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+
+    def receive(self, connection: socket) -> list[Message] | None:
+        """
+        Reads from the socket and returns the complete messages, or None if the connection was closed.
+        """
+
+        if self._end == len(self._buffer):
+            self._make_room()
+
+        with memoryview(self._buffer) as view:
+            count = connection.recv_into(view[self._end:])
+
+        if count == 0:
+            return None
+
+        self._end += count
+
+        return self.decode()
+
+    def feed(self, data: bytes) -> list[Message]:
+        """
+        Appends bytes to the buffer and returns the complete messages.
+        """
+
+        while len(self._buffer) - self._end < len(data):
+            self._make_room()
+
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+        return self.decode()
+
+    def decode(self) -> list[Message]:
+        """
+        Decodes every complete frame in the buffer.
+        """
+
+        messages = []
+        buffer = self._buffer
+        unpack_from = HEADER.unpack_from
+        header_size = HEADER.size
+        start = self._start
+        end = self._end
+
+        while end - start >= header_size:
+            version, code, channel, sender_id, length = unpack_from(buffer, start)
+
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f"Unsupported protocol version {version}")
+
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Frame of {length} bytes is larger than {MAX_FRAME_SIZE}")
+
+            frame_end = start + header_size + length
+            if frame_end > end:
+                break
+
+            message_type = MESSAGE_TYPES.get(code)
+            if message_type is None:
+                raise ProtocolError(f"Unknown message type {code}")
+
+            if channel & (TRACED_FLAG | GROUP_FLAG):
+                messages.append(self._decode_prefixed(message_type, channel, sender_id, start + header_size, frame_end))
+            else:
+                messages.append(Message(message_type, sender_id, bytes(buffer[start + header_size:frame_end]), channel))
+            start = frame_end
+
+        if start == end:
+            start = 0
+            end = 0
+
+        self._start = start
+        self._end = end
+
+        return messages
+
+    def _decode_prefixed(self,
+                         message_type: MessageType,
+                         channel: int,
+                         sender_id: int,
+                         payload_start: int,
+                         frame_end: int) -> Message:
+        """
+        Decodes a frame whose payload starts with the clock of the sender, the group id or both.
+        """
+
+        clock = None
+        group = DEFAULT_GROUP
+        prefix_size = (CLOCK.size if channel & TRACED_FLAG else 0) + (GROUP.size if channel & GROUP_FLAG else 0)
+
+        if frame_end - payload_start < prefix_size:
+            raise ProtocolError(f"Frame of {frame_end - payload_start} bytes is shorter than its {prefix_size} "
+                                f"bytes prefix")
+
+        if channel & TRACED_FLAG:
+            clock = CLOCK.unpack_from(self._buffer, payload_start)[0]
+            payload_start += CLOCK.size
+        if channel & GROUP_FLAG:
+            group = GROUP.unpack_from(self._buffer, payload_start)[0]
+            payload_start += GROUP.size
+
+        return Message(message_type, sender_id, bytes(self._buffer[payload_start:frame_end]), channel & CHANNEL_MASK,
+                       clock, group)
+
+    def _make_room(self) -> None:
+        """
+        Moves the pending bytes to the beginning of the buffer, growing it if it is still full.
+        """
+
+        if self._start > 0:
+            pending = self._end - self._start
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        else:
+            self._buffer.extend(bytes(len(self._buffer)))
@@ -0,0 +1,316 @@
+"""
+Module for the metrics of the election.
+
+Each node counts the messages and bytes it sends and receives by message type and keeps histograms of the
+time to connect to each neighbor and of the time it spends in each phase of the election. Counting a message is
+an addition under a lock and observing a duration a binary search over the buckets, so the metrics are always
+on. get_stats returns them with the other counters of the node, and MetricsServer serves the stats of one or
+more nodes as Prometheus text.
+"""
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from threading import Lock, Thread
+from typing import Callable
+
+from lib.message import CLOCK, DEFAULT_GROUP, GROUP, HEADER, Message, MessageType
+
+logger = getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the histograms.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# The phases of the election at a node: forwarding the start of the election to its neighbors, finding its
+# parent and waiting for the announcement of the leader.
+WAKE_UP = "wake_up"
+PARENT_REQUESTS = "parent_requests"
+LEADER_ANNOUNCEMENT = "leader_announcement"
+PHASES = (WAKE_UP, PARENT_REQUESTS, LEADER_ANNOUNCEMENT)
+
+_TYPE_COUNT = max(MessageType) + 1
+
+
+class Histogram():
+
+    """
+    Counts observations in buckets with fixed upper bounds, like a Prometheus histogram.
+    """
+
+    __slots__ = ("_bounds", "_counts", "_sum")
+
+    _bounds: tuple[float, ...]
+    _counts: list[int]  # the last bucket counts the observations above every bound
+    _sum: float
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Adds an observation.
+        """
+
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._sum += value
+
+    def snapshot(self) -> dict:
+        """
+        Returns the count, the sum and the cumulative count of each bucket, by upper bound.
+        """
+
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip((*self._bounds, float("inf")), self._counts):
+            cumulative += count
+            buckets[bound] = cumulative
+
+        return {"count": cumulative, "sum": self._sum, "buckets": buckets}
+
+
+class NodeMetrics():
+
+    """
+    The message counters and the latency histograms of a node, shared by its threads.
+    """
+
+    _lock: Lock
+    _messages_sent: list[int]  # by message type
+    _bytes_sent: list[int]
+    _messages_received: list[int]
+    _bytes_received: list[int]
+    _connect_latency: dict[int, Histogram]  # by neighbor
+    _phases: dict[str, Histogram]
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._messages_sent = [0] * _TYPE_COUNT
+        self._bytes_sent = [0] * _TYPE_COUNT
+        self._messages_received = [0] * _TYPE_COUNT
+        self._bytes_received = [0] * _TYPE_COUNT
+        self._connect_latency = {}
+        self._phases = {phase: Histogram() for phase in PHASES}
+
+    @property
+    def messages_sent(self) -> int:
+        """
+        Returns the number of messages sent.
+        """
+
+        return sum(self._messages_sent)
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Returns the number of bytes sent, including the frame headers.
+        """
+
+        return sum(self._bytes_sent)
+
+    def count_sent(self, message_type: MessageType, size: int) -> None:
+        """
+        Counts a frame of size bytes sent.
+        """
+
+        with self._lock:
+            self._messages_sent[message_type] += 1
+            self._bytes_sent[message_type] += size
+
+    def count_received(self, messages: list[Message]) -> None:
+        """
+        Counts the messages read from a connection.
+        """
+
+        with self._lock:
+            for message in messages:
+                self._messages_received[message.message_type] += 1
+                self._bytes_received[message.message_type] += HEADER.size + len(message.payload) + (
+                    0 if message.clock is None else CLOCK.size) + (0 if message.group == DEFAULT_GROUP else GROUP.size)
+
+    def observe_connect(self, neighbor_id: int, seconds: float) -> None:
+        """
+        Records the time a connection to a neighbor took, including the retries while it was not listening.
+        """
+
+        with self._lock:
+            histogram = self._connect_latency.get(neighbor_id)
+            if histogram is None:
+                histogram = self._connect_latency[neighbor_id] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_phase(self, phase: str, seconds: float) -> None:
+        """
+        Records the time the node spent in a phase of the election.
+        """
+
+        with self._lock:
+            self._phases[phase].observe(seconds)
+
+    def snapshot(self) -> dict:
+        """
+        Returns the metrics as the entries of get_stats.
+        """
+
+        with self._lock:
+            return {
+                "messages_received": sum(self._messages_received),
+                "bytes_received": sum(self._bytes_received),
+                "messages_sent_by_type": _by_type(self._messages_sent),
+                "bytes_sent_by_type": _by_type(self._bytes_sent),
+                "messages_received_by_type": _by_type(self._messages_received),
+                "bytes_received_by_type": _by_type(self._bytes_received),
+                "connect_latency": {neighbor_id: histogram.snapshot()
+                                    for neighbor_id, histogram in self._connect_latency.items()},
+                "phases": {phase: histogram.snapshot() for phase, histogram in self._phases.items()},
+            }
+
+
+def _by_type(counts: list[int]) -> dict[str, int]:
+    """
+    Returns the non-zero counts by message type name.
+    """
+
+    return {MessageType(value).name: count for value, count in enumerate(counts) if count}
+
+
+# The counters of get_stats exported as they are: stats key, metric name, type and help.
+_SCALARS = (
+    ("messages_sent", "election_messages_sent_total", "counter", "Messages sent"),
+    ("bytes_sent", "election_bytes_sent_total", "counter", "Bytes sent, including the frame headers"),
+    ("messages_received", "election_messages_received_total", "counter", "Messages received"),
+    ("bytes_received", "election_bytes_received_total", "counter", "Bytes received, including the frame headers"),
+    ("contention_rounds", "election_contention_retries_total", "counter",
+     "Parent requests retried after a root contention"),
+    ("contention_backoff_time", "election_contention_backoff_seconds_total", "counter",
+     "Time spent backing off after root contentions"),
+    ("heartbeats_sent", "election_heartbeats_sent_total", "counter", "Heartbeats sent"),
+    ("recoveries", "election_recoveries_total", "counter", "Re-elections after a failure"),
+    ("epoch", "election_epoch", "gauge", "Epoch of the election of the current leader"),
+    ("leader_distance", "election_leader_distance", "gauge", "Tree hops to the current leader"),
+)
+
+# The counters by message type: stats key, metric name and help.
+_BY_TYPE = (
+    ("messages_sent_by_type", "election_messages_sent_by_type_total", "Messages sent by type"),
+    ("bytes_sent_by_type", "election_bytes_sent_by_type_total", "Bytes sent by message type"),
+    ("messages_received_by_type", "election_messages_received_by_type_total", "Messages received by type"),
+    ("bytes_received_by_type", "election_bytes_received_by_type_total", "Bytes received by message type"),
+)
+
+# The histograms: stats key, metric name, label of their key and help.
+_HISTOGRAMS = (
+    ("connect_latency", "election_connect_latency_seconds", "neighbor", "Time to connect to a neighbor"),
+    ("phases", "election_phase_duration_seconds", "phase", "Time spent in a phase of the election"),
+)
+
+
+def _format_bound(bound: float) -> str:
+    """
+    Returns the le label of a bucket.
+    """
+
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render_prometheus(stats: dict[int, dict]) -> str:
+    """
+    Returns the stats of the nodes, by node id, in the Prometheus text format, with the node id as a label.
+
+    The entries a node does not report, like the histograms of the asyncio nodes, are left out.
+    """
+
+    lines = []
+
+    for key, name, metric_type, description in _SCALARS:
+        samples = [(node_id, node_stats[key]) for node_id, node_stats in stats.items()
+                   if node_stats.get(key) is not None]
+        if samples:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+            lines += [f'{name}{{node="{node_id}"}} {float(value)!r}' for node_id, value in samples]
+
+    for key, name, description in _BY_TYPE:
+        samples = [(node_id, node_stats[key]) for node_id, node_stats in stats.items() if key in node_stats]
+        if samples:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{node="{node_id}",type="{message_type}"}} {count}'
+                      for node_id, counts in samples for message_type, count in counts.items()]
+
+    for key, name, label, description in _HISTOGRAMS:
+        samples = [(node_id, node_stats[key]) for node_id, node_stats in stats.items() if key in node_stats]
+        if samples:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+
+        for node_id, histograms in samples:
+            for label_value, histogram in histograms.items():
+                labels = f'node="{node_id}",{label}="{label_value}"'
+                lines += [f'{name}_bucket{{{labels},le="{_format_bound(bound)}"}} {count}'
+                          for bound, count in histogram["buckets"].items()]
+                lines.append(f"{name}_sum{{{labels}}} {histogram['sum']!r}")
+                lines.append(f"{name}_count{{{labels}}} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer():
+
+    """
+    Serves the stats of one or more nodes as Prometheus text on /metrics, from a daemon thread.
+
+    collect returns the stats of the nodes by node id, it is called on every scrape.
+    """
+
+    _server: ThreadingHTTPServer
+    _thread: Thread
+
+    def __init__(self, address: tuple[str, int], collect: Callable[[], dict[int, dict]]) -> None:
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            """
+            Answers the scrapes.
+            """
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = render_prometheus(collect()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format, *args)
+
+        self._server = ThreadingHTTPServer(address, MetricsHandler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """
+        Returns the address the server listens on, with the port chosen by the system if 0 was given.
+        """
+
+        return self._server.server_address[:2]
+
+    def start(self) -> None:
+        """
+        Starts serving.
+        """
+
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Stops serving and closes the listening socket.
+        """
+
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
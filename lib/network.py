@@ -1,66 +1,486 @@
 """
 Module for the network specification.
+
+The network file is validated when it is loaded: the ids are unique, every connection is listed by both of its
+nodes and the graph is a tree, otherwise the election would never finish. The nodes are kept in arrays sorted by
+id and the connections in a compressed adjacency index, so networks with hundreds of thousands of nodes take
+little memory and every lookup is a binary search and a slice.
+
+The transport of a node, a key of lib.transport.TRANSPORTS set in its optional "transport" field, is the one
+its neighbors connect to it with, TCP by default. The optional "link_transports" object sets the transport of
+single connections, used in both directions, like {"0": {"1": "shm"}}.
 """
 
-from json import load
+from array import array
+from bisect import bisect_left
+from json import JSONDecodeError, load
+from operator import itemgetter
+
+from lib.election_state import topology_hash
+from lib.placement import check_capacity
+from lib.transport import TRANSPORTS
+
+# The sender of the messages is a signed 32-bit integer and -1 means no leader.
+MAX_NODE_ID = 2 ** 31 - 1
+MAX_PORT = 65535
+TRANSPORT_NAMES = tuple(TRANSPORTS)
+DEFAULT_TRANSPORT = "tcp"
+
+
+class TopologyError(ValueError):
+
+    """
+    Raised when a network file does not describe a valid election network.
+    """
+
+
+def _reject_duplicate_keys(pairs: list[tuple[str, object]]) -> dict:
+    """
+    Builds a JSON object, raising TopologyError if a key repeats, which json.load would silently overwrite.
+    """
+
+    result = dict(pairs)
+
+    if len(result) != len(pairs):
+        seen = set()
+        for key, _ in pairs:
+            if key in seen:
+                raise TopologyError(f"The key {key!r} is repeated in the network file")
+            seen.add(key)
+
+    return result
+
+
+def _parse_node_id(key: object) -> int:
+    """
+    Returns the node id of a key of the network file.
+    """
+
+    try:
+        node_id = int(key)
+    except (TypeError, ValueError) as exception:
+        raise TopologyError(f"{key!r} is not a node id") from exception
+
+    if isinstance(key, bool) or not 0 <= node_id <= MAX_NODE_ID:
+        raise TopologyError(f"The node id {key!r} is not between 0 and {MAX_NODE_ID}")
+
+    return node_id
+
+
+def _parse_port(node_id: int, data: dict, name: str) -> int:
+    """
+    Returns a port of a node.
+    """
+
+    port = data[name]
+    if not isinstance(port, int) or isinstance(port, bool) or not 0 <= port <= MAX_PORT:
+        raise TopologyError(f"The {name} of the node {node_id} is not a port: {port!r}")
+
+    return port
+
+
+def _parse_capacity(node_id: int, data: dict) -> float:
+    """
+    Returns the capacity of a node, 1.0 if it is not set.
+    """
+
+    try:
+        return check_capacity(data.get("capacity", 1.0))
+    except ValueError as exception:
+        raise TopologyError(f"The capacity of the node {node_id} is invalid: {exception}") from exception
+
+
+def _parse_neighbor_id(key: object, neighbor_id: object) -> int:
+    """
+    Returns a node id listed in the connections of a node.
+    """
+
+    # A JSON true would be taken as the node 1 by the lookups.
+    if not isinstance(neighbor_id, int) or isinstance(neighbor_id, bool):
+        raise TopologyError(f"The connections of the node {key} list {neighbor_id!r}, which is not a node id")
+
+    return neighbor_id
+
+
+def _parse_transport(description: str, name: object) -> int:
+    """
+    Returns the position in TRANSPORT_NAMES of a transport of the network file.
+    """
+
+    if name not in TRANSPORT_NAMES:
+        raise TopologyError(f"{description} is not one of {', '.join(TRANSPORT_NAMES)}: {name!r}")
+
+    return TRANSPORT_NAMES.index(name)
+
+
+class DisjointSets():
+
+    """
+    Union-find over the integers 0 to count - 1, with union by size and path halving.
+    """
+
+    __slots__ = ("_parents", "_sizes")
+
+    _parents: array
+    _sizes: array
+
+    def __init__(self, count: int) -> None:
+        self._parents = array("i", range(count))
+        self._sizes = array("i", [1]) * count
+
+    def find(self, element: int) -> int:
+        """
+        Returns the representative of the set of element.
+        """
+
+        parents = self._parents
+        while parents[element] != element:
+            parents[element] = parents[parents[element]]
+            element = parents[element]
+
+        return element
+
+    def union(self, first: int, second: int) -> bool:
+        """
+        Joins the sets of first and second, returning False if they were already the same set.
+        """
+
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return False
+
+        if self._sizes[first] < self._sizes[second]:
+            first, second = second, first
+
+        self._parents[second] = first
+        self._sizes[first] += self._sizes[second]
+
+        return True
 
 
 class Network():
 
     """
     Defines a network graph.
+
+    Raises TopologyError if the file is not a valid network: ids repeated or out of range, invalid addresses or
+    capacities, connections to unknown nodes or listed by only one of their nodes, cycles or nodes that cannot be
+    reached.
     """
 
-    _nodes: dict[int, tuple[str, int, int]]
-    _connections: dict[int, list[int]]
+    __slots__ = ("_ids", "_hosts", "_host_indexes", "_election_ports", "_application_ports", "_capacities",
+                 "_transports", "_neighbor_offsets", "_neighbor_indexes", "_link_transports", "_topology_hash")
+
+    _ids: array  # the node ids, sorted; the other arrays are indexed by the position of the id here
+    _hosts: list[str]  # the distinct hosts
+    _host_indexes: array
+    _election_ports: array
+    _application_ports: array
+    _capacities: array
+    _transports: array  # positions in TRANSPORT_NAMES
+    _neighbor_offsets: array  # the neighbors of the node at index i are at offsets[i] to offsets[i + 1]
+    _neighbor_indexes: array
+    _link_transports: dict[int, int]  # by smaller index * count + larger index, positions in TRANSPORT_NAMES
+    _topology_hash: str | None
 
     def __init__(self, network_file_path: str) -> None:
-        with open(network_file_path, "r", encoding="utf-8") as network_file:
-            network = load(network_file)
+        try:
+            with open(network_file_path, "r", encoding="utf-8") as network_file:
+                network = load(network_file, object_pairs_hook=_reject_duplicate_keys)
+        except JSONDecodeError as exception:
+            raise TopologyError(f"{network_file_path} is not valid JSON: {exception}") from exception
+
+        if not isinstance(network, dict) or not isinstance(network.get("nodes"), dict) \
+                or not isinstance(network.get("connections"), dict):
+            raise TopologyError(f"{network_file_path} must have the nodes and connections objects")
+
+        self.load_nodes(network["nodes"])
+        self.load_connections(network["connections"])
+        self.load_link_transports(network.get("link_transports", {}))
+        self._topology_hash = None
+
+    def load_nodes(self, nodes: dict) -> None:
+        """
+        Stores the nodes sorted by id, checking that the ids are unique and the addresses valid.
+        """
+
+        if not nodes:
+            raise TopologyError("The network has no nodes")
+
+        entries = sorted(((_parse_node_id(key), data) for key, data in nodes.items()), key=itemgetter(0))
 
-        self._nodes = {}
-        for node_id, data in network["nodes"].items():
-            self._nodes[int(node_id)] = (data["host"], data["election_port"], data["application_port"])
+        self._ids = array("i")
+        self._hosts = []
+        self._host_indexes = array("I")
+        self._election_ports = array("H")
+        self._application_ports = array("H")
+        self._capacities = array("d")
+        self._transports = array("B")
+        host_table = {}
 
-        self._connections = {int(node_id): neighbors for node_id, neighbors in network["connections"].items()}
+        for node_id, data in entries:
+            if self._ids and self._ids[-1] == node_id:
+                raise TopologyError(f"The node id {node_id} is repeated")
+
+            try:
+                host = data["host"]
+                if not isinstance(host, str) or not host:
+                    raise TopologyError(f"The host of the node {node_id} is not a name: {host!r}")
+
+                election_port = _parse_port(node_id, data, "election_port")
+                application_port = _parse_port(node_id, data, "application_port")
+                capacity = _parse_capacity(node_id, data)
+                transport = _parse_transport(f"The transport of the node {node_id}",
+                                             data.get("transport", DEFAULT_TRANSPORT))
+            except (KeyError, TypeError, ValueError, AttributeError) as exception:
+                if isinstance(exception, TopologyError):
+                    raise
+                raise TopologyError(f"The node {node_id} is invalid: {exception!r}") from exception
+
+            if host not in host_table:
+                host_table[host] = len(self._hosts)
+                self._hosts.append(host)
+
+            self._ids.append(node_id)
+            self._host_indexes.append(host_table[host])
+            self._election_ports.append(election_port)
+            self._application_ports.append(application_port)
+            self._capacities.append(capacity)
+            self._transports.append(transport)
+
+    def load_connections(self, connections: dict) -> None:
+        """
+        Builds the adjacency index, checking in near-linear time that the connections form a tree.
+        """
+
+        count = len(self._ids)
+        positions = {node_id: index for index, node_id in enumerate(self._ids)}
+        adjacency = {}
+
+        for key, neighbor_ids in connections.items():
+            index = positions.get(_parse_node_id(key))
+            if index is None:
+                raise TopologyError(f"The connections list the unknown node {key}")
+
+            if not isinstance(neighbor_ids, list):
+                raise TopologyError(f"The connections of the node {key} are not a list")
+
+            neighbor_indexes = [positions.get(_parse_neighbor_id(key, neighbor_id)) for neighbor_id in neighbor_ids]
+
+            if None in neighbor_indexes:
+                unknown_id = neighbor_ids[neighbor_indexes.index(None)]
+                raise TopologyError(f"The node {key} is connected to the unknown node {unknown_id!r}")
+            if index in neighbor_indexes:
+                raise TopologyError(f"The node {key} is connected to itself")
+            if len(set(neighbor_indexes)) != len(neighbor_indexes):
+                raise TopologyError(f"The node {key} lists a neighbor more than once")
+
+            adjacency[index] = neighbor_indexes
+
+        self._neighbor_offsets = array("i", [0]) * (count + 1)
+        self._neighbor_indexes = array("i")
+        sets = DisjointSets(count)
+        edges = set()
+
+        # Each connection is listed by both nodes: it is added to the tree from the smaller index and must be
+        # there when the larger one lists it.
+        for index in range(count):
+            neighbor_indexes = adjacency.pop(index, ())
+
+            for neighbor_index in neighbor_indexes:
+                if index < neighbor_index:
+                    edges.add(index * count + neighbor_index)
+                    if not sets.union(index, neighbor_index):
+                        raise TopologyError(f"The connection {self._ids[index]} - {self._ids[neighbor_index]} "
+                                            f"closes a cycle")
+                elif neighbor_index * count + index in edges:
+                    edges.remove(neighbor_index * count + index)
+                else:
+                    self.raise_one_sided(neighbor_index, index)
+
+            self._neighbor_indexes.extend(neighbor_indexes)
+            self._neighbor_offsets[index + 1] = len(self._neighbor_indexes)
+
+        if edges:
+            self.raise_one_sided(*divmod(next(iter(edges)), count))
+
+        if len(self._neighbor_indexes) != 2 * (count - 1):
+            root = sets.find(0)
+            unreachable = next(index for index in range(count) if sets.find(index) != root)
+            raise TopologyError(f"The network is not connected: the node {self._ids[unreachable]} cannot reach "
+                                f"the node {self._ids[0]}")
+
+    def load_link_transports(self, link_transports: dict) -> None:
+        """
+        Stores the transports set for single connections, checking that the nodes are connected and that a
+        connection listed under both of its nodes has a single transport.
+        """
+
+        if not isinstance(link_transports, dict):
+            raise TopologyError("The link_transports must be an object")
+
+        count = len(self._ids)
+        self._link_transports = {}
+
+        for key, transports in link_transports.items():
+            index = self.index_of(_parse_node_id(key), "The link_transports list the unknown node")
+
+            if not isinstance(transports, dict):
+                raise TopologyError(f"The link_transports of the node {key} are not an object")
+
+            for neighbor_key, name in transports.items():
+                neighbor_index = self.index_of(_parse_node_id(neighbor_key),
+                                               "The link_transports list the unknown node")
+                neighbor_indexes = self._neighbor_indexes[self._neighbor_offsets[index]:
+                                                          self._neighbor_offsets[index + 1]]
+                if neighbor_index not in neighbor_indexes:
+                    raise TopologyError(f"The link_transports set {key} - {neighbor_key}, which are not connected")
+
+                transport = _parse_transport(f"The transport of the connection {key} - {neighbor_key}", name)
+                edge = min(index, neighbor_index) * count + max(index, neighbor_index)
+                if self._link_transports.setdefault(edge, transport) != transport:
+                    raise TopologyError(f"The connection {key} - {neighbor_key} has two transports")
+
+    def raise_one_sided(self, first: int, second: int) -> None:
+        """
+        Raises the TopologyError of a connection listed by only one of its nodes, given their indexes.
+        """
+
+        raise TopologyError(f"The connection {self._ids[first]} - {self._ids[second]} is listed by only one of "
+                            f"its nodes")
+
+    def index_of(self, node_id: int, message: str | None = None) -> int:
+        """
+        Returns the position of a node in the arrays.
+
+        Raises KeyError if there is no such node, or TopologyError with the message if one is given.
+        """
+
+        index = bisect_left(self._ids, node_id)
+
+        if index == len(self._ids) or self._ids[index] != node_id:
+            if message is not None:
+                raise TopologyError(f"{message} {node_id}")
+            raise KeyError(node_id)
+
+        return index
 
     def get_node_count(self) -> int:
         """
         Returns the number of nodes.
         """
 
-        return len(self._nodes)
+        return len(self._ids)
+
+    def get_node_ids(self) -> list[int]:
+        """
+        Returns the ids of the nodes, sorted.
+        """
+
+        return self._ids.tolist()
 
     def get_node_election_address(self, node_id: int) -> tuple[str, int]:
         """
         Returns the address of a node.
         """
 
-        return self._nodes[node_id][:2]
+        index = self.index_of(node_id)
+
+        return (self._hosts[self._host_indexes[index]], self._election_ports[index])
 
     def get_node_application_address(self, node_id: int) -> tuple[str, int]:
         """
         Returns the address of a node.
         """
 
-        return (self._nodes[node_id][0], self._nodes[node_id][2])
+        index = self.index_of(node_id)
+
+        return (self._hosts[self._host_indexes[index]], self._application_ports[index])
+
+    def get_node_capacity(self, node_id: int) -> float:
+        """
+        Returns the capacity a node advertises to the leader placement, 1.0 if the network does not set it.
+        """
+
+        return self._capacities[self.index_of(node_id)]
+
+    def get_node_transport(self, node_id: int) -> str:
+        """
+        Returns the transport of the listener of a node, a key of lib.transport.TRANSPORTS.
+        """
+
+        return TRANSPORT_NAMES[self._transports[self.index_of(node_id)]]
+
+    def get_neighbor_transports(self, node_id: int) -> dict[int, str]:
+        """
+        Returns the transport a node connects to each neighbor with: the one set for the connection, or else the
+        one of the neighbor.
+        """
+
+        index = self.index_of(node_id)
+        count = len(self._ids)
+        result = {}
+
+        for offset in range(self._neighbor_offsets[index], self._neighbor_offsets[index + 1]):
+            neighbor_index = self._neighbor_indexes[offset]
+            edge = min(index, neighbor_index) * count + max(index, neighbor_index)
+            transport = self._link_transports.get(edge, self._transports[neighbor_index])
+            result[self._ids[neighbor_index]] = TRANSPORT_NAMES[transport]
+
+        return result
+
+    def get_topology_hash(self) -> str:
+        """
+        Returns a hash of the nodes, their addresses and capacities and the connections, which changes whenever
+        a persisted election state would no longer be valid. It is only computed on the first call.
+        """
+
+        if self._topology_hash is None:
+            self._topology_hash = topology_hash({
+                "nodes": {str(node_id): [*self.get_node_election_address(node_id),
+                                         self._application_ports[index],
+                                         self._capacities[index]]
+                          for index, node_id in enumerate(self._ids)},
+                "connections": {str(node_id): sorted(self.get_neighbor_ids(node_id)) for node_id in self._ids},
+            })
+
+        return self._topology_hash
+
+    def get_neighbor_ids(self, node_id: int) -> list[int]:
+        """
+        Returns the ids of the neighbors of a node.
+        """
+
+        index = self.index_of(node_id)
+        neighbor_indexes = self._neighbor_indexes[self._neighbor_offsets[index]:self._neighbor_offsets[index + 1]]
+
+        return [self._ids[neighbor_index] for neighbor_index in neighbor_indexes]
 
     def get_election_neighbors(self, node_id: int) -> dict[int, tuple[str, int]]:
         """
         Returns the neighbors of a node.
         """
 
-        return {neighbor_id: self._nodes[neighbor_id][:2] for neighbor_id in self._connections[node_id]}
+        return self.neighbors_with_ports(node_id, self._election_ports)
 
     def get_application_neighbors(self, node_id: int) -> dict[int, tuple[str, int]]:
         """
         Returns the neighbors of a node.
         """
 
+        return self.neighbors_with_ports(node_id, self._application_ports)
+
+    def neighbors_with_ports(self, node_id: int, ports: array) -> dict[int, tuple[str, int]]:
+        """
+        Returns the addresses of the neighbors of a node with the given ports.
+        """
+
+        index = self.index_of(node_id)
         result = {}
 
-        for neighbor_id in self._connections[node_id]:
-            result[neighbor_id] = (self._nodes[neighbor_id][0], self._nodes[neighbor_id][2])
+        for offset in range(self._neighbor_offsets[index], self._neighbor_offsets[index + 1]):
+            neighbor_index = self._neighbor_indexes[offset]
+            result[self._ids[neighbor_index]] = (self._hosts[self._host_indexes[neighbor_index]], ports[neighbor_index])
 
         return result
 
@@ -69,4 +489,4 @@ class Network():
         Returns the id of the node that starts the election.
         """
 
-        return min(self._nodes.keys())
+        return self._ids[0]
@@ -0,0 +1,157 @@
+"""
+Module for the leader placement policies.
+
+The node that ends the parent requests phase is the root of the spanning tree. Without a placement policy
+it becomes the leader; with one, it uses the subtree summaries its children sent with their parenting
+requests to hand the leadership down the tree, one hop at a time, until the chosen node is reached.
+"""
+
+from math import isfinite
+from typing import NamedTuple
+
+
+class SubtreeSummary(NamedTuple):
+
+    """
+    Defines what a child tells its parent about its subtree.
+
+    height is the distance from the child to the deepest node of its subtree, and capacity_id is the node
+    with the largest capacity, ties broken by the largest id.
+    """
+
+    height: int
+    size: int
+    capacity: float
+    capacity_id: int
+
+
+class PlacementSearch(NamedTuple):
+
+    """
+    Defines the state of the walk towards the leader.
+
+    up_height is the distance from the current node to the farthest node outside its subtree, and target_id
+    is the node being searched for, or -1 when the policy decides at each hop.
+    """
+
+    target_id: int
+    up_height: int
+
+
+ROOT_SEARCH = PlacementSearch(-1, 0)
+
+
+def check_capacity(capacity: object) -> float:
+    """
+    Returns a capacity as a float, raising ValueError if it is not a finite, non-negative number.
+
+    A NaN would make the comparisons of the subtree summaries depend on their order, so the nodes could disagree
+    on the leader.
+    """
+
+    if not isinstance(capacity, (int, float)) or isinstance(capacity, bool) or not isfinite(capacity) \
+            or capacity < 0:
+        raise ValueError(f"The capacity is not a finite, non-negative number: {capacity!r}")
+
+    return float(capacity)
+
+
+def summarize_subtree(node_id: int, capacity: float, children: dict[int, SubtreeSummary]) -> SubtreeSummary:
+    """
+    Returns the summary of the subtree rooted at a node.
+    """
+
+    best_capacity, best_id = max([(capacity, node_id)] + [(child.capacity, child.capacity_id)
+                                                           for child in children.values()])
+
+    return SubtreeSummary(
+        height=max((child.height + 1 for child in children.values()), default=0),
+        size=1 + sum(child.size for child in children.values()),
+        capacity=best_capacity,
+        capacity_id=best_id,
+    )
+
+
+class PlacementPolicy():
+
+    """
+    Defines where the leadership goes after the parent requests phase.
+    """
+
+    def next_hop(self,
+                 node_id: int,
+                 capacity: float,
+                 children: dict[int, SubtreeSummary],
+                 search: PlacementSearch) -> tuple[int, PlacementSearch] | None:
+        """
+        Returns the child the leadership is handed to and the search it receives, or None if this node leads.
+        """
+
+        return None
+
+
+class RootPlacement(PlacementPolicy):
+
+    """
+    The root of the spanning tree is the leader, as in the original protocol.
+    """
+
+
+class CenterPlacement(PlacementPolicy):
+
+    """
+    The leader is a center of the tree: the node with the smallest eccentricity.
+
+    At each hop the leadership moves to the child with the tallest subtree while that lowers the eccentricity.
+    """
+
+    def next_hop(self,
+                 node_id: int,
+                 capacity: float,
+                 children: dict[int, SubtreeSummary],
+                 search: PlacementSearch) -> tuple[int, PlacementSearch] | None:
+        if not children:
+            return None
+
+        # Distance from this node to the farthest node through each child.
+        distances = {child_id: child.height + 1 for child_id, child in children.items()}
+        tallest_id = max(distances, key=lambda child_id: (distances[child_id], child_id))
+        others = max([search.up_height] + [distance for child_id, distance in distances.items()
+                                           if child_id != tallest_id])
+
+        if distances[tallest_id] <= others + 1:
+            return None
+
+        return tallest_id, PlacementSearch(-1, others + 1)
+
+
+class CapacityPlacement(PlacementPolicy):
+
+    """
+    The leader is the node that advertised the largest capacity, ties broken by the largest id.
+    """
+
+    def next_hop(self,
+                 node_id: int,
+                 capacity: float,
+                 children: dict[int, SubtreeSummary],
+                 search: PlacementSearch) -> tuple[int, PlacementSearch] | None:
+        target_id = search.target_id
+        if target_id == -1:
+            target_id = summarize_subtree(node_id, capacity, children).capacity_id
+
+        if target_id == node_id:
+            return None
+
+        for child_id, child in children.items():
+            if child.capacity_id == target_id:
+                return child_id, PlacementSearch(target_id, 0)
+
+        return None
+
+
+PLACEMENT_POLICIES = {
+    "root": RootPlacement,
+    "center": CenterPlacement,
+    "capacity": CapacityPlacement,
+}
@@ -1,10 +1,83 @@
 """
 The socket manager is used to manage both the server and client sockets.
+
+The sockets are opened by the transports of lib.transport, TCP unless other ones are given, and the connections
+of every transport are read and written the same way.
 """
 
 import select
 from atexit import register
-from socket import AF_INET, SOCK_STREAM, socket, timeout
+from logging import getLogger
+from socket import SHUT_RDWR, socket, timeout
+from time import monotonic, sleep
+
+from lib.backoff import ExponentialBackoff
+from lib.message import Message, MessageReader, MessageType, encode_message
+from lib.transport import SharedMemoryConnection, TcpTransport, Transport, UnixListener
+
+logger = getLogger(__name__)
+
+
+def connect_with_backoff(address: tuple[str, int],
+                         connect_timeout: float,
+                         backoff: ExponentialBackoff | None = None,
+                         transport: Transport | None = None) -> socket | SharedMemoryConnection:
+    """
+    Connects to a server, retrying with a capped exponential backoff while it is not accepting connections.
+
+    Raises TimeoutError if the connection could not be made in connect_timeout seconds.
+    """
+
+    backoff = backoff or ExponentialBackoff()
+    transport = transport or TcpTransport()
+    deadline = monotonic() + connect_timeout
+
+    for delay in backoff.delays():
+        try:
+            return transport.connect(address)
+        except OSError as exception:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Could not connect to {address[0]}:{address[1]}: {exception}") from exception
+
+            sleep(min(delay, remaining))
+
+
+def probe_server(address: tuple[str, int],
+                 sender_id: int,
+                 probe_timeout: float,
+                 transport: Transport | None = None) -> None:
+    """
+    Checks that a node is accepting election connections, on the transport of its listener.
+
+    Connects with backoff, sends a readiness probe and waits for the ready answer. Raises TimeoutError if
+    the node is not ready in probe_timeout seconds.
+    """
+
+    deadline = monotonic() + probe_timeout
+    connection = connect_with_backoff(address, probe_timeout, transport=transport)
+
+    try:
+        connection.sendall(encode_message(MessageType.READINESS_PROBE, sender_id))
+        reader = MessageReader(256)
+
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Node at {address[0]}:{address[1]} did not answer the readiness probe")
+
+            connection.settimeout(remaining)
+            messages = reader.receive(connection)
+
+            if messages is None:
+                raise TimeoutError(f"Node at {address[0]}:{address[1]} closed the readiness probe")
+
+            if any(message.message_type == MessageType.READY for message in messages):
+                return
+    except timeout as exception:
+        raise TimeoutError(f"Node at {address[0]}:{address[1]} did not answer the readiness probe") from exception
+    finally:
+        connection.close()
 
 
 class SocketManager():
@@ -12,55 +85,99 @@ class SocketManager():
     """
     Defines a socket manager.
 
-    This is a container that has a client and a server socket, they are created and freed together.
+    This is a container that has a client and a server socket, they are created and freed together. The server
+    listens on one socket per transport, so the neighbors can connect with the transport of their link.
     """
 
-    _server_socket: socket
-    _client_sockets: dict[int, socket]
-    _connected_clients: dict[tuple[str, int], socket]
+    _transports: list[Transport]
+    _server_sockets: list[socket | UnixListener]
+    _client_sockets: dict[int, socket | SharedMemoryConnection]
+    _connected_clients: dict[tuple[str, int], socket | SharedMemoryConnection]
     _connected_clients_addresses: dict[int, tuple[str, int]]
+    _readers: dict[socket | SharedMemoryConnection, MessageReader]
     _timeout: float
+    _connect_timeout: float
 
-    def __init__(self, timeout: float) -> None:
-        self._server_socket = socket(AF_INET, SOCK_STREAM)
+    def __init__(self,
+                 timeout: float,
+                 connect_timeout: float = 30.0,
+                 transports: list[Transport] | None = None) -> None:
+        """
+        Args:
+            transports (list): the transports the server listens on, by default only TCP.
+        """
+
+        self._transports = transports or [TcpTransport()]
+        self._server_sockets = []
         self._client_sockets = {}
         self._connected_clients = {}
         self._connected_clients_addresses = {}
+        self._readers = {}
         self._timeout = timeout
-
-        # self._server_socket.setblocking(False)
+        self._connect_timeout = connect_timeout
 
         # Register the close_sockets method to be called when the program ends.
         # The sockets can also be closed at any moment.
         register(self.close_sockets)
 
+    @property
+    def server_sockets(self) -> list[socket | UnixListener]:
+        """
+        Returns the server sockets, one per transport.
+        """
+
+        return self._server_sockets
+
+    def get_client_socket(self, address: tuple[str, int]) -> socket | SharedMemoryConnection:
+        """
+        Returns the socket of a connected client using the client address.
+        """
+
+        return self._connected_clients[address]
+
+    def get_server_socket(self, server_id: int) -> socket | SharedMemoryConnection:
+        """
+        Returns the socket connected to a server using the server id.
+        """
+
+        return self._client_sockets[server_id]
+
     def bind_server(self, address: tuple[str, int]) -> None:
         """
-        Binds the server socket to the given host and port.
+        Binds a server socket of each transport to the given host and port.
         """
 
-        self._server_socket.bind(address)
+        for transport in self._transports:
+            self._server_sockets.append(transport.bind(address))
 
     def listen(self, backlog: int) -> None:
         """
         Starts listening for connections.
         """
 
-        self._server_socket.listen(backlog)
+        for server_socket in self._server_sockets:
+            server_socket.listen(backlog)
 
     def accept(self) -> tuple[str, int] | None:
         """
         Accepts a connection and returns the client address.
         """
 
-        readable, _, _ = select.select([self._server_socket], [], [], 1)  # Timeout de 1 segundo
-        if self._server_socket in readable:
-            client_socket, client_address = self._server_socket.accept()
-            self._connected_clients[client_address] = client_socket
+        try:
+            readable, _, _ = select.select(self._server_sockets, [], [], 1)  # 1 second timeout
+            if not readable:
+                return None
 
-            print(f"Aceitou conexão de {client_address}")
+            client_socket, client_address = readable[0].accept()
+        except (OSError, ValueError):
+            # The server socket was closed while waiting.
+            return None
+
+        self._connected_clients[client_address] = client_socket
 
-            return client_address
+        logger.debug("Accepted a connection from %s:%d", *client_address)
+
+        return client_address
 
     def is_connected_to_server(self, server_id: int) -> bool:
         """
@@ -76,85 +193,126 @@ class SocketManager():
 
         self._connected_clients_addresses[id] = address
 
-    def connect_to_server(self, server_id, address: tuple[str, int]) -> None:
+    def connect_to_server(self,
+                          server_id,
+                          address: tuple[str, int],
+                          connect_timeout: float | None = None,
+                          transport: Transport | None = None) -> None:
         """
-        Connects to a server as a client.
+        Connects to a server as a client with the transport, TCP by default, retrying while the server is not
+        listening yet, by default for the connect timeout.
         """
 
-        self._client_sockets[server_id] = socket(AF_INET, SOCK_STREAM)
-        self._client_sockets[server_id].connect(address)
-        print("enviou conexao")
+        self._client_sockets[server_id] = connect_with_backoff(
+            address, self._connect_timeout if connect_timeout is None else connect_timeout, transport=transport
+        )
+        logger.debug("Connected to the server %d at %s:%d", server_id, *address)
 
-    def send_to_client(self, client_id: int, message: str) -> None:
+    def send_to_client(self, client_id: int, frame: bytes) -> None:
         """
-        Sends a message to a client using the client id.
+        Sends a frame to a client using the client id.
         """
 
         try:
-            self._connected_clients[self._connected_clients_addresses[client_id]].sendall(message.encode("utf-8"))
+            self._connected_clients[self._connected_clients_addresses[client_id]].sendall(frame)
         except Exception as exception:
-            print(f"Socket error: {exception}")
+            logger.debug("Socket error: %s", exception)
 
-    def send_to_server(self, server_id: int, message: str) -> bool:
+    def send_to_server(self, server_id: int, frame: bytes) -> bool:
         """
-        Sends a message to a server using the server id.
+        Sends a frame to a server using the server id.
         """
 
         try:
-            self._client_sockets[server_id].sendall(message.encode("utf-8"))
+            self._client_sockets[server_id].sendall(frame)
             return False
         except Exception as exception:
-            print(f"Socket error: {exception}")
+            logger.debug("Socket error: %s", exception)
             return True
 
-    def receive_from_client_by_address(self, address: tuple[str, int]) -> str:
+    def send_to_address(self, address: tuple[str, int], frame: bytes) -> None:
         """
-        Receives a message from a client using the client address.
+        Sends a frame to a client using the client address.
         """
 
         try:
-            message = self._connected_clients[address].recv(1024).decode("utf-8")
-        except Exception as exception:
-            print(f"Socket error: {exception}")
-            message = ""
+            self._connected_clients[address].sendall(frame)
+        except OSError as exception:
+            logger.debug("Socket error: %s", exception)
 
-        return message
+    def close_connection_with_address(self, address: tuple[str, int]) -> None:
+        """
+        Closes a connection with a client that was not bound to an id.
+        """
+
+        client_socket = self._connected_clients.pop(address)
+        client_socket.close()
+        self._readers.pop(client_socket, None)
 
-    def receive_from_client_by_id(self, client_id: int) -> str:
+    def receive_from_client_by_address(self, address: tuple[str, int]) -> list[Message] | None:
         """
-        Receives a message from a client using the client id.
+        Receives the messages from a client using the client address.
+
+        Returns an empty list on timeout and None if the connection was closed.
         """
 
         try:
-            message = self._connected_clients[self._connected_clients_addresses[client_id]].recv(1024).decode("utf-8")
-        except Exception as exception:
-            print(f"Socket error: {exception}")
-            message = ""
+            return self._receive(self._connected_clients[address])
+        except timeout:
+            return []
+        except OSError as exception:
+            logger.debug("Socket error: %s", exception)
+            return None
 
-        return message
+    def receive_from_client_by_id(self, client_id: int) -> list[Message] | None:
+        """
+        Receives the messages from a client using the client id.
 
-    def receive_from_server(self, server_id: int) -> str | None:
+        Returns an empty list on timeout and None if the connection was closed.
         """
-        Receives a message from a server using the server id.
+
+        try:
+            return self._receive(self._connected_clients[self._connected_clients_addresses[client_id]])
+        except timeout:
+            return []
+        except OSError as exception:
+            logger.debug("Socket error: %s", exception)
+            return None
+
+    def receive_from_server(self, server_id: int) -> list[Message] | None:
+        """
+        Receives the messages from a server using the server id.
+
+        Returns an empty list on timeout and None if the connection was closed.
         """
 
         client_socket = self._client_sockets[server_id]
         client_socket.settimeout(self._timeout)
 
         try:
-            message = client_socket.recv(1024).decode("utf-8")
-
-            return message
+            return self._receive(client_socket)
         except timeout:
-            return None
+            return []
+
+    def _receive(self, connection: socket | SharedMemoryConnection) -> list[Message] | None:
+        """
+        Reads from a socket using its buffered reader.
+        """
+
+        reader = self._readers.get(connection)
+        if reader is None:
+            reader = self._readers[connection] = MessageReader()
+
+        return reader.receive(connection)
 
     def close_connection_with_client(self, client_id: int) -> None:
         """
         Closes a connection using the client id.
         """
 
-        self._connected_clients[self._connected_clients_addresses[client_id]].close()
-        self._connected_clients.pop(self._connected_clients_addresses[client_id])
+        client_socket = self._connected_clients.pop(self._connected_clients_addresses[client_id])
+        client_socket.close()
+        self._readers.pop(client_socket, None)
         self._connected_clients_addresses.pop(client_id)
 
     def close_connection_with_server(self, server_id: int) -> None:
@@ -162,18 +320,20 @@ class SocketManager():
         Closes a connection using the server id.
         """
 
-        self._client_sockets[server_id].close()
-        self._client_sockets.pop(server_id)
+        client_socket = self._client_sockets.pop(server_id)
+        client_socket.close()
+        self._readers.pop(client_socket, None)
 
     def close_server_socket(self) -> None:
         """
-        Closes the server socket.
+        Closes the server sockets.
         """
 
         for client_socket in self._connected_clients.values():
             client_socket.close()
 
-        self._server_socket.close()
+        for server_socket in self._server_sockets:
+            server_socket.close()
 
     def close_client_sockets(self) -> None:
         """
@@ -183,6 +343,18 @@ class SocketManager():
         for client_socket in self._client_sockets.values():
             client_socket.close()
 
+    def shutdown_sockets(self) -> None:
+        """
+        Shuts down the connected sockets without closing them, waking up any thread blocked reading them.
+        """
+
+        for connection in [*self._connected_clients.values(), *self._client_sockets.values()]:
+            try:
+                connection.shutdown(SHUT_RDWR)
+            except OSError:
+                # Not connected or already closed.
+                pass
+
     def close_sockets(self) -> None:
         """
         Closes both the server and client sockets.
@@ -0,0 +1,339 @@
+"""
+Module for the indexed topology format.
+
+Reading network.json costs every node time and memory proportional to the whole network, while a node only
+needs its own address, its neighbors and the starter id. The index is a binary file compiled from a validated
+network.json that a node maps with mmap, so it only touches the pages of the records it reads:
+
+* header: magic, format version, node count, starter id, topology hash and the offsets of the sections
+* ids: the node ids, sorted, as 32-bit integers, searched with a binary search
+* records: one fixed-size record per node, in the order of the ids: host index, ports, capacity, the position
+  of its neighbors and its transport
+* neighbors: the positions of the neighbors of every node, one node after the other
+* links: the transport each node connects to each of its neighbors with, one byte per position of the neighbors
+* hosts: the distinct host names
+
+Compile with: python -m lib.topology_index config/network.json config/network.idx
+"""
+
+import argparse
+from mmap import ACCESS_READ, mmap
+from struct import Struct
+from typing import BinaryIO
+
+from lib.network import TRANSPORT_NAMES, Network, TopologyError
+
+MAGIC = b"T1394IDX"
+FORMAT_VERSION = 2
+
+# Magic, version, node count, starter id, topology hash and the offsets of the ids, records, neighbors, links and
+# hosts.
+HEADER = Struct("<8sHxxIi32sQQQQQ")
+# Host index, election port, application port, capacity, first neighbor position, neighbor count and transport.
+RECORD = Struct("<IHHdIIB")
+NODE_ID = Struct("<i")
+POSITION = Struct("<I")
+
+
+def write_topology_index(network: Network, path: str) -> None:
+    """
+    Writes the index of a network.
+    """
+
+    node_ids = network.get_node_ids()
+    positions = {node_id: position for position, node_id in enumerate(node_ids)}
+    host_table = {}
+    records = bytearray()
+    neighbors = bytearray()
+    links = bytearray()
+    neighbor_count = 0
+
+    for node_id in node_ids:
+        host, election_port = network.get_node_election_address(node_id)
+        _, application_port = network.get_node_application_address(node_id)
+        neighbor_ids = network.get_neighbor_ids(node_id)
+        host_index = host_table.setdefault(host, len(host_table))
+
+        neighbor_transports = network.get_neighbor_transports(node_id)
+
+        records += RECORD.pack(host_index, election_port, application_port, network.get_node_capacity(node_id),
+                               neighbor_count, len(neighbor_ids),
+                               TRANSPORT_NAMES.index(network.get_node_transport(node_id)))
+        for neighbor_id in neighbor_ids:
+            neighbors += POSITION.pack(positions[neighbor_id])
+            links.append(TRANSPORT_NAMES.index(neighbor_transports[neighbor_id]))
+        neighbor_count += len(neighbor_ids)
+
+    encoded_hosts = [host.encode("utf-8") for host in host_table]
+    host_offsets = [0]
+    for encoded_host in encoded_hosts:
+        host_offsets.append(host_offsets[-1] + len(encoded_host))
+    hosts = Struct(f"<I{len(host_offsets)}I").pack(len(encoded_hosts), *host_offsets) + b"".join(encoded_hosts)
+
+    ids_offset = HEADER.size
+    records_offset = ids_offset + NODE_ID.size * len(node_ids)
+    neighbors_offset = records_offset + len(records)
+    links_offset = neighbors_offset + len(neighbors)
+    hosts_offset = links_offset + len(links)
+
+    with open(path, "wb") as index_file:
+        index_file.write(HEADER.pack(MAGIC,
+                                     FORMAT_VERSION,
+                                     len(node_ids),
+                                     network.get_election_starter_id(),
+                                     bytes.fromhex(network.get_topology_hash()),
+                                     ids_offset,
+                                     records_offset,
+                                     neighbors_offset,
+                                     links_offset,
+                                     hosts_offset))
+        index_file.write(Struct(f"<{len(node_ids)}i").pack(*node_ids))
+        index_file.write(records)
+        index_file.write(neighbors)
+        index_file.write(links)
+        index_file.write(hosts)
+
+
+class TopologyIndex():
+
+    """
+    Defines a network read from an index file, with the lookups of Network.
+
+    Opening the index reads only its header; every lookup reads the few records it needs from the mapped file.
+    """
+
+    __slots__ = ("_file", "_map", "_node_count", "_starter_id", "_topology_hash", "_ids_offset",
+                 "_records_offset", "_neighbors_offset", "_links_offset", "_hosts_offset", "_hosts")
+
+    _file: BinaryIO
+    _map: mmap
+    _node_count: int
+    _starter_id: int
+    _topology_hash: str
+    _ids_offset: int
+    _records_offset: int
+    _neighbors_offset: int
+    _links_offset: int
+    _hosts_offset: int
+    _hosts: dict[int, str]
+
+    def __init__(self, index_file_path: str) -> None:
+        self._file = open(index_file_path, "rb")
+
+        try:
+            self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        except ValueError as exception:
+            self._file.close()
+            raise TopologyError(f"{index_file_path} is empty") from exception
+
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise TopologyError(f"{index_file_path} is not a topology index")
+
+        (magic, version, self._node_count, self._starter_id, topology_hash, self._ids_offset,
+         self._records_offset, self._neighbors_offset, self._links_offset,
+         self._hosts_offset) = HEADER.unpack_from(self._map)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise TopologyError(f"{index_file_path} is not a topology index of version {FORMAT_VERSION}")
+
+        self._topology_hash = topology_hash.hex()
+        self._hosts = {}
+
+    def close(self) -> None:
+        """
+        Unmaps and closes the index file.
+        """
+
+        self._map.close()
+        self._file.close()
+
+    def position_of(self, node_id: int) -> int:
+        """
+        Returns the position of a node in the index, raising KeyError if there is no such node.
+        """
+
+        low, high = 0, self._node_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.id_at(middle) < node_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == self._node_count or self.id_at(low) != node_id:
+            raise KeyError(node_id)
+
+        return low
+
+    def id_at(self, position: int) -> int:
+        """
+        Returns the id of the node at a position.
+        """
+
+        return NODE_ID.unpack_from(self._map, self._ids_offset + NODE_ID.size * position)[0]
+
+    def record_at(self, position: int) -> tuple[int, int, int, float, int, int, int]:
+        """
+        Returns the record of the node at a position.
+        """
+
+        return RECORD.unpack_from(self._map, self._records_offset + RECORD.size * position)
+
+    def host(self, host_index: int) -> str:
+        """
+        Returns a host name, reading it from the index the first time.
+        """
+
+        host = self._hosts.get(host_index)
+
+        if host is None:
+            start, end = Struct("<2I").unpack_from(self._map, self._hosts_offset + POSITION.size * (host_index + 1))
+            base = self._hosts_offset + POSITION.size * (POSITION.unpack_from(self._map, self._hosts_offset)[0] + 2)
+            host = self._hosts[host_index] = self._map[base + start:base + end].decode("utf-8")
+
+        return host
+
+    def neighbor_positions(self, node_id: int) -> list[int]:
+        """
+        Returns the positions of the neighbors of a node.
+        """
+
+        *_, first_neighbor, neighbor_count, _ = self.record_at(self.position_of(node_id))
+
+        return list(Struct(f"<{neighbor_count}I").unpack_from(self._map,
+                                                               self._neighbors_offset
+                                                               + POSITION.size * first_neighbor))
+
+    def get_node_count(self) -> int:
+        """
+        Returns the number of nodes.
+        """
+
+        return self._node_count
+
+    def get_node_ids(self) -> list[int]:
+        """
+        Returns the ids of the nodes, sorted. Reads the whole ids section.
+        """
+
+        return list(Struct(f"<{self._node_count}i").unpack_from(self._map, self._ids_offset))
+
+    def get_node_election_address(self, node_id: int) -> tuple[str, int]:
+        """
+        Returns the address of a node.
+        """
+
+        host_index, election_port, *_ = self.record_at(self.position_of(node_id))
+
+        return (self.host(host_index), election_port)
+
+    def get_node_application_address(self, node_id: int) -> tuple[str, int]:
+        """
+        Returns the address of a node.
+        """
+
+        host_index, _, application_port, *_ = self.record_at(self.position_of(node_id))
+
+        return (self.host(host_index), application_port)
+
+    def get_node_capacity(self, node_id: int) -> float:
+        """
+        Returns the capacity a node advertises to the leader placement.
+        """
+
+        return self.record_at(self.position_of(node_id))[3]
+
+    def get_node_transport(self, node_id: int) -> str:
+        """
+        Returns the transport of the listener of a node.
+        """
+
+        return TRANSPORT_NAMES[self.record_at(self.position_of(node_id))[6]]
+
+    def get_neighbor_transports(self, node_id: int) -> dict[int, str]:
+        """
+        Returns the transport a node connects to each neighbor with.
+        """
+
+        *_, first_neighbor, neighbor_count, _ = self.record_at(self.position_of(node_id))
+        links = self._map[self._links_offset + first_neighbor:self._links_offset + first_neighbor + neighbor_count]
+
+        return {self.id_at(position): TRANSPORT_NAMES[link]
+                for position, link in zip(self.neighbor_positions(node_id), links)}
+
+    def get_topology_hash(self) -> str:
+        """
+        Returns the hash of the network the index was compiled from, the same as Network.get_topology_hash.
+        """
+
+        return self._topology_hash
+
+    def get_neighbor_ids(self, node_id: int) -> list[int]:
+        """
+        Returns the ids of the neighbors of a node.
+        """
+
+        return [self.id_at(position) for position in self.neighbor_positions(node_id)]
+
+    def get_election_neighbors(self, node_id: int) -> dict[int, tuple[str, int]]:
+        """
+        Returns the neighbors of a node.
+        """
+
+        result = {}
+        for position in self.neighbor_positions(node_id):
+            host_index, election_port, *_ = self.record_at(position)
+            result[self.id_at(position)] = (self.host(host_index), election_port)
+
+        return result
+
+    def get_application_neighbors(self, node_id: int) -> dict[int, tuple[str, int]]:
+        """
+        Returns the neighbors of a node.
+        """
+
+        result = {}
+        for position in self.neighbor_positions(node_id):
+            host_index, _, application_port, *_ = self.record_at(position)
+            result[self.id_at(position)] = (self.host(host_index), application_port)
+
+        return result
+
+    def get_election_starter_id(self) -> int:
+        """
+        Returns the id of the node that starts the election.
+        """
+
+        return self._starter_id
+
+
+def load_network(path: str) -> Network | TopologyIndex:
+    """
+    Returns the network of a network.json file or of a topology index, told apart by their first bytes.
+    """
+
+    with open(path, "rb") as network_file:
+        is_index = network_file.read(len(MAGIC)) == MAGIC
+
+    return TopologyIndex(path) if is_index else Network(path)
+
+
+def main() -> None:
+    """
+    Compiles a network.json into a topology index.
+    """
+
+    parser = argparse.ArgumentParser(description="Compile a network.json into a topology index")
+    parser.add_argument("network", help="The network.json file")
+    parser.add_argument("index", help="The index file to write")
+    args = parser.parse_args()
+
+    network = Network(args.network)
+    write_topology_index(network, args.index)
+    print(f"{args.index}: {network.get_node_count()} nodes")
+
+
+if __name__ == "__main__":
+    main()
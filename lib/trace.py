@@ -0,0 +1,291 @@
+"""
+Module for the causal traces of the election.
+
+A Tracer keeps the Lamport clock of a node: every frame the node sends carries the clock, and every frame it
+receives moves the clock past the one of its sender. The sends, the receives and the time spent handling each
+message are written as Chrome trace events, one JSON object per line, to a file per node.
+
+The tool merges the files of the nodes into one Chrome trace, with an arrow from each send to its receive, and
+prints the critical path of the election: the chain of messages and local work from the start of the election to
+the last LEADER_ANNOUNCEMENT received, following at each event the dependency that finished last.
+
+Merge with: python -m lib.trace traces/ --output election.json
+"""
+
+import argparse
+from atexit import register
+from glob import glob
+from json import dump, dumps, loads
+from os.path import isdir, join
+from threading import Lock, get_ident
+from time import time_ns
+from typing import TextIO
+
+from lib.message import Message, MessageType
+
+START_ELECTION = "start_election"
+CONTENTION_BACKOFF = "contention_backoff"
+
+
+def now() -> int:
+    """
+    Returns the wall clock in microseconds, the time unit of the traces.
+    """
+
+    return time_ns() // 1000
+
+
+class Tracer():
+
+    """
+    Defines the Lamport clock of a node and writes its trace events.
+    """
+
+    _node_id: int
+    _file: TextIO
+    _lock: Lock
+    _clock: int
+    _closed: bool
+
+    def __init__(self, node_id: int, path: str) -> None:
+        self._node_id = node_id
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = Lock()
+        self._clock = 0
+        self._closed = False
+
+        register(self.close)
+
+    def send(self, node_id: int, message_type: MessageType, channel: int) -> int:
+        """
+        Records a message sent to a neighbor and returns the clock the frame carries.
+        """
+
+        with self._lock:
+            self._clock += 1
+            self.write("i", f"send {message_type.name}", now(),
+                       {"to": node_id, "type": message_type.name, "channel": channel, "clock": self._clock})
+            return self._clock
+
+    def receive(self, node_id: int, message: Message) -> None:
+        """
+        Records a message received from a neighbor, before it is handled.
+        """
+
+        with self._lock:
+            self._clock = max(self._clock, message.clock or 0) + 1
+            self.write("i", f"receive {message.message_type.name}", now(),
+                       {"from": node_id, "type": message.message_type.name, "channel": message.channel,
+                        "clock": self._clock, "send_clock": message.clock})
+
+    def start_election(self, sender_id: int | None) -> None:
+        """
+        Records that the election reached the node, from sender_id or, on the node that starts it, from None.
+        """
+
+        with self._lock:
+            self._clock += 1
+            self.write("i", START_ELECTION, now(), {"from": sender_id, "clock": self._clock})
+
+    def span(self, name: str, started: int, args: dict | None = None) -> None:
+        """
+        Records work of the node from started, a value of now, until now.
+        """
+
+        ended = now()
+        with self._lock:
+            self.write("X", name, started, args or {}, ended - started)
+
+    def write(self, phase: str, name: str, timestamp: int, args: dict, duration: int | None = None) -> None:
+        """
+        Writes an event, with the lock held.
+        """
+
+        if self._closed:
+            return
+
+        event = {"name": name, "ph": phase, "ts": timestamp, "pid": self._node_id, "tid": get_ident(), "args": args}
+        if phase == "i":
+            event["s"] = "t"
+        if duration is not None:
+            event["dur"] = duration
+
+        self._file.write(dumps(event) + "\n")
+
+    def close(self) -> None:
+        """
+        Flushes and closes the trace file.
+        """
+
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._file.close()
+
+
+def load_events(paths: list[str]) -> list[dict]:
+    """
+    Reads the events of trace files, or of every node-*.trace.jsonl file of the directories given.
+    """
+
+    events = []
+    for path in paths:
+        files = sorted(glob(join(path, "node-*.trace.jsonl"))) if isdir(path) else [path]
+
+        for file_path in files:
+            with open(file_path, "r", encoding="utf-8") as trace_file:
+                events += [loads(line) for line in trace_file if line.strip()]
+
+    return events
+
+
+def _message_events(events: list[dict]) -> dict[int, list[dict]]:
+    """
+    Returns the events with a clock of each node, in the order of their clocks.
+    """
+
+    by_node = {}
+    for event in events:
+        if "clock" in event["args"]:
+            by_node.setdefault(event["pid"], []).append(event)
+
+    for node_events in by_node.values():
+        node_events.sort(key=lambda event: event["args"]["clock"])
+
+    return by_node
+
+
+def _sends(events: list[dict]) -> dict[tuple[int, int], dict]:
+    """
+    Returns the send events by node and clock, the key a receive finds its send with.
+    """
+
+    return {(event["pid"], event["args"]["clock"]): event for event in events if event["name"].startswith("send ")}
+
+
+def to_chrome_trace(events: list[dict]) -> dict:
+    """
+    Returns the events as a Chrome trace, naming the processes after the nodes and linking each send to its
+    receive with a flow arrow.
+    """
+
+    sends = _sends(events)
+    trace_events = list(events)
+
+    for node_id in sorted({event["pid"] for event in events}):
+        trace_events.append({"name": "process_name", "ph": "M", "pid": node_id, "args": {"name": f"node {node_id}"}})
+
+    for flow_id, event in enumerate(event for event in events if event["name"].startswith("receive ")):
+        send = sends.get((event["args"]["from"], event["args"]["send_clock"]))
+        if send is not None:
+            common = {"name": event["args"]["type"], "cat": "message", "id": flow_id}
+            trace_events.append({**common, "ph": "s", "ts": send["ts"], "pid": send["pid"], "tid": send["tid"]})
+            trace_events.append({**common, "ph": "f", "bp": "e", "ts": event["ts"], "pid": event["pid"],
+                                 "tid": event["tid"]})
+
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def critical_path(events: list[dict]) -> list[dict]:
+    """
+    Returns the events of the critical path, from the start of the election to the last LEADER_ANNOUNCEMENT
+    received.
+
+    Each event depends on the previous event of its node and a receive also on its send. Walking back from the
+    last announcement, the path follows the dependency that happened last, the one the event waited for.
+    """
+
+    by_node = _message_events(events)
+    sends = _sends(events)
+    announcements = [event for event in events if event["name"] == f"receive {MessageType.LEADER_ANNOUNCEMENT.name}"]
+
+    if not announcements:
+        raise ValueError("The traces have no LEADER_ANNOUNCEMENT received")
+
+    positions = {id(event): position for node_events in by_node.values() for position, event in enumerate(node_events)}
+    path = [max(announcements, key=lambda event: event["ts"])]
+
+    while True:
+        event = path[-1]
+        if event["name"] == START_ELECTION and event["args"]["from"] is None:
+            break
+
+        dependencies = []
+        if event["name"].startswith("receive "):
+            send = sends.get((event["args"]["from"], event["args"]["send_clock"]))
+            if send is not None:
+                dependencies.append(send)
+
+        # On a tie the message is preferred, it is listed first.
+        position = positions[id(event)]
+        if position > 0:
+            dependencies.append(by_node[event["pid"]][position - 1])
+
+        if not dependencies:
+            break
+
+        path.append(max(dependencies, key=lambda dependency: dependency["ts"]))
+
+    path.reverse()
+
+    return path
+
+
+def describe_path(path: list[dict], events: list[dict]) -> list[str]:
+    """
+    Returns the lines of a report of a critical path: each step with its time since the start and the time it
+    added, as network time for a message and local time otherwise, with the root contention backoffs it included.
+    """
+
+    backoffs = [event for event in events if event["name"] == CONTENTION_BACKOFF]
+    start = path[0]["ts"]
+    network_time = 0
+    local_time = 0
+    lines = [f"{'time (ms)':>10}{'+ (ms)':>9}  {'node':>6}  step"]
+
+    for previous, event in zip([None, *path], path):
+        added = 0 if previous is None else event["ts"] - previous["ts"]
+        step = event["name"]
+
+        if previous is not None and previous["pid"] != event["pid"]:
+            network_time += added
+            step += f" from {previous['pid']} (network)"
+        elif previous is not None:
+            local_time += added
+            included = [backoff for backoff in backoffs
+                        if backoff["pid"] == event["pid"] and previous["ts"] <= backoff["ts"] < event["ts"]]
+            if included:
+                backoff_time = sum(backoff["dur"] for backoff in included)
+                step += f" (after {len(included)} contention backoffs, {backoff_time / 1000:.3f} ms)"
+
+        lines.append(f"{(event['ts'] - start) / 1000:>10.3f}{added / 1000:>9.3f}  {event['pid']:>6}  {step}")
+
+    messages = sum(1 for previous, event in zip(path, path[1:]) if previous["pid"] != event["pid"])
+    lines.append(f"Critical path: {(path[-1]['ts'] - start) / 1000:.3f} ms, {messages} messages, "
+                 f"{network_time / 1000:.3f} ms in the network and {local_time / 1000:.3f} ms in the nodes")
+
+    return lines
+
+
+def main() -> None:
+    """
+    Merges the traces of the nodes and prints the critical path of the election.
+    """
+
+    parser = argparse.ArgumentParser(description="Merge the traces of the nodes and find the critical path")
+    parser.add_argument("traces", nargs="+", help="Trace files or directories with node-<id>.trace.jsonl files")
+    parser.add_argument("--output", help="Write the merged Chrome trace to this file")
+    args = parser.parse_args()
+
+    events = load_events(args.traces)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            dump(to_chrome_trace(events), output_file)
+
+    for line in describe_path(critical_path(events), events):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
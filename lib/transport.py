@@ -0,0 +1,672 @@
+"""
+Module for the transports of the election connections.
+
+A transport binds the listener of a node and opens the connections to its neighbors. Whatever the transport,
+the connections behave as connected stream sockets: SocketManager reads and writes them and the event loop
+selects them.
+
+* tcp: TCP/IP sockets, the default, for nodes on any host.
+* unix: Unix domain sockets, for nodes on the same host, which skip the TCP/IP stack. The socket of a node is
+  a file named after its port in the socket directory, the host is not used.
+* shm: the bytes go through two ring buffers in shared memory, one per direction. A Unix domain socket, like
+  the one of the unix transport, carries the handshake and a doorbell after each write, so a connection can
+  still be selected and its end is seen by the reader. The listener side reads the handshake as it arrives,
+  when the connection is read, so a slow client does not hold back the accepting thread.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from os import stat, unlink
+from os.path import join
+from socket import (AF_INET, AF_UNIX, MSG_PEEK, SHUT_RDWR, SO_REUSEADDR, SOCK_STREAM, SOL_SOCKET, socket,
+                    timeout)
+from stat import S_ISSOCK
+from struct import Struct
+from tempfile import gettempdir
+from time import monotonic, sleep
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from lib.network import Network
+    from lib.topology_index import TopologyIndex
+
+# Counters of a ring buffer, at the start of its shared memory: the bytes written and the bytes read since the
+# connection opened, and whether an end closed the connection.
+RING_HEADER = Struct("<QQB")
+RING_DATA_OFFSET = 64
+COUNTER = Struct("<Q")
+HEAD_OFFSET = 0
+TAIL_OFFSET = 8
+CLOSED_OFFSET = 16
+
+# The doorbell of a write carries the bytes written to the ring so far; the reader only reads up to it.
+DOORBELL = Struct("<Q")
+# Capacity of the rings and the lengths of the names of the ring to the listener and of the ring back.
+HANDSHAKE = Struct("<IBB")
+MAX_HANDSHAKE_SIZE = HANDSHAKE.size + 2 * 255
+HANDSHAKE_TIMEOUT = 5.0
+# How long a writer sleeps while the ring of the connection is full.
+ROOM_POLL_INTERVAL = 0.0001
+# Doorbells looked at in a single read.
+MAX_DOORBELLS = 64
+
+
+class Transport(ABC):
+
+    """
+    Defines how the listener and the connections of a node are opened.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def bind(self, address: tuple[str, int]) -> socket | UnixListener:
+        """
+        Returns a listener bound to the address of a node, with the listen, accept, fileno and close methods of
+        a socket.
+        """
+
+    @abstractmethod
+    def connect(self, address: tuple[str, int]) -> socket | SharedMemoryConnection:
+        """
+        Returns a connection to the listener at the address, raising OSError if it cannot be made.
+        """
+
+
+class TcpTransport(Transport):
+
+    """
+    Connects the nodes with TCP/IP sockets.
+    """
+
+    name = "tcp"
+
+    def bind(self, address: tuple[str, int]) -> socket:
+        listener = socket(AF_INET, SOCK_STREAM)
+        listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+
+        try:
+            listener.bind(address)
+        except OSError:
+            listener.close()
+            raise
+
+        return listener
+
+    def connect(self, address: tuple[str, int]) -> socket:
+        connection = socket(AF_INET, SOCK_STREAM)
+
+        try:
+            connection.connect(address)
+        except OSError:
+            connection.close()
+            raise
+
+        return connection
+
+
+class UnixTransport(Transport):
+
+    """
+    Connects the nodes on the same host with Unix domain sockets, in files named after their ports.
+    """
+
+    name = "unix"
+
+    _directory: str
+
+    def __init__(self, directory: str | None = None) -> None:
+        """
+        Args:
+            directory (str): where the socket files are, by default the temporary directory. Every node of the
+                host must use the same one.
+        """
+
+        self._directory = directory or gettempdir()
+
+    def socket_path(self, address: tuple[str, int]) -> str:
+        """
+        Returns the file of the listener of a node.
+        """
+
+        return join(self._directory, f"node-{address[1]}.{self.name}.sock")
+
+    def bind(self, address: tuple[str, int]) -> UnixListener:
+        return UnixListener(self.socket_path(address))
+
+    def connect(self, address: tuple[str, int]) -> socket:
+        connection = socket(AF_UNIX, SOCK_STREAM)
+
+        try:
+            connection.connect(self.socket_path(address))
+        except OSError:
+            connection.close()
+            raise
+
+        return connection
+
+
+class SharedMemoryTransport(UnixTransport):
+
+    """
+    Connects the nodes on the same host with ring buffers in shared memory.
+    """
+
+    name = "shm"
+
+    _capacity: int
+
+    def __init__(self, directory: str | None = None, capacity: int = 1 << 18) -> None:
+        """
+        Args:
+            capacity (int): the bytes of each ring, the most a connection holds in each direction before the
+                writer waits for the reader.
+        """
+
+        super().__init__(directory)
+        self._capacity = capacity
+
+    def bind(self, address: tuple[str, int]) -> SharedMemoryListener:
+        return SharedMemoryListener(self.socket_path(address))
+
+    def connect(self, address: tuple[str, int]) -> SharedMemoryConnection:
+        outgoing = create_shared_memory(RING_DATA_OFFSET + self._capacity)
+        incoming = create_shared_memory(RING_DATA_OFFSET + self._capacity)
+
+        try:
+            connection = super().connect(address)
+
+            try:
+                names = outgoing.name.encode("utf-8"), incoming.name.encode("utf-8")
+                connection.settimeout(HANDSHAKE_TIMEOUT)
+                connection.sendall(HANDSHAKE.pack(self._capacity, *map(len, names)) + b"".join(names))
+
+                # The listener answers once it attached and unlinked both rings.
+                if receive_exactly(connection, DOORBELL.size) != DOORBELL.pack(0):
+                    raise ConnectionError(f"The node at {address[0]}:{address[1]} refused the shared memory")
+
+                connection.settimeout(None)
+            except OSError:
+                connection.close()
+                raise
+        except OSError:
+            for memory in (outgoing, incoming):
+                release_shared_memory(memory, unlink_memory=True)
+            raise
+
+        return SharedMemoryConnection(connection,
+                                      RingBuffer(outgoing, self._capacity),
+                                      RingBuffer(incoming, self._capacity))
+
+
+class UnixListener():
+
+    """
+    Defines the listener of a Unix domain socket, which removes its file when it is closed.
+
+    The file a node left behind when it stopped is removed when the node binds again, but not the file of a
+    node that still accepts connections, so two nodes cannot share a port.
+    """
+
+    _socket: socket
+    _path: str
+    _accepted: int
+
+    def __init__(self, path: str) -> None:
+        remove_stale_socket(path)
+
+        self._socket = socket(AF_UNIX, SOCK_STREAM)
+        self._path = path
+        self._accepted = 0
+
+        try:
+            self._socket.bind(path)
+        except OSError:
+            self._socket.close()
+            raise
+
+    def fileno(self) -> int:
+        """
+        Returns the file descriptor of the listener, to select it.
+        """
+
+        return self._socket.fileno()
+
+    def listen(self, backlog: int) -> None:
+        """
+        Starts listening for connections.
+        """
+
+        self._socket.listen(backlog)
+
+    def accept(self) -> tuple[socket | SharedMemoryConnection, tuple[str, int]]:
+        """
+        Accepts a connection and returns it with an address made of the socket file and the number of the
+        connection, since the clients of a Unix domain socket have no address.
+        """
+
+        connection, _ = self._socket.accept()
+        self._accepted += 1
+
+        return connection, (self._path, self._accepted)
+
+    def close(self) -> None:
+        """
+        Closes the listener and removes its file.
+        """
+
+        if self._socket.fileno() == -1:
+            return
+
+        self._socket.close()
+
+        try:
+            unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryListener(UnixListener):
+
+    """
+    Defines the listener of the shared memory transport. The accepted connections attach their rings once their
+    handshake is read.
+    """
+
+    def accept(self) -> tuple[SharedMemoryConnection, tuple[str, int]]:
+        connection, address = super().accept()
+
+        return SharedMemoryConnection(connection), address
+
+
+class RingBuffer():
+
+    """
+    Defines a ring buffer in shared memory with a single writer and a single reader.
+
+    The writer only moves the head and the reader only moves the tail, so neither needs a lock. The data is
+    copied before the counter that publishes it is written.
+    """
+
+    _memory: SharedMemory
+    _capacity: int
+    _position: int  # the head for the writer, the tail for the reader
+
+    def __init__(self, memory: SharedMemory, capacity: int) -> None:
+        self._memory = memory
+        self._capacity = capacity
+        self._position = 0
+
+    @property
+    def position(self) -> int:
+        """
+        Returns the bytes written, for the writer, or read, for the reader, since the connection opened.
+        """
+
+        return self._position
+
+    def write(self, data: memoryview) -> int:
+        """
+        Copies as much of the data as fits and returns the number of bytes copied.
+        """
+
+        buffer = self._memory.buf
+        head = self._position
+        count = min(len(data), self._capacity - (head - COUNTER.unpack_from(buffer, TAIL_OFFSET)[0]))
+        if count <= 0:
+            return 0
+
+        start = head % self._capacity
+        first = min(count, self._capacity - start)
+        buffer[RING_DATA_OFFSET + start:RING_DATA_OFFSET + start + first] = data[:first]
+        if first < count:
+            buffer[RING_DATA_OFFSET:RING_DATA_OFFSET + count - first] = data[first:count]
+
+        self._position = head + count
+        COUNTER.pack_into(buffer, HEAD_OFFSET, self._position)
+
+        return count
+
+    def read_into(self, destination: memoryview, limit: int) -> int:
+        """
+        Copies the bytes up to the limit, a head announced by a doorbell, and returns the number of bytes copied.
+        """
+
+        buffer = self._memory.buf
+        tail = self._position
+        count = min(limit - tail, len(destination))
+        if count <= 0:
+            return 0
+
+        start = tail % self._capacity
+        first = min(count, self._capacity - start)
+        destination[:first] = buffer[RING_DATA_OFFSET + start:RING_DATA_OFFSET + start + first]
+        if first < count:
+            destination[first:count] = buffer[RING_DATA_OFFSET:RING_DATA_OFFSET + count - first]
+
+        self._position = tail + count
+        COUNTER.pack_into(buffer, TAIL_OFFSET, self._position)
+
+        return count
+
+    def is_closed(self) -> bool:
+        """
+        Returns whether an end closed the connection.
+        """
+
+        return self._memory.buf[CLOSED_OFFSET] != 0
+
+    def close(self) -> None:
+        """
+        Tells the other end the connection is closed and unmaps the ring.
+        """
+
+        try:
+            self._memory.buf[CLOSED_OFFSET] = 1
+        except (TypeError, ValueError):
+            # Already unmapped.
+            return
+
+        release_shared_memory(self._memory)
+
+
+class SharedMemoryConnection():
+
+    """
+    Defines a connection of the shared memory transport, with the methods of a connected socket that
+    SocketManager and MessageReader use.
+
+    After each write the writer sends a doorbell with the new head on the Unix domain socket. The reader waits
+    for the doorbells on that socket, reads the ring up to the last one and consumes only the doorbells it
+    covered, so the socket stays readable exactly while there are bytes to read.
+
+    An accepted connection has no rings until the handshake of the client is read, one read of the socket per
+    recv_into, so a selector loop never waits for a slow client.
+    """
+
+    _socket: socket
+    _outgoing: RingBuffer | None
+    _incoming: RingBuffer | None
+    _handshake: bytearray  # received so far, until the rings are attached
+    _timeout: float | None
+
+    def __init__(self,
+                 connection: socket,
+                 outgoing: RingBuffer | None = None,
+                 incoming: RingBuffer | None = None) -> None:
+        """
+        Args:
+            outgoing (RingBuffer): the ring this end writes; without the rings the connection was accepted and
+                reads the handshake first.
+            incoming (RingBuffer): the ring this end reads.
+        """
+
+        self._socket = connection
+        self._outgoing = outgoing
+        self._incoming = incoming
+        self._handshake = bytearray()
+        self._timeout = None
+
+    def fileno(self) -> int:
+        """
+        Returns the file descriptor of the doorbell socket, to select the connection.
+        """
+
+        return self._socket.fileno()
+
+    def settimeout(self, value: float | None) -> None:
+        """
+        Sets the timeout of the reads and of the writes waiting for room.
+        """
+
+        self._timeout = value
+        self._socket.settimeout(value)
+
+    def setblocking(self, flag: bool) -> None:
+        """
+        Sets the connection blocking or non-blocking, like a socket.
+        """
+
+        self.settimeout(None if flag else 0.0)
+
+    def sendall(self, data: bytes) -> None:
+        """
+        Writes all the data to the ring, waiting while it is full. Raises BrokenPipeError if the other end closed
+        the connection and socket.timeout if there is no room before the timeout.
+        """
+
+        if self._outgoing is None:
+            raise ConnectionError("The shared memory handshake is not complete")
+
+        view = memoryview(data).cast("B")
+        deadline = None if self._timeout is None else monotonic() + self._timeout
+
+        while view:
+            if self._outgoing.is_closed():
+                raise BrokenPipeError("The shared memory connection was closed")
+
+            written = self._outgoing.write(view)
+            if written:
+                view = view[written:]
+                self._socket.sendall(DOORBELL.pack(self._outgoing.position))
+                continue
+
+            if deadline is not None and monotonic() >= deadline:
+                raise timeout("timed out waiting for room in the shared memory ring")
+            sleep(ROOM_POLL_INTERVAL)
+
+    def recv_into(self, buffer: memoryview | bytearray, nbytes: int = 0) -> int:
+        """
+        Reads the bytes announced by the doorbells into the buffer and returns their number, 0 once the other
+        end closed the connection. Blocks like the socket while there is nothing to read.
+
+        Until the handshake of an accepted connection is complete, reads it and raises socket.timeout, since
+        the client only writes once it is acknowledged.
+        """
+
+        if self._incoming is None:
+            self.receive_handshake()
+            raise timeout("No data before the end of the shared memory handshake")
+
+        destination = memoryview(buffer).cast("B")
+        if nbytes:
+            destination = destination[:nbytes]
+
+        while True:
+            pending = self._socket.recv(DOORBELL.size * MAX_DOORBELLS, MSG_PEEK)
+            if not pending:
+                return 0
+
+            heads = [head for head, in DOORBELL.iter_unpack(pending[:len(pending) - len(pending) % DOORBELL.size])]
+            if not heads:
+                # Only a part of a doorbell arrived.
+                sleep(0)
+                continue
+
+            try:
+                count = self._incoming.read_into(destination, heads[-1])
+            except (TypeError, ValueError):
+                # The connection was closed by another thread, its rings are unmapped.
+                return 0
+
+            covered = sum(1 for head in heads if head <= self._incoming.position)
+            if covered:
+                receive_exactly(self._socket, DOORBELL.size * covered)
+
+            if count or not destination:
+                return count
+
+    def receive_handshake(self) -> None:
+        """
+        Reads what arrived of the handshake of the client with a single read of the socket and, once it is
+        complete, attaches the rings, unlinks their names and acknowledges them.
+
+        Raises ConnectionError if the client closed the connection or its rings cannot be attached.
+        """
+
+        # The client sends nothing else before the acknowledgement, so the read can ask for the longest handshake.
+        chunk = self._socket.recv(MAX_HANDSHAKE_SIZE - len(self._handshake))
+        if not chunk:
+            raise ConnectionError("The connection was closed during the shared memory handshake")
+
+        self._handshake += chunk
+        if len(self._handshake) < self.handshake_size():
+            return
+
+        capacity, *lengths = HANDSHAKE.unpack_from(self._handshake)
+        names = bytes(self._handshake[HANDSHAKE.size:self.handshake_size()])
+        attached = []
+
+        try:
+            # The ring the client writes is the one this end reads.
+            for name in (names[:lengths[0]], names[lengths[0]:]):
+                attached.append(SharedMemory(name.decode("utf-8")))
+
+            # Both ends are attached, so the names are no longer needed and nothing is left behind if a node dies.
+            for memory in attached:
+                memory.unlink()
+
+            self._socket.sendall(DOORBELL.pack(0))
+        except (OSError, ValueError) as exception:
+            for memory in attached:
+                release_shared_memory(memory)
+            raise ConnectionError(f"Shared memory handshake failed: {exception}") from exception
+
+        incoming, outgoing = attached
+        self._incoming = RingBuffer(incoming, capacity)
+        self._outgoing = RingBuffer(outgoing, capacity)
+
+    def handshake_size(self) -> int:
+        """
+        Returns the size of the handshake as far as it is known: the header, then the header and the names.
+        """
+
+        if len(self._handshake) < HANDSHAKE.size:
+            return HANDSHAKE.size
+
+        return HANDSHAKE.size + sum(HANDSHAKE.unpack_from(self._handshake)[1:])
+
+    def shutdown(self, how: int) -> None:
+        """
+        Shuts down the doorbell socket, waking up a thread blocked reading the connection.
+        """
+
+        self._socket.shutdown(how)
+
+    def close(self) -> None:
+        """
+        Closes the connection and unmaps its rings.
+        """
+
+        if self._socket.fileno() == -1:
+            return
+
+        try:
+            self._socket.shutdown(SHUT_RDWR)
+        except OSError:
+            pass
+
+        self._socket.close()
+
+        for ring in (self._outgoing, self._incoming):
+            if ring is not None:
+                ring.close()
+
+
+def receive_exactly(connection: socket, size: int) -> bytes:
+    """
+    Reads size bytes from a socket, raising ConnectionError if it is closed before.
+    """
+
+    data = bytearray()
+
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("The connection was closed during the shared memory handshake")
+        data += chunk
+
+    return bytes(data)
+
+
+def remove_stale_socket(path: str) -> None:
+    """
+    Removes the socket file of a listener that is gone, raising OSError if a listener still accepts on it.
+    """
+
+    try:
+        if not S_ISSOCK(stat(path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+
+    probe = socket(AF_UNIX, SOCK_STREAM)
+
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        unlink(path)
+        return
+    except OSError:
+        return
+    finally:
+        probe.close()
+
+    raise OSError(f"Another node is listening on {path}")
+
+
+def create_shared_memory(size: int) -> SharedMemory:
+    """
+    Creates a shared memory segment that the listener unlinks once it attached it.
+
+    The resource tracker would unlink the segments a process created when it exits, so the creator stops
+    tracking it; the listener tracks it from the attachment until its unlink.
+    """
+
+    memory = SharedMemory(create=True, size=size)
+    resource_tracker.unregister(memory._name, "shared_memory")  # pylint: disable=protected-access
+
+    return memory
+
+
+def release_shared_memory(memory: SharedMemory, unlink_memory: bool = False) -> None:
+    """
+    Unmaps a shared memory segment and, when the listener never attached it, unlinks it.
+    """
+
+    if unlink_memory:
+        # Tracked again so that the unlink, which stops the tracking, balances it.
+        resource_tracker.register(memory._name, "shared_memory")  # pylint: disable=protected-access
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            resource_tracker.unregister(memory._name, "shared_memory")  # pylint: disable=protected-access
+
+    try:
+        memory.close()
+    except BufferError:
+        # A reader still copies from the ring, the mapping goes with the last view of it.
+        pass
+
+
+TRANSPORTS = {
+    "tcp": TcpTransport,
+    "unix": UnixTransport,
+    "shm": SharedMemoryTransport,
+}
+
+
+def node_transports(network: Network | TopologyIndex, node_id: int) -> tuple[Transport, dict[int, Transport]]:
+    """
+    Returns the transport of the listener of a node of the network and the transports it connects to its
+    neighbors with, for ElectionProtocolManager.
+    """
+
+    transports = {name: TRANSPORTS[name]() for name in TRANSPORTS}
+    neighbor_transports = {neighbor_id: transports[name]
+                           for neighbor_id, name in network.get_neighbor_transports(node_id).items()}
+
+    return transports[network.get_node_transport(node_id)], neighbor_transports
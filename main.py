@@ -5,13 +5,86 @@ Simple application that uses the election protocol IEEE 1394.
 import argparse
 from os.path import join
 from application import Application
+from lib.data_plane import DataPlaneOptions
+from lib.datagram import DatagramOptions
+from lib.log import configure_logging
+from lib.failure_detector import FAILURE_DETECTORS, failure_detector_for
+from lib.placement import PLACEMENT_POLICIES
 
 
 parser = argparse.ArgumentParser(description="Launch a node")
 parser.add_argument("id", type=int, help="The node id")
+parser.add_argument("--event-loop", action="store_true", help="Multiplex the election connections in one thread")
+parser.add_argument("--placement", choices=PLACEMENT_POLICIES, default="root",
+                    help="Which node of the spanning tree becomes the leader")
+parser.add_argument("--verbose", action="store_true", help="Print every chunk received by the leader")
+parser.add_argument("--convergecast", action="store_true",
+                    help="Send the data through the election tree instead of directly to the leader")
+parser.add_argument("--reuse-connections", action="store_true",
+                    help="Send the data through the election tree on the election connections")
+parser.add_argument("--heartbeat", type=float, metavar="SECONDS",
+                    help="Keep running after the data is collected, re-electing when a tree link fails")
+parser.add_argument("--failure-detector", choices=FAILURE_DETECTORS, default="timeout",
+                    help="When a tree link is considered failed")
+parser.add_argument("--network", default=join("config", "network.json"),
+                    help="The network.json or a topology index compiled from it with lib.topology_index")
+parser.add_argument("--state-dir", metavar="DIR",
+                    help="Persist the election in DIR and confirm it on restart instead of electing again")
+parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                    help="Serve the metrics of the election as Prometheus text on http://127.0.0.1:PORT/metrics")
+parser.add_argument("--trace-dir", metavar="DIR",
+                    help="Trace the election to DIR/node-<ID>.trace.jsonl, merged with python -m lib.trace DIR")
+parser.add_argument("--log-level", default="INFO", type=str.upper,
+                    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="The level of the log")
+parser.add_argument("--log-module", action="append", default=[], metavar="MODULE=LEVEL",
+                    help="The level of the log of one module, like lib.connection_manager=DEBUG; repeatable")
+parser.add_argument("--log-json", action="store_true", help="Write the log as JSON lines")
+parser.add_argument("--udp", action="store_true",
+                    help="Send the election messages in datagrams with retransmissions instead of TCP connections")
+parser.add_argument("--data-plane", action="store_true",
+                    help="Stream batches of records to the leader with flow control and report their throughput")
+parser.add_argument("--records", type=int, default=DataPlaneOptions().records, help="Records sent by each node")
+parser.add_argument("--record-size", type=int, default=DataPlaneOptions().record_size, help="Bytes per record")
+parser.add_argument("--batch-size", type=int, default=DataPlaneOptions().batch_size, help="Records per batch")
+parser.add_argument("--rate", type=float, metavar="RECORDS_PER_SECOND",
+                    help="Records per second sent by each node, as fast as the flow control allows if not set")
+parser.add_argument("--window", type=int, default=DataPlaneOptions().window,
+                    help="Records each node may have in flight to the leader")
 
 args = parser.parse_args()
 node_id = args.id
 
-application = Application(node_id, join("config", "network.json"), 1.0)
+module_levels = {}
+for module_level in args.log_module:
+    module, separator, level = module_level.partition("=")
+    if not separator:
+        parser.error(f"--log-module expects MODULE=LEVEL, not {module_level}")
+    module_levels[module] = level.upper()
+
+configure_logging(args.log_level, module_levels, args.log_json)
+
+if args.udp and args.reuse_connections:
+    parser.error("--udp carries only the election, without --reuse-connections")
+
+data_plane = None
+if args.data_plane:
+    if args.convergecast or args.reuse_connections:
+        parser.error("--data-plane sends the records directly to the leader, without --convergecast")
+    data_plane = DataPlaneOptions(args.records, args.record_size, args.batch_size, args.rate, args.window)
+
+application = Application(node_id,
+                          args.network,
+                          event_loop=args.event_loop,
+                          placement_policy=PLACEMENT_POLICIES[args.placement](),
+                          verbose=args.verbose,
+                          convergecast=args.convergecast,
+                          reuse_connections=args.reuse_connections,
+                          heartbeat_interval=args.heartbeat,
+                          failure_detector=None if args.heartbeat is None else failure_detector_for(
+                              args.failure_detector, args.heartbeat),
+                          state_dir=args.state_dir,
+                          metrics_port=args.metrics_port,
+                          trace_dir=args.trace_dir,
+                          data_plane=data_plane,
+                          datagram=DatagramOptions() if args.udp else None)
 application.start()
@@ -0,0 +1,66 @@
+"""
+Helpers to run small election networks on this machine in the tests.
+"""
+
+from socket import socket
+
+from lib.election import ElectionProtocolManager
+
+
+def free_ports(count: int) -> list[int]:
+    """
+    Returns count ports nobody listens on, found by binding to port 0.
+    """
+
+    sockets = [socket() for _ in range(count)]
+
+    try:
+        for port_socket in sockets:
+            port_socket.bind(("localhost", 0))
+
+        return [port_socket.getsockname()[1] for port_socket in sockets]
+    finally:
+        for port_socket in sockets:
+            port_socket.close()
+
+
+def line(nodes: int) -> dict[int, list[int]]:
+    """
+    Returns the connections of a line of nodes, 0 - 1 - ... - nodes-1.
+    """
+
+    return {node_id: [neighbor_id for neighbor_id in (node_id - 1, node_id + 1) if 0 <= neighbor_id < nodes]
+            for node_id in range(nodes)}
+
+
+def start_managers(connections: dict[int, list[int]],
+                   node_options: dict[int, dict] | None = None,
+                   **options) -> dict[int, ElectionProtocolManager]:
+    """
+    Creates and starts an ElectionProtocolManager per node of the connections, on free ports of localhost.
+
+    The options are passed to every manager and node_options to single nodes.
+    """
+
+    ports = dict(zip(connections, free_ports(len(connections))))
+    managers = {}
+
+    for node_id, neighbor_ids in connections.items():
+        neighbors = {neighbor_id: ("localhost", ports[neighbor_id]) for neighbor_id in neighbor_ids}
+        extra_options = (node_options or {}).get(node_id, {})
+        managers[node_id] = ElectionProtocolManager(node_id, "localhost", ports[node_id], neighbors,
+                                                    **options, **extra_options)
+
+    for manager in managers.values():
+        manager.start_server()
+
+    return managers
+
+
+def close_managers(managers: dict[int, ElectionProtocolManager]) -> None:
+    """
+    Closes every manager, which also stops their election threads.
+    """
+
+    for manager in managers.values():
+        manager.close()
@@ -0,0 +1,72 @@
+"""
+Tests of the example application: the data of every node reaches the leader, directly or through the tree.
+"""
+
+import json
+from pathlib import Path
+from threading import Thread
+
+import pytest
+
+from application import Application
+from tests.helpers import free_ports, line
+
+CONTRIBUTIONS = 3
+
+
+def write_network(path: Path, connections: dict[int, list[int]]) -> str:
+    """
+    Writes a network file of localhost nodes with free election and application ports and returns its path.
+    """
+
+    ports = iter(free_ports(2 * len(connections)))
+    nodes = {str(node_id): {"host": "localhost", "election_port": next(ports), "application_port": next(ports)}
+             for node_id in connections}
+    network_file = path / "network.json"
+    network_file.write_text(json.dumps({"nodes": nodes, "connections": connections}), encoding="utf-8")
+
+    return str(network_file)
+
+
+def run_applications(network_file_path: str, count: int, **options) -> dict[int, Application]:
+    """
+    Runs the application of every node until each one finished, with a few quick contributions per node.
+    """
+
+    applications = {node_id: Application(node_id, network_file_path, **options) for node_id in range(count)}
+
+    for node_id, application in applications.items():
+        contribution = str(node_id).encode("utf-8")
+        application.send_random_numbers = lambda send, contribution=contribution: [send(contribution)
+                                                                                  for _ in range(CONTRIBUTIONS)]
+
+    threads = [Thread(target=application.start) for application in applications.values()]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for thread in threads:
+            thread.join(30.0)
+            assert not thread.is_alive()
+    finally:
+        for application in applications.values():
+            application._election_protocol_manager.close()
+
+    return applications
+
+
+@pytest.mark.parametrize("options", [{}, {"convergecast": True}, {"reuse_connections": True}],
+                         ids=["star", "convergecast", "reuse-connections"])
+def test_the_leader_collects_every_node(tmp_path: Path, options: dict) -> None:
+    """
+    The leader collects the contributions of every other node, sent to it directly, relayed by the parents
+    on new connections or relayed on the election connections.
+    """
+
+    applications = run_applications(write_network(tmp_path, line(5)), 5, **options)
+    leader_id = applications[0].wait_for_leader(0)
+    leader = applications[leader_id]
+
+    assert {application.wait_for_leader(0) for application in applications.values()} == {leader_id}
+    assert sorted(leader._random_number_message) == sorted("".join(str(node_id) * CONTRIBUTIONS
+                                                                   for node_id in range(5) if node_id != leader_id))
@@ -0,0 +1,174 @@
+"""
+Tests of AsyncElectionProtocolManager.
+"""
+
+import asyncio
+
+import pytest
+
+from lib.election import AsyncElectionProtocolManager
+from tests.helpers import free_ports, line
+
+
+async def run_election(connections: dict[int, list[int]]) -> dict[int, int]:
+    """
+    Runs an election with an AsyncElectionProtocolManager per node in the running loop and returns the leader
+    seen by each node.
+    """
+
+    ports = dict(zip(connections, free_ports(len(connections))))
+    managers = {node_id: AsyncElectionProtocolManager(node_id, "localhost", ports[node_id],
+                                                      {neighbor_id: ("localhost", ports[neighbor_id])
+                                                       for neighbor_id in neighbor_ids})
+                for node_id, neighbor_ids in connections.items()}
+
+    try:
+        for manager in managers.values():
+            await manager.start_server()
+
+        await managers[0].start_election(10.0)
+
+        return {node_id: await manager.wait_for_election(10.0) for node_id, manager in managers.items()}
+    finally:
+        for manager in managers.values():
+            await manager.close()
+
+
+def test_every_node_learns_the_same_leader() -> None:
+    """
+    The nodes of a line agree on a leader of the network.
+    """
+
+    leaders = asyncio.run(run_election(line(4)))
+
+    assert len(set(leaders.values())) == 1
+    assert set(leaders.values()) <= set(leaders)
+
+
+def test_start_election_timeout_counts_the_start() -> None:
+    """
+    The timeout of start_election bounds the start and the wait for the leader together.
+    """
+
+    async def slow_start() -> None:
+        await asyncio.sleep(0.4)
+
+    async def start() -> float:
+        port, neighbor_port = free_ports(2)
+        manager = AsyncElectionProtocolManager(0, "localhost", port, {1: ("localhost", neighbor_port)})
+        # The start takes most of the timeout and the leader never comes.
+        manager._election_node.start_the_election = slow_start
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        try:
+            with pytest.raises(TimeoutError):
+                await manager.start_election(0.5)
+        finally:
+            await manager.close()
+
+        return loop.time() - started
+
+    assert asyncio.run(start()) < 0.8
+
+
+def test_a_node_without_neighbors_elects_itself() -> None:
+    """
+    A node without neighbors is the leader of its own network, like with ElectionProtocolManager.
+    """
+
+    async def elect() -> tuple[int, dict]:
+        manager = AsyncElectionProtocolManager(0, "localhost", free_ports(1)[0], {})
+        await manager.start_server()
+
+        try:
+            leader_id = await manager.start_election(3.0)
+            await manager.wait_for_network_ready(3.0)
+
+            return leader_id, manager.get_stats()
+        finally:
+            await manager.close()
+
+    leader_id, stats = asyncio.run(elect())
+
+    assert leader_id == 0
+    assert stats["leader_distance"] == 0
+    assert stats["messages_sent"] == 0
+
+
+def test_the_stats_count_every_message_received() -> None:
+    """
+    The asyncio nodes report the metrics of ElectionNode: what the nodes sent, by type, they received.
+    """
+
+    async def elect() -> list[dict]:
+        connections = line(3)
+        ports = dict(zip(connections, free_ports(len(connections))))
+        managers = [AsyncElectionProtocolManager(node_id, "localhost", ports[node_id],
+                                                 {neighbor_id: ("localhost", ports[neighbor_id])
+                                                  for neighbor_id in neighbor_ids})
+                    for node_id, neighbor_ids in connections.items()]
+
+        try:
+            for manager in managers:
+                await manager.start_server()
+
+            await managers[0].start_election(10.0)
+            for manager in managers:
+                await manager.wait_for_network_ready(10.0)
+
+            # Every node acknowledged the leader, so every message reached its node.
+            return [manager.get_stats() for manager in managers]
+        finally:
+            for manager in managers:
+                await manager.close()
+
+    stats = asyncio.run(elect())
+    sent, received = {}, {}
+    for node_stats in stats:
+        for message_type, count in node_stats["messages_sent_by_type"].items():
+            sent[message_type] = sent.get(message_type, 0) + count
+        for message_type, count in node_stats["messages_received_by_type"].items():
+            received[message_type] = received.get(message_type, 0) + count
+
+    assert sent == received
+    assert sent["LEADER_ANNOUNCEMENT_ACK"] == 2
+    assert all(node_stats["phases"]["wake_up"]["count"] == 1 for node_stats in stats)
+
+
+def test_the_subtrees_cut_from_the_leader_elect_their_own() -> None:
+    """
+    With heartbeats, when the leader of a line fails, each side of the line elects a leader of its own.
+    """
+
+    async def reelect() -> tuple[int, list[set[int]]]:
+        connections = line(5)
+        ports = dict(zip(connections, free_ports(len(connections))))
+        managers = {node_id: AsyncElectionProtocolManager(node_id, "localhost", ports[node_id],
+                                                          {neighbor_id: ("localhost", ports[neighbor_id])
+                                                           for neighbor_id in neighbor_ids},
+                                                          heartbeat_interval=0.05)
+                    for node_id, neighbor_ids in connections.items()}
+
+        try:
+            for manager in managers.values():
+                await manager.start_server()
+
+            leader_id = await managers[0].start_election(10.0)
+            for manager in managers.values():
+                await manager.wait_for_election(10.0)
+
+            await managers[leader_id].close()
+
+            sides = (range(0, leader_id), range(leader_id + 1, len(connections)))
+            return leader_id, [{await managers[node_id].wait_for_leader_change(leader_id, 10.0) for node_id in side}
+                               for side in sides]
+        finally:
+            for manager in managers.values():
+                await manager.close()
+
+    leader_id, leaders = asyncio.run(reelect())
+
+    for side, side_leaders in zip((range(0, leader_id), range(leader_id + 1, 5)), leaders):
+        if side:
+            assert len(side_leaders) == 1 and side_leaders <= set(side)
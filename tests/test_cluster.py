@@ -0,0 +1,68 @@
+"""
+Tests of the cluster launcher.
+"""
+
+import json
+from pathlib import Path
+from socket import socket
+
+import pytest
+
+from benchmarks.topology import generate_topology, network_description
+from cluster import ClusterError, launch_cluster
+from lib.network import Network
+from lib.topology_index import write_topology_index
+from tests.helpers import free_ports
+
+
+def write_network(path: Path, nodes: int) -> str:
+    """
+    Writes the network.json of a random tree on free ports and returns its path.
+    """
+
+    description = network_description(generate_topology("random", nodes))
+    ports = free_ports(2 * nodes)
+    for node, election_port, application_port in zip(description["nodes"].values(), ports[::2], ports[1::2]):
+        node.update(election_port=election_port, application_port=application_port)
+
+    network_file = path / "network.json"
+    network_file.write_text(json.dumps(description), encoding="utf-8")
+
+    return str(network_file)
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_every_node_reports_the_same_leader(tmp_path: Path, indexed: bool) -> None:
+    """
+    The nodes of a network spread over two processes, read from the network.json or from its index, all report
+    the leader.
+    """
+
+    network_file_path = write_network(tmp_path, 12)
+    if indexed:
+        write_topology_index(Network(network_file_path), str(tmp_path / "network.idx"))
+        network_file_path = str(tmp_path / "network.idx")
+
+    result = launch_cluster(network_file_path, processes=2, timeout=60.0)
+
+    assert result["processes"] == 2
+    assert sorted(result["nodes"]) == list(range(12))
+    assert {report["leader"] for report in result["nodes"].values()} == {result["leader"]}
+    assert 0 <= result["time_to_first_leader"] <= result["time_to_all_know_leader"]
+
+
+def test_a_node_that_cannot_start_fails_the_cluster(tmp_path: Path) -> None:
+    """
+    A node whose port is taken stops the cluster with a ClusterError naming it.
+    """
+
+    network_file_path = write_network(tmp_path, 4)
+    taken = socket()
+    taken.bind(Network(network_file_path).get_node_election_address(2))
+    taken.listen()
+
+    try:
+        with pytest.raises(ClusterError, match="Node 2"):
+            launch_cluster(network_file_path, processes=2, timeout=30.0)
+    finally:
+        taken.close()
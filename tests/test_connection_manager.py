@@ -0,0 +1,117 @@
+"""
+Tests of the connections of ConnectionManager: the application channels and the send path.
+"""
+
+from threading import Event, Thread
+from time import sleep
+
+import pytest
+
+from lib.election import ElectionProtocolManager
+from lib.message import DATA_CHANNEL, MessageType
+from lib.socket_manager import probe_server
+from tests.helpers import close_managers, free_ports, start_managers
+
+STAR = {0: [1, 2], 1: [0], 2: [0]}
+
+
+@pytest.mark.parametrize("event_loop", [False, True])
+def test_a_blocked_neighbor_does_not_hold_back_the_others(event_loop: bool) -> None:
+    """
+    While a send to one neighbor is stuck, the frames to the other neighbors still go out.
+    """
+
+    received = {node_id: Event() for node_id in STAR}
+    node_options = {node_id: {"channel_handlers": {DATA_CHANNEL: lambda sender_id, message, event=event: event.set()}}
+                    for node_id, event in received.items()}
+    managers = start_managers(STAR, node_options, event_loop=event_loop)
+
+    blocked = Event()
+    release = Event()
+
+    try:
+        managers[0].start_election()
+
+        socket_manager = managers[0]._election_node._connection_manager._socket_manager
+        for name in ("send_to_client", "send_to_server"):
+            send = getattr(socket_manager, name)
+
+            def blocking_send(node_id: int, frame: bytes, send=send) -> bool:
+                if node_id == 1:
+                    blocked.set()
+                    release.wait(10.0)
+                return send(node_id, frame)
+
+            setattr(socket_manager, name, blocking_send)
+
+        stuck = Thread(target=managers[0].send_on_channel, args=(1, DATA_CHANNEL, MessageType.DATA, b"first"))
+        stuck.start()
+        assert blocked.wait(5.0)
+
+        managers[0].send_on_channel(2, DATA_CHANNEL, MessageType.DATA, b"second")
+        assert received[2].wait(5.0)
+        assert not received[1].is_set()
+
+        release.set()
+        stuck.join(5.0)
+        assert received[1].wait(5.0)
+    finally:
+        release.set()
+        close_managers(managers)
+
+
+@pytest.mark.parametrize("event_loop", [False, True])
+def test_the_event_loop_serves_every_connection_in_one_thread(event_loop: bool) -> None:
+    """
+    In the threaded mode the hub of a star reads each leaf in a thread of its own; in the event loop mode its
+    selector thread reads them all.
+    """
+
+    star = {0: list(range(1, 11)), **{node_id: [0] for node_id in range(1, 11)}}
+    managers = start_managers(star, {0: {"event_loop": event_loop}})
+    connection_manager = managers[0]._election_node._connection_manager
+    handle_connection_thread = connection_manager.handle_connection_thread
+    threads = []
+
+    def counting_handle_connection_thread(*args) -> None:
+        threads.append(args)
+        handle_connection_thread(*args)
+
+    connection_manager.handle_connection_thread = counting_handle_connection_thread
+
+    try:
+        leader_id = managers[1].start_election()
+
+        assert all(manager.wait_for_election(10.0) == leader_id for manager in managers.values())
+        assert len(threads) == (0 if event_loop else 10)
+    finally:
+        close_managers(managers)
+
+
+@pytest.mark.parametrize("event_loop", [False, True])
+def test_an_unreachable_neighbor_does_not_stop_the_server(event_loop: bool) -> None:
+    """
+    While the middle node of a line connects to a neighbor that never listens, and after it gave up, it still
+    answers readiness probes.
+    """
+
+    ports = free_ports(3)
+    managers = {node_id: ElectionProtocolManager(node_id, "localhost", ports[node_id],
+                                                 {neighbor_id: ("localhost", ports[neighbor_id])
+                                                  for neighbor_id in neighbor_ids},
+                                                 event_loop,
+                                                 connect_timeout=1.0)
+                for node_id, neighbor_ids in {0: [1], 1: [0, 2]}.items()}
+
+    try:
+        for manager in managers.values():
+            manager.start_server()
+
+        managers[0].start_election(block_until_result=False)
+
+        # Connecting to the node 2, then giving up on it.
+        for delay in (0.3, 1.2):
+            sleep(delay)
+            probe_server(("localhost", ports[1]), 0, 0.5)
+    finally:
+        close_managers(managers)
@@ -0,0 +1,86 @@
+"""
+Tests of the root contention policies.
+"""
+
+import pytest
+
+from lib.contention import (CONTENTION_POLICIES, BoundedExponentialBackoff, ContentionPolicy, DeterministicTiebreak,
+                            RandomBitBackoff)
+from tests.helpers import close_managers, line, start_managers
+
+
+def test_a_policy_without_backoff_cannot_be_created() -> None:
+    """
+    An incomplete policy fails when it is created, not in the middle of an election.
+    """
+
+    class NoBackoff(ContentionPolicy):
+
+        """
+        A policy that forgot the backoff.
+        """
+
+    with pytest.raises(TypeError):
+        NoBackoff()
+
+
+def test_exponential_backoff_stays_within_its_bounds() -> None:
+    """
+    The backoff grows with the rounds but never leaves [minimum, maximum], even after many rounds.
+    """
+
+    policy = BoundedExponentialBackoff(0.001, 0.05)
+
+    assert all(0.001 <= policy.backoff(0) <= 0.002 for _ in range(100))
+
+    for contention_round in (1, 5, 100, 10000):
+        assert all(0.001 <= policy.backoff(contention_round) <= 0.05 for _ in range(100))
+
+
+@pytest.mark.parametrize("arguments", [(0.0, 0.1), (0.2, 0.1)])
+def test_exponential_backoff_rejects_invalid_bounds(arguments: tuple[float, float]) -> None:
+    """
+    The minimum must be positive and not above the maximum.
+    """
+
+    with pytest.raises(ValueError):
+        BoundedExponentialBackoff(*arguments)
+
+
+def test_random_bit_backoff_waits_short_or_long() -> None:
+    """
+    The random bit policy only waits its short or its long time.
+    """
+
+    policy = RandomBitBackoff(0.001, 0.01)
+
+    assert {policy.backoff(0) for _ in range(200)} == {0.001, 0.01}
+
+
+def test_deterministic_tiebreak_lets_the_largest_id_win() -> None:
+    """
+    The node with the largest id wins the contention, without waiting.
+    """
+
+    policy = DeterministicTiebreak()
+
+    assert policy.tiebreak(5, 3) is True
+    assert policy.tiebreak(3, 5) is False
+    assert policy.backoff(0) == 0.0
+
+
+@pytest.mark.parametrize("name", CONTENTION_POLICIES)
+def test_every_policy_resolves_a_root_contention(name: str) -> None:
+    """
+    Two nodes always end in a root contention, which every policy resolves to a single leader.
+    """
+
+    managers = start_managers(line(2), contention_policy=CONTENTION_POLICIES[name]())
+
+    try:
+        leader_id = managers[0].start_election()
+
+        assert managers[1].wait_for_election(10.0) == leader_id
+        assert sum(manager.get_stats()["contention_rounds"] for manager in managers.values()) >= 1
+    finally:
+        close_managers(managers)
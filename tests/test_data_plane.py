@@ -0,0 +1,71 @@
+"""
+Tests of the flow controlled data plane.
+"""
+
+from socket import create_connection
+from threading import Thread
+
+from lib.data_plane import DataPlaneOptions, DataPlaneServer, DataProducer, encode_records
+from lib.message import CREDIT_PAYLOAD, DATA_CHANNEL, MessageReader, MessageType, encode_message
+from tests.helpers import free_ports
+
+
+def serve(server: DataPlaneServer) -> Thread:
+    """
+    Starts serving the producers in a thread, once the server is listening.
+    """
+
+    server.listen()
+    thread = Thread(target=server.serve, args=(10.0,))
+    thread.start()
+
+    return thread
+
+
+def test_producers_send_every_record_within_their_window() -> None:
+    """
+    The records of every producer reach the server, with many batches of at most the window each.
+    """
+
+    address = ("localhost", free_ports(1)[0])
+    consumed = []
+    server = DataPlaneServer(address, 2, window=8, consume=lambda sender_id, records: consumed.append(len(records)))
+    thread = serve(server)
+    options = DataPlaneOptions(records=100, record_size=16, batch_size=32)
+    producers = [DataProducer(node_id, options) for node_id in (1, 2)]
+
+    for producer in producers:
+        with create_connection(address) as connection:
+            producer.run(connection)
+
+    thread.join(10.0)
+
+    assert server.get_stats()["records_received"] == 200
+    assert server.get_stats()["producers"] == 2
+    assert max(consumed) <= 8
+    assert all(producer.get_stats()["records_sent"] == 100 for producer in producers)
+
+
+def test_a_producer_over_its_credit_is_dropped() -> None:
+    """
+    A producer that sends more records than the server granted it is disconnected and its batch is not
+    consumed.
+    """
+
+    address = ("localhost", free_ports(1)[0])
+    server = DataPlaneServer(address, 1, window=4)
+    thread = serve(server)
+
+    with create_connection(address) as connection:
+        credit = MessageReader().receive(connection)
+        assert CREDIT_PAYLOAD.unpack(credit[0].payload)[0] == 4
+
+        records = encode_records([(0.0, b"record")] * 5)
+        connection.sendall(encode_message(MessageType.RECORD_BATCH, 1, records, DATA_CHANNEL))
+
+        assert MessageReader().receive(connection) is None
+
+    thread.join(10.0)
+
+    assert server.get_stats()["dropped_producers"] == 1
+    assert server.get_stats()["records_received"] == 0
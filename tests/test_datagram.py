@@ -0,0 +1,69 @@
+"""
+Tests of the datagram transport of the election.
+"""
+
+from lib.datagram import DatagramConnectionManager, DatagramOptions
+from lib.election_node import NodeAddress
+from lib.message import Message, MessageType, encode_message
+from tests.helpers import close_managers, line, start_managers
+
+
+def test_frames_are_delivered_in_order_once() -> None:
+    """
+    Frames received out of order or twice are delivered once each, in the order they were sent.
+    """
+
+    manager = DatagramConnectionManager(0, NodeAddress("localhost", 0), {1: NodeAddress("localhost", 0)})
+    delivered = []
+    manager.dispatch = lambda sender_id, message: delivered.append(message.payload)
+
+    try:
+        for sequence in (3, 1, 1, 2, 3):
+            manager.receive_frame(1, sequence, encode_message(MessageType.DATA, 1, bytes([sequence])))
+
+        assert delivered == [b"\x01", b"\x02", b"\x03"]
+        assert manager.duplicates == 2
+        assert manager.get_delivered(1) == 3
+    finally:
+        manager.close_all_sockets()
+
+
+def test_frames_beyond_the_window_are_dropped() -> None:
+    """
+    While a frame is missing, only the window of frames after it is kept; the later ones are dropped until they
+    are sent again.
+    """
+
+    manager = DatagramConnectionManager(0, NodeAddress("localhost", 0), {1: NodeAddress("localhost", 0)},
+                                        DatagramOptions(window=4))
+    delivered: list[Message] = []
+    manager.dispatch = lambda sender_id, message: delivered.append(message)
+
+    try:
+        for sequence in range(2, 1000):
+            manager.receive_frame(1, sequence, encode_message(MessageType.DATA, 1, bytes([sequence % 256])))
+
+        assert len(manager._out_of_order[1]) == 4
+        assert manager.beyond_window == 1000 - 2 - 4
+
+        manager.receive_frame(1, 1, encode_message(MessageType.DATA, 1, b"\x01"))
+
+        assert manager.get_delivered(1) == 5
+        assert [message.payload[0] for message in delivered] == [1, 2, 3, 4, 5]
+    finally:
+        manager.close_all_sockets()
+
+
+def test_the_election_survives_lost_datagrams() -> None:
+    """
+    With a fraction of the datagrams lost, the retransmissions still bring every node to the same leader.
+    """
+
+    managers = start_managers(line(4), datagram=DatagramOptions(loss=0.2))
+
+    try:
+        leader_id = managers[0].start_election()
+
+        assert all(manager.wait_for_election(10.0) == leader_id for manager in managers.values())
+    finally:
+        close_managers(managers)
@@ -0,0 +1,69 @@
+"""
+Tests of the non-blocking election API: start_election without blocking and the future of the election.
+"""
+
+from threading import Event, current_thread, main_thread
+from time import monotonic
+
+import pytest
+
+from lib.election import ElectionProtocolManager
+from tests.helpers import close_managers, free_ports, line, start_managers
+
+
+def test_the_callbacks_get_the_leader_on_every_node() -> None:
+    """
+    start_election returns the future of the node at once, and the callbacks of every node run with the leader
+    in the election thread.
+    """
+
+    managers = start_managers(line(4))
+    leaders = {}
+    threads = set()
+    finished = Event()
+
+    def callback(node_id: int):
+        def record(future) -> None:
+            leaders[node_id] = future.result()
+            threads.add(current_thread())
+            # The callbacks must not block the election thread, the last one only signals the test.
+            if len(leaders) == len(managers):
+                finished.set()
+
+        return record
+
+    try:
+        for node_id, manager in managers.items():
+            manager.get_election_future().add_done_callback(callback(node_id))
+
+        future = managers[0].start_election(block_until_result=False)
+        assert future is managers[0].get_election_future()
+
+        assert finished.wait(10.0)
+
+        assert len(set(leaders.values())) == 1
+        assert future.result(0) == leaders[0]
+        assert main_thread() not in threads
+    finally:
+        close_managers(managers)
+
+
+def test_a_start_that_fails_fails_the_future() -> None:
+    """
+    Without blocking, a start that cannot reach a neighbor returns at once and fails the future instead of
+    raising.
+    """
+
+    port, neighbor_port = free_ports(2)
+    manager = ElectionProtocolManager(0, "localhost", port, {1: ("localhost", neighbor_port)}, connect_timeout=0.5)
+    manager.start_server()
+
+    try:
+        started = monotonic()
+        future = manager.start_election(block_until_result=False)
+
+        assert monotonic() - started < 0.4
+        with pytest.raises(TimeoutError):
+            future.result(10.0)
+    finally:
+        manager.close()
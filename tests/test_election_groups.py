@@ -0,0 +1,82 @@
+"""
+Tests of ElectionGroupManager.
+"""
+
+from time import monotonic, sleep
+
+import pytest
+
+from lib.election import ElectionGroupManager
+from tests.helpers import free_ports, line
+
+
+@pytest.mark.parametrize("event_loop", [False, True])
+def test_concurrent_groups_elect_their_own_leaders(event_loop: bool) -> None:
+    """
+    The elections of two groups started at once from different nodes, one over a line of four nodes and one
+    over its first two nodes, each end with a leader of their own nodes.
+    """
+
+    connections = line(4)
+    ports = dict(zip(connections, free_ports(len(connections))))
+    managers = {node_id: ElectionGroupManager(node_id, "localhost", ports[node_id],
+                                              {neighbor_id: ("localhost", ports[neighbor_id])
+                                               for neighbor_id in neighbor_ids},
+                                              event_loop)
+                for node_id, neighbor_ids in connections.items()}
+
+    try:
+        for node_id, manager in managers.items():
+            manager.add_group(1)
+            if node_id < 2:
+                manager.add_group(2, [1 - node_id])
+            manager.start_server()
+
+        futures = [managers[3].start_election(1, False), managers[0].start_election(2, False)]
+        leaders = [future.result(10.0) for future in futures]
+
+        assert all(managers[node_id].wait_for_election(1, 10.0) == leaders[0] for node_id in managers)
+        assert all(managers[node_id].wait_for_election(2, 10.0) == leaders[1] for node_id in (0, 1))
+        assert leaders[1] in (0, 1)
+        assert managers[2].get_groups() == [1]
+
+        # The stats of a group count only its messages: in the group of two nodes, what one sent the other
+        # received, once the last acknowledgements arrived.
+        deadline = monotonic() + 5.0
+        while True:
+            stats = [managers[node_id].get_stats(2) for node_id in (0, 1)]
+            balanced = all(stats[index]["messages_sent_by_type"] == stats[1 - index]["messages_received_by_type"]
+                           for index in (0, 1))
+            if balanced or monotonic() > deadline:
+                break
+            sleep(0.05)
+
+        assert balanced
+        assert stats[0]["messages_sent"] > 0
+    finally:
+        for manager in managers.values():
+            manager.close()
+
+
+def test_groups_are_added_before_the_server_starts() -> None:
+    """
+    A group of a node that is not a neighbor, a group added twice and a group added after the start are
+    rejected.
+    """
+
+    port, neighbor_port = free_ports(2)
+    manager = ElectionGroupManager(0, "localhost", port, {1: ("localhost", neighbor_port)})
+
+    try:
+        with pytest.raises(ValueError, match="not neighbors"):
+            manager.add_group(1, [2])
+
+        manager.add_group(1)
+        with pytest.raises(ValueError, match="already open"):
+            manager.add_group(1)
+
+        manager.start_server()
+        with pytest.raises(ValueError, match="before the server starts"):
+            manager.add_group(2)
+    finally:
+        manager.close()
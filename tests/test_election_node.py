@@ -0,0 +1,115 @@
+"""
+Tests of the life cycle of ElectionNode: starting, waiting for and closing an election.
+"""
+
+from threading import Thread
+from time import monotonic
+
+import pytest
+
+from lib.datagram import DatagramOptions
+from tests.helpers import close_managers, line, start_managers
+
+MODES = {
+    "threaded": {},
+    "event-loop": {"event_loop": True},
+    "datagram": {"datagram": DatagramOptions()},
+}
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_close_before_the_election_reaches_the_node(mode: str) -> None:
+    """
+    Closing a node the election never reached stops its election thread and fails the future of the election.
+    """
+
+    managers = start_managers({0: [1], 1: [0]}, **MODES[mode])
+    closing = Thread(target=managers[0].close)
+    closing.start()
+    closing.join(10.0)
+
+    assert not closing.is_alive()
+    with pytest.raises(RuntimeError, match="closed before the election ended"):
+        managers[0].get_election_future().result(0)
+
+    managers[1].close()
+
+
+def silence_acknowledgements(managers: dict) -> None:
+    """
+    Makes every node ignore the acknowledgements of its children, as if they never arrived.
+    """
+
+    for manager in managers.values():
+        manager._election_node.handle_announcement_ack = lambda node_id, epoch: None
+
+
+@pytest.mark.parametrize("mode", ["threaded", "event-loop"])
+def test_wait_for_election_is_bounded_by_its_timeout(mode: str) -> None:
+    """
+    A child that never acknowledges the leader does not keep wait_for_election past its timeout.
+    """
+
+    managers = start_managers(line(2), ack_timeout=60.0, **MODES[mode])
+    silence_acknowledgements(managers)
+
+    try:
+        managers[0].start_election(block_until_result=False)
+
+        for manager in managers.values():
+            started = monotonic()
+            manager.wait_for_election(2.0)
+            assert monotonic() - started < 3.0
+    finally:
+        close_managers(managers)
+
+
+@pytest.mark.parametrize("mode", ["threaded", "event-loop"])
+def test_ack_timeout_gives_up_on_a_silent_child(mode: str) -> None:
+    """
+    After the ack timeout the leader stops waiting for its silent child: wait_for_network_ready raises and the
+    election thread closes the connections.
+    """
+
+    managers = start_managers(line(2), ack_timeout=0.5, **MODES[mode])
+    silence_acknowledgements(managers)
+
+    try:
+        leader_id = managers[0].start_election()
+        started = monotonic()
+
+        with pytest.raises(TimeoutError):
+            managers[leader_id].wait_for_network_ready(10.0)
+
+        assert monotonic() - started < 5.0
+        assert managers[leader_id].get_stats()["network_ready_at"] is None
+        # The leaf has no children, its own subtree is ready.
+        managers[1 - leader_id].wait_for_network_ready(5.0)
+        managers[leader_id]._election_node._election_thread.join(5.0)
+        assert not managers[leader_id]._election_node._election_thread.is_alive()
+    finally:
+        close_managers(managers)
+
+
+def test_an_announcement_from_outside_the_tree_changes_nothing() -> None:
+    """
+    A leader announcement from a node that is neither the parent nor a child is ignored before it touches the
+    tree, the leader or the epoch.
+    """
+
+    managers = start_managers(line(3))
+
+    try:
+        leader_id = managers[0].start_election()
+        managers[1].wait_for_election(5.0)
+        node = managers[1]._election_node
+        tree = (managers[1].get_parent_id(), managers[1].get_children_ids())
+        stats = managers[1].get_stats()
+
+        node.set_leader(7, 1, 7, stats["epoch"] + 1)
+
+        assert (managers[1].get_parent_id(), managers[1].get_children_ids()) == tree
+        assert managers[1].wait_for_election(0) == leader_id
+        assert managers[1].get_stats()["epoch"] == stats["epoch"]
+    finally:
+        close_managers(managers)
@@ -0,0 +1,106 @@
+"""
+Tests of the election state persisted between runs and of its confirmation on restart.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from lib.election_state import ElectionState, ElectionStateStore, topology_hash
+from tests.helpers import close_managers, line, start_managers
+
+TOPOLOGY = topology_hash({"nodes": 4})
+
+
+def test_the_state_is_only_loaded_for_the_same_topology(tmp_path: Path) -> None:
+    """
+    A saved state is loaded back with the hash it was saved with, and not with another one or from a corrupt
+    file.
+    """
+
+    path = str(tmp_path / "state" / "node-0.json")
+    state = ElectionState(3, 2, 1, [4, 5], 2)
+    ElectionStateStore(path, "a").save(state)
+
+    assert ElectionStateStore(path, "a").load() == state
+    assert ElectionStateStore(path, "b").load() is None
+
+    Path(path).write_text("{", encoding="utf-8")
+    assert ElectionStateStore(path, "a").load() is None
+
+
+def test_the_topology_hash_ignores_the_order_of_the_keys() -> None:
+    """
+    The same description hashes the same whatever the order of its keys.
+    """
+
+    assert topology_hash({"a": 1, "b": [1, 2]}) == topology_hash({"b": [1, 2], "a": 1})
+    assert topology_hash({"a": 1}) != topology_hash({"a": 2})
+
+
+def elect(tmp_path: Path, hashes: dict[int, str]) -> dict[int, dict]:
+    """
+    Runs an election in a line of nodes persisting their states with the given topology hashes and returns the
+    stats of every node.
+    """
+
+    stores = {node_id: {"state_store": ElectionStateStore(str(tmp_path / f"node-{node_id}.json"), topology)}
+              for node_id, topology in hashes.items()}
+    managers = start_managers(line(len(hashes)), stores)
+
+    try:
+        leader_id = managers[0].start_election()
+        for manager in managers.values():
+            assert manager.wait_for_election(10.0) == leader_id
+            manager.wait_for_network_ready(10.0)
+
+        return {node_id: manager.get_stats() for node_id, manager in managers.items()}
+    finally:
+        close_managers(managers)
+
+
+def test_a_restart_confirms_the_persisted_election(tmp_path: Path) -> None:
+    """
+    Restarted with the same topology, the nodes confirm the leader, epoch and tree of the last election.
+    """
+
+    first = elect(tmp_path, {node_id: TOPOLOGY for node_id in range(4)})
+    second = elect(tmp_path, {node_id: TOPOLOGY for node_id in range(4)})
+
+    assert not any(stats["confirmed"] for stats in first.values())
+    assert all(stats["confirmed"] for stats in second.values())
+    for node_id in first:
+        assert second[node_id]["leader_distance"] == first[node_id]["leader_distance"]
+        assert second[node_id]["epoch"] == first[node_id]["epoch"]
+
+
+def test_a_changed_topology_elects_again(tmp_path: Path) -> None:
+    """
+    A node whose topology changed has no persisted state, and the nodes fall back to an election with a new
+    epoch.
+    """
+
+    first = elect(tmp_path, {node_id: TOPOLOGY for node_id in range(4)})
+    second = elect(tmp_path, {node_id: TOPOLOGY if node_id else topology_hash({"changed": True})
+                              for node_id in range(4)})
+
+    assert not any(stats["confirmed"] for stats in second.values())
+    assert all(second[node_id]["epoch"] > first[node_id]["epoch"] for node_id in first)
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_an_error_in_the_confirmation_fails_the_election(tmp_path: Path) -> None:
+    """
+    A confirmation that ends with an error fails the election of the node instead of leaving its start waiting
+    for it.
+    """
+
+    path = str(tmp_path / "node-0.json")
+    ElectionStateStore(path, "not a hash").save(ElectionState(1, 0, 1, [], 1))
+    managers = start_managers(line(2), {0: {"state_store": ElectionStateStore(path, "not a hash")}})
+
+    try:
+        with pytest.raises(ValueError):
+            managers[0].start_election()
+    finally:
+        close_managers(managers)
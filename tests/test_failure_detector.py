@@ -0,0 +1,97 @@
+"""
+Tests of the failure detectors and of the re-election of the subtrees cut by a failure.
+"""
+
+import pytest
+
+from lib.failure_detector import FailureDetector, PhiAccrualDetector, TimeoutDetector, failure_detector_for
+from tests.helpers import close_managers, line, start_managers
+
+
+def test_a_detector_without_its_methods_cannot_be_created() -> None:
+    """
+    An incomplete detector fails when it is created, not when the first heartbeat arrives.
+    """
+
+    class OnlyHeartbeats(FailureDetector):
+
+        """
+        A detector that only records heartbeats.
+        """
+
+        def heartbeat(self, node_id: int, now: float) -> None:
+            pass
+
+    with pytest.raises(TypeError):
+        OnlyHeartbeats()
+
+
+def test_timeout_detector_suspects_after_the_timeout() -> None:
+    """
+    A neighbor is suspected once no heartbeat arrived for longer than the timeout, and never before it is watched.
+    """
+
+    detector = TimeoutDetector(1.0)
+
+    assert not detector.suspect(1, 100.0)
+
+    detector.watch(1, 0.0)
+    detector.heartbeat(1, 0.5)
+
+    assert not detector.suspect(1, 1.4)
+    assert detector.suspect(1, 1.6)
+
+    detector.forget(1)
+
+    assert not detector.suspect(1, 10.0)
+
+
+def test_phi_accrual_detector_suspects_a_long_silence() -> None:
+    """
+    Regular heartbeats keep phi low and a silence of many intervals raises it above the threshold.
+    """
+
+    detector = PhiAccrualDetector(threshold=8.0, first_interval=0.1, min_std=0.01)
+
+    for beat in range(20):
+        detector.heartbeat(1, beat * 0.1)
+
+    assert not detector.suspect(1, 1.95)
+    assert detector.suspect(1, 3.0)
+    assert detector.phi(1, 3.0) > detector.phi(1, 2.5)
+
+
+def test_failure_detector_for_tunes_the_timeout() -> None:
+    """
+    The timeout detector of a heartbeat interval waits for five missed heartbeats.
+    """
+
+    detector = failure_detector_for("timeout", 0.1)
+    detector.watch(1, 0.0)
+
+    assert not detector.suspect(1, 0.45)
+    assert detector.suspect(1, 0.55)
+
+
+@pytest.mark.parametrize("event_loop", [False, True])
+def test_the_subtrees_cut_from_the_leader_elect_their_own(event_loop: bool) -> None:
+    """
+    When the leader of a line fails, each side of the line elects a leader of its own.
+    """
+
+    nodes = line(5)
+    managers = start_managers(nodes, heartbeat_interval=0.05, event_loop=event_loop)
+
+    try:
+        leader_id = managers[0].start_election()
+        for manager in managers.values():
+            manager.wait_for_election(10.0)
+
+        managers[leader_id].close()
+
+        for side in (range(0, leader_id), range(leader_id + 1, len(nodes))):
+            leaders = {managers[node_id].wait_for_leader_change(leader_id, 10.0) for node_id in side}
+            if side:
+                assert len(leaders) == 1 and leaders <= set(side)
+    finally:
+        close_managers(managers)
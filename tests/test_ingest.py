@@ -0,0 +1,64 @@
+"""
+Tests of the leader ingest server.
+"""
+
+from socket import create_connection
+from threading import Thread
+
+from lib.ingest import IngestServer, StreamCollector
+from lib.message import Message, MessageType, encode_message
+from tests.helpers import free_ports
+
+
+def test_collector_joins_the_streams_in_the_order_they_ended() -> None:
+    """
+    The streams of a relaying source are kept per sender and joined in the order the sources ended.
+    """
+
+    collector = StreamCollector()
+
+    data, ended = collector.collect("relay", [Message(MessageType.DATA, 2, b"b1"), Message(MessageType.DATA, 3, b"c"),
+                                              Message(MessageType.DATA, 2, b"b2")])
+    assert [message.payload for message in data] == [b"b1", b"c", b"b2"] and not ended
+
+    data, ended = collector.collect("direct", [Message(MessageType.DATA, 1, b"a"),
+                                               Message(MessageType.END_OF_STREAM, 1)])
+    assert [message.payload for message in data] == [b"a"] and ended
+
+    collector.collect("relay", [Message(MessageType.END_OF_STREAM, 2)])
+    collector.collect("never", [Message(MessageType.DATA, 4, b"lost")])
+
+    assert collector.finished_ids == [1, 2, 3]
+    assert collector.join() == b"ab1b2c"
+
+
+def test_the_server_collects_many_clients_in_one_loop() -> None:
+    """
+    The server collects the streams of every client and relays their frames; a client that closes without an
+    end of stream is dropped.
+    """
+
+    address = ("localhost", free_ports(1)[0])
+    relayed = []
+    server = IngestServer(address, 4, relay=relayed.extend)
+    server.listen()
+    result = []
+    thread = Thread(target=lambda: result.append(server.serve(10.0)))
+    thread.start()
+
+    for sender_id in (1, 2, 3):
+        with create_connection(address) as connection:
+            connection.sendall(b"".join(encode_message(MessageType.DATA, sender_id, str(sender_id).encode("utf-8"))
+                                        for _ in range(100)))
+            connection.sendall(encode_message(MessageType.END_OF_STREAM, sender_id))
+            connection.recv(1)
+
+    with create_connection(address) as connection:
+        connection.sendall(encode_message(MessageType.DATA, 4, b"4"))
+
+    thread.join(10.0)
+
+    assert result == [b"1" * 100 + b"2" * 100 + b"3" * 100]
+    assert len(relayed) == 301
+    assert server.get_stats()["clients"] == 3
+    assert server.get_stats()["dropped_clients"] == 1
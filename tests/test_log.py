@@ -0,0 +1,89 @@
+"""
+Tests of the logging of the library.
+"""
+
+import json
+import logging
+from collections.abc import Iterator
+from io import StringIO
+
+import pytest
+
+from lib.log import NodeLogger, configure_logging, stop_logging
+
+
+@pytest.fixture
+def stream() -> Iterator[StringIO]:
+    """
+    Returns the stream configure_logging writes to, restoring the levels it changed afterwards.
+    """
+
+    root_level = logging.getLogger().level
+    stream = StringIO()
+
+    try:
+        yield stream
+    finally:
+        stop_logging()
+        logging.getLogger().setLevel(root_level)
+        logging.getLogger("test.quiet").setLevel(logging.NOTSET)
+
+
+def test_records_carry_the_node_as_a_field(stream: StringIO) -> None:
+    """
+    The records of a NodeLogger are written with the id of the node and their other fields.
+    """
+
+    configure_logging(logging.INFO, stream=stream)
+    NodeLogger(logging.getLogger("test.node"), 3).info("Elected %d", 5, extra={"epoch": 2})
+    stop_logging()
+
+    line = stream.getvalue().strip()
+    assert "INFO test.node Elected 5" in line
+    assert line.endswith("node=3 epoch=2")
+
+
+def test_json_lines(stream: StringIO) -> None:
+    """
+    With json_lines every record is a JSON object with its fields as keys.
+    """
+
+    configure_logging(logging.INFO, json_lines=True, stream=stream)
+    NodeLogger(logging.getLogger("test.node"), 3).warning("Lost %s", "neighbor")
+    stop_logging()
+
+    entry = json.loads(stream.getvalue())
+    assert entry["level"] == "WARNING"
+    assert entry["logger"] == "test.node"
+    assert entry["message"] == "Lost neighbor"
+    assert entry["node"] == 3
+
+
+def test_records_below_the_level_are_not_formatted(stream: StringIO) -> None:
+    """
+    The arguments of a dropped record are never converted to text, and a module level overrides the root one.
+    """
+
+    class Counted():
+
+        """
+        Counts its conversions to text.
+        """
+
+        conversions = 0
+
+        def __str__(self) -> str:
+            Counted.conversions += 1
+            return "counted"
+
+    configure_logging(logging.DEBUG, module_levels={"test.quiet": logging.WARNING}, stream=stream)
+    quiet = NodeLogger(logging.getLogger("test.quiet"), 1)
+
+    for _ in range(100):
+        quiet.debug("Sent %s", Counted())
+    assert Counted.conversions == 0
+
+    quiet.warning("Kept %s", Counted())
+    stop_logging()
+
+    assert stream.getvalue().count("\n") == 1
@@ -0,0 +1,60 @@
+"""
+Tests of the election wire protocol.
+"""
+
+import pytest
+
+from lib.message import (DATA_CHANNEL, HEADER, MAX_FRAME_SIZE, PROTOCOL_VERSION, Message, MessageReader, MessageType,
+                         ProtocolError, encode_message)
+
+
+def test_frames_are_decoded_as_encoded() -> None:
+    """
+    Plain, traced and group frames come back with the same fields.
+    """
+
+    messages = [
+        Message(MessageType.START_ELECTION, 3),
+        Message(MessageType.DATA, 7, b"payload", DATA_CHANNEL),
+        Message(MessageType.HEARTBEAT, 1, b"", 0, 42),
+        Message(MessageType.DATA, 2, b"grouped", DATA_CHANNEL, 9, 5),
+    ]
+
+    frames = b"".join(encode_message(message.message_type, message.sender_id, message.payload, message.channel,
+                                     message.clock, message.group) for message in messages)
+
+    assert MessageReader().feed(frames) == messages
+
+
+def test_partial_frames_wait_for_their_bytes() -> None:
+    """
+    A frame split across reads is returned once its last byte arrives.
+    """
+
+    frame = encode_message(MessageType.DATA, 1, bytes(1000))
+    reader = MessageReader(16)
+
+    assert reader.feed(frame[:3]) == []
+    assert reader.feed(frame[3:500]) == []
+    assert reader.feed(frame[500:]) == [Message(MessageType.DATA, 1, bytes(1000))]
+
+
+def test_unsupported_version_is_a_protocol_error() -> None:
+    """
+    A frame of another protocol version is rejected.
+    """
+
+    with pytest.raises(ProtocolError, match="version"):
+        MessageReader().feed(HEADER.pack(PROTOCOL_VERSION + 1, MessageType.DATA, 0, 1, 0))
+
+
+def test_oversize_frame_is_a_protocol_error() -> None:
+    """
+    A header announcing more than MAX_FRAME_SIZE bytes is rejected before its payload is buffered.
+    """
+
+    reader = MessageReader()
+
+    assert reader.feed(HEADER.pack(PROTOCOL_VERSION, MessageType.DATA, 0, 1, MAX_FRAME_SIZE)) == []
+    with pytest.raises(ProtocolError, match="larger than"):
+        MessageReader().feed(HEADER.pack(PROTOCOL_VERSION, MessageType.DATA, 0, 1, MAX_FRAME_SIZE + 1))
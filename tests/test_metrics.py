@@ -0,0 +1,103 @@
+"""
+Tests of the metrics of the election.
+"""
+
+from time import monotonic, sleep
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from lib.metrics import PHASES, Histogram, MetricsServer, render_prometheus
+from tests.helpers import close_managers, line, start_managers
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    """
+    Each bucket counts the observations up to its bound, the last one all of them.
+    """
+
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["buckets"] == {0.1: 2, 1.0: 3, float("inf"): 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(2.65)
+
+
+def test_every_message_sent_is_counted_once_received() -> None:
+    """
+    After an election, the messages and bytes the nodes sent, by type, are the ones they received, and every
+    node observed each phase.
+    """
+
+    managers = start_managers(line(4))
+
+    try:
+        managers[0].start_election()
+        for manager in managers.values():
+            manager.wait_for_election(10.0)
+            manager.wait_for_network_ready(10.0)
+
+        # The last acknowledgements may still be on their way.
+        deadline = monotonic() + 5.0
+        while True:
+            stats = [manager.get_stats() for manager in managers.values()]
+            totals = {key: sum(node_stats[key] for node_stats in stats)
+                      for key in ("messages_sent", "messages_received", "bytes_sent", "bytes_received")}
+            if totals["messages_sent"] == totals["messages_received"] or monotonic() > deadline:
+                break
+            sleep(0.05)
+
+        assert totals["messages_sent"] == totals["messages_received"] > 0
+        assert totals["bytes_sent"] == totals["bytes_received"]
+
+        for direction in ("messages", "bytes"):
+            sent, received = {}, {}
+            for node_stats in stats:
+                for message_type, count in node_stats[f"{direction}_sent_by_type"].items():
+                    sent[message_type] = sent.get(message_type, 0) + count
+                for message_type, count in node_stats[f"{direction}_received_by_type"].items():
+                    received[message_type] = received.get(message_type, 0) + count
+            assert sent == received
+
+        for node_stats in stats:
+            assert all(node_stats["phases"][phase]["count"] == 1 for phase in PHASES)
+    finally:
+        close_managers(managers)
+
+
+def test_the_server_serves_prometheus_text() -> None:
+    """
+    /metrics returns the stats of every node collected at the scrape, other paths are not found.
+    """
+
+    stats = {
+        1: {"messages_sent": 3, "leader_distance": None, "messages_sent_by_type": {"START_ELECTION": 3},
+            "phases": {"wake_up": Histogram((0.5,)).snapshot()}},
+        2: {"messages_sent": 5},
+    }
+    server = MetricsServer(("localhost", 0), lambda: stats)
+    server.start()
+    url = "http://{}:{}".format(*server.address)
+
+    try:
+        with urlopen(f"{url}/metrics", timeout=5.0) as response:
+            body = response.read().decode("utf-8")
+
+        assert body == render_prometheus(stats)
+        assert "# TYPE election_messages_sent_total counter" in body
+        assert 'election_messages_sent_total{node="1"} 3.0' in body
+        assert 'election_messages_sent_total{node="2"} 5.0' in body
+        assert "election_leader_distance" not in body
+        assert 'election_messages_sent_by_type_total{node="1",type="START_ELECTION"} 3' in body
+        assert 'election_phase_duration_seconds_bucket{node="1",phase="wake_up",le="+Inf"} 0' in body
+
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/other", timeout=5.0)
+        assert error.value.code == 404
+    finally:
+        server.close()
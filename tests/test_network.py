@@ -0,0 +1,96 @@
+"""
+Tests of the validation of the network file.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from lib.election_node import ElectionNode
+from lib.network import Network, TopologyError
+
+
+def write_network(path: Path, nodes: dict, connections: dict) -> str:
+    """
+    Writes a network file and returns its path.
+    """
+
+    network_file = path / "network.json"
+    network_file.write_text(json.dumps({"nodes": nodes, "connections": connections}), encoding="utf-8")
+
+    return str(network_file)
+
+
+def node(port: int, **fields) -> dict:
+    """
+    Returns the description of a node on localhost.
+    """
+
+    return {"host": "localhost", "election_port": port, "application_port": port + 1000, **fields}
+
+
+def test_a_valid_network_is_loaded(tmp_path: Path) -> None:
+    """
+    The nodes, capacities and neighbors of a valid file are kept.
+    """
+
+    network = Network(write_network(tmp_path,
+                                     {"0": node(8000), "1": node(8001, capacity=2), "2": node(8002, capacity=0.5)},
+                                     {"0": [1], "1": [0, 2], "2": [1]}))
+
+    assert network.get_node_ids() == [0, 1, 2]
+    assert [network.get_node_capacity(node_id) for node_id in (0, 1, 2)] == [1.0, 2.0, 0.5]
+    assert network.get_neighbor_ids(1) == [0, 2]
+    assert network.get_node_election_address(2) == ("localhost", 8002)
+
+
+@pytest.mark.parametrize("capacity", [float("nan"), float("inf"), -1.0, True, "2"])
+def test_invalid_capacities_are_rejected(tmp_path: Path, capacity: object) -> None:
+    """
+    A capacity that is not a finite, non-negative number is a topology error.
+    """
+
+    # json.dumps writes NaN and Infinity, which json.load accepts.
+    path = write_network(tmp_path, {"0": node(8000, capacity=capacity), "1": node(8001)}, {"0": [1], "1": [0]})
+
+    with pytest.raises(TopologyError, match="capacity of the node 0"):
+        Network(path)
+
+
+@pytest.mark.parametrize("neighbor_id", [True, 1.0, "1", None])
+def test_neighbors_that_are_not_ids_are_rejected(tmp_path: Path, neighbor_id: object) -> None:
+    """
+    A connection to true or to a float is not taken as the node 1.
+    """
+
+    path = write_network(tmp_path, {"0": node(8000), "1": node(8001)}, {"0": [neighbor_id], "1": [0]})
+
+    with pytest.raises(TopologyError, match="not a node id"):
+        Network(path)
+
+
+@pytest.mark.parametrize("connections, message", [
+    ({"0": [1, 2], "1": [0, 2], "2": [0, 1]}, "closes a cycle"),
+    ({"0": [1], "1": [], "2": []}, "listed by only one"),
+    ({"0": [1], "1": [0], "2": []}, "not connected"),
+    ({"0": [3], "1": [], "2": []}, "unknown node"),
+])
+def test_connections_must_form_a_tree(tmp_path: Path, connections: dict, message: str) -> None:
+    """
+    Cycles, one-sided connections, unreachable and unknown nodes are topology errors.
+    """
+
+    path = write_network(tmp_path, {"0": node(8000), "1": node(8001), "2": node(8002)}, connections)
+
+    with pytest.raises(TopologyError, match=message):
+        Network(path)
+
+
+def test_an_election_node_rejects_an_invalid_capacity() -> None:
+    """
+    The capacity given to a node directly is checked like the one of the network file.
+    """
+
+    with pytest.raises(ValueError, match="capacity"):
+        ElectionNode(0, ("localhost", 0), {}, capacity=float("nan"))
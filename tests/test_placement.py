@@ -0,0 +1,78 @@
+"""
+Tests of the leader placement policies.
+"""
+
+import pytest
+
+from lib.placement import (ROOT_SEARCH, CapacityPlacement, CenterPlacement, PlacementSearch, SubtreeSummary,
+                           check_capacity, summarize_subtree)
+from tests.helpers import close_managers, line, start_managers
+
+
+def test_subtree_summary() -> None:
+    """
+    The summary of a subtree has its height, its size and its largest capacity, ties broken by the largest id.
+    """
+
+    children = {1: SubtreeSummary(2, 3, 5.0, 4), 2: SubtreeSummary(0, 1, 5.0, 2)}
+
+    assert summarize_subtree(0, 1.0, children) == SubtreeSummary(3, 5, 5.0, 4)
+    assert summarize_subtree(9, 5.0, children) == SubtreeSummary(3, 5, 5.0, 9)
+    assert summarize_subtree(0, 1.0, {}) == SubtreeSummary(0, 1, 1.0, 0)
+
+
+def test_center_placement_walks_down_the_tallest_subtree() -> None:
+    """
+    The leadership moves to the tallest child while that lowers the eccentricity.
+    """
+
+    policy = CenterPlacement()
+    children = {1: SubtreeSummary(4, 5, 1.0, 1), 2: SubtreeSummary(0, 1, 1.0, 2)}
+
+    assert policy.next_hop(0, 1.0, children, ROOT_SEARCH) == (1, PlacementSearch(-1, 2))
+    assert policy.next_hop(0, 1.0, children, PlacementSearch(-1, 4)) is None
+    assert policy.next_hop(0, 1.0, {}, ROOT_SEARCH) is None
+
+
+def test_capacity_placement_follows_the_best_node() -> None:
+    """
+    The leadership moves towards the node with the largest capacity.
+    """
+
+    policy = CapacityPlacement()
+    children = {1: SubtreeSummary(1, 2, 3.0, 5), 2: SubtreeSummary(0, 1, 2.0, 2)}
+
+    assert policy.next_hop(0, 1.0, children, ROOT_SEARCH) == (1, PlacementSearch(5, 0))
+    assert policy.next_hop(0, 4.0, children, ROOT_SEARCH) is None
+    assert policy.next_hop(5, 3.0, {}, PlacementSearch(5, 0)) is None
+
+
+@pytest.mark.parametrize("capacity", [float("nan"), float("-inf"), -0.5, False, None])
+def test_invalid_capacities(capacity: object) -> None:
+    """
+    Only finite, non-negative numbers are capacities.
+    """
+
+    with pytest.raises(ValueError):
+        check_capacity(capacity)
+
+
+@pytest.mark.parametrize("event_loop", [False, True])
+def test_elections_place_the_leader(event_loop: bool) -> None:
+    """
+    In a line of 7 nodes the center policy elects the middle node and the capacity policy the strongest node,
+    and every node reports its distance to the leader.
+    """
+
+    capacities = {node_id: {"capacity": 2.0 if node_id == 5 else 1.0} for node_id in range(7)}
+
+    for policy, expected_id in ((CenterPlacement(), 3), (CapacityPlacement(), 5)):
+        managers = start_managers(line(7), capacities, placement_policy=policy, event_loop=event_loop)
+
+        try:
+            assert managers[0].start_election() == expected_id
+            for node_id, manager in managers.items():
+                assert manager.wait_for_election(10.0) == expected_id
+                assert manager.get_stats()["leader_distance"] == abs(node_id - expected_id)
+        finally:
+            close_managers(managers)
@@ -0,0 +1,104 @@
+"""
+Tests of the connection setup: the retry backoff, the connects with backoff and the readiness probes.
+"""
+
+from socket import create_server
+from threading import Thread, Timer
+from time import monotonic
+
+import pytest
+
+from lib.backoff import ExponentialBackoff
+from lib.election import ElectionProtocolManager
+from lib.socket_manager import connect_with_backoff, probe_server
+from tests.helpers import close_managers, free_ports, start_managers
+
+
+def test_backoff_delays_grow_up_to_the_maximum() -> None:
+    """
+    The delays double from the initial one, are capped at the maximum and lowered by at most the jitter.
+    """
+
+    backoff = ExponentialBackoff(initial=0.01, maximum=0.5, jitter=0.5)
+
+    for attempt in range(100):
+        expected = min(0.5, 0.01 * 2 ** attempt)
+        assert expected / 2 <= backoff.delay(attempt) <= expected
+
+    with pytest.raises(ValueError):
+        ExponentialBackoff(initial=1.0, maximum=0.5)
+    with pytest.raises(ValueError):
+        ExponentialBackoff(jitter=2.0)
+
+
+def test_connect_retries_until_the_server_listens() -> None:
+    """
+    A connect made before the server listens succeeds once it does.
+    """
+
+    address = ("localhost", free_ports(1)[0])
+    servers = []
+    listen = Timer(0.3, lambda: servers.append(create_server(address)))
+    listen.start()
+
+    try:
+        connection = connect_with_backoff(address, 5.0)
+        connection.close()
+    finally:
+        listen.join()
+        for server in servers:
+            server.close()
+
+
+def test_connect_gives_up_after_its_timeout() -> None:
+    """
+    Without a server the connect raises TimeoutError once its timeout passed.
+    """
+
+    started = monotonic()
+
+    with pytest.raises(TimeoutError):
+        connect_with_backoff(("localhost", free_ports(1)[0]), 0.3)
+
+    assert monotonic() - started < 2.0
+
+
+def test_readiness_probe() -> None:
+    """
+    A started node answers the readiness probe; a port nobody listens on does not.
+    """
+
+    managers = start_managers({0: []})
+
+    try:
+        probe_server(managers[0]._election_node._connection_manager._server_address.get_address(), 1, 5.0)
+
+        with pytest.raises(TimeoutError):
+            probe_server(("localhost", free_ports(1)[0]), 1, 0.3)
+    finally:
+        close_managers(managers)
+
+
+def test_the_election_waits_for_a_neighbor_started_later() -> None:
+    """
+    The nodes can start in any order: the election waits until the neighbors listen, with no startup time.
+    """
+
+    ports = free_ports(2)
+    managers = {node_id: ElectionProtocolManager(node_id, "localhost", ports[node_id],
+                                                 {1 - node_id: ("localhost", ports[1 - node_id])})
+                for node_id in (0, 1)}
+    leaders = {}
+
+    try:
+        managers[0].start_server(0)
+        election = Thread(target=lambda: leaders.update({0: managers[0].start_election()}))
+        election.start()
+
+        Timer(0.3, managers[1].start_server, (0,)).start()
+        leaders[1] = managers[1].wait_for_election(10.0)
+        election.join(10.0)
+
+        assert leaders[0] == leaders[1]
+    finally:
+        close_managers(managers)
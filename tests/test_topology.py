@@ -0,0 +1,71 @@
+"""
+Tests of the topology generator and of the election benchmark on its topologies.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from benchmarks.bench_election import summarize
+from benchmarks.local_cluster import MODES, run_election
+from benchmarks.topology import TOPOLOGIES, generate_topology, network_description
+from lib.network import Network
+from tests.helpers import free_ports
+
+
+def load_topology(path: Path, connections: dict[int, list[int]]) -> Network:
+    """
+    Writes the network.json of a topology with free election ports and loads it.
+    """
+
+    description = network_description(connections)
+    for node, port in zip(description["nodes"].values(), free_ports(len(connections))):
+        node["election_port"] = port
+
+    network_file = path / "network.json"
+    network_file.write_text(json.dumps(description), encoding="utf-8")
+
+    return Network(str(network_file))
+
+
+@pytest.mark.parametrize("kind", TOPOLOGIES)
+@pytest.mark.parametrize("nodes", [1, 10, 1000])
+def test_generated_topologies_are_trees(tmp_path: Path, kind: str, nodes: int) -> None:
+    """
+    Every topology has the requested number of nodes and passes the tree validation of Network.
+    """
+
+    network = load_topology(tmp_path, generate_topology(kind, nodes))
+
+    assert network.get_node_ids() == list(range(nodes))
+
+
+def test_topology_shapes() -> None:
+    """
+    The line, star and k-ary trees have the degrees of their shapes.
+    """
+
+    assert generate_topology("line", 5)[2] == [1, 3]
+    assert generate_topology("star", 5)[0] == [1, 2, 3, 4]
+    assert all(len(neighbors) <= 3 for neighbors in generate_topology("kary", 100).values())
+    assert generate_topology("random", 50, seed=1) == generate_topology("random", 50, seed=1)
+
+    with pytest.raises(ValueError):
+        generate_topology("ring", 5)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_the_benchmark_measures_an_election(tmp_path: Path, mode: str) -> None:
+    """
+    The benchmark runs an election on a generated topology and reports a single leader and its costs.
+    """
+
+    network = load_topology(tmp_path, generate_topology("random", 10))
+
+    result = summarize(run_election(network, mode, 30.0))
+
+    assert result["leader"] in network.get_node_ids()
+    assert 0 <= result["time_to_first_leader"] <= result["time_to_all_know_leader"]
+    assert result["messages"] > 0 and result["bytes"] > 0
+    assert result["max_leader_distance"] <= 9
@@ -0,0 +1,88 @@
+"""
+Tests of the indexed topology format.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from benchmarks.topology import generate_topology, network_description
+from lib.network import Network, TopologyError
+from lib.topology_index import TopologyIndex, load_network, write_topology_index
+
+
+def write_network(path: Path) -> str:
+    """
+    Writes a network.json with two hosts, capacities and transports and returns its path.
+    """
+
+    description = network_description(generate_topology("random", 50))
+    description["nodes"]["7"].update(host="127.0.0.1", capacity=2.5, transport="unix")
+    description["link_transports"] = {"0": {"1": "shm"}}
+
+    network_file = path / "network.json"
+    network_file.write_text(json.dumps(description), encoding="utf-8")
+
+    return str(network_file)
+
+
+def test_the_index_answers_like_the_network(tmp_path: Path) -> None:
+    """
+    Every lookup of the index returns what the network.json it was compiled from returns.
+    """
+
+    network = Network(write_network(tmp_path))
+    write_topology_index(network, str(tmp_path / "network.idx"))
+    index = TopologyIndex(str(tmp_path / "network.idx"))
+
+    try:
+        assert index.get_node_count() == network.get_node_count()
+        assert index.get_node_ids() == network.get_node_ids()
+        assert index.get_election_starter_id() == network.get_election_starter_id()
+        assert index.get_topology_hash() == network.get_topology_hash()
+
+        for node_id in network.get_node_ids():
+            assert index.get_node_election_address(node_id) == network.get_node_election_address(node_id)
+            assert index.get_node_application_address(node_id) == network.get_node_application_address(node_id)
+            assert index.get_node_capacity(node_id) == network.get_node_capacity(node_id)
+            assert index.get_node_transport(node_id) == network.get_node_transport(node_id)
+            assert index.get_neighbor_ids(node_id) == network.get_neighbor_ids(node_id)
+            assert index.get_neighbor_transports(node_id) == network.get_neighbor_transports(node_id)
+            assert index.get_election_neighbors(node_id) == network.get_election_neighbors(node_id)
+            assert index.get_application_neighbors(node_id) == network.get_application_neighbors(node_id)
+
+        with pytest.raises(KeyError):
+            index.position_of(1000)
+    finally:
+        index.close()
+
+
+def test_load_network_tells_the_formats_apart(tmp_path: Path) -> None:
+    """
+    load_network reads a network.json as a Network and an index as a TopologyIndex.
+    """
+
+    network_file_path = write_network(tmp_path)
+    write_topology_index(Network(network_file_path), str(tmp_path / "network.idx"))
+
+    assert isinstance(load_network(network_file_path), Network)
+
+    index = load_network(str(tmp_path / "network.idx"))
+    try:
+        assert isinstance(index, TopologyIndex)
+    finally:
+        index.close()
+
+
+@pytest.mark.parametrize("content", [b"", b"T1394IDX", b"NOTINDEX" + bytes(200)])
+def test_other_files_are_not_indexes(tmp_path: Path, content: bytes) -> None:
+    """
+    Empty, truncated and foreign files are topology errors.
+    """
+
+    index_file = tmp_path / "network.idx"
+    index_file.write_bytes(content)
+
+    with pytest.raises(TopologyError):
+        TopologyIndex(str(index_file))
@@ -0,0 +1,66 @@
+"""
+Tests of the causal traces of the election.
+"""
+
+from pathlib import Path
+
+from lib.message import Message, MessageType
+from lib.trace import START_ELECTION, Tracer, critical_path, describe_path, load_events, to_chrome_trace
+from tests.helpers import close_managers, line, start_managers
+
+
+def test_a_receive_moves_the_clock_past_its_send(tmp_path: Path) -> None:
+    """
+    The clock of a node is past the clock of every message it received.
+    """
+
+    tracer = Tracer(0, str(tmp_path / "node-0.trace.jsonl"))
+
+    try:
+        assert tracer.send(1, MessageType.START_ELECTION, 0) == 1
+        tracer.receive(1, Message(MessageType.CHILD_PARENTING_REQUEST, 1, clock=10))
+        assert tracer.send(1, MessageType.PARENT_ACK_RESPONSE, 0) == 12
+    finally:
+        tracer.close()
+
+    receive = load_events([str(tmp_path)])[1]
+    assert receive["args"] == {"from": 1, "type": "CHILD_PARENTING_REQUEST", "channel": 0, "clock": 11,
+                               "send_clock": 10}
+
+
+def test_the_critical_path_of_a_traced_election(tmp_path: Path) -> None:
+    """
+    The traces of an election link every receive to its send and give a critical path from the start of the
+    election to the last announcement received.
+    """
+
+    tracers = {node_id: Tracer(node_id, str(tmp_path / f"node-{node_id}.trace.jsonl")) for node_id in range(4)}
+    managers = start_managers(line(4), {node_id: {"tracer": tracer} for node_id, tracer in tracers.items()})
+
+    try:
+        managers[0].start_election()
+        for manager in managers.values():
+            manager.wait_for_election(10.0)
+            manager.wait_for_network_ready(10.0)
+    finally:
+        close_managers(managers)
+        for tracer in tracers.values():
+            tracer.close()
+
+    events = load_events([str(tmp_path)])
+    sends = {(event["pid"], event["args"]["clock"]) for event in events if event["name"].startswith("send ")}
+    receives = [event for event in events if event["name"].startswith("receive ")]
+
+    assert receives
+    for receive in receives:
+        assert (receive["args"]["from"], receive["args"]["send_clock"]) in sends
+        assert receive["args"]["clock"] > receive["args"]["send_clock"]
+
+    flows = [event for event in to_chrome_trace(events)["traceEvents"] if event["ph"] in ("s", "f")]
+    assert len(flows) == 2 * len(receives)
+
+    path = critical_path(events)
+    assert path[0]["name"] == START_ELECTION and path[0]["args"]["from"] is None
+    assert path[-1]["name"] == f"receive {MessageType.LEADER_ANNOUNCEMENT.name}"
+    assert [event["ts"] for event in path] == sorted(event["ts"] for event in path)
+    assert describe_path(path, events)[-1].startswith("Critical path:")
@@ -0,0 +1,107 @@
+"""
+Tests of the election transports.
+"""
+
+from socket import AF_UNIX, SOCK_STREAM, socket, timeout
+from threading import Thread
+from time import monotonic
+
+import pytest
+
+from lib.message import Message, MessageReader, MessageType, encode_message
+from lib.transport import HANDSHAKE, TRANSPORTS, SharedMemoryConnection, SharedMemoryTransport, Transport
+from tests.helpers import close_managers, free_ports, line, start_managers
+
+
+def test_transport_is_abstract() -> None:
+    """
+    A transport without bind and connect cannot be created.
+    """
+
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def receive_messages(connection: socket | SharedMemoryConnection, count: int) -> list[Message]:
+    """
+    Reads a connection until count messages arrived, going on after the timeouts of the shared memory handshake.
+    """
+
+    reader = MessageReader()
+    messages = []
+
+    while len(messages) < count:
+        try:
+            received = reader.receive(connection)
+        except timeout:
+            continue
+
+        assert received is not None
+        messages += received
+
+    return messages
+
+
+@pytest.mark.parametrize("name", TRANSPORTS)
+def test_frames_go_both_ways(name: str) -> None:
+    """
+    The frames written on each end of a connection are read in order on the other end.
+    """
+
+    transport = TRANSPORTS[name]()
+    address = ("localhost", free_ports(1)[0])
+    listener = transport.bind(address)
+    listener.listen(1)
+    payloads = [bytes([index]) * size for index, size in enumerate((0, 1, 1000, 100000))]
+    connected = []
+
+    def connect_and_send() -> None:
+        connected.append(transport.connect(address))
+        for payload in payloads:
+            connected[0].sendall(encode_message(MessageType.DATA, 1, payload))
+
+    # The shared memory client waits for the listener side to read its handshake.
+    client = Thread(target=connect_and_send)
+    client.start()
+    server_connection, _ = listener.accept()
+
+    try:
+        messages = receive_messages(server_connection, len(payloads))
+        client.join(5.0)
+
+        assert [message.payload for message in messages] == payloads
+
+        server_connection.sendall(encode_message(MessageType.READY, 0))
+        assert receive_messages(connected[0], 1)[0].message_type == MessageType.READY
+
+        connected[0].close()
+        assert MessageReader().receive(server_connection) is None
+    finally:
+        for connection in (*connected, server_connection):
+            connection.close()
+        listener.close()
+
+
+def test_a_stalled_shared_memory_handshake_does_not_block_the_event_loop() -> None:
+    """
+    A client that stops in the middle of the handshake does not keep the event loop of the node from serving
+    the election.
+    """
+
+    transport = SharedMemoryTransport()
+    managers = start_managers(line(2), event_loop=True, transport=transport)
+    address = managers[0]._election_node._connection_manager._server_address.get_address()
+    stalled = socket(AF_UNIX, SOCK_STREAM)
+
+    try:
+        stalled.connect(transport.socket_path(address))
+        stalled.sendall(HANDSHAKE.pack(1024, 10, 10)[:3])
+        started = monotonic()
+
+        leader_id = managers[1].start_election()
+
+        assert managers[0].wait_for_election(5.0) == leader_id
+        assert monotonic() - started < 3.0
+    finally:
+        stalled.close()
+        close_managers(managers)